@@ -0,0 +1,2097 @@
+import argparse
+import csv
+import datetime
+import json
+import mmap
+import os
+import re
+import sys
+import backup_store
+import change_log
+import file_util
+import metrics
+
+## const value
+DEFAULT_PROFILE_NAME = "default"
+PROFILE_SECTION_PREFIX = "profile "
+SECTION_TYPE_PROFILE = "profile"
+NON_PROFILE_SECTION_TYPES = ("sso-session", "services", "plugins", "preview")
+CONFIG_FILE_ENCODING = "utf-8"
+MANIFEST_REQUIRED_FIELDS = ("profile", "role_arn", "source_profile")
+MANIFEST_YAML_EXTENSIONS = (".yaml", ".yml")
+SECTION_INDEX_FILE_SUFFIX = ".index.json"
+ROLE_ARN_PATTERN = re.compile(r"^arn:[^:]+:iam::(\d{12}):role/(?:.*/)?([^/]+)$")
+
+
+class ProfileSection:
+    """
+    One section of AWS CLI config file.
+
+    The header is None for the lines placed before the first section.
+    """
+
+    __slots__ = ("header", "name", "lines")
+
+    def __init__(self, header, name, lines):
+        """
+        Parameters
+        ----------
+        header : str
+            section header line. (ex. "[profile sts-session]")
+        name : str
+            profile name of this section. (ex. "sts-session")
+        lines : list of str
+            non blank lines of this section except the header.
+        """
+        self.header = header
+        self.name = name
+        self.lines = lines
+
+    def get(self, key):
+        """
+        Get the value of a key in this section.
+
+        Parameters
+        ----------
+        key : str
+            setting key name. (ex. "role_arn")
+
+        Returns
+        -------
+        value : str
+            setting value. None if the key not exist.
+        """
+        for line in self.lines:
+            separator_index = line.find("=")
+            if separator_index < 0:
+                continue
+            if line[:separator_index].strip() == key:
+                return line[separator_index + 1 :].strip()
+        return None
+
+    def to_string(self):
+        """
+        Serialize this section to the file format.
+
+        Returns
+        -------
+        section_string : str
+            section string ends with a new line.
+        """
+        section_lines = list(self.lines)
+        if self.header is not None:
+            section_lines.insert(0, self.header)
+        return "\n".join(section_lines) + "\n"
+
+
+class AssumedRoleVO:
+    """
+    Assumed role profile registration request.
+    """
+
+    __slots__ = (
+        "profile_name",
+        "role_arn",
+        "source_profile",
+        "mfa_serial",
+        "region",
+        "output",
+        "comment",
+    )
+
+    def __init__(
+        self,
+        profile_name,
+        role_arn,
+        source_profile,
+        mfa_serial,
+        region,
+        output,
+        comment,
+    ):
+        """
+        Parameters
+        ----------
+        profile_name : str
+            register profile name.
+        role_arn : str
+            assumed role arn.
+        source_profile : str
+            source profile name.
+        mfa_serial : str
+            mfa serial arn. empty if not used.
+        region : str
+            region name.
+        output : str
+            output format.
+        comment : str
+            registered comment for change log.
+        """
+        self.profile_name = profile_name
+        self.role_arn = role_arn
+        self.source_profile = source_profile
+        self.mfa_serial = mfa_serial
+        self.region = region
+        self.output = output
+        self.comment = comment
+
+
+class AwsConfig:
+    """
+    AWS CLI config file model indexed by profile name.
+    """
+
+    __slots__ = ("sections", "profile_index")
+
+    def __init__(self, sections):
+        """
+        Parameters
+        ----------
+        sections : list of ProfileSection
+            config file sections in file order.
+        """
+        self.sections = sections
+        self.profile_index = {}
+        for position, section in enumerate(sections):
+            if section.header is not None:
+                self.profile_index.setdefault(section.name, []).append(position)
+
+    def find_profile(self, profile_name):
+        """
+        Find the sections of a profile.
+
+        Parameters
+        ----------
+        profile_name : str
+            profile name.
+
+        Returns
+        -------
+        sections : list of ProfileSection
+            matched sections. empty if the profile not exist.
+        """
+        return [
+            self.sections[position]
+            for position in self.profile_index.get(profile_name, [])
+            if self.sections[position] is not None
+        ]
+
+    def delete_profile(self, profile_name):
+        """
+        Delete all sections of a profile.
+
+        The sections are replaced with None, so the positions of the other
+        sections are kept until compact.
+
+        Parameters
+        ----------
+        profile_name : str
+            delete target profile name.
+
+        Returns
+        -------
+        deleted_sections : list of ProfileSection
+            deleted sections.
+        """
+        deleted_sections = self.find_profile(profile_name)
+        for position in self.profile_index.pop(profile_name, []):
+            self.sections[position] = None
+        return deleted_sections
+
+    def append_profile(self, section):
+        """
+        Append a profile section to the end of config.
+
+        Parameters
+        ----------
+        section : ProfileSection
+            append target section.
+        """
+        self.profile_index.setdefault(section.name, []).append(len(self.sections))
+        self.sections.append(section)
+
+    def compact(self):
+        """
+        Remove the deleted sections and rebuild the profile index.
+
+        Returns
+        -------
+        removed_count : int
+            number of removed deleted sections.
+        """
+        sections = [section for section in self.sections if section is not None]
+        removed_count = len(self.sections) - len(sections)
+        if removed_count > 0:
+            self.sections = sections
+            self.profile_index = {}
+            for position, section in enumerate(sections):
+                if section.header is not None:
+                    self.profile_index.setdefault(section.name, []).append(position)
+        return removed_count
+
+    def register_profile(self, section):
+        """
+        Delete the same name profile and append the new one.
+
+        Parameters
+        ----------
+        section : ProfileSection
+            register target section.
+
+        Returns
+        -------
+        deleted_sections : list of ProfileSection
+            deleted sections that had the same profile name.
+        """
+        deleted_sections = self.delete_profile(section.name)
+        self.append_profile(section)
+        return deleted_sections
+
+    def profile_names(self):
+        """
+        Get registered profile names in file order.
+
+        Returns
+        -------
+        profile_names : list of str
+            profile names.
+        """
+        return [
+            section.name
+            for section in self.sections
+            if section is not None and section.header is not None
+        ]
+
+    def to_string(self):
+        """
+        Serialize config to the file format.
+
+        Sections are separated by one blank line and blank lines in sections
+        are removed, same as the register_sts_assumed_role shell function.
+
+        Returns
+        -------
+        config_string : str
+            config file string.
+        """
+        config_lines = []
+        for section in self.sections:
+            if section is None:
+                continue
+            if section.header is not None:
+                if len(config_lines) > 0:
+                    config_lines.append("")
+                config_lines.append(section.header)
+            config_lines.extend(section.lines)
+        if len(config_lines) == 0:
+            return ""
+        return "\n".join(config_lines) + "\n"
+
+
+class SectionIndex:
+    """
+    Byte offset index of the sections in AWS CLI config file.
+
+    A section starts at its header and ends at the next section header, so
+    the blank lines after a section belong to it. The name is None for the
+    lines placed before the first section.
+    """
+
+    __slots__ = ("names", "starts", "size")
+
+    def __init__(self, names, starts, size):
+        """
+        Parameters
+        ----------
+        names : list of str
+            profile name of each section in file order.
+        starts : list of int
+            start byte offset of each section.
+        size : int
+            config file size.
+        """
+        self.names = names
+        self.starts = starts
+        self.size = size
+
+    def find(self, profile_name):
+        """
+        Find the positions of a profile.
+
+        Parameters
+        ----------
+        profile_name : str
+            profile name.
+
+        Returns
+        -------
+        positions : list of int
+            section positions in file order.
+        """
+        positions = []
+        position = -1
+        while True:
+            try:
+                position = self.names.index(profile_name, position + 1)
+            except ValueError:
+                return positions
+            positions.append(position)
+
+    def span(self, start_position, end_position):
+        """
+        Get the byte offset range of continuous sections.
+
+        Parameters
+        ----------
+        start_position : int
+            first section position. (inclusive)
+        end_position : int
+            last section position. (exclusive)
+
+        Returns
+        -------
+        start : int
+            start byte offset. (inclusive)
+        end : int
+            end byte offset. (exclusive)
+        """
+        if start_position >= end_position:
+            return 0, 0
+        start = self.starts[start_position]
+        if end_position < len(self.starts):
+            return start, self.starts[end_position]
+        return start, self.size
+
+
+def parse_profile_name(header):
+    """
+    Parse profile name from section header line.
+
+    Parameters
+    ----------
+    header : str
+        section header line. (ex. "[profile sts-session]")
+
+    Returns
+    -------
+    profile_name : str
+        profile name. (ex. "sts-session")
+    """
+    name = header[1:-1].strip()
+    if name.startswith(PROFILE_SECTION_PREFIX):
+        return name[len(PROFILE_SECTION_PREFIX) :].strip()
+    return name
+
+
+def get_section_type(header):
+    """
+    Get the type of a section from its header line.
+
+    Parameters
+    ----------
+    header : str
+        section header line. (ex. "[sso-session my-sso]")
+
+    Returns
+    -------
+    section_type : str
+        "profile" for "[default]" and "[profile ...]", otherwise the type of
+        the non-profile section. (ex. "sso-session", "services")
+    """
+    name = header[1:-1].strip()
+    if name.startswith(PROFILE_SECTION_PREFIX) or len(name.split()) == 0:
+        return SECTION_TYPE_PROFILE
+    section_type = name.split()[0]
+    if section_type in NON_PROFILE_SECTION_TYPES:
+        return section_type
+    return SECTION_TYPE_PROFILE
+
+
+def is_section_header(line):
+    """
+    Whether the line is a section header.
+
+    Parameters
+    ----------
+    line : str
+        stripped config file line.
+
+    Returns
+    -------
+    is_header : bool
+        if section header True. otherwise False.
+    """
+    return line.startswith("[") and line.endswith("]")
+
+
+def parse_config(lines):
+    """
+    Parse config file lines to AwsConfig in one pass.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        config file lines.
+
+    Returns
+    -------
+    aws_config : AwsConfig
+        parsed config.
+    """
+    sections = []
+    current_section = ProfileSection(None, None, [])
+    for line in lines:
+        line = line.strip()
+        if line == "":
+            continue
+        if is_section_header(line):
+            if current_section.header is not None or len(current_section.lines) > 0:
+                sections.append(current_section)
+            current_section = ProfileSection(line, parse_profile_name(line), [])
+            continue
+        current_section.lines.append(line)
+    if current_section.header is not None or len(current_section.lines) > 0:
+        sections.append(current_section)
+    return AwsConfig(sections)
+
+
+def load_config(config_file_path):
+    """
+    Load AWS CLI config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+
+    Returns
+    -------
+    aws_config : AwsConfig
+        loaded config. empty if the file not exist.
+    """
+    if not os.path.exists(config_file_path):
+        return AwsConfig([])
+    with open(config_file_path, "r", encoding=CONFIG_FILE_ENCODING) as config_file:
+        return parse_config(config_file)
+
+
+def save_config(aws_config, config_file_path):
+    """
+    Save AWS CLI config file atomically.
+
+    The config is written to a temporary file in the same directory and
+    renamed over the original, so a crash never leaves a truncated config.
+
+    Parameters
+    ----------
+    aws_config : AwsConfig
+        save target config.
+    config_file_path : str
+        AWS CLI config file path.
+    """
+    file_util.write_file_atomically(
+        config_file_path, [aws_config.to_string().encode(CONFIG_FILE_ENCODING)]
+    )
+
+
+def get_section_index_file_path(config_file_path):
+    """
+    Get the sidecar section index file path of a config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+
+    Returns
+    -------
+    section_index_file_path : str
+        section index file path. (ex. "~/.aws/.config.index.json")
+    """
+    config_dir_path, config_file_name = os.path.split(os.path.abspath(config_file_path))
+    return os.path.join(
+        config_dir_path, "." + config_file_name + SECTION_INDEX_FILE_SUFFIX
+    )
+
+
+def get_file_signature(file_stat):
+    """
+    Get the signature to detect a config file change.
+
+    Parameters
+    ----------
+    file_stat : os.stat_result
+        config file stat.
+
+    Returns
+    -------
+    file_signature : list of int
+        inode, size and mtime of the file.
+    """
+    return [file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def scan_section_index(config_file):
+    """
+    Scan the start byte offset of every section.
+
+    Parameters
+    ----------
+    config_file : file object
+        config file opened with binary mode.
+
+    Returns
+    -------
+    section_index : SectionIndex
+        section index of the file.
+    """
+    names = []
+    starts = []
+    offset = 0
+    for line in config_file:
+        stripped_line = line.strip()
+        if stripped_line.startswith(b"[") and stripped_line.endswith(b"]"):
+            if offset > 0 and len(starts) == 0:
+                names.append(None)
+                starts.append(0)
+            names.append(parse_profile_name(stripped_line.decode(CONFIG_FILE_ENCODING)))
+            starts.append(offset)
+        offset += len(line)
+    if offset > 0 and len(starts) == 0:
+        names.append(None)
+        starts.append(0)
+    return SectionIndex(names, starts, offset)
+
+
+def save_section_index(config_file_path, section_index, signature):
+    """
+    Save the sidecar section index keyed by the signature of the scanned file.
+
+    The caller must hold the config file lock.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    section_index : SectionIndex
+        section index of the scanned config file.
+    signature : list of int
+        signature of the scanned config file from get_file_signature.
+    """
+    file_util.write_file_atomically(
+        get_section_index_file_path(config_file_path),
+        [
+            json.dumps(
+                {
+                    "signature": signature,
+                    "names": section_index.names,
+                    "starts": section_index.starts,
+                    "size": section_index.size,
+                },
+                separators=(",", ":"),
+            ).encode(CONFIG_FILE_ENCODING)
+        ],
+    )
+
+
+def load_opened_section_index(config_file_path, config_file, locked=False):
+    """
+    Load the sidecar section index of an opened config file.
+
+    The index is rebuilt from the opened file if the saved one is not of
+    it, and saved only under the config file lock. An unlocked caller
+    saves it only if the lock is free at once, so offsets of a file being
+    replaced are never saved.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    config_file : file object
+        the config file opened with binary mode at the start.
+    locked : bool
+        True if the caller holds the config file lock.
+
+    Returns
+    -------
+    section_index : SectionIndex
+        section index of the opened file.
+    """
+    signature = get_file_signature(os.fstat(config_file.fileno()))
+    try:
+        with open(
+            get_section_index_file_path(config_file_path),
+            "r",
+            encoding=CONFIG_FILE_ENCODING,
+        ) as section_index_file:
+            saved_index = json.load(section_index_file)
+        if saved_index["signature"] == signature:
+            return SectionIndex(
+                saved_index["names"], saved_index["starts"], saved_index["size"]
+            )
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    section_index = scan_section_index(config_file)
+    if locked:
+        save_section_index(config_file_path, section_index, signature)
+        return section_index
+    try:
+        with file_util.lock_file(config_file_path, 0):
+            save_section_index(config_file_path, section_index, signature)
+    except OSError:
+        pass
+    return section_index
+
+
+def load_section_index(config_file_path, locked=False):
+    """
+    Load the sidecar section index, rebuild it if the config file changed.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    locked : bool
+        True if the caller holds the config file lock.
+
+    Returns
+    -------
+    section_index : SectionIndex
+        section index. empty if the config file not exist.
+    """
+    try:
+        config_file = open(config_file_path, "rb")
+    except FileNotFoundError:
+        return SectionIndex([], [], 0)
+    with config_file:
+        return load_opened_section_index(config_file_path, config_file, locked)
+
+
+def read_profile(config_file_path, profile_name):
+    """
+    Read the sections of a profile without parsing the whole config file.
+
+    Only the byte ranges of the profile in the section index are read from
+    the same opened file the index belongs to. If the index does not match
+    the sections, the whole file is parsed.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        read target profile name.
+
+    Returns
+    -------
+    sections : list of ProfileSection
+        sections of the profile. empty if the profile not exist.
+    """
+    try:
+        config_file = open(config_file_path, "rb")
+    except FileNotFoundError:
+        return []
+    sections = []
+    with config_file:
+        section_index = load_opened_section_index(config_file_path, config_file)
+        positions = section_index.find(profile_name)
+        if len(positions) == 0:
+            return []
+        for position in positions:
+            start, end = section_index.span(position, position + 1)
+            config_file.seek(start)
+            sections.extend(
+                parse_config(
+                    config_file.read(end - start)
+                    .decode(CONFIG_FILE_ENCODING)
+                    .splitlines()
+                ).sections
+            )
+    if [section.name for section in sections] != [profile_name] * len(positions):
+        return load_config(config_file_path).find_profile(profile_name)
+    return sections
+
+
+def splice_profile(config_file_path, profile_name, section_string):
+    """
+    Replace the sections of a profile without re-parsing the config file.
+
+    The untouched byte ranges are copied from a memory map of the original
+    file and the new section is appended to the end, so the cost depends on
+    the changed section instead of the number of profiles. The caller must
+    hold the config file lock.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        replace target profile name.
+    section_string : str
+        new section string. the profile is only deleted if None.
+
+    Returns
+    -------
+    deleted_sections : list of ProfileSection
+        deleted sections that had the same profile name.
+    """
+    try:
+        config_file = open(config_file_path, "rb")
+    except FileNotFoundError:
+        return splice_opened_profile(
+            config_file_path,
+            None,
+            SectionIndex([], [], 0),
+            profile_name,
+            section_string,
+        )[0]
+    with config_file:
+        return splice_opened_profile(
+            config_file_path,
+            config_file,
+            load_opened_section_index(config_file_path, config_file, True),
+            profile_name,
+            section_string,
+        )[0]
+
+
+def splice_opened_profile(
+    config_file_path, config_file, section_index, profile_name, section_string
+):
+    """
+    Replace the sections of a profile of an opened config file.
+
+    The caller must hold the config file lock and give the section index of
+    the opened file. (ex. kept in memory by profile_daemon.py)
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    config_file : file object
+        the config file opened with binary mode. None if not exist.
+    section_index : SectionIndex
+        section index of the opened file.
+    profile_name : str
+        replace target profile name.
+    section_string : str
+        new section string. the profile is only deleted if None.
+
+    Returns
+    -------
+    deleted_sections : list of ProfileSection
+        deleted sections that had the same profile name.
+    spliced_index : SectionIndex
+        section index of the written file. None if not written.
+    signature : list of int
+        signature of the written file. None if not written.
+    """
+    deleted_positions = section_index.find(profile_name)
+    if len(deleted_positions) == 0 and section_string is None:
+        return [], None, None
+
+    names = []
+    starts = []
+    chunks = []
+    deleted_string = b""
+    config_map = None
+    config_view = memoryview(b"")
+    try:
+        if section_index.size > 0:
+            config_map = mmap.mmap(config_file.fileno(), 0, access=mmap.ACCESS_READ)
+            config_view = memoryview(config_map)
+
+        kept_position = 0
+        kept_offset = 0
+        for deleted_position in deleted_positions + [len(section_index.names)]:
+            kept_start, kept_end = section_index.span(kept_position, deleted_position)
+            if kept_end > kept_start:
+                chunks.append(config_view[kept_start:kept_end])
+                names.extend(section_index.names[kept_position:deleted_position])
+                shift = kept_offset - kept_start
+                starts.extend(
+                    [
+                        start + shift
+                        for start in section_index.starts[
+                            kept_position:deleted_position
+                        ]
+                    ]
+                )
+                kept_offset += kept_end - kept_start
+            if deleted_position < len(section_index.names):
+                deleted_start, deleted_end = section_index.span(
+                    deleted_position, deleted_position + 1
+                )
+                deleted_string += config_view[deleted_start:deleted_end]
+            kept_position = deleted_position + 1
+
+        if section_string is not None:
+            tail = bytes(chunks[-1][-2:]) if len(chunks) > 0 else b""
+            if tail == b"" or tail.endswith(b"\n\n"):
+                separator = b""
+            elif tail.endswith(b"\n"):
+                separator = b"\n"
+            else:
+                separator = b"\n\n"
+            section_bytes = separator + section_string.encode(CONFIG_FILE_ENCODING)
+            names.append(profile_name)
+            starts.append(kept_offset + len(separator))
+            kept_offset += len(section_bytes)
+            chunks.append(section_bytes)
+
+        config_file_stat = file_util.write_file_atomically(config_file_path, chunks)
+    finally:
+        for chunk in chunks:
+            if isinstance(chunk, memoryview):
+                chunk.release()
+        config_view.release()
+        if config_map is not None:
+            config_map.close()
+
+    spliced_index = SectionIndex(names, starts, kept_offset)
+    signature = get_file_signature(config_file_stat)
+    save_section_index(config_file_path, spliced_index, signature)
+    return (
+        parse_config(deleted_string.decode(CONFIG_FILE_ENCODING).splitlines()).sections,
+        spliced_index,
+        signature,
+    )
+
+
+def make_profile_header(profile_name):
+    """
+    Make the section header line of a profile.
+
+    Parameters
+    ----------
+    profile_name : str
+        profile name.
+
+    Returns
+    -------
+    header : str
+        section header line. (ex. "[profile sts-session]", "[default]")
+    """
+    if profile_name == DEFAULT_PROFILE_NAME:
+        return "[" + DEFAULT_PROFILE_NAME + "]"
+    return "[" + PROFILE_SECTION_PREFIX + profile_name + "]"
+
+
+def generate_profile_section(
+    profile_name,
+    role_arn,
+    source_profile,
+    region,
+    output,
+    mfa_serial,
+    credential_cache_dir_path=None,
+):
+    """
+    Generate assumed role profile section.
+
+    With the credential cache directory, the role is written as a
+    credential_process of credential_cache.py instead of role_arn, because
+    the AWS CLI prefers role_arn to credential_process.
+
+    Parameters
+    ----------
+    profile_name : str
+        register profile name.
+    role_arn : str
+        assumed role arn.
+    source_profile : str
+        source profile name.
+    region : str
+        region name.
+    output : str
+        output format.
+    mfa_serial : str
+        mfa serial arn. not written if None or empty.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if None or
+        empty.
+
+    Returns
+    -------
+    section : ProfileSection
+        generated profile section.
+    """
+    header = make_profile_header(profile_name)
+    if credential_cache_dir_path:
+        import credential_cache
+
+        lines = [
+            "credential_process = "
+            + credential_cache.make_credential_process(
+                credential_cache_dir_path,
+                profile_name,
+                role_arn,
+                source_profile,
+                mfa_serial,
+            )
+        ]
+    else:
+        lines = ["role_arn = " + role_arn, "source_profile = " + source_profile]
+        if mfa_serial:
+            lines.append("mfa_serial = " + mfa_serial)
+    lines.append("region = " + region)
+    lines.append("output = " + output)
+    return ProfileSection(header, profile_name, lines)
+
+
+def register_assumed_role(
+    config_file_path,
+    profile_name,
+    role_arn,
+    source_profile,
+    region,
+    output,
+    mfa_serial,
+    backup_dir_path=None,
+    credential_cache_dir_path=None,
+    recorder=None,
+    config_store=None,
+):
+    """
+    Register assumed role profile to AWS CLI config file.
+
+    The config file is backed up and rewritten under the config file lock.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        register profile name.
+    role_arn : str
+        assumed role arn.
+    source_profile : str
+        source profile name.
+    region : str
+        region name.
+    output : str
+        output format.
+    mfa_serial : str
+        mfa serial arn.
+    backup_dir_path : str
+        backup store directory path. not backed up if None.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if None.
+    recorder : metrics.SpanRecorder
+        records the backup_config and rewrite_config spans. not recorded
+        if None.
+    config_store : profile_daemon.ConfigCache
+        resident config cache splicing the profile. the config file is
+        read if None.
+
+    Returns
+    -------
+    deleted_sections : list of ProfileSection
+        deleted sections that had the same profile name.
+    """
+    recorder = recorder or metrics.SpanRecorder("register")
+    splice = splice_profile if config_store is None else config_store.splice_profile
+    section_string = generate_profile_section(
+        profile_name,
+        role_arn,
+        source_profile,
+        region,
+        output,
+        mfa_serial,
+        credential_cache_dir_path,
+    ).to_string()
+    with file_util.lock_file(config_file_path):
+        if backup_dir_path is not None:
+            with recorder.span("backup_config") as span:
+                snapshot = backup_store.save_snapshot(
+                    backup_dir_path, config_file_path, datetime.datetime.now()
+                )
+                if snapshot is not None:
+                    span.read_bytes = snapshot.size
+                    span.written_bytes = snapshot.stored_size
+        with recorder.span("rewrite_config") as span:
+            span.read_bytes = metrics.get_file_size(config_file_path)
+            deleted_sections = splice(config_file_path, profile_name, section_string)
+            span.written_bytes = metrics.get_file_size(config_file_path)
+        return deleted_sections
+
+
+def delete_assumed_role(config_file_path, profile_name, config_store=None):
+    """
+    Delete profile from AWS CLI config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        delete target profile name.
+    config_store : profile_daemon.ConfigCache
+        resident config cache splicing the profile. the config file is
+        read if None.
+
+    Returns
+    -------
+    deleted_sections : list of ProfileSection
+        deleted sections.
+    """
+    splice = splice_profile if config_store is None else config_store.splice_profile
+    with file_util.lock_file(config_file_path):
+        return splice(config_file_path, profile_name, None)
+
+
+def load_manifest(manifest_file_path, default_region, default_output):
+    """
+    Load assumed role registration requests from YAML or CSV manifest.
+
+    YAML manifest is a list of mappings (or a mapping with "profiles" list),
+    CSV manifest has a header row. Both use the keys profile, role_arn,
+    source_profile, mfa_serial, region, output and comment.
+
+    Parameters
+    ----------
+    manifest_file_path : str
+        manifest file path.
+    default_region : str
+        region name used when a row has no region.
+    default_output : str
+        output format used when a row has no output.
+
+    Returns
+    -------
+    assumed_roles : list of AssumedRoleVO
+        registration requests in manifest order.
+
+    Raises
+    ------
+    ValueError
+        if a row lacks a required field.
+    """
+    with open(manifest_file_path, "r", encoding=CONFIG_FILE_ENCODING) as manifest_file:
+        if manifest_file_path.endswith(MANIFEST_YAML_EXTENSIONS):
+            import yaml
+
+            rows = yaml.load(manifest_file, Loader=yaml.SafeLoader) or []
+            if isinstance(rows, dict):
+                rows = rows.get("profiles") or []
+        else:
+            rows = list(csv.DictReader(manifest_file))
+
+    return [
+        make_assumed_role(row, row_number, default_region, default_output)
+        for row_number, row in enumerate(rows, start=1)
+    ]
+
+
+def make_assumed_role(row, row_number, default_region, default_output):
+    """
+    Make an assumed role registration request from a manifest row.
+
+    Parameters
+    ----------
+    row : dict
+        manifest row with the keys profile, role_arn, source_profile,
+        mfa_serial, region, output and comment.
+    row_number : int
+        row number for the error message.
+    default_region : str
+        region name used when the row has no region.
+    default_output : str
+        output format used when the row has no output.
+
+    Returns
+    -------
+    assumed_role : AssumedRoleVO
+        registration request.
+
+    Raises
+    ------
+    ValueError
+        if the row is not a mapping or lacks a required field.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("manifest row " + str(row_number) + " is not a mapping.")
+    row = {
+        key.strip(): str(value).strip()
+        for key, value in row.items()
+        if key is not None and value is not None
+    }
+    for field in MANIFEST_REQUIRED_FIELDS:
+        if not row.get(field):
+            raise ValueError(
+                "manifest row " + str(row_number) + " has no " + field + "."
+            )
+    return AssumedRoleVO(
+        row["profile"],
+        row["role_arn"],
+        row["source_profile"],
+        row.get("mfa_serial", ""),
+        row.get("region") or default_region,
+        row.get("output") or default_output,
+        row.get("comment", ""),
+    )
+
+
+def register_assumed_roles(
+    config_file_path,
+    change_log_file_path,
+    backup_dir_path,
+    assumed_roles,
+    now,
+    rotation_policy=None,
+    credential_cache_dir_path=None,
+    recorder=None,
+):
+    """
+    Register many assumed role profiles in one pass.
+
+    The config file is read once, backed up once and written once under the
+    config file lock, and the change log entries of all profiles are
+    appended with one write.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    backup_dir_path : str
+        backup store directory path.
+    assumed_roles : list of AssumedRoleVO
+        registration requests.
+    now : datetime.datetime
+        current datetime.
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. not rotated if None.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if None.
+    recorder : metrics.SpanRecorder
+        records the load_config, backup_config, rewrite_config and
+        append_change_log spans. not recorded if None.
+
+    Returns
+    -------
+    snapshot : backup_store.SnapshotVO
+        config file backup. None if the config file not exist.
+    """
+    recorder = recorder or metrics.SpanRecorder("register-batch")
+    change_log_events = []
+    with file_util.lock_file(config_file_path):
+        with recorder.span("load_config") as span:
+            span.read_bytes = metrics.get_file_size(config_file_path)
+            aws_config = load_config(config_file_path)
+        for assumed_role in assumed_roles:
+            deleted_sections = aws_config.register_profile(
+                generate_profile_section(
+                    assumed_role.profile_name,
+                    assumed_role.role_arn,
+                    assumed_role.source_profile,
+                    assumed_role.region,
+                    assumed_role.output,
+                    assumed_role.mfa_serial,
+                    credential_cache_dir_path,
+                )
+            )
+            change_log_events.extend(make_delete_events(deleted_sections, now))
+            change_log_events.append(
+                change_log.make_register_event(
+                    assumed_role.profile_name,
+                    assumed_role.role_arn,
+                    assumed_role.source_profile,
+                    assumed_role.mfa_serial,
+                    assumed_role.comment,
+                    now,
+                )
+            )
+
+        with recorder.span("backup_config") as span:
+            snapshot = backup_store.save_snapshot(
+                backup_dir_path, config_file_path, now
+            )
+            if snapshot is not None:
+                span.read_bytes = snapshot.size
+                span.written_bytes = snapshot.stored_size
+        with recorder.span("rewrite_config") as span:
+            save_config(aws_config, config_file_path)
+            span.written_bytes = metrics.get_file_size(config_file_path)
+    with recorder.span("append_change_log") as span:
+        span.written_bytes = change_log.append_events(
+            change_log_file_path, change_log_events, rotation_policy
+        )
+    return snapshot
+
+
+def register_assumed_role_stream(
+    config_file_path,
+    change_log_file_path,
+    backup_dir_path,
+    lines,
+    default_region,
+    default_output,
+    rotation_policy=None,
+    credential_cache_dir_path=None,
+    recorder=None,
+):
+    """
+    Register assumed role profiles from NDJSON lines as they arrive.
+
+    Each line is a JSON object with the manifest keys. A profile is written
+    and logged before the next line is read, so a long running pipeline
+    sees every registration at once. The config file is backed up only
+    before the first registration.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    backup_dir_path : str
+        backup store directory path.
+    lines : iterable of str
+        NDJSON lines. blank lines are skipped.
+    default_region : str
+        region name used when a line has no region.
+    default_output : str
+        output format used when a line has no output.
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. not rotated if None.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if None.
+    recorder : metrics.SpanRecorder
+        records the spans of each registration. not recorded if None.
+
+    Yields
+    ------
+    result : dict
+        "line" number, "profile" and "status" ("registered" or "failed")
+        with "error" message if failed.
+    """
+    recorder = recorder or metrics.SpanRecorder("register-stream")
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip() == "":
+            continue
+        try:
+            assumed_role = make_assumed_role(
+                json.loads(line), line_number, default_region, default_output
+            )
+        except ValueError as error:
+            yield {
+                "line": line_number,
+                "profile": None,
+                "status": "failed",
+                "error": str(error),
+            }
+            continue
+
+        now = datetime.datetime.now()
+        deleted_sections = register_assumed_role(
+            config_file_path,
+            assumed_role.profile_name,
+            assumed_role.role_arn,
+            assumed_role.source_profile,
+            assumed_role.region,
+            assumed_role.output,
+            assumed_role.mfa_serial,
+            backup_dir_path,
+            credential_cache_dir_path,
+            recorder,
+        )
+        backup_dir_path = None
+        with recorder.span("append_change_log") as span:
+            span.written_bytes = change_log.append_events(
+                change_log_file_path,
+                make_delete_events(deleted_sections, now)
+                + [
+                    change_log.make_register_event(
+                        assumed_role.profile_name,
+                        assumed_role.role_arn,
+                        assumed_role.source_profile,
+                        assumed_role.mfa_serial,
+                        assumed_role.comment,
+                        now,
+                    )
+                ],
+                rotation_policy,
+            )
+        yield {
+            "line": line_number,
+            "profile": assumed_role.profile_name,
+            "status": "registered",
+        }
+
+
+def get_switch_profile_name(role_arn):
+    """
+    Get the permanent profile name of a role for role-switch mode.
+
+    Parameters
+    ----------
+    role_arn : str
+        assumed role arn. (ex. "arn:aws:iam::123456789012:role/path/dev")
+
+    Returns
+    -------
+    profile_name : str
+        "<account id>-<role name>". (ex. "123456789012-dev")
+        None if the arn is not an IAM role arn.
+    """
+    match = ROLE_ARN_PATTERN.match(role_arn)
+    if match is None:
+        return None
+    return match.group(1) + "-" + match.group(2)
+
+
+def get_section_role_arn(section):
+    """
+    Get the role arn of a profile section.
+
+    Parameters
+    ----------
+    section : ProfileSection
+        profile section.
+
+    Returns
+    -------
+    role_arn : str
+        role_arn, or the role arn of a credential cache credential_process.
+        None if the section has neither.
+    """
+    role_arn = section.get("role_arn")
+    credential_process = section.get("credential_process")
+    if role_arn is None and credential_process is not None:
+        import credential_cache
+
+        cached_profile = credential_cache.parse_credential_process(
+            section.name, credential_process
+        )
+        if cached_profile is not None:
+            role_arn = cached_profile.role_arn
+    return role_arn
+
+
+def get_section_source_profiles(section):
+    """
+    Get the profile names a profile section gets its credentials from.
+
+    Parameters
+    ----------
+    section : ProfileSection
+        profile section.
+
+    Returns
+    -------
+    source_profiles : list of str
+        source_profile, and the source profile of a credential cache
+        credential_process.
+    """
+    source_profiles = []
+    if section.get("source_profile") is not None:
+        source_profiles.append(section.get("source_profile"))
+    credential_process = section.get("credential_process")
+    if credential_process is not None:
+        import credential_cache
+
+        cached_profile = credential_cache.parse_credential_process(
+            section.name, credential_process
+        )
+        if cached_profile is not None and cached_profile.source_profile:
+            source_profiles.append(cached_profile.source_profile)
+    return source_profiles
+
+
+def get_section_mfa_serial(section):
+    """
+    Get the mfa serial of a profile section.
+
+    Parameters
+    ----------
+    section : ProfileSection
+        profile section.
+
+    Returns
+    -------
+    mfa_serial : str
+        mfa_serial, or the mfa serial of a credential cache credential_process.
+        None if the section has neither.
+    """
+    mfa_serial = section.get("mfa_serial")
+    credential_process = section.get("credential_process")
+    if mfa_serial is None and credential_process is not None:
+        import credential_cache
+
+        cached_profile = credential_cache.parse_credential_process(
+            section.name, credential_process
+        )
+        if cached_profile is not None and cached_profile.mfa_serial:
+            mfa_serial = cached_profile.mfa_serial
+    return mfa_serial
+
+
+def switch_assumed_role(
+    config_file_path,
+    change_log_file_path,
+    target,
+    profile_name,
+    source_profile,
+    region,
+    output,
+    mfa_serial,
+    comment,
+    now,
+    backup_dir_path=None,
+    rotation_policy=None,
+    credential_cache_dir_path=None,
+    recorder=None,
+    config_store=None,
+):
+    """
+    Switch to the permanent profile of a role.
+
+    A registered profile is only looked up and a SWITCHED event is
+    appended, so the config file is not rewritten or backed up. The
+    profile is registered only the first time a role is switched to.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    target : str
+        role arn, or a registered profile name.
+    profile_name : str
+        alias profile name of a role arn. named from the arn if empty.
+    source_profile : str
+        source profile name. required only to register the profile.
+    region : str
+        region name used to register the profile.
+    output : str
+        output format used to register the profile.
+    mfa_serial : str
+        mfa serial arn used to register the profile.
+    comment : str
+        registered comment.
+    now : datetime.datetime
+        current datetime.
+    backup_dir_path : str
+        backup store directory path. not backed up if None.
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. not rotated if None.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if None.
+    recorder : metrics.SpanRecorder
+        records the find_profile, registration and append_change_log
+        spans. not recorded if None.
+    config_store : profile_daemon.ConfigCache
+        resident config cache reading and splicing the profile. the config
+        file is read if None.
+
+    Returns
+    -------
+    profile_name : str
+        switched profile name.
+    is_registered : bool
+        True if the profile was registered by this switch.
+    """
+    recorder = recorder or metrics.SpanRecorder("switch")
+    role_arn = target if target.startswith("arn:") else None
+    if role_arn is None:
+        profile_name = target
+    elif not profile_name:
+        profile_name = get_switch_profile_name(role_arn)
+        if profile_name is None:
+            raise ValueError(
+                role_arn
+                + " is not an IAM role arn. give the profile name with --profile."
+            )
+
+    with recorder.span("find_profile") as span:
+        if config_store is None:
+            sections = read_profile(config_file_path, profile_name)
+        else:
+            sections = config_store.read_profile(config_file_path, profile_name)
+        span.read_bytes = sum(len(section.to_string()) for section in sections)
+    if len(sections) > 0:
+        registered_role_arn = get_section_role_arn(sections[-1])
+        if role_arn is not None and registered_role_arn != role_arn:
+            raise ValueError(
+                "profile "
+                + profile_name
+                + " is registered with another role. "
+                + str(registered_role_arn)
+            )
+        with recorder.span("append_change_log") as span:
+            span.written_bytes = change_log.append_events(
+                change_log_file_path,
+                [change_log.make_switch_event(profile_name, registered_role_arn, now)],
+                rotation_policy,
+            )
+        return profile_name, False
+
+    if role_arn is None:
+        raise ValueError(
+            "profile "
+            + profile_name
+            + " is not registered. give the role arn to register it."
+        )
+    if not source_profile:
+        raise ValueError(
+            "--source-profile is required to register " + profile_name + "."
+        )
+    deleted_sections = register_assumed_role(
+        config_file_path,
+        profile_name,
+        role_arn,
+        source_profile,
+        region,
+        output,
+        mfa_serial,
+        backup_dir_path,
+        credential_cache_dir_path,
+        recorder,
+        config_store,
+    )
+    with recorder.span("append_change_log") as span:
+        span.written_bytes = change_log.append_events(
+            change_log_file_path,
+            make_delete_events(deleted_sections, now)
+            + [
+                change_log.make_register_event(
+                    profile_name, role_arn, source_profile, mfa_serial, comment, now
+                ),
+                change_log.make_switch_event(profile_name, role_arn, now),
+            ],
+            rotation_policy,
+        )
+    return profile_name, True
+
+
+def find_stale_profiles(config, change_log_events, expire_before):
+    """
+    Find registered profiles not registered or used since a time.
+
+    Only profiles registered by this tool and still in the config are
+    candidates. The last change log event of a profile other than DELETED
+    is its last activity, and a DELETED event forgets the profile until it
+    is registered again. A stale profile a kept profile gets its credentials
+    from, directly or through other profiles, is kept.
+
+    Parameters
+    ----------
+    config : AwsConfig
+        parsed config.
+    change_log_events : iterable of dict
+        change log events in written order.
+    expire_before : datetime.datetime
+        aware datetime. profiles last active before this are stale.
+
+    Returns
+    -------
+    stale_profiles : list of tuple of (str, str)
+        profile name and last activity time in config file order.
+    """
+    last_active_times = {}
+    for change_log_event in change_log_events:
+        if change_log_event["event"] == change_log.EVENT_DELETED:
+            last_active_times.pop(change_log_event["profile"], None)
+        else:
+            last_active_times[change_log_event["profile"]] = change_log_event["time"]
+
+    stale_profile_names = set(
+        profile_name
+        for profile_name, last_active_time in last_active_times.items()
+        if profile_name in config.profile_index
+        and datetime.datetime.fromisoformat(last_active_time) < expire_before
+    )
+    source_profiles = {}
+    for section in config.sections:
+        if section is None or section.header is None:
+            continue
+        source_profiles.setdefault(section.name, []).extend(
+            get_section_source_profiles(section)
+        )
+    # keep every profile reachable from a kept profile before deleting any.
+    pending_profile_names = [
+        profile_name
+        for profile_name in source_profiles
+        if profile_name not in stale_profile_names
+    ]
+    while len(pending_profile_names) > 0:
+        for source_profile in source_profiles.get(pending_profile_names.pop(), []):
+            if source_profile in stale_profile_names:
+                stale_profile_names.discard(source_profile)
+                pending_profile_names.append(source_profile)
+
+    stale_profiles = []
+    for profile_name in config.profile_names():
+        if profile_name in stale_profile_names:
+            stale_profiles.append((profile_name, last_active_times[profile_name]))
+            stale_profile_names.discard(profile_name)
+    return stale_profiles
+
+
+def delete_stale_profiles(
+    config_file_path,
+    change_log_file_path,
+    backup_dir_path,
+    expire_before,
+    now,
+    dry_run=False,
+    rotation_policy=None,
+):
+    """
+    Delete stale registered profiles in one config file rewrite.
+
+    The change log is read and the config file is backed up and written
+    once under the config file lock, and the DELETED entries of all
+    profiles are appended with one write.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    backup_dir_path : str
+        backup store directory path.
+    expire_before : datetime.datetime
+        aware datetime. profiles last active before this are deleted.
+    now : datetime.datetime
+        current datetime.
+    dry_run : bool
+        if True only find the stale profiles.
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. not rotated if None.
+
+    Returns
+    -------
+    stale_profiles : list of tuple of (str, str)
+        deleted (or to be deleted) profile name and last activity time.
+    """
+    with file_util.lock_file(config_file_path):
+        config = load_config(config_file_path)
+        stale_profiles = find_stale_profiles(
+            config, change_log.read_events(change_log_file_path), expire_before
+        )
+        if dry_run or len(stale_profiles) == 0:
+            return stale_profiles
+
+        deleted_sections = []
+        for profile_name, _ in stale_profiles:
+            deleted_sections.extend(config.delete_profile(profile_name))
+        backup_store.save_snapshot(backup_dir_path, config_file_path, now)
+        save_config(config, config_file_path)
+    change_log.append_events(
+        change_log_file_path, make_delete_events(deleted_sections, now), rotation_policy
+    )
+    return stale_profiles
+
+
+def make_delete_events(deleted_sections, now):
+    """
+    Make DELETED change log events of deleted sections.
+
+    Parameters
+    ----------
+    deleted_sections : list of ProfileSection
+        deleted sections.
+    now : datetime.datetime
+        deleted datetime.
+
+    Returns
+    -------
+    change_log_events : list of dict
+        change log events.
+    """
+    return [
+        change_log.make_delete_event(
+            section.name,
+            get_section_role_arn(section),
+            (get_section_source_profiles(section) or [None])[0],
+            get_section_mfa_serial(section),
+            now,
+        )
+        for section in deleted_sections
+        if section.header is not None
+    ]
+
+
+def print_sections(sections):
+    """
+    Print section lines for the shell function.
+
+    Parameters
+    ----------
+    sections : list of ProfileSection
+        print target sections.
+    """
+    for section in sections:
+        print(section.header)
+        for line in section.lines:
+            print(line)
+
+
+def add_rotation_arguments(parser):
+    """
+    Add change log rotation policy arguments.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        sub command parser.
+    """
+    parser.add_argument("--change-log-max-size", type=int, default=0)
+    parser.add_argument("--change-log-max-archives", type=int, default=0)
+    parser.add_argument(
+        "--change-log-compress", choices=("true", "false"), default="false"
+    )
+
+
+def add_metrics_arguments(parser):
+    """
+    Add metrics export arguments.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        sub command parser.
+    """
+    parser.add_argument("--metrics-log-file", default="")
+    parser.add_argument("--metrics-textfile-dir", default="")
+
+
+def export_metrics(arguments, recorder):
+    """
+    Export the spans and the profile count of a command run.
+
+    Parameters
+    ----------
+    arguments : argparse.Namespace
+        parsed arguments.
+    recorder : metrics.SpanRecorder
+        recorded spans of the run.
+    """
+    log_file_path = getattr(arguments, "metrics_log_file", "")
+    textfile_dir_path = getattr(arguments, "metrics_textfile_dir", "")
+    if not log_file_path and not textfile_dir_path:
+        return
+    recorder.set_gauge("profiles", len(load_section_index(arguments.config_file).names))
+    error = metrics.export(recorder, log_file_path, textfile_dir_path)
+    if error is not None:
+        print("metrics export error. " + str(error), file=sys.stderr)
+
+
+def get_rotation_policy(arguments):
+    """
+    Get change log rotation policy from parsed arguments.
+
+    Parameters
+    ----------
+    arguments : argparse.Namespace
+        parsed arguments.
+
+    Returns
+    -------
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. None if max size is not set.
+    """
+    if arguments.change_log_max_size <= 0:
+        return None
+    return change_log.RotationPolicyVO(
+        arguments.change_log_max_size,
+        arguments.change_log_max_archives,
+        arguments.change_log_compress == "true",
+    )
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="AWS CLI config file engine.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    register_parser = subparsers.add_parser("register")
+    register_parser.add_argument("--config-file", required=True)
+    register_parser.add_argument("--profile", required=True)
+    register_parser.add_argument("--role-arn", required=True)
+    register_parser.add_argument("--source-profile", required=True)
+    register_parser.add_argument("--region", required=True)
+    register_parser.add_argument("--output", required=True)
+    register_parser.add_argument("--mfa-serial", default="")
+    register_parser.add_argument("--comment", default="")
+    register_parser.add_argument("--change-log-file", required=True)
+    register_parser.add_argument("--backup-dir", required=True)
+    register_parser.add_argument("--credential-cache-dir", default="")
+    add_rotation_arguments(register_parser)
+    add_metrics_arguments(register_parser)
+
+    delete_parser = subparsers.add_parser("delete")
+    delete_parser.add_argument("--config-file", required=True)
+    delete_parser.add_argument("--profile", required=True)
+    delete_parser.add_argument("--change-log-file")
+    add_rotation_arguments(delete_parser)
+
+    register_batch_parser = subparsers.add_parser("register-batch")
+    register_batch_parser.add_argument("--config-file", required=True)
+    register_batch_parser.add_argument("--change-log-file", required=True)
+    register_batch_parser.add_argument("--backup-dir", required=True)
+    register_batch_parser.add_argument("--manifest", required=True)
+    register_batch_parser.add_argument("--region", required=True)
+    register_batch_parser.add_argument("--output", required=True)
+    register_batch_parser.add_argument("--credential-cache-dir", default="")
+    add_rotation_arguments(register_batch_parser)
+    add_metrics_arguments(register_batch_parser)
+
+    register_stream_parser = subparsers.add_parser("register-stream")
+    register_stream_parser.add_argument("--config-file", required=True)
+    register_stream_parser.add_argument("--change-log-file", required=True)
+    register_stream_parser.add_argument("--backup-dir", required=True)
+    register_stream_parser.add_argument("--region", required=True)
+    register_stream_parser.add_argument("--output", required=True)
+    register_stream_parser.add_argument("--credential-cache-dir", default="")
+    add_rotation_arguments(register_stream_parser)
+    add_metrics_arguments(register_stream_parser)
+
+    switch_parser = subparsers.add_parser("switch")
+    switch_parser.add_argument("--config-file", required=True)
+    switch_parser.add_argument("--target", required=True)
+    switch_parser.add_argument("--profile", default="")
+    switch_parser.add_argument("--source-profile", default="")
+    switch_parser.add_argument("--region", required=True)
+    switch_parser.add_argument("--output", required=True)
+    switch_parser.add_argument("--mfa-serial", default="")
+    switch_parser.add_argument("--comment", default="")
+    switch_parser.add_argument("--change-log-file", required=True)
+    switch_parser.add_argument("--backup-dir", required=True)
+    switch_parser.add_argument("--credential-cache-dir", default="")
+    add_rotation_arguments(switch_parser)
+    add_metrics_arguments(switch_parser)
+
+    gc_parser = subparsers.add_parser("gc")
+    gc_parser.add_argument("--config-file", required=True)
+    gc_parser.add_argument("--change-log-file", required=True)
+    gc_parser.add_argument("--backup-dir", required=True)
+    gc_parser.add_argument("--ttl-days", type=float, required=True)
+    gc_parser.add_argument("--dry-run", action="store_true")
+    add_rotation_arguments(gc_parser)
+
+    list_parser = subparsers.add_parser("list")
+    list_parser.add_argument("--config-file", required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv, config_store=None):
+    """
+    Execute AWS CLI config file engine command.
+
+    register and delete write the change log with one append.
+    delete prints the deleted sections.
+    register-batch registers all profiles of a manifest.
+    register-stream registers NDJSON lines of stdin one by one and prints
+    a JSON result line for each.
+    switch prints the permanent profile name of --target, and registers
+    it only if it is not registered yet.
+    gc deletes the profiles not registered or used in --ttl-days and
+    prints them. (only prints them with --dry-run)
+    list prints the registered profile names.
+    The register commands export the stage spans and the profile count to
+    --metrics-log-file and --metrics-textfile-dir if given.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+    config_store : profile_daemon.ConfigCache
+        resident config cache serving register, delete, switch and list.
+        the config file is read if None.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    recorder = metrics.SpanRecorder(arguments.command)
+    try:
+        exit_status = execute_command(arguments, recorder, config_store)
+    except file_util.LockTimeoutError as error:
+        print("file is locked by another process. " + str(error), file=sys.stderr)
+        exit_status = 1
+    export_metrics(arguments, recorder)
+    return exit_status
+
+
+def execute_command(arguments, recorder=None, config_store=None):
+    """
+    Execute a parsed AWS CLI config file engine command.
+
+    Parameters
+    ----------
+    arguments : argparse.Namespace
+        parsed arguments.
+    recorder : metrics.SpanRecorder
+        records the stage spans of the register commands. not recorded if
+        None.
+    config_store : profile_daemon.ConfigCache
+        resident config cache serving register, delete, switch and list.
+        the config file is read if None.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    recorder = recorder or metrics.SpanRecorder(arguments.command)
+    if arguments.command == "register":
+        now = datetime.datetime.now()
+        deleted_sections = register_assumed_role(
+            arguments.config_file,
+            arguments.profile,
+            arguments.role_arn,
+            arguments.source_profile,
+            arguments.region,
+            arguments.output,
+            arguments.mfa_serial,
+            arguments.backup_dir,
+            arguments.credential_cache_dir or None,
+            recorder,
+            config_store,
+        )
+        with recorder.span("append_change_log") as span:
+            span.written_bytes = change_log.append_events(
+                arguments.change_log_file,
+                make_delete_events(deleted_sections, now)
+                + [
+                    change_log.make_register_event(
+                        arguments.profile,
+                        arguments.role_arn,
+                        arguments.source_profile,
+                        arguments.mfa_serial,
+                        arguments.comment,
+                        now,
+                    )
+                ],
+                get_rotation_policy(arguments),
+            )
+        recorder.set_gauge("registered_profiles", 1)
+    elif arguments.command == "delete":
+        deleted_sections = delete_assumed_role(
+            arguments.config_file, arguments.profile, config_store
+        )
+        if arguments.change_log_file:
+            change_log.append_events(
+                arguments.change_log_file,
+                make_delete_events(deleted_sections, datetime.datetime.now()),
+                get_rotation_policy(arguments),
+            )
+        print_sections(deleted_sections)
+    elif arguments.command == "register-batch":
+        try:
+            with recorder.span("load_manifest") as span:
+                span.read_bytes = metrics.get_file_size(arguments.manifest)
+                assumed_roles = load_manifest(
+                    arguments.manifest, arguments.region, arguments.output
+                )
+        except (OSError, ValueError) as error:
+            print("manifest load error. " + str(error), file=sys.stderr)
+            return 1
+        register_assumed_roles(
+            arguments.config_file,
+            arguments.change_log_file,
+            arguments.backup_dir,
+            assumed_roles,
+            datetime.datetime.now(),
+            get_rotation_policy(arguments),
+            arguments.credential_cache_dir or None,
+            recorder,
+        )
+        recorder.set_gauge("registered_profiles", len(assumed_roles))
+        print("registered " + str(len(assumed_roles)) + " profiles.")
+    elif arguments.command == "register-stream":
+        exit_status = 0
+        registered_count = 0
+        for result in register_assumed_role_stream(
+            arguments.config_file,
+            arguments.change_log_file,
+            arguments.backup_dir,
+            sys.stdin,
+            arguments.region,
+            arguments.output,
+            get_rotation_policy(arguments),
+            arguments.credential_cache_dir or None,
+            recorder,
+        ):
+            if result["status"] == "registered":
+                registered_count += 1
+            else:
+                exit_status = 1
+            print(json.dumps(result), flush=True)
+        recorder.set_gauge("registered_profiles", registered_count)
+        return exit_status
+    elif arguments.command == "switch":
+        try:
+            profile_name, is_registered = switch_assumed_role(
+                arguments.config_file,
+                arguments.change_log_file,
+                arguments.target,
+                arguments.profile,
+                arguments.source_profile,
+                arguments.region,
+                arguments.output,
+                arguments.mfa_serial,
+                arguments.comment,
+                datetime.datetime.now(),
+                arguments.backup_dir,
+                get_rotation_policy(arguments),
+                arguments.credential_cache_dir or None,
+                recorder,
+                config_store,
+            )
+        except ValueError as error:
+            print("switch error. " + str(error), file=sys.stderr)
+            return 1
+        recorder.set_gauge("registered_profiles", 1 if is_registered else 0)
+        print(profile_name)
+    elif arguments.command == "gc":
+        now = datetime.datetime.now().astimezone()
+        stale_profiles = delete_stale_profiles(
+            arguments.config_file,
+            arguments.change_log_file,
+            arguments.backup_dir,
+            now - datetime.timedelta(days=arguments.ttl_days),
+            now,
+            arguments.dry_run,
+            get_rotation_policy(arguments),
+        )
+        for profile_name, last_active_time in stale_profiles:
+            print(profile_name + "\t" + last_active_time)
+        print(
+            str(len(stale_profiles))
+            + " profiles "
+            + ("are stale." if arguments.dry_run else "deleted.")
+        )
+    elif arguments.command == "list":
+        if config_store is None:
+            config = load_config(arguments.config_file)
+        else:
+            config = config_store.get(arguments.config_file)
+        for profile_name in config.profile_names():
+            print(profile_name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,547 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import sys
+import file_util
+
+## const value
+OBJECTS_DIR_NAME = "objects"
+SNAPSHOT_INDEX_FILE_NAME = "snapshots.json"
+COMPRESSED_OBJECT_SUFFIX = ".gz"
+INDEX_FILE_ENCODING = "utf-8"
+DEFAULT_COMPRESS = True
+DEFAULT_MAX_COUNT = 100
+DEFAULT_MAX_AGE_DAYS = 90
+DEFAULT_MAX_TOTAL_SIZE = 100 * 1024 * 1024
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class BackupPolicyVO:
+    """
+    Backup store compression and retention policy.
+
+    A retention limit is disabled when it is 0 or None.
+    """
+
+    __slots__ = ("compress", "max_count", "max_age_days", "max_total_size")
+
+    def __init__(self, compress, max_count, max_age_days, max_total_size):
+        """
+        Parameters
+        ----------
+        compress : bool
+            if True store contents with gzip.
+        max_count : int
+            max number of snapshots kept for each backup target file.
+        max_age_days : int
+            snapshots older than this days are evicted.
+        max_total_size : int
+            max total bytes of the stored contents.
+        """
+        self.compress = compress
+        self.max_count = max_count
+        self.max_age_days = max_age_days
+        self.max_total_size = max_total_size
+
+    def to_dict(self):
+        """
+        Convert to dict for the snapshot index file.
+
+        Returns
+        -------
+        policy : dict
+            policy values.
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class SnapshotVO:
+    """
+    One backup of a file at a point in time.
+    """
+
+    __slots__ = (
+        "file_path",
+        "created_at",
+        "digest",
+        "size",
+        "stored_size",
+        "compressed",
+    )
+
+    def __init__(self, file_path, created_at, digest, size, stored_size, compressed):
+        """
+        Parameters
+        ----------
+        file_path : str
+            absolute path of the backup target file.
+        created_at : float
+            backup unix time.
+        digest : str
+            sha256 hex digest of the file contents.
+        size : int
+            file size.
+        stored_size : int
+            size of the stored object.
+        compressed : bool
+            if True the stored object is gzip compressed.
+        """
+        self.file_path = file_path
+        self.created_at = created_at
+        self.digest = digest
+        self.size = size
+        self.stored_size = stored_size
+        self.compressed = compressed
+
+    def to_dict(self):
+        """
+        Convert to dict for the snapshot index file.
+
+        Returns
+        -------
+        snapshot : dict
+            snapshot values.
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def default_policy():
+    """
+    Get the default backup policy.
+
+    Returns
+    -------
+    policy : BackupPolicyVO
+        default policy.
+    """
+    return BackupPolicyVO(
+        DEFAULT_COMPRESS,
+        DEFAULT_MAX_COUNT,
+        DEFAULT_MAX_AGE_DAYS,
+        DEFAULT_MAX_TOTAL_SIZE,
+    )
+
+
+def get_object_file_path(store_dir_path, digest, compressed):
+    """
+    Get the stored object file path of a content digest.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    digest : str
+        sha256 hex digest of the contents.
+    compressed : bool
+        if True the object is gzip compressed.
+
+    Returns
+    -------
+    object_file_path : str
+        object file path. (ex. "<store>/objects/ab/abcdef...gz")
+    """
+    return os.path.join(
+        store_dir_path,
+        OBJECTS_DIR_NAME,
+        digest[:2],
+        digest + (COMPRESSED_OBJECT_SUFFIX if compressed else ""),
+    )
+
+
+def load_index(store_dir_path):
+    """
+    Load the snapshot index of a backup store.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+
+    Returns
+    -------
+    policy : BackupPolicyVO
+        stored policy. default policy if the store has no index.
+    snapshots : list of SnapshotVO
+        snapshots in created order.
+    """
+    index_file_path = os.path.join(store_dir_path, SNAPSHOT_INDEX_FILE_NAME)
+    if not os.path.exists(index_file_path):
+        return default_policy(), []
+    with open(index_file_path, "r", encoding=INDEX_FILE_ENCODING) as index_file:
+        index = json.load(index_file)
+    return (
+        BackupPolicyVO(**index["policy"]),
+        [SnapshotVO(**snapshot) for snapshot in index["snapshots"]],
+    )
+
+
+def save_index(store_dir_path, policy, snapshots):
+    """
+    Save the snapshot index of a backup store.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    policy : BackupPolicyVO
+        store policy.
+    snapshots : list of SnapshotVO
+        snapshots in created order.
+    """
+    os.makedirs(store_dir_path, exist_ok=True)
+    index = {
+        "policy": policy.to_dict(),
+        "snapshots": [snapshot.to_dict() for snapshot in snapshots],
+    }
+    file_util.write_file_atomically(
+        os.path.join(store_dir_path, SNAPSHOT_INDEX_FILE_NAME),
+        [json.dumps(index, indent=1).encode(INDEX_FILE_ENCODING)],
+    )
+
+
+def evict_snapshots(snapshots, policy, now):
+    """
+    Select the snapshots kept by the retention policy.
+
+    The newest snapshot of each file is always kept.
+
+    Parameters
+    ----------
+    snapshots : list of SnapshotVO
+        snapshots in created order.
+    policy : BackupPolicyVO
+        retention policy.
+    now : datetime.datetime
+        current datetime.
+
+    Returns
+    -------
+    kept_snapshots : list of SnapshotVO
+        kept snapshots in created order.
+    """
+    min_created_at = None
+    if policy.max_age_days:
+        min_created_at = now.timestamp() - policy.max_age_days * SECONDS_PER_DAY
+
+    newest_snapshots = {}
+    for snapshot in snapshots:
+        newest_snapshots[snapshot.file_path] = snapshot
+
+    kept_snapshots = []
+    file_counts = {}
+    for snapshot in reversed(snapshots):
+        if newest_snapshots[snapshot.file_path] is not snapshot:
+            if policy.max_count and file_counts[snapshot.file_path] >= policy.max_count:
+                continue
+            if min_created_at is not None and snapshot.created_at < min_created_at:
+                continue
+        file_counts[snapshot.file_path] = file_counts.get(snapshot.file_path, 0) + 1
+        kept_snapshots.append(snapshot)
+    kept_snapshots.reverse()
+
+    if policy.max_total_size:
+        stored_sizes = {}
+        digest_counts = {}
+        for snapshot in kept_snapshots:
+            stored_sizes[snapshot.digest] = snapshot.stored_size
+            digest_counts[snapshot.digest] = digest_counts.get(snapshot.digest, 0) + 1
+        total_size = sum(stored_sizes.values())
+
+        size_kept_snapshots = []
+        for snapshot in kept_snapshots:
+            if (
+                total_size > policy.max_total_size
+                and newest_snapshots[snapshot.file_path] is not snapshot
+            ):
+                digest_counts[snapshot.digest] -= 1
+                if digest_counts[snapshot.digest] == 0:
+                    total_size -= stored_sizes[snapshot.digest]
+                continue
+            size_kept_snapshots.append(snapshot)
+        kept_snapshots = size_kept_snapshots
+    return kept_snapshots
+
+
+def save_snapshot(store_dir_path, file_path, now, policy=None):
+    """
+    Save a snapshot of a file and evict old snapshots.
+
+    The contents are stored once for each distinct digest, and no snapshot
+    is added when the file equals its newest snapshot. The snapshot index
+    is updated under the store lock.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    file_path : str
+        backup target file path.
+    now : datetime.datetime
+        current datetime.
+    policy : BackupPolicyVO
+        store policy. the stored policy is used if None.
+
+    Returns
+    -------
+    snapshot : SnapshotVO
+        saved snapshot. None if the backup target file not exist.
+    """
+    if not os.path.exists(file_path):
+        return None
+
+    os.makedirs(store_dir_path, exist_ok=True)
+    with file_util.lock_file(os.path.join(store_dir_path, SNAPSHOT_INDEX_FILE_NAME)):
+        stored_policy, snapshots = load_index(store_dir_path)
+        if policy is None:
+            policy = stored_policy
+        file_path = os.path.abspath(file_path)
+        with open(file_path, "rb") as target_file:
+            contents = target_file.read()
+        digest = hashlib.sha256(contents).hexdigest()
+
+        for snapshot in reversed(snapshots):
+            if snapshot.file_path == file_path:
+                if snapshot.digest == digest:
+                    if policy.to_dict() != stored_policy.to_dict():
+                        save_index(store_dir_path, policy, snapshots)
+                    return snapshot
+                break
+
+        snapshot = None
+        for stored_snapshot in snapshots:
+            if stored_snapshot.digest == digest:
+                snapshot = SnapshotVO(
+                    file_path,
+                    now.timestamp(),
+                    digest,
+                    len(contents),
+                    stored_snapshot.stored_size,
+                    stored_snapshot.compressed,
+                )
+                break
+        if snapshot is None:
+            stored_contents = gzip.compress(contents) if policy.compress else contents
+            object_file_path = get_object_file_path(
+                store_dir_path, digest, policy.compress
+            )
+            os.makedirs(os.path.dirname(object_file_path), exist_ok=True)
+            file_util.write_file_atomically(object_file_path, [stored_contents])
+            snapshot = SnapshotVO(
+                file_path,
+                now.timestamp(),
+                digest,
+                len(contents),
+                len(stored_contents),
+                policy.compress,
+            )
+        snapshots.append(snapshot)
+
+        kept_snapshots = evict_snapshots(snapshots, policy, now)
+        save_index(store_dir_path, policy, kept_snapshots)
+        remove_unreferenced_objects(store_dir_path, snapshots, kept_snapshots)
+    return snapshot
+
+
+def remove_unreferenced_objects(store_dir_path, before_snapshots, kept_snapshots):
+    """
+    Remove the stored objects of evicted snapshots.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    before_snapshots : list of SnapshotVO
+        snapshots before eviction.
+    kept_snapshots : list of SnapshotVO
+        snapshots after eviction.
+    """
+    kept_digests = set(snapshot.digest for snapshot in kept_snapshots)
+    for snapshot in before_snapshots:
+        if snapshot.digest in kept_digests:
+            continue
+        object_file_path = get_object_file_path(
+            store_dir_path, snapshot.digest, snapshot.compressed
+        )
+        if os.path.exists(object_file_path):
+            os.remove(object_file_path)
+
+
+def find_snapshot(snapshots, file_path, before):
+    """
+    Find the newest snapshot of a file created at or before a time.
+
+    Parameters
+    ----------
+    snapshots : list of SnapshotVO
+        snapshots in created order.
+    file_path : str
+        backup target file path.
+    before : datetime.datetime
+        search time.
+
+    Returns
+    -------
+    snapshot : SnapshotVO
+        found snapshot. None if not found.
+    """
+    file_path = os.path.abspath(file_path)
+    for snapshot in reversed(snapshots):
+        if (
+            snapshot.file_path == file_path
+            and snapshot.created_at <= before.timestamp()
+        ):
+            return snapshot
+    return None
+
+
+def read_snapshot(store_dir_path, snapshot):
+    """
+    Read the contents of a snapshot.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    snapshot : SnapshotVO
+        read target snapshot.
+
+    Returns
+    -------
+    contents : bytes
+        backup file contents.
+    """
+    object_file_path = get_object_file_path(
+        store_dir_path, snapshot.digest, snapshot.compressed
+    )
+    with open(object_file_path, "rb") as object_file:
+        stored_contents = object_file.read()
+    if snapshot.compressed:
+        return gzip.decompress(stored_contents)
+    return stored_contents
+
+
+def restore_snapshot(store_dir_path, file_path, before, output_file_path):
+    """
+    Restore a file from the newest snapshot created at or before a time.
+
+    Parameters
+    ----------
+    store_dir_path : str
+        backup store directory path.
+    file_path : str
+        backup target file path.
+    before : datetime.datetime
+        search time.
+    output_file_path : str
+        restore destination file path.
+
+    Returns
+    -------
+    snapshot : SnapshotVO
+        restored snapshot. None if not found.
+    """
+    snapshot = find_snapshot(load_index(store_dir_path)[1], file_path, before)
+    if snapshot is None:
+        return None
+    file_util.write_file_atomically(
+        output_file_path, [read_snapshot(store_dir_path, snapshot)]
+    )
+    return snapshot
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deduplicated backup store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    save_parser = subparsers.add_parser("save")
+    save_parser.add_argument("--store-dir", required=True)
+    save_parser.add_argument("file")
+
+    list_parser = subparsers.add_parser("list")
+    list_parser.add_argument("--store-dir", required=True)
+    list_parser.add_argument("--file")
+
+    restore_parser = subparsers.add_parser("restore")
+    restore_parser.add_argument("--store-dir", required=True)
+    restore_parser.add_argument("--before", help="ISO 8601 datetime. default now.")
+    restore_parser.add_argument("--output", help="default the backup target file.")
+    restore_parser.add_argument("file")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute backup store command.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    now = datetime.datetime.now()
+    if arguments.command == "save":
+        snapshot = save_snapshot(arguments.store_dir, arguments.file, now)
+        if snapshot is None:
+            print("backup target file not exist. " + arguments.file, file=sys.stderr)
+            return 1
+        print(snapshot.digest)
+    elif arguments.command == "list":
+        for snapshot in load_index(arguments.store_dir)[1]:
+            if arguments.file and snapshot.file_path != os.path.abspath(arguments.file):
+                continue
+            print(
+                datetime.datetime.fromtimestamp(snapshot.created_at).isoformat()
+                + " "
+                + snapshot.digest[:12]
+                + " "
+                + str(snapshot.size)
+                + " "
+                + snapshot.file_path
+            )
+    elif arguments.command == "restore":
+        before = now
+        if arguments.before:
+            before = datetime.datetime.fromisoformat(arguments.before)
+        snapshot = restore_snapshot(
+            arguments.store_dir,
+            arguments.file,
+            before,
+            arguments.output or arguments.file,
+        )
+        if snapshot is None:
+            print("snapshot not found. " + arguments.file, file=sys.stderr)
+            return 1
+        print(
+            "restored "
+            + datetime.datetime.fromtimestamp(snapshot.created_at).isoformat()
+            + " snapshot to "
+            + (arguments.output or arguments.file)
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,785 @@
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import aws_config
+import backup_store
+import change_log
+import setup
+
+## const value
+DEFAULT_RC_FILE_SIZES = [
+    1024,
+    64 * 1024,
+    1024 * 1024,
+    10 * 1024 * 1024,
+    100 * 1024 * 1024,
+]
+DEFAULT_PROFILE_COUNTS = [10, 100, 1000, 10000, 100000]
+QUICK_RC_FILE_SIZES = [1024, 64 * 1024]
+QUICK_PROFILE_COUNTS = [10, 100]
+DEFAULT_CONTENTION_WORKERS = [1, 4, 16]
+QUICK_CONTENTION_WORKERS = [1, 4]
+CONTENTION_REGISTRATIONS = 200
+DEFAULT_REPEAT = 5
+DEFAULT_REGRESSION_THRESHOLD = 1.5
+RESULT_FORMAT_VERSION = 1
+RC_FILLER_LINE = 'export PATH="$HOME/bin:$PATH" # synthetic login shell setting\n'
+SHELL_TEMPLATE_FILE_PATHS = {
+    "bash": setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+    "zsh": setup.REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH,
+}
+STARTUP_MODES = ["none", setup.INSTALL_MODE_INLINE, setup.INSTALL_MODE_LAZY]
+SHELL_REGISTER_ROLE_ARN = "arn:aws:iam::123456789012:role/benchmark"
+SHELL_SOURCE_PROFILE = "default"
+
+
+class BenchmarkResultVO:
+    """
+    Timing result of one benchmark case.
+    """
+
+    __slots__ = (
+        "name",
+        "parameter",
+        "repeat",
+        "min_seconds",
+        "median_seconds",
+        "status",
+    )
+
+    def __init__(self, name, parameter, repeat, min_seconds, median_seconds, status):
+        """
+        Parameters
+        ----------
+        name : str
+            benchmark target name. (ex. "register_function")
+        parameter : int
+            rc file bytes or config profile count.
+        repeat : int
+            number of timed runs.
+        min_seconds : float
+            fastest run seconds. None if skipped.
+        median_seconds : float
+            median run seconds. None if skipped.
+        status : str
+            "ok" or the reason why the case is skipped.
+        """
+        self.name = name
+        self.parameter = parameter
+        self.repeat = repeat
+        self.min_seconds = min_seconds
+        self.median_seconds = median_seconds
+        self.status = status
+
+    def key(self):
+        """
+        Get the key to compare with another result file.
+
+        Returns
+        -------
+        key : str
+            "<name>/<parameter>".
+        """
+        return self.name + "/" + str(self.parameter)
+
+    def to_dict(self):
+        """
+        Convert to dict for the result file.
+
+        Returns
+        -------
+        result : dict
+            result values.
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def generate_config(config_file_path, profile_count):
+    """
+    Generate a synthetic AWS CLI config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        output config file path.
+    profile_count : int
+        number of profiles. "default" is the first profile.
+    """
+    with open(config_file_path, "w") as config_file:
+        config_file.write("[default]\nregion = ap-northeast-1\noutput = json\n")
+        for number in range(1, profile_count):
+            config_file.write(
+                "\n[profile synthetic-"
+                + str(number)
+                + "]\nrole_arn = arn:aws:iam::123456789012:role/synthetic-"
+                + str(number)
+                + "\nsource_profile = default\nregion = ap-northeast-1\noutput = json\n"
+            )
+
+
+def generate_rc_file(rc_file_path, rc_file_size, function_string):
+    """
+    Generate a synthetic login shell setting file.
+
+    The registered function is placed in the middle of the filler lines.
+
+    Parameters
+    ----------
+    rc_file_path : str
+        output login shell setting file path.
+    rc_file_size : int
+        approximate file bytes.
+    function_string : str
+        register-sts-assumed-role function string.
+    """
+    filler_size = max(rc_file_size - len(function_string), 0) // 2
+    filler = RC_FILLER_LINE * (filler_size // len(RC_FILLER_LINE) + 1)
+    filler = filler[: filler_size - filler_size % len(RC_FILLER_LINE)]
+    with open(rc_file_path, "w") as rc_file:
+        rc_file.write(filler)
+        rc_file.write(function_string + "\n")
+        rc_file.write(filler)
+
+
+def measure(name, parameter, repeat, function):
+    """
+    Time a benchmark case.
+
+    Parameters
+    ----------
+    name : str
+        benchmark target name.
+    parameter : int
+        rc file bytes or config profile count.
+    repeat : int
+        number of timed runs.
+    function : callable
+        benchmark target without arguments.
+
+    Returns
+    -------
+    result : BenchmarkResultVO
+        timing result.
+    """
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - started)
+    return BenchmarkResultVO(
+        name, parameter, repeat, min(seconds), statistics.median(seconds), "ok"
+    )
+
+
+def render_function_string(template_file_path, config_file_path, work_dir_path):
+    """
+    Render the register-sts-assumed-role function for the benchmark files.
+
+    Parameters
+    ----------
+    template_file_path : str
+        template file path relative to the project root.
+    config_file_path : str
+        AWS CLI config file path.
+    work_dir_path : str
+        benchmark work directory path.
+
+    Returns
+    -------
+    function_string : str
+        register-sts-assumed-role function string.
+    """
+    with open(
+        os.path.join(setup.PROJECT_ROOT_DIR_PATH, template_file_path), "r"
+    ) as template_file:
+        return setup.replace_replacement_string(
+            template_file.read(),
+            config_file_path,
+            "sts-session",
+            "ap-northeast-1",
+            "json",
+            os.path.join(work_dir_path, "change.log"),
+            setup.PYTHON_EXECUTABLE_PATH,
+            setup.PROJECT_ROOT_DIR_PATH,
+            os.path.join(work_dir_path, "backup"),
+            change_log.RotationPolicyVO(0, 0, False),
+        )
+
+
+def run_setup_benchmarks(rc_file_sizes, repeat, work_dir_path):
+    """
+    Benchmark setup.py functions on synthetic login shell setting files.
+
+    Parameters
+    ----------
+    rc_file_sizes : list of int
+        login shell setting file bytes.
+    repeat : int
+        number of timed runs.
+    work_dir_path : str
+        benchmark work directory path.
+
+    Returns
+    -------
+    results : list of BenchmarkResultVO
+        timing results.
+    """
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    config_file_path = os.path.join(work_dir_path, "config")
+    with open(
+        os.path.join(
+            setup.PROJECT_ROOT_DIR_PATH,
+            setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+        ),
+        "r",
+    ) as template_file:
+        template_string = template_file.read()
+    function_string = render_function_string(
+        setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+        config_file_path,
+        work_dir_path,
+    )
+    setup_config = setup.SetupConfigVO(
+        config_file_path,
+        "sts-session",
+        "ap-northeast-1",
+        "json",
+        os.path.join(work_dir_path, "change.log"),
+        os.path.join(work_dir_path, "backup"),
+        backup_store.default_policy(),
+        change_log.RotationPolicyVO(0, 0, False),
+        setup.INSTALL_MODE_INLINE,
+        os.path.join(work_dir_path, "functions"),
+        "",
+        "",
+        "",
+        "",
+    )
+
+    results = [
+        measure(
+            "replace_replacement_string",
+            len(template_string),
+            repeat,
+            lambda: render_function_string(
+                setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+                config_file_path,
+                work_dir_path,
+            ),
+        )
+    ]
+    for rc_file_size in rc_file_sizes:
+        rc_file_path = os.path.join(work_dir_path, "rc-" + str(rc_file_size))
+        generate_rc_file(rc_file_path, rc_file_size, function_string)
+        results.append(
+            measure(
+                "exist_register_sts_assumed_role",
+                rc_file_size,
+                repeat,
+                lambda: setup.exist_register_sts_assumed_role(rc_file_path),
+            )
+        )
+        results.append(
+            measure(
+                "read_block_digest",
+                rc_file_size,
+                repeat,
+                lambda: setup.read_block_digest(rc_file_path),
+            )
+        )
+        results.append(
+            measure(
+                "register_function",
+                rc_file_size,
+                repeat,
+                lambda: setup.register_function(function_string, rc_file_path, logger),
+            )
+        )
+        results.append(
+            measure(
+                "backup_file",
+                rc_file_size,
+                repeat,
+                lambda: setup.backup_file(
+                    rc_file_path, setup_config, datetime.datetime.now(), logger
+                ),
+            )
+        )
+        os.remove(rc_file_path)
+    return results
+
+
+def run_shell_benchmarks(profile_counts, repeat, work_dir_path):
+    """
+    Benchmark the generated shell functions on synthetic config files.
+
+    Each run replaces a profile in the middle of the config file.
+    A shell not installed is reported as skipped.
+
+    Parameters
+    ----------
+    profile_counts : list of int
+        number of profiles in the config file.
+    repeat : int
+        number of timed runs.
+    work_dir_path : str
+        benchmark work directory path.
+
+    Returns
+    -------
+    results : list of BenchmarkResultVO
+        timing results.
+    """
+    results = []
+    config_file_path = os.path.join(work_dir_path, "config")
+    for shell_name, template_file_path in SHELL_TEMPLATE_FILE_PATHS.items():
+        name = "register_sts_assumed_role." + shell_name
+        shell_path = shutil.which(shell_name)
+        function_file_path = os.path.join(work_dir_path, "function." + shell_name)
+        with open(function_file_path, "w") as function_file:
+            function_file.write(
+                render_function_string(
+                    template_file_path, config_file_path, work_dir_path
+                )
+            )
+
+        for profile_count in profile_counts:
+            if shell_path is None:
+                results.append(
+                    BenchmarkResultVO(
+                        name, profile_count, 0, None, None, shell_name + " not found"
+                    )
+                )
+                continue
+            generate_config(config_file_path, profile_count)
+            user_input = (
+                "\n".join(
+                    [
+                        SHELL_REGISTER_ROLE_ARN,
+                        SHELL_SOURCE_PROFILE,
+                        "synthetic-" + str(profile_count // 2),
+                        "",
+                        "",
+                        "",
+                        "benchmark",
+                    ]
+                )
+                + "\n"
+            )
+
+            def run_function():
+                subprocess.run(
+                    [
+                        shell_path,
+                        "-c",
+                        "source "
+                        + function_file_path
+                        + " && register_sts_assumed_role",
+                    ],
+                    input=user_input,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    check=True,
+                )
+
+            results.append(measure(name, profile_count, repeat, run_function))
+    return results
+
+
+def run_startup_benchmarks(repeat, work_dir_path):
+    """
+    Benchmark interactive shell startup with and without the installed block.
+
+    "none" is an empty login shell setting file, "inline" has the whole
+    function and "lazy" has only the stub loading the function file.
+    A shell not installed is reported as skipped.
+
+    Parameters
+    ----------
+    repeat : int
+        number of timed runs.
+    work_dir_path : str
+        benchmark work directory path.
+
+    Returns
+    -------
+    results : list of BenchmarkResultVO
+        timing results. the parameter is the login shell setting file bytes.
+    """
+    logger = logging.getLogger("benchmark")
+    results = []
+    config_file_path = os.path.join(work_dir_path, "config")
+    for shell_name, template_file_path in SHELL_TEMPLATE_FILE_PATHS.items():
+        shell_path = shutil.which(shell_name)
+        shell_dir_path = os.path.join(work_dir_path, "startup-" + shell_name)
+        os.makedirs(shell_dir_path, exist_ok=True)
+        function_string = render_function_string(
+            template_file_path, config_file_path, work_dir_path
+        )
+        for mode in STARTUP_MODES:
+            name = "shell_startup." + shell_name + "." + mode
+            if shell_path is None:
+                results.append(
+                    BenchmarkResultVO(name, 0, 0, None, None, shell_name + " not found")
+                )
+                continue
+            if mode == setup.INSTALL_MODE_INLINE:
+                block = function_string
+            elif mode == setup.INSTALL_MODE_LAZY:
+                block = setup.install_lazy_function(
+                    function_string,
+                    shell_path,
+                    setup.SetupConfigVO(
+                        config_file_path,
+                        "sts-session",
+                        "ap-northeast-1",
+                        "json",
+                        os.path.join(work_dir_path, "change.log"),
+                        os.path.join(work_dir_path, "backup"),
+                        backup_store.default_policy(),
+                        change_log.RotationPolicyVO(0, 0, False),
+                        setup.INSTALL_MODE_LAZY,
+                        os.path.join(shell_dir_path, "functions"),
+                        "",
+                        "",
+                        "",
+                        "",
+                    ),
+                    logger,
+                )
+            else:
+                block = ""
+            rc_file_path = os.path.join(
+                shell_dir_path, ".zshrc" if shell_name == "zsh" else ".bashrc"
+            )
+            with open(rc_file_path, "w") as rc_file:
+                rc_file.write(block + "\n")
+
+            if shell_name == "zsh":
+                command = [shell_path, "-i", "-c", "true"]
+            else:
+                command = [shell_path, "--rcfile", rc_file_path, "-i", "-c", "true"]
+            environment = dict(os.environ, ZDOTDIR=shell_dir_path)
+
+            def start_shell():
+                subprocess.run(
+                    command,
+                    env=environment,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True,
+                )
+
+            results.append(
+                measure(name, os.path.getsize(rc_file_path), repeat, start_shell)
+            )
+    return results
+
+
+def register_contention_profile(arguments):
+    """
+    Register a profile with aws_config.py for the contention benchmark.
+
+    Parameters
+    ----------
+    arguments : tuple of (str, int)
+        benchmark work directory path and profile number.
+
+    Returns
+    -------
+    exit_status : int
+        aws_config.py exit status.
+    """
+    work_dir_path, number = arguments
+    return aws_config.main(
+        [
+            "register",
+            "--config-file",
+            os.path.join(work_dir_path, "config"),
+            "--profile",
+            "contention-" + str(number),
+            "--role-arn",
+            SHELL_REGISTER_ROLE_ARN,
+            "--source-profile",
+            SHELL_SOURCE_PROFILE,
+            "--region",
+            "ap-northeast-1",
+            "--output",
+            "json",
+            "--change-log-file",
+            os.path.join(work_dir_path, "change.log"),
+            "--backup-dir",
+            os.path.join(work_dir_path, "backup"),
+        ]
+    )
+
+
+def run_contention_benchmarks(worker_counts, repeat, work_dir_path):
+    """
+    Benchmark concurrent registrations to one config file.
+
+    Each run registers CONTENTION_REGISTRATIONS profiles with the worker
+    processes and checks none of them is lost. The throughput is
+    CONTENTION_REGISTRATIONS / seconds.
+
+    Parameters
+    ----------
+    worker_counts : list of int
+        number of concurrent worker processes.
+    repeat : int
+        number of timed runs.
+    work_dir_path : str
+        benchmark work directory path.
+
+    Returns
+    -------
+    results : list of BenchmarkResultVO
+        timing results. the parameter is the number of workers.
+    """
+    results = []
+    contention_dir_path = os.path.join(work_dir_path, "contention")
+    for worker_count in worker_counts:
+
+        def register_profiles():
+            if os.path.isdir(contention_dir_path):
+                shutil.rmtree(contention_dir_path)
+            os.makedirs(contention_dir_path)
+            generate_config(os.path.join(contention_dir_path, "config"), 10)
+            with concurrent.futures.ProcessPoolExecutor(worker_count) as executor:
+                exit_statuses = list(
+                    executor.map(
+                        register_contention_profile,
+                        [
+                            (contention_dir_path, number)
+                            for number in range(CONTENTION_REGISTRATIONS)
+                        ],
+                    )
+                )
+            profile_count = len(
+                aws_config.load_config(
+                    os.path.join(contention_dir_path, "config")
+                ).profile_names()
+            )
+            if any(exit_statuses) or profile_count != 10 + CONTENTION_REGISTRATIONS:
+                raise RuntimeError("registered profiles are lost under contention.")
+
+        results.append(
+            measure(
+                "contention.register." + str(CONTENTION_REGISTRATIONS),
+                worker_count,
+                repeat,
+                register_profiles,
+            )
+        )
+    return results
+
+
+def run_benchmarks(rc_file_sizes, profile_counts, repeat, worker_counts=None):
+    """
+    Run all benchmarks in a temporary directory.
+
+    Parameters
+    ----------
+    rc_file_sizes : list of int
+        login shell setting file bytes.
+    profile_counts : list of int
+        number of profiles in the config file.
+    repeat : int
+        number of timed runs.
+    worker_counts : list of int
+        number of concurrent workers of the contention benchmark. skipped if None.
+
+    Returns
+    -------
+    report : dict
+        JSON serializable benchmark report.
+    """
+    work_dir_path = tempfile.mkdtemp()
+    try:
+        results = run_setup_benchmarks(rc_file_sizes, repeat, work_dir_path)
+        results.extend(run_shell_benchmarks(profile_counts, repeat, work_dir_path))
+        results.extend(run_startup_benchmarks(repeat, work_dir_path))
+        if worker_counts:
+            results.extend(
+                run_contention_benchmarks(worker_counts, repeat, work_dir_path)
+            )
+    finally:
+        shutil.rmtree(work_dir_path)
+    return {
+        "version": RESULT_FORMAT_VERSION,
+        "created_at": datetime.datetime.now()
+        .astimezone()
+        .isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [result.to_dict() for result in results],
+    }
+
+
+def find_regressions(report, baseline_report, threshold):
+    """
+    Find benchmark cases slower than the baseline.
+
+    Parameters
+    ----------
+    report : dict
+        current benchmark report.
+    baseline_report : dict
+        baseline benchmark report.
+    threshold : float
+        a case is regressed when its median is slower than baseline median * threshold.
+
+    Returns
+    -------
+    regressions : list of tuple of (str, float, float)
+        regressed case key, baseline median seconds and current median seconds.
+    """
+    baseline_medians = {
+        BenchmarkResultVO(**result).key(): result["median_seconds"]
+        for result in baseline_report["results"]
+    }
+    regressions = []
+    for result in report["results"]:
+        benchmark_result = BenchmarkResultVO(**result)
+        baseline_median = baseline_medians.get(benchmark_result.key())
+        if baseline_median is None or benchmark_result.median_seconds is None:
+            continue
+        if benchmark_result.median_seconds > baseline_median * threshold:
+            regressions.append(
+                (
+                    benchmark_result.key(),
+                    baseline_median,
+                    benchmark_result.median_seconds,
+                )
+            )
+    return regressions
+
+
+def parse_int_list(value):
+    """
+    Parse a comma separated int list argument.
+
+    Parameters
+    ----------
+    value : str
+        comma separated ints. (ex. "10,100,1000")
+
+    Returns
+    -------
+    values : list of int
+        parsed ints.
+    """
+    try:
+        return [int(item) for item in value.split(",") if item]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int list: " + value)
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark setup.py and the generated shell functions."
+    )
+    parser.add_argument("--rc-file-sizes", type=parse_int_list)
+    parser.add_argument("--profile-counts", type=parse_int_list)
+    parser.add_argument("--contention-workers", type=parse_int_list)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Run the benchmarks and print the JSON report.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. 1 if a case regressed from the baseline.
+    """
+    arguments = parse_arguments(argv)
+    rc_file_sizes = arguments.rc_file_sizes
+    if rc_file_sizes is None:
+        rc_file_sizes = (
+            QUICK_RC_FILE_SIZES if arguments.quick else DEFAULT_RC_FILE_SIZES
+        )
+    profile_counts = arguments.profile_counts
+    if profile_counts is None:
+        profile_counts = (
+            QUICK_PROFILE_COUNTS if arguments.quick else DEFAULT_PROFILE_COUNTS
+        )
+
+    worker_counts = arguments.contention_workers
+    if worker_counts is None:
+        worker_counts = (
+            QUICK_CONTENTION_WORKERS if arguments.quick else DEFAULT_CONTENTION_WORKERS
+        )
+
+    report = run_benchmarks(
+        rc_file_sizes, profile_counts, arguments.repeat, worker_counts
+    )
+    report_string = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report_string + "\n")
+    else:
+        print(report_string)
+
+    if arguments.baseline:
+        with open(arguments.baseline, "r") as baseline_file:
+            regressions = find_regressions(
+                report, json.load(baseline_file), arguments.threshold
+            )
+        for key, baseline_median, median in regressions:
+            print(
+                "regression "
+                + key
+                + ": "
+                + format(baseline_median, ".6f")
+                + "s -> "
+                + format(median, ".6f")
+                + "s",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,596 @@
+import datetime
+import gzip
+import json
+import os
+import re
+import sys
+import file_util
+
+## const value
+EVENT_REGISTERED = "REGISTERED"
+EVENT_DELETED = "DELETED"
+EVENT_SWITCHED = "SWITCHED"
+EVENT_KEYS = (
+    "event",
+    "time",
+    "profile",
+    "role_arn",
+    "source_profile",
+    "mfa_serial",
+    "comment",
+)
+CHANGE_LOG_FILE_ENCODING = "utf-8"
+LEGACY_DATETIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+LEGACY_LOG_PATTERN = re.compile(r"^(REGISTERED|DELETED) - - \[([^\]]+)\] (.*)$")
+LEGACY_FIELD_PATTERN = re.compile(r'"([a-z_ ]+?) = ([^"]*)"')
+ARCHIVE_COMPRESSED_SUFFIX = ".gz"
+ARCHIVE_FILE_PATTERN = re.compile(r"^\.(\d+)(\.gz)?$")
+LEGACY_FIELD_KEYS = {
+    "profile": "profile",
+    "role_arn": "role_arn",
+    "source_profile": "source_profile",
+    "mfa_serial": "mfa_serial",
+    "registered comment": "comment",
+}
+
+
+class RotationPolicyVO:
+    """
+    Change log size based rotation policy.
+    """
+
+    __slots__ = ("max_size", "max_archives", "compress")
+
+    def __init__(self, max_size, max_archives, compress):
+        """
+        Parameters
+        ----------
+        max_size : int
+            the change log is rotated when a write makes it larger than
+            this bytes. not rotated if 0 or None.
+        max_archives : int
+            number of kept archives. "<log>.1" is the newest.
+        compress : bool
+            if True archives are gzip compressed. ("<log>.1.gz")
+        """
+        self.max_size = max_size
+        self.max_archives = max_archives
+        self.compress = compress
+
+    def to_dict(self):
+        """
+        Convert to dict.
+
+        Returns
+        -------
+        policy : dict
+            policy values.
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def format_datetime(now):
+    """
+    Format datetime for change log.
+
+    Parameters
+    ----------
+    now : datetime.datetime
+        log datetime.
+
+    Returns
+    -------
+    datetime_string : str
+        ISO 8601 datetime with offset. (ex. "2026-10-18T12:34:56+09:00")
+    """
+    return now.astimezone().isoformat(timespec="seconds")
+
+
+def make_event(event, profile_name, role_arn, source_profile, mfa_serial, comment, now):
+    """
+    Make a change log event with the fixed schema.
+
+    Parameters
+    ----------
+    event : str
+        "REGISTERED", "DELETED" or "SWITCHED".
+    profile_name : str
+        changed profile name.
+    role_arn : str
+        role arn. None if unknown.
+    source_profile : str
+        source profile name. None if unknown.
+    mfa_serial : str
+        mfa serial arn. None if not used.
+    comment : str
+        registered comment. None if not given.
+    now : datetime.datetime
+        changed datetime.
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event.
+    """
+    return {
+        "event": event,
+        "time": format_datetime(now),
+        "profile": profile_name,
+        "role_arn": role_arn or None,
+        "source_profile": source_profile or None,
+        "mfa_serial": mfa_serial or None,
+        "comment": comment or None,
+    }
+
+
+def make_register_event(
+    profile_name, role_arn, source_profile, mfa_serial, comment, now
+):
+    """
+    Make a REGISTERED change log event.
+
+    Parameters
+    ----------
+    profile_name : str
+        registered profile name.
+    role_arn : str
+        registered role arn.
+    source_profile : str
+        registered source profile name.
+    mfa_serial : str
+        registered mfa serial arn. None or empty if not used.
+    comment : str
+        registered comment. None or empty if not given.
+    now : datetime.datetime
+        registered datetime.
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event.
+    """
+    return make_event(
+        EVENT_REGISTERED,
+        profile_name,
+        role_arn,
+        source_profile,
+        mfa_serial,
+        comment,
+        now,
+    )
+
+
+def make_delete_event(profile_name, role_arn, source_profile, mfa_serial, now):
+    """
+    Make a DELETED change log event.
+
+    Parameters
+    ----------
+    profile_name : str
+        deleted profile name.
+    role_arn : str
+        deleted role arn. None if not exist.
+    source_profile : str
+        deleted source profile name. None if not exist.
+    mfa_serial : str
+        deleted mfa serial arn. None if not exist.
+    now : datetime.datetime
+        deleted datetime.
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event.
+    """
+    return make_event(
+        EVENT_DELETED, profile_name, role_arn, source_profile, mfa_serial, None, now
+    )
+
+
+def make_switch_event(profile_name, role_arn, now):
+    """
+    Make a SWITCHED change log event.
+
+    The config file is not changed by a switch, so the event only records
+    the profile made active in a shell.
+
+    Parameters
+    ----------
+    profile_name : str
+        switched profile name.
+    role_arn : str
+        role arn of the profile. None if unknown.
+    now : datetime.datetime
+        switched datetime.
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event.
+    """
+    return make_event(EVENT_SWITCHED, profile_name, role_arn, None, None, None, now)
+
+
+def append_events(change_log_file_path, change_log_events, rotation_policy=None):
+    """
+    Append change log events with one O_APPEND write.
+
+    All events of one operation are written by a single write call, so
+    concurrent writers never interleave inside a line. The change log is
+    rotated first when the write would exceed the rotation max size.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    change_log_events : list of dict
+        change log events.
+    rotation_policy : RotationPolicyVO
+        rotation policy. not rotated if None.
+
+    Returns
+    -------
+    written_size : int
+        appended bytes.
+    """
+    if len(change_log_events) == 0:
+        return 0
+    change_log_bytes = "".join(
+        json.dumps(change_log_event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        for change_log_event in change_log_events
+    ).encode(CHANGE_LOG_FILE_ENCODING)
+
+    with file_util.lock_file(change_log_file_path):
+        if rotation_policy is not None and rotation_policy.max_size:
+            if os.path.exists(change_log_file_path):
+                change_log_size = os.stat(change_log_file_path).st_size
+                if (
+                    change_log_size > 0
+                    and change_log_size + len(change_log_bytes)
+                    > rotation_policy.max_size
+                ):
+                    rotate(change_log_file_path, rotation_policy)
+
+        change_log_fd = os.open(
+            change_log_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600
+        )
+        try:
+            written_size = 0
+            while written_size < len(change_log_bytes):
+                written_size += os.write(change_log_fd, change_log_bytes[written_size:])
+        finally:
+            os.close(change_log_fd)
+    return written_size
+
+
+def get_archive_file_path(change_log_file_path, number, compressed):
+    """
+    Get a change log archive file path.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    number : int
+        archive number. 1 is the newest.
+    compressed : bool
+        if True gzip compressed archive.
+
+    Returns
+    -------
+    archive_file_path : str
+        archive file path. (ex. "~/.aws/sts_assumed_role.log.1.gz")
+    """
+    return (
+        change_log_file_path
+        + "."
+        + str(number)
+        + (ARCHIVE_COMPRESSED_SUFFIX if compressed else "")
+    )
+
+
+def list_archive_file_paths(change_log_file_path):
+    """
+    List change log archives from the oldest.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+
+    Returns
+    -------
+    archive_file_paths : list of tuple of (int, str)
+        archive number and file path, oldest first.
+    """
+    change_log_dir_path, change_log_file_name = os.path.split(
+        os.path.abspath(change_log_file_path)
+    )
+    if not os.path.isdir(change_log_dir_path):
+        return []
+    archive_file_paths = []
+    for file_name in os.listdir(change_log_dir_path):
+        if not file_name.startswith(change_log_file_name):
+            continue
+        matched = ARCHIVE_FILE_PATTERN.match(file_name[len(change_log_file_name) :])
+        if matched is None:
+            continue
+        archive_file_paths.append(
+            (int(matched.group(1)), os.path.join(change_log_dir_path, file_name))
+        )
+    archive_file_paths.sort(reverse=True)
+    return archive_file_paths
+
+
+def rotate(change_log_file_path, rotation_policy):
+    """
+    Rotate the change log to "<log>.1" and shift older archives.
+
+    The caller must hold the change log lock.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    rotation_policy : RotationPolicyVO
+        rotation policy.
+    """
+    for number, archive_file_path in list_archive_file_paths(change_log_file_path):
+        if number >= rotation_policy.max_archives:
+            os.remove(archive_file_path)
+            continue
+        os.replace(
+            archive_file_path,
+            get_archive_file_path(
+                change_log_file_path,
+                number + 1,
+                archive_file_path.endswith(ARCHIVE_COMPRESSED_SUFFIX),
+            ),
+        )
+
+    if not rotation_policy.max_archives:
+        os.remove(change_log_file_path)
+        return
+    newest_archive_file_path = get_archive_file_path(change_log_file_path, 1, False)
+    os.replace(change_log_file_path, newest_archive_file_path)
+    if rotation_policy.compress:
+        with open(newest_archive_file_path, "rb") as archive_file:
+            file_util.write_file_atomically(
+                get_archive_file_path(change_log_file_path, 1, True),
+                [gzip.compress(archive_file.read())],
+            )
+        os.remove(newest_archive_file_path)
+
+
+def parse_legacy_log_line(line):
+    """
+    Parse a change log line written by the former text format.
+
+    Parameters
+    ----------
+    line : str
+        change log line. (ex. 'REGISTERED - - [18/Oct/2026:12:34:56 +0900] "profile = a" ...')
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event. None if the line is not a change log.
+    """
+    matched = LEGACY_LOG_PATTERN.match(line)
+    if matched is None:
+        return None
+    change_log_event = dict.fromkeys(EVENT_KEYS)
+    change_log_event["event"] = matched.group(1)
+    try:
+        change_log_event["time"] = format_datetime(
+            datetime.datetime.strptime(matched.group(2), LEGACY_DATETIME_FORMAT)
+        )
+    except ValueError:
+        return None
+    for key, value in LEGACY_FIELD_PATTERN.findall(matched.group(3)):
+        if key in LEGACY_FIELD_KEYS:
+            change_log_event[LEGACY_FIELD_KEYS[key]] = value
+    if change_log_event["comment"] == "None":
+        change_log_event["comment"] = None
+    return change_log_event
+
+
+def parse_log_line(line):
+    """
+    Parse a change log line.
+
+    Parameters
+    ----------
+    line : str
+        change log line.
+
+    Returns
+    -------
+    change_log_event : dict
+        change log event. None if the line is not a change log.
+    """
+    if line.startswith("{"):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+    return parse_legacy_log_line(line)
+
+
+def read_lines(change_log_file_path, since=None):
+    """
+    Stream the lines of the change log archives and the change log.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    since : datetime.datetime
+        archives last modified before this time are skipped. not skipped if None.
+
+    Yields
+    ------
+    line : str
+        change log line, oldest first.
+    """
+    file_paths = [
+        archive_file_path
+        for _, archive_file_path in list_archive_file_paths(change_log_file_path)
+        if since is None or os.stat(archive_file_path).st_mtime >= since.timestamp()
+    ]
+    file_paths.append(change_log_file_path)
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            continue
+        with open_log_file(file_path) as log_file:
+            for line in log_file:
+                yield line
+
+
+def open_log_file(file_path):
+    """
+    Open a change log or an archive as text.
+
+    Parameters
+    ----------
+    file_path : str
+        change log or archive file path. ".gz" archives are decompressed.
+
+    Returns
+    -------
+    log_file : file object
+        text file object. undecodable bytes are replaced.
+    """
+    if file_path.endswith(ARCHIVE_COMPRESSED_SUFFIX):
+        return gzip.open(
+            file_path, "rt", encoding=CHANGE_LOG_FILE_ENCODING, errors="replace"
+        )
+    return open(file_path, "r", encoding=CHANGE_LOG_FILE_ENCODING, errors="replace")
+
+
+def read_events(
+    change_log_file_path, profile_name=None, role_arn=None, since=None, until=None
+):
+    """
+    Stream change log events matched to the filters.
+
+    The archives are read from the oldest and then the current change log,
+    line by line. Lines which can not match a profile or role arn filter
+    are skipped before json decoding.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    profile_name : str
+        profile name filter. not filtered if None.
+    role_arn : str
+        role arn filter. not filtered if None.
+    since : datetime.datetime
+        only events at or after this time. not filtered if None.
+    until : datetime.datetime
+        only events at or before this time. not filtered if None.
+
+    Yields
+    ------
+    change_log_event : dict
+        matched change log event in written order.
+    """
+    needles = [value for value in (profile_name, role_arn) if value is not None]
+    for line in read_lines(change_log_file_path, since):
+        if any(needle not in line for needle in needles):
+            continue
+        change_log_event = parse_log_line(line.strip())
+        if change_log_event is None:
+            continue
+        if profile_name is not None and change_log_event["profile"] != profile_name:
+            continue
+        if role_arn is not None and change_log_event["role_arn"] != role_arn:
+            continue
+        if since is not None or until is not None:
+            event_time = datetime.datetime.fromisoformat(change_log_event["time"])
+            if since is not None and event_time < since:
+                continue
+            if until is not None and event_time > until:
+                continue
+        yield change_log_event
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="STS assumed role change log.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("--change-log-file", required=True)
+    query_parser.add_argument("--profile")
+    query_parser.add_argument("--role-arn")
+    query_parser.add_argument("--since", help="ISO 8601 datetime with offset.")
+    query_parser.add_argument("--until", help="ISO 8601 datetime with offset.")
+    return parser.parse_args(argv)
+
+
+def parse_datetime_argument(value):
+    """
+    Parse a datetime command line argument.
+
+    Parameters
+    ----------
+    value : str
+        ISO 8601 datetime. local time zone is used if it has no offset.
+
+    Returns
+    -------
+    parsed_datetime : datetime.datetime
+        aware datetime. None if the value is None.
+    """
+    if value is None:
+        return None
+    return datetime.datetime.fromisoformat(value).astimezone()
+
+
+def main(argv):
+    """
+    Execute change log command.
+
+    query prints the matched events as JSON lines.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    if arguments.command == "query":
+        for change_log_event in read_events(
+            arguments.change_log_file,
+            arguments.profile,
+            arguments.role_arn,
+            parse_datetime_argument(arguments.since),
+            parse_datetime_argument(arguments.until),
+        ):
+            print(json.dumps(change_log_event, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
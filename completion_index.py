@@ -0,0 +1,666 @@
+import argparse
+import json
+import os
+import sys
+
+## const value
+COMPLETION_KINDS = ("profile", "role_arn", "source_profile", "mfa_serial")
+COMPLETION_INDEX_FILE_SUFFIX = ".completion.json"
+COMPLETION_INDEX_VERSION = 2
+COMPLETION_INDEX_ENCODING = "utf-8"
+MISSING_CHANGE_LOG_POSITION = [0, 0, 0]
+OPTION_KINDS = {
+    "--profile": "profile",
+    "--role-arn": "role_arn",
+    "--source-profile": "source_profile",
+    "--mfa-serial": "mfa_serial",
+    "--switch": "profile",
+}
+SWITCH_OPTION = "--switch"
+COMPLETION_OPTIONS = (
+    "--comment",
+    "--manifest",
+    "--mfa-serial",
+    "--output",
+    "--profile",
+    "--region",
+    "--role-arn",
+    "--source-profile",
+    "--stdin-ndjson",
+    "--switch",
+    "--yes",
+)
+VALUE_OPTIONS = ("--comment", "--manifest", "--output", "--region")
+
+
+class CompletionIndexVO:
+    """
+    Sorted completion values of the config file and the change log history.
+
+    The values of each kind are kept as one sorted newline separated string,
+    so the index file is compact, loads without building a list and is
+    searched by binary search.
+    The config values are rebuilt when the config file signature changes.
+    The history values only grow, and the change log is read from the last
+    read byte offset, so an update reads only the appended events.
+    """
+
+    __slots__ = (
+        "config_signature",
+        "change_log_position",
+        "config_values",
+        "history_values",
+    )
+
+    def __init__(
+        self, config_signature, change_log_position, config_values, history_values
+    ):
+        """
+        Parameters
+        ----------
+        config_signature : list of int
+            config file signature of the config values. None if not read.
+        change_log_position : list of int
+            inode, read byte offset and mtime (ns) of the change log. None if
+            not read. [0, 0, 0] if the change log did not exist.
+        config_values : dict
+            completion kind to sorted newline separated values of the
+            config file.
+        history_values : dict
+            completion kind to sorted newline separated values of the
+            change log history.
+        """
+        self.config_signature = config_signature
+        self.change_log_position = change_log_position
+        self.config_values = config_values
+        self.history_values = history_values
+
+    def to_dict(self):
+        """
+        Convert to JSON serializable dict.
+
+        Returns
+        -------
+        index : dict
+            attribute name to value with the index version.
+        """
+        index = {name: getattr(self, name) for name in self.__slots__}
+        index["version"] = COMPLETION_INDEX_VERSION
+        return index
+
+
+def empty_index():
+    """
+    Make an empty completion index.
+
+    Returns
+    -------
+    index : CompletionIndexVO
+        index without any value.
+    """
+    return CompletionIndexVO(
+        None,
+        None,
+        {kind: "" for kind in COMPLETION_KINDS},
+        {kind: "" for kind in COMPLETION_KINDS},
+    )
+
+
+def get_index_file_path(change_log_file_path):
+    """
+    Get the sidecar completion index file path of a change log.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+
+    Returns
+    -------
+    index_file_path : str
+        completion index file path.
+        (ex. "~/.aws/.sts_assumed_role.log.completion.json")
+    """
+    change_log_dir_path, change_log_file_name = os.path.split(
+        os.path.abspath(change_log_file_path)
+    )
+    return os.path.join(
+        change_log_dir_path, "." + change_log_file_name + COMPLETION_INDEX_FILE_SUFFIX
+    )
+
+
+def load_index(index_file_path):
+    """
+    Load the completion index.
+
+    Parameters
+    ----------
+    index_file_path : str
+        completion index file path.
+
+    Returns
+    -------
+    index : CompletionIndexVO
+        loaded index. empty if the file not exist, broken or old version.
+    """
+    try:
+        with open(index_file_path, "rb") as index_file:
+            index = json.loads(index_file.read().decode(COMPLETION_INDEX_ENCODING))
+        if index.pop("version") != COMPLETION_INDEX_VERSION:
+            return empty_index()
+        return CompletionIndexVO(**index)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return empty_index()
+
+
+def save_index(index_file_path, index):
+    """
+    Save the completion index.
+
+    Parameters
+    ----------
+    index_file_path : str
+        completion index file path.
+    index : CompletionIndexVO
+        save target index.
+    """
+    import file_util
+
+    index_dir_path = os.path.dirname(os.path.abspath(index_file_path))
+    if not os.path.isdir(index_dir_path):
+        os.makedirs(index_dir_path)
+    file_util.write_file_atomically(
+        index_file_path,
+        [
+            json.dumps(index.to_dict(), separators=(",", ":")).encode(
+                COMPLETION_INDEX_ENCODING
+            )
+        ],
+    )
+
+
+def collect_config_values(config):
+    """
+    Collect the completion values of a config file.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+
+    Returns
+    -------
+    config_values : dict
+        completion kind to sorted newline separated values.
+    """
+    import credential_cache
+
+    values = {kind: set() for kind in COMPLETION_KINDS}
+    for section in config.sections:
+        if section is None or section.header is None:
+            continue
+        values["profile"].add(section.name)
+        role_arn = section.get("role_arn")
+        source_profile = section.get("source_profile")
+        mfa_serial = section.get("mfa_serial")
+        credential_process = section.get("credential_process")
+        if credential_process:
+            cached_profile = credential_cache.parse_credential_process(
+                section.name, credential_process
+            )
+            if cached_profile is not None:
+                role_arn = cached_profile.role_arn
+                source_profile = cached_profile.source_profile
+                mfa_serial = cached_profile.mfa_serial
+        for kind, value in (
+            ("role_arn", role_arn),
+            ("source_profile", source_profile),
+            ("mfa_serial", mfa_serial),
+        ):
+            if value:
+                values[kind].add(value)
+    return {
+        kind: "\n".join(sorted(kind_values)) for kind, kind_values in values.items()
+    }
+
+
+def find_first_line(values, prefix):
+    """
+    Find the first line not less than a prefix by binary search.
+
+    Parameters
+    ----------
+    values : str
+        sorted newline separated values.
+    prefix : str
+        search prefix.
+
+    Returns
+    -------
+    position : int
+        start offset of the line. the length of values if not found.
+    """
+    low = 0
+    high = len(values)
+    while low < high:
+        line_start = values.rfind("\n", 0, (low + high) // 2) + 1
+        line_end = values.find("\n", line_start)
+        if line_end < 0:
+            line_end = len(values)
+        if values[line_start:line_end] < prefix:
+            low = line_end + 1
+        else:
+            high = line_start
+    return min(low, len(values))
+
+
+def iterate_prefix_lines(values, prefix):
+    """
+    Iterate the lines starting with a prefix.
+
+    Parameters
+    ----------
+    values : str
+        sorted newline separated values.
+    prefix : str
+        search prefix.
+
+    Yields
+    ------
+    value : str
+        matched value in sorted order.
+    """
+    if values == "":
+        return
+    position = find_first_line(values, prefix)
+    while position <= len(values):
+        line_end = values.find("\n", position)
+        if line_end < 0:
+            line_end = len(values)
+        value = values[position:line_end]
+        if not value.startswith(prefix):
+            return
+        yield value
+        position = line_end + 1
+
+
+def merge_values(values, new_values):
+    """
+    Merge values into sorted newline separated values.
+
+    Parameters
+    ----------
+    values : str
+        sorted newline separated values.
+    new_values : set of str
+        merge target values.
+
+    Returns
+    -------
+    values : str
+        sorted newline separated values. the same string if nothing is new.
+    """
+    added_values = [
+        value
+        for value in new_values
+        if next(iterate_prefix_lines(values, value), None) != value
+    ]
+    if len(added_values) == 0:
+        return values
+    return "\n".join(sorted((values.split("\n") if values else []) + added_values))
+
+
+def add_event_values(values, change_log_event):
+    """
+    Add the completion values of a change log event.
+
+    Parameters
+    ----------
+    values : dict
+        completion kind to set of values. updated in place.
+    change_log_event : dict
+        change log event. None is ignored.
+    """
+    if not change_log_event:
+        return
+    for kind in COMPLETION_KINDS:
+        value = change_log_event.get(kind)
+        if value:
+            values[kind].add(value)
+
+
+def read_appended_events(change_log_file_path, change_log_position):
+    """
+    Read the change log events appended after a position.
+
+    An incomplete last line is left for the next read.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    change_log_position : list of int
+        inode, read byte offset and mtime (ns). None to read from the start.
+
+    Returns
+    -------
+    change_log_events : list of dict
+        appended change log events.
+    change_log_position : list of int
+        inode, read byte offset after the events and mtime (ns) of the log.
+        [0, 0, 0] if the log not exist.
+    rotated : bool
+        if True the change log was rotated or recreated after the position.
+    """
+    try:
+        change_log_file = open(change_log_file_path, "rb")
+    except FileNotFoundError:
+        return (
+            [],
+            list(MISSING_CHANGE_LOG_POSITION),
+            change_log_position not in (None, MISSING_CHANGE_LOG_POSITION),
+        )
+    with change_log_file:
+        file_stat = os.fstat(change_log_file.fileno())
+        rotated = change_log_position is not None and (
+            change_log_position[0] != file_stat.st_ino
+            or change_log_position[1] > file_stat.st_size
+        )
+        offset = 0 if change_log_position is None or rotated else change_log_position[1]
+        change_log_file.seek(offset)
+        appended_bytes = change_log_file.read()
+
+    complete_size = appended_bytes.rfind(b"\n") + 1
+    if complete_size == 0:
+        return [], [file_stat.st_ino, offset, file_stat.st_mtime_ns], rotated
+
+    import change_log
+
+    change_log_events = [
+        change_log.parse_log_line(line)
+        for line in appended_bytes[:complete_size]
+        .decode(change_log.CHANGE_LOG_FILE_ENCODING, errors="replace")
+        .splitlines()
+    ]
+    return (
+        change_log_events,
+        [file_stat.st_ino, offset + complete_size, file_stat.st_mtime_ns],
+        rotated,
+    )
+
+
+def update_index(index, config_file_path, change_log_file_path):
+    """
+    Update the completion index with the changes since the last update.
+
+    The config file is parsed only when its signature changed. The change
+    log is read from the last read offset. All archives are read on the
+    first build, and after rotations the archives modified since the change
+    log was read, because the older ones were indexed before. An archive
+    read again only adds the values already indexed.
+
+    Parameters
+    ----------
+    index : CompletionIndexVO
+        current index.
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+
+    Returns
+    -------
+    index : CompletionIndexVO
+        updated index.
+    changed : bool
+        if True the index must be saved.
+    """
+    changed = False
+    try:
+        config_file_stat = os.stat(config_file_path)
+        # same signature as aws_config.get_file_signature without importing it.
+        config_signature = [
+            config_file_stat.st_ino,
+            config_file_stat.st_size,
+            config_file_stat.st_mtime_ns,
+        ]
+    except FileNotFoundError:
+        config_signature = None
+    if config_signature != index.config_signature:
+        import aws_config
+
+        index.config_signature = config_signature
+        index.config_values = collect_config_values(
+            aws_config.load_config(config_file_path)
+        )
+        changed = True
+
+    change_log_events, change_log_position, rotated = read_appended_events(
+        change_log_file_path, index.change_log_position
+    )
+    archive_file_paths = []
+    if index.change_log_position is None or rotated:
+        import change_log
+
+        archive_file_paths = [
+            archive_file_path
+            for _, archive_file_path in change_log.list_archive_file_paths(
+                change_log_file_path
+            )
+            if index.change_log_position is None
+            or os.stat(archive_file_path).st_mtime_ns >= index.change_log_position[2]
+        ]
+    new_values = {kind: set() for kind in COMPLETION_KINDS}
+    for archive_file_path in archive_file_paths:
+        with change_log.open_log_file(archive_file_path) as archive_file:
+            for line in archive_file:
+                add_event_values(new_values, change_log.parse_log_line(line))
+    for change_log_event in change_log_events:
+        add_event_values(new_values, change_log_event)
+    for kind in COMPLETION_KINDS:
+        history_values = merge_values(index.history_values[kind], new_values[kind])
+        if history_values is not index.history_values[kind]:
+            index.history_values[kind] = history_values
+            changed = True
+    if change_log_position != index.change_log_position:
+        index.change_log_position = change_log_position
+        changed = True
+    return index, changed
+
+
+def complete(index, kind, prefix):
+    """
+    Find the known values starting with a prefix.
+
+    Each values string is sorted, so the matches are found by binary
+    search. Every profile name is also a source profile candidate.
+
+    Parameters
+    ----------
+    index : CompletionIndexVO
+        completion index.
+    kind : str
+        "profile", "role_arn", "source_profile" or "mfa_serial".
+    prefix : str
+        typed prefix.
+
+    Returns
+    -------
+    candidates : list of str
+        sorted unique matched values.
+    """
+    values_list = [index.config_values[kind], index.history_values[kind]]
+    if kind == "source_profile":
+        values_list += [index.config_values["profile"], index.history_values["profile"]]
+    candidates = set()
+    for values in values_list:
+        candidates.update(iterate_prefix_lines(values, prefix))
+    return sorted(candidates)
+
+
+def split_completion_line(line):
+    """
+    Split the command line before the cursor into the previous and current word.
+
+    Parameters
+    ----------
+    line : str
+        register_sts_assumed_role command line before the cursor.
+
+    Returns
+    -------
+    previous_word : str
+        word before the current word. empty if not exist.
+    current_word : str
+        word under the cursor. empty after a space.
+    """
+    words = line.split()
+    if line == "" or line[-1].isspace():
+        words.append("")
+    return (words[-2] if len(words) > 1 else ""), words[-1]
+
+
+def update_saved_index(
+    config_file_path, change_log_file_path, index_file_path, rebuild=False
+):
+    """
+    Load, update and save the completion index.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    index_file_path : str
+        completion index file path.
+    rebuild : bool
+        if True the saved index is ignored and built again.
+
+    Returns
+    -------
+    index : CompletionIndexVO
+        updated index. not saved if the index file is not writable.
+    """
+    index = empty_index() if rebuild else load_index(index_file_path)
+    index, changed = update_index(index, config_file_path, change_log_file_path)
+    if changed:
+        try:
+            save_index(index_file_path, index)
+        except OSError as error:
+            print("completion index save error. " + str(error), file=sys.stderr)
+    return index
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Shell completion index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("complete", "update"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("--config-file", required=True)
+        command_parser.add_argument("--change-log-file", required=True)
+        command_parser.add_argument("--index-file")
+        if command == "complete":
+            target_group = command_parser.add_mutually_exclusive_group(required=True)
+            target_group.add_argument("--kind", choices=COMPLETION_KINDS)
+            target_group.add_argument("--line")
+            target_group.add_argument("--bash", action="store_true")
+            command_parser.add_argument("--prefix", default="")
+            command_parser.add_argument("words", nargs="*")
+        else:
+            command_parser.add_argument("--rebuild", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute completion index command.
+
+    complete prints the candidates one per line.
+    with --kind, the known values starting with --prefix.
+    with --line, the options or the values of the option before the
+    current word of the command line. (zsh)
+    with --bash, the same for COMP_LINE and COMP_POINT of `complete -C`,
+    trimmed to the word bash is completing after ":".
+    update updates the index (builds it again with --rebuild) and prints
+    the number of values of each kind.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        always 0.
+    """
+    arguments = parse_arguments(argv)
+    config_file_path = os.path.expanduser(arguments.config_file)
+    change_log_file_path = os.path.expanduser(arguments.change_log_file)
+    index_file_path = (
+        os.path.expanduser(arguments.index_file)
+        if arguments.index_file
+        else get_index_file_path(change_log_file_path)
+    )
+    if arguments.command == "update":
+        index = update_saved_index(
+            config_file_path, change_log_file_path, index_file_path, arguments.rebuild
+        )
+        for kind in COMPLETION_KINDS:
+            print(kind + "\t" + str(len(complete(index, kind, ""))))
+        return 0
+
+    kind = arguments.kind
+    current_word = arguments.prefix
+    bash_word = None
+    if kind is None:
+        if arguments.bash:
+            line = os.environ.get("COMP_LINE", "")
+            line = line[: int(os.environ.get("COMP_POINT", len(line)))]
+            bash_word = arguments.words[1] if len(arguments.words) > 1 else ""
+        else:
+            line = arguments.line
+        previous_word, current_word = split_completion_line(line)
+        kind = OPTION_KINDS.get(previous_word)
+        if previous_word == SWITCH_OPTION and current_word.startswith("arn:"):
+            # --switch takes a profile name, or a role arn registered first.
+            kind = "role_arn"
+        if kind is None:
+            candidates = []
+            if current_word.startswith("-") and previous_word not in VALUE_OPTIONS:
+                candidates = [
+                    option
+                    for option in COMPLETION_OPTIONS
+                    if option.startswith(current_word)
+                ]
+    if kind is not None:
+        candidates = complete(
+            update_saved_index(config_file_path, change_log_file_path, index_file_path),
+            kind,
+            current_word,
+        )
+    if bash_word is not None and current_word.endswith(bash_word):
+        candidates = [
+            candidate[len(current_word) - len(bash_word) :] for candidate in candidates
+        ]
+    for candidate in candidates:
+        print(candidate)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,528 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import aws_config
+import change_log
+import file_util
+
+## const value
+CHECKPOINT_FILE_SUFFIX = ".checkpoints.json"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILE_ENCODING = "utf-8"
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+# events are appended after the config file lock is released, so two
+# writers can append in the reverse order of their times. a checkpoint is
+# made only after this many seconds passed, longer than the lock timeout.
+CHECKPOINT_SETTLE_SECONDS = 60
+PROFILE_KEYS = ("role_arn", "source_profile", "mfa_serial", "comment", "time")
+REPLACED_KEYS = ("role_arn", "source_profile", "mfa_serial", "credential_process")
+OUTPUT_FORMATS = ("diff", "config", "json")
+
+
+class CheckpointVO:
+    """
+    Managed profiles made by all change log events at or before a time.
+    """
+
+    __slots__ = ("time", "profiles")
+
+    def __init__(self, time, profiles):
+        """
+        Parameters
+        ----------
+        time : datetime.datetime
+            aware datetime. every event at or before this time is applied.
+        profiles : dict
+            profile name to the PROFILE_KEYS values of the last REGISTERED
+            event of the profile.
+        """
+        self.time = time
+        self.profiles = profiles
+
+    def to_dict(self):
+        """
+        Convert to JSON serializable dict.
+
+        Returns
+        -------
+        checkpoint : dict
+            "time" ISO 8601 string and "profiles".
+        """
+        return {"time": self.time.isoformat(), "profiles": self.profiles}
+
+
+def get_checkpoint_file_path(change_log_file_path):
+    """
+    Get the sidecar checkpoint file path of a change log.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+
+    Returns
+    -------
+    checkpoint_file_path : str
+        checkpoint file path.
+        (ex. "~/.aws/.sts_assumed_role.log.checkpoints.json")
+    """
+    change_log_dir_path, change_log_file_name = os.path.split(
+        os.path.abspath(change_log_file_path)
+    )
+    return os.path.join(
+        change_log_dir_path, "." + change_log_file_name + CHECKPOINT_FILE_SUFFIX
+    )
+
+
+def load_checkpoints(checkpoint_file_path):
+    """
+    Load checkpoints.
+
+    Parameters
+    ----------
+    checkpoint_file_path : str
+        checkpoint file path.
+
+    Returns
+    -------
+    checkpoints : list of CheckpointVO
+        checkpoints from the oldest. empty if the file not exist, broken or
+        old version.
+    """
+    try:
+        with open(checkpoint_file_path, "rb") as checkpoint_file:
+            saved = json.loads(checkpoint_file.read().decode(CHECKPOINT_FILE_ENCODING))
+        if saved["version"] != CHECKPOINT_VERSION:
+            return []
+        return [
+            CheckpointVO(
+                datetime.datetime.fromisoformat(checkpoint["time"]),
+                checkpoint["profiles"],
+            )
+            for checkpoint in saved["checkpoints"]
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def save_checkpoints(checkpoint_file_path, checkpoints):
+    """
+    Save checkpoints.
+
+    Parameters
+    ----------
+    checkpoint_file_path : str
+        checkpoint file path.
+    checkpoints : list of CheckpointVO
+        checkpoints from the oldest.
+    """
+    file_util.write_file_atomically(
+        checkpoint_file_path,
+        [
+            json.dumps(
+                {
+                    "version": CHECKPOINT_VERSION,
+                    "checkpoints": [checkpoint.to_dict() for checkpoint in checkpoints],
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode(CHECKPOINT_FILE_ENCODING)
+        ],
+    )
+
+
+def find_checkpoint(checkpoints, at):
+    """
+    Find the newest checkpoint usable for a time.
+
+    Parameters
+    ----------
+    checkpoints : list of CheckpointVO
+        checkpoints from the oldest.
+    at : datetime.datetime
+        replay target time. the newest checkpoint if None.
+
+    Returns
+    -------
+    checkpoint : CheckpointVO
+        newest checkpoint at or before the time. None if not exist.
+    """
+    for checkpoint in reversed(checkpoints):
+        if at is None or checkpoint.time <= at:
+            return checkpoint
+    return None
+
+
+def apply_event(profiles, change_log_event):
+    """
+    Apply a change log event to managed profiles.
+
+    SWITCHED events do not change the config file, so they are ignored.
+
+    Parameters
+    ----------
+    profiles : dict
+        profile name to the PROFILE_KEYS values. updated in place.
+    change_log_event : dict
+        change log event.
+    """
+    if change_log_event["event"] == change_log.EVENT_REGISTERED:
+        profiles[change_log_event["profile"]] = {
+            key: change_log_event.get(key) for key in PROFILE_KEYS
+        }
+    elif change_log_event["event"] == change_log.EVENT_DELETED:
+        profiles.pop(change_log_event["profile"], None)
+
+
+def replay(
+    change_log_file_path, checkpoints, at, now, interval=DEFAULT_CHECKPOINT_INTERVAL
+):
+    """
+    Rebuild the managed profiles at a time from the change log.
+
+    The replay starts from the newest checkpoint at or before the time, and
+    archives last modified before the checkpoint are not read. When the
+    replay starts from the newest checkpoint, a new checkpoint is made
+    every interval events. A new checkpoint is kept pending until an event
+    later than its time plus CHECKPOINT_SETTLE_SECONDS is read, and events
+    appended late with an earlier time are applied to it meanwhile.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    checkpoints : list of CheckpointVO
+        checkpoints from the oldest.
+    at : datetime.datetime
+        aware replay target time. the end of the change log if None.
+    now : datetime.datetime
+        aware current datetime.
+    interval : int
+        number of events between checkpoints. no checkpoint is made if 0.
+
+    Returns
+    -------
+    profiles : dict
+        profile name to the PROFILE_KEYS values at the time.
+    new_checkpoints : list of CheckpointVO
+        checkpoints made by this replay, from the oldest.
+    """
+    checkpoint = find_checkpoint(checkpoints, at)
+    profiles = dict(checkpoint.profiles) if checkpoint is not None else {}
+    checkpoint_time = checkpoint.time if checkpoint is not None else None
+    collecting = interval > 0 and (
+        len(checkpoints) == 0 or checkpoint is checkpoints[-1]
+    )
+    settle = datetime.timedelta(seconds=CHECKPOINT_SETTLE_SECONDS)
+
+    new_checkpoints = []
+    pending = None
+    latest_time = checkpoint_time
+    event_count = 0
+    for line in change_log.read_lines(change_log_file_path, checkpoint_time):
+        change_log_event = change_log.parse_log_line(line.strip())
+        if change_log_event is None:
+            continue
+        try:
+            event_time = datetime.datetime.fromisoformat(change_log_event["time"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if checkpoint_time is not None and event_time <= checkpoint_time:
+            continue
+        if at is not None and event_time > at:
+            if event_time > at + settle:
+                break
+            continue
+
+        if pending is not None and event_time <= pending.time:
+            apply_event(pending.profiles, change_log_event)
+        apply_event(profiles, change_log_event)
+        if latest_time is None or event_time > latest_time:
+            latest_time = event_time
+        event_count += 1
+
+        if pending is not None and event_time > pending.time + settle:
+            new_checkpoints.append(pending)
+            pending = None
+        if (
+            collecting
+            and pending is None
+            and event_count >= interval
+            and latest_time < now - settle
+        ):
+            pending = CheckpointVO(latest_time, dict(profiles))
+            event_count = 0
+    if pending is not None:
+        new_checkpoints.append(pending)
+    return profiles, new_checkpoints
+
+
+def replay_saved(change_log_file_path, at, now, interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """
+    Replay with the saved checkpoints and save the new checkpoints.
+
+    Parameters
+    ----------
+    change_log_file_path : str
+        change log file path.
+    at : datetime.datetime
+        aware replay target time. the end of the change log if None.
+    now : datetime.datetime
+        aware current datetime.
+    interval : int
+        number of events between checkpoints. no checkpoint is made if 0.
+
+    Returns
+    -------
+    profiles : dict
+        profile name to the PROFILE_KEYS values at the time.
+    """
+    checkpoint_file_path = get_checkpoint_file_path(change_log_file_path)
+    checkpoints = load_checkpoints(checkpoint_file_path)
+    profiles, new_checkpoints = replay(
+        change_log_file_path, checkpoints, at, now, interval
+    )
+    if len(new_checkpoints) > 0:
+        try:
+            save_checkpoints(checkpoint_file_path, checkpoints + new_checkpoints)
+        except OSError:
+            pass
+    return profiles
+
+
+def make_section(profile_name, profile, section=None):
+    """
+    Make the section of a managed profile at a time.
+
+    The current section is kept if it has the same role. Otherwise the
+    recorded values replace the role keys of the current section, and the
+    other keys (ex. region) are kept.
+
+    Parameters
+    ----------
+    profile_name : str
+        profile name.
+    profile : dict
+        PROFILE_KEYS values of the profile.
+    section : aws_config.ProfileSection
+        current section of the profile. None if not exist.
+
+    Returns
+    -------
+    section : aws_config.ProfileSection
+        section of the profile at the time.
+    """
+    if (
+        section is not None
+        and aws_config.get_section_role_arn(section) == profile["role_arn"]
+        and section.get("source_profile") in (None, profile["source_profile"])
+    ):
+        return section
+
+    lines = [
+        "role_arn = " + str(profile["role_arn"]),
+        "source_profile = " + str(profile["source_profile"]),
+    ]
+    if profile["mfa_serial"]:
+        lines.append("mfa_serial = " + profile["mfa_serial"])
+    header = aws_config.make_profile_header(profile_name)
+    if section is not None:
+        header = section.header
+        lines.extend(
+            line
+            for line in section.lines
+            if line.partition("=")[0].strip() not in REPLACED_KEYS
+        )
+    return aws_config.ProfileSection(header, profile_name, lines)
+
+
+def render_config(config, profiles, managed_profile_names):
+    """
+    Render the config file with the managed profiles at a time.
+
+    Sections not managed by the change log are kept as is, so the result
+    only differs from the current config by the managed profiles.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        current config.
+    profiles : dict
+        managed profiles at the time.
+    managed_profile_names : set of str
+        profiles managed now or at the time.
+
+    Returns
+    -------
+    config_string : str
+        rendered config file string.
+    """
+    sections = []
+    rendered_profile_names = set()
+    for section in config.sections:
+        if section is None:
+            continue
+        if section.header is None or section.name not in managed_profile_names:
+            sections.append(section)
+            continue
+        if section.name in rendered_profile_names or section.name not in profiles:
+            continue
+        sections.append(make_section(section.name, profiles[section.name], section))
+        rendered_profile_names.add(section.name)
+    for profile_name in sorted(profiles):
+        if profile_name not in rendered_profile_names:
+            sections.append(make_section(profile_name, profiles[profile_name]))
+    return aws_config.AwsConfig(sections).to_string()
+
+
+def as_of(
+    config_file_path,
+    change_log_file_path,
+    at,
+    output_format,
+    now,
+    interval=DEFAULT_CHECKPOINT_INTERVAL,
+):
+    """
+    Show the managed profiles of the config file at a time.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    change_log_file_path : str
+        change log file path.
+    at : datetime.datetime
+        aware target time.
+    output_format : str
+        "diff" from the current config, rendered "config" or "json" of the
+        managed profiles.
+    now : datetime.datetime
+        aware current datetime.
+    interval : int
+        number of events between checkpoints. no checkpoint is made if 0.
+
+    Returns
+    -------
+    output : str
+        formatted output.
+    """
+    profiles = replay_saved(change_log_file_path, at, now, interval)
+    if output_format == "json":
+        return json.dumps(profiles, ensure_ascii=False, indent=2, sort_keys=True) + "\n"
+
+    import difflib
+
+    current_profiles = replay_saved(change_log_file_path, None, now, interval)
+    config = aws_config.load_config(config_file_path)
+    config_string = render_config(
+        config, profiles, set(profiles) | set(current_profiles)
+    )
+    if output_format == "config":
+        return config_string
+    return "".join(
+        difflib.unified_diff(
+            config.to_string().splitlines(keepends=True),
+            config_string.splitlines(keepends=True),
+            config_file_path,
+            config_file_path + "@" + at.isoformat(),
+        )
+    )
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Point-in-time replay of the AWS CLI config file."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    as_of_parser = subparsers.add_parser("as-of")
+    as_of_parser.add_argument("--config-file", required=True)
+    as_of_parser.add_argument("--change-log-file", required=True)
+    as_of_parser.add_argument(
+        "--at", required=True, help="ISO 8601 datetime. local time zone if no offset."
+    )
+    as_of_parser.add_argument("--format", choices=OUTPUT_FORMATS, default="diff")
+    as_of_parser.add_argument(
+        "--checkpoint-interval", type=int, default=DEFAULT_CHECKPOINT_INTERVAL
+    )
+
+    checkpoint_parser = subparsers.add_parser("checkpoint")
+    checkpoint_parser.add_argument("--change-log-file", required=True)
+    checkpoint_parser.add_argument(
+        "--checkpoint-interval", type=int, default=DEFAULT_CHECKPOINT_INTERVAL
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute config history command.
+
+    as-of prints the config file at --at as a diff from the current file,
+    the rendered config file or JSON of the managed profiles.
+    checkpoint replays the change log after the newest checkpoint, saves
+    the new checkpoints and prints the number of checkpoints.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    now = datetime.datetime.now().astimezone()
+    if arguments.command == "as-of":
+        try:
+            at = change_log.parse_datetime_argument(arguments.at)
+        except ValueError as error:
+            print("invalid --at. " + str(error), file=sys.stderr)
+            return 1
+        sys.stdout.write(
+            as_of(
+                arguments.config_file,
+                arguments.change_log_file,
+                at,
+                arguments.format,
+                now,
+                arguments.checkpoint_interval,
+            )
+        )
+    elif arguments.command == "checkpoint":
+        replay_saved(
+            arguments.change_log_file, None, now, arguments.checkpoint_interval
+        )
+        print(
+            str(
+                len(
+                    load_checkpoints(
+                        get_checkpoint_file_path(arguments.change_log_file)
+                    )
+                )
+            )
+            + " checkpoints."
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,390 @@
+import argparse
+import datetime
+import os
+import sys
+import aws_config
+import backup_store
+import file_util
+
+## const value
+DEFAULT_CREDENTIALS_FILE_PATH = "~/.aws/credentials"
+ISSUE_DUPLICATE = "duplicate"
+ISSUE_DANGLING_SOURCE_PROFILE = "dangling_source_profile"
+ISSUE_DANGLING_SECTION = "dangling_section"
+ISSUE_CYCLE = "cycle"
+ISSUE_UNUSED = "unused"
+CREDENTIAL_KEYS = (
+    "aws_access_key_id",
+    "credential_process",
+    "credential_source",
+    "sso_session",
+    "sso_start_url",
+    "web_identity_token_file",
+)
+# keys of a profile naming a non-profile section. (ex. "[sso-session my-sso]")
+SECTION_REFERENCE_KEYS = (
+    ("sso_session", "sso-session"),
+    ("services", "services"),
+)
+
+
+class LintIssueVO:
+    """
+    Problem found in AWS CLI config file.
+    """
+
+    __slots__ = ("kind", "profile_name", "message")
+
+    def __init__(self, kind, profile_name, message):
+        """
+        Parameters
+        ----------
+        kind : str
+            "duplicate", "dangling_source_profile", "dangling_section", "cycle"
+            or "unused".
+        profile_name : str
+            profile name of the issue. the first profile for a cycle.
+        message : str
+            issue detail.
+        """
+        self.kind = kind
+        self.profile_name = profile_name
+        self.message = message
+
+
+def merge_sections(sections):
+    """
+    Merge duplicate sections of a profile into one.
+
+    A later value overrides the same key, same as the AWS CLI. Keys keep
+    the order of the first appearance and the other lines are kept.
+
+    Parameters
+    ----------
+    sections : list of aws_config.ProfileSection
+        sections of one profile in file order.
+
+    Returns
+    -------
+    section : aws_config.ProfileSection
+        merged section with the header of the first section.
+    """
+    if len(sections) == 1:
+        return sections[0]
+    lines = []
+    key_positions = {}
+    for section in sections:
+        for line in section.lines:
+            separator_index = line.find("=")
+            if separator_index < 0:
+                lines.append(line)
+                continue
+            key = line[:separator_index].strip()
+            if key in key_positions:
+                lines[key_positions[key]] = line
+            else:
+                key_positions[key] = len(lines)
+                lines.append(line)
+    return aws_config.ProfileSection(sections[0].header, sections[0].name, lines)
+
+
+def has_credentials(section):
+    """
+    Whether the section provides credentials without source_profile.
+
+    Parameters
+    ----------
+    section : aws_config.ProfileSection
+        profile section.
+
+    Returns
+    -------
+    has_credentials : bool
+        if one of CREDENTIAL_KEYS is set True. otherwise False.
+    """
+    return any(section.get(key) for key in CREDENTIAL_KEYS)
+
+
+def find_cycles(source_profiles):
+    """
+    Find source_profile cycles in linear time.
+
+    Each profile has at most one source_profile, so every walk ends at a
+    profile without source_profile, at a visited profile or on the current
+    walk, which is a new cycle.
+
+    Parameters
+    ----------
+    source_profiles : dict
+        profile name to source profile name.
+
+    Returns
+    -------
+    cycles : list of list of str
+        profile names of each cycle in source_profile order.
+    """
+    cycles = []
+    visited = set()
+    for start in source_profiles:
+        if start in visited:
+            continue
+        walk = []
+        walk_positions = {}
+        profile_name = start
+        while profile_name is not None and profile_name not in visited:
+            visited.add(profile_name)
+            walk_positions[profile_name] = len(walk)
+            walk.append(profile_name)
+            profile_name = source_profiles.get(profile_name)
+        if profile_name in walk_positions:
+            cycles.append(walk[walk_positions[profile_name] :])
+    return cycles
+
+
+def lint_config(config, credential_profile_names=()):
+    """
+    Lint the profile dependency graph of AWS CLI config file.
+
+    Every profile is a node and its source_profile is the edge, so each
+    check is one pass over the profiles. Non-profile sections (ex.
+    "[sso-session my-sso]", "[services my-services]") are not nodes, and
+    only checked to exist when a profile refers to them.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+    credential_profile_names : iterable of str
+        profile names of the credentials file. they are valid source
+        profiles.
+
+    Returns
+    -------
+    issues : list of LintIssueVO
+        found issues ordered by kind and file order.
+    """
+    duplicates = []
+    profiles = {}
+    non_profile_section_names = set()
+    for profile_name, positions in config.profile_index.items():
+        sections = [config.sections[position] for position in positions]
+        if len(sections) > 1:
+            duplicates.append(
+                LintIssueVO(
+                    ISSUE_DUPLICATE,
+                    profile_name,
+                    str(len(sections)) + " sections.",
+                )
+            )
+        if aws_config.get_section_type(sections[0].header) != (
+            aws_config.SECTION_TYPE_PROFILE
+        ):
+            non_profile_section_names.add(profile_name)
+            continue
+        profiles[profile_name] = merge_sections(sections)
+
+    credential_profile_names = set(credential_profile_names)
+    dangling_source_profiles = []
+    dangling_sections = []
+    source_profiles = {}
+    for profile_name, section in profiles.items():
+        for key, section_type in SECTION_REFERENCE_KEYS:
+            section_name = section.get(key)
+            if section_name and (
+                section_type + " " + section_name not in non_profile_section_names
+            ):
+                dangling_sections.append(
+                    LintIssueVO(
+                        ISSUE_DANGLING_SECTION,
+                        profile_name,
+                        key + " " + section_name + " not exist.",
+                    )
+                )
+        source_profile = section.get("source_profile")
+        if not source_profile:
+            continue
+        if (
+            source_profile not in profiles
+            and source_profile not in credential_profile_names
+        ):
+            dangling_source_profiles.append(
+                LintIssueVO(
+                    ISSUE_DANGLING_SOURCE_PROFILE,
+                    profile_name,
+                    "source_profile " + source_profile + " not exist.",
+                )
+            )
+            continue
+        if source_profile == profile_name and has_credentials(section):
+            continue
+        source_profiles[profile_name] = source_profile
+
+    cycles = [
+        LintIssueVO(ISSUE_CYCLE, cycle[0], " -> ".join(cycle + [cycle[0]]))
+        for cycle in find_cycles(source_profiles)
+    ]
+
+    referenced_profile_names = set(
+        profiles[profile_name].get("source_profile") for profile_name in profiles
+    )
+    unused = [
+        LintIssueVO(
+            ISSUE_UNUSED,
+            profile_name,
+            "no role_arn, credentials or profile using it as source_profile.",
+        )
+        for profile_name, section in profiles.items()
+        if profile_name != aws_config.DEFAULT_PROFILE_NAME
+        and profile_name not in referenced_profile_names
+        and not section.get("role_arn")
+        and not has_credentials(section)
+        and profile_name not in credential_profile_names
+    ]
+    return duplicates + dangling_source_profiles + dangling_sections + cycles + unused
+
+
+def compact_config(config):
+    """
+    Merge duplicate sections of every profile in place of the first one.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+
+    Returns
+    -------
+    compacted_config : aws_config.AwsConfig
+        config without duplicate sections.
+    merged_count : int
+        number of removed sections.
+    """
+    sections = []
+    merged_count = 0
+    for position, section in enumerate(config.sections):
+        if section is None:
+            continue
+        if section.header is None:
+            sections.append(section)
+            continue
+        positions = config.profile_index[section.name]
+        if positions[0] != position:
+            merged_count += 1
+            continue
+        sections.append(
+            merge_sections([config.sections[position] for position in positions])
+        )
+    return aws_config.AwsConfig(sections), merged_count
+
+
+def load_credential_profile_names(credentials_file_path):
+    """
+    Load profile names of the AWS CLI credentials file.
+
+    Parameters
+    ----------
+    credentials_file_path : str
+        credentials file path.
+
+    Returns
+    -------
+    profile_names : list of str
+        profile names. empty if the file not exist.
+    """
+    return aws_config.load_config(credentials_file_path).profile_names()
+
+
+def format_issues(issues):
+    """
+    Format lint issues.
+
+    Parameters
+    ----------
+    issues : list of LintIssueVO
+        lint issues.
+
+    Returns
+    -------
+    lines : list of str
+        one tab separated line per issue and a total line.
+    """
+    lines = [
+        "\t".join([issue.kind, issue.profile_name, issue.message]) for issue in issues
+    ]
+    lines.append(str(len(issues)) + " issues found.")
+    return lines
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="AWS CLI config file linter.")
+    parser.add_argument("--config-file", required=True)
+    parser.add_argument("--credentials-file", default=DEFAULT_CREDENTIALS_FILE_PATH)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--backup-dir")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Lint AWS CLI config file and print the issues.
+
+    With --compact, duplicate sections are merged and the config file is
+    rewritten once under the config file lock. (backed up to --backup-dir)
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if no issue is left. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    config_file_path = os.path.expanduser(arguments.config_file)
+    credential_profile_names = load_credential_profile_names(
+        os.path.expanduser(arguments.credentials_file)
+    )
+    if not arguments.compact:
+        config = aws_config.load_config(config_file_path)
+    else:
+        try:
+            with file_util.lock_file(config_file_path):
+                config, merged_count = compact_config(
+                    aws_config.load_config(config_file_path)
+                )
+                if merged_count > 0:
+                    if arguments.backup_dir:
+                        backup_store.save_snapshot(
+                            os.path.expanduser(arguments.backup_dir),
+                            config_file_path,
+                            datetime.datetime.now(),
+                        )
+                    aws_config.save_config(config, config_file_path)
+        except file_util.LockTimeoutError as error:
+            print("file is locked by another process. " + str(error), file=sys.stderr)
+            return 1
+        print("merged " + str(merged_count) + " duplicate sections.")
+
+    issues = lint_config(config, credential_profile_names)
+    for line in format_issues(issues):
+        print(line)
+    return 1 if len(issues) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,1021 @@
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import re
+import shlex
+import sys
+import time
+import aws_config
+import file_util
+
+## const value
+STS_API_VERSION = "2011-06-15"
+STS_SERVICE_NAME = "sts"
+DEFAULT_STS_ENDPOINT = "https://sts.amazonaws.com"
+DEFAULT_STS_REGION = "us-east-1"
+STS_ENDPOINT_ENVIRONMENT_VARIABLE = "AWS_ENDPOINT_URL_STS"
+STS_REGIONAL_HOST_PATTERN = re.compile(r"^sts\.([a-z0-9-]+)\.amazonaws\.com")
+STS_TIMEOUT_SECONDS = 10
+DEFAULT_CONFIG_FILE_PATH = "~/.aws/config"
+DEFAULT_CREDENTIALS_FILE_PATH = "~/.aws/credentials"
+CONFIG_FILE_ENVIRONMENT_VARIABLE = "AWS_CONFIG_FILE"
+CREDENTIALS_FILE_ENVIRONMENT_VARIABLE = "AWS_SHARED_CREDENTIALS_FILE"
+DEFAULT_DURATION_SECONDS = 3600
+DEFAULT_MFA_DURATION_SECONDS = 43200
+DEFAULT_REFRESH_AHEAD_SECONDS = 1200
+DEFAULT_REFRESH_INTERVAL_SECONDS = 60
+DEFAULT_WORKERS = 4
+CREDENTIAL_CACHE_SCRIPT_NAME = "credential_cache.py"
+CREDENTIAL_PROCESS_COMMAND = "credential-process"
+CACHE_FILE_SUFFIX = ".json"
+MAX_SOURCE_PROFILE_DEPTH = 10
+AWS_CLI_EXPORT_CREDENTIALS_COMMAND = (
+    "aws",
+    "configure",
+    "export-credentials",
+    "--format",
+    "process",
+    "--profile",
+)
+ROLE_SESSION_NAME_PREFIX = "sts-assumed-role-"
+ROLE_SESSION_NAME_INVALID_PATTERN = re.compile(r"[^\w+=,.@-]")
+ROLE_SESSION_NAME_MAX_LENGTH = 64
+
+
+class StsError(RuntimeError):
+    """
+    STS request failed or the source credentials are not available.
+    """
+
+
+class CredentialsVO:
+    """
+    AWS credentials with the expiration.
+    """
+
+    __slots__ = ("access_key_id", "secret_access_key", "session_token", "expiration")
+
+    def __init__(self, access_key_id, secret_access_key, session_token, expiration):
+        """
+        Parameters
+        ----------
+        access_key_id : str
+            access key id.
+        secret_access_key : str
+            secret access key.
+        session_token : str
+            session token. None for long term credentials.
+        expiration : datetime.datetime
+            aware expiration datetime. None for long term credentials.
+        """
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.session_token = session_token
+        self.expiration = expiration
+
+    def expires_within(self, seconds, now):
+        """
+        Whether the credentials expire within the seconds.
+
+        Parameters
+        ----------
+        seconds : float
+            refresh ahead seconds.
+        now : datetime.datetime
+            aware current datetime.
+
+        Returns
+        -------
+        expires : bool
+            if expire True. always False for long term credentials.
+        """
+        if self.expiration is None:
+            return False
+        return self.expiration - now <= datetime.timedelta(seconds=seconds)
+
+    def to_dict(self):
+        """
+        Convert to the credential_process output format.
+
+        Returns
+        -------
+        credentials : dict
+            "Version" 1 credentials.
+        """
+        credentials = {
+            "Version": 1,
+            "AccessKeyId": self.access_key_id,
+            "SecretAccessKey": self.secret_access_key,
+        }
+        if self.session_token:
+            credentials["SessionToken"] = self.session_token
+        if self.expiration is not None:
+            credentials["Expiration"] = (
+                self.expiration.astimezone(datetime.timezone.utc)
+                .isoformat(timespec="seconds")
+                .replace("+00:00", "Z")
+            )
+        return credentials
+
+
+class CachedProfileVO:
+    """
+    Assumed role profile whose credentials are served from the cache.
+    """
+
+    __slots__ = (
+        "cache_dir_path",
+        "profile_name",
+        "role_arn",
+        "source_profile",
+        "mfa_serial",
+    )
+
+    def __init__(
+        self, cache_dir_path, profile_name, role_arn, source_profile, mfa_serial
+    ):
+        """
+        Parameters
+        ----------
+        cache_dir_path : str
+            credential cache directory path.
+        profile_name : str
+            profile name.
+        role_arn : str
+            assumed role arn.
+        source_profile : str
+            source profile name.
+        mfa_serial : str
+            mfa serial arn. empty if not used.
+        """
+        self.cache_dir_path = cache_dir_path
+        self.profile_name = profile_name
+        self.role_arn = role_arn
+        self.source_profile = source_profile
+        self.mfa_serial = mfa_serial
+
+
+def parse_credentials(credentials):
+    """
+    Parse credentials of the credential_process output format.
+
+    Parameters
+    ----------
+    credentials : dict
+        credential_process output or STS Credentials element values.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        parsed credentials.
+    """
+    expiration = credentials.get("Expiration")
+    if expiration:
+        expiration = datetime.datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+    return CredentialsVO(
+        credentials["AccessKeyId"],
+        credentials["SecretAccessKey"],
+        credentials.get("SessionToken"),
+        expiration or None,
+    )
+
+
+def sign_request(method, url, headers, body, region, service, credentials, now):
+    """
+    Sign an HTTP request with AWS Signature Version 4.
+
+    Parameters
+    ----------
+    method : str
+        HTTP method.
+    url : str
+        request url with the query string.
+    headers : dict
+        request headers to sign. lower case names.
+    body : bytes
+        request body.
+    region : str
+        signing region name.
+    service : str
+        signing service name.
+    credentials : CredentialsVO
+        signing credentials.
+    now : datetime.datetime
+        aware signing datetime.
+
+    Returns
+    -------
+    signed_headers : dict
+        request headers with host, x-amz-date, x-amz-security-token and
+        authorization.
+    """
+    import urllib.parse
+
+    split_url = urllib.parse.urlsplit(url)
+    amz_date = now.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    headers = dict(headers)
+    headers["host"] = split_url.netloc
+    headers["x-amz-date"] = amz_date
+    if credentials.session_token:
+        headers["x-amz-security-token"] = credentials.session_token
+
+    header_names = sorted(headers)
+    canonical_query = "&".join(
+        urllib.parse.quote(key, safe="-_.~")
+        + "="
+        + urllib.parse.quote(value, safe="-_.~")
+        for key, value in sorted(
+            urllib.parse.parse_qsl(split_url.query, keep_blank_values=True)
+        )
+    )
+    canonical_request = "\n".join(
+        [
+            method,
+            urllib.parse.quote(split_url.path or "/", safe="/-_.~"),
+            canonical_query,
+            "".join(
+                name + ":" + " ".join(headers[name].split()) + "\n"
+                for name in header_names
+            ),
+            ";".join(header_names),
+            hashlib.sha256(body).hexdigest(),
+        ]
+    )
+    credential_scope = "/".join([amz_date[:8], region, service, "aws4_request"])
+    string_to_sign = "\n".join(
+        [
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            credential_scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ]
+    )
+    signing_key = ("AWS4" + credentials.secret_access_key).encode("utf-8")
+    for scope_value in (amz_date[:8], region, service, "aws4_request"):
+        signing_key = hmac.new(
+            signing_key, scope_value.encode("utf-8"), hashlib.sha256
+        ).digest()
+    headers["authorization"] = (
+        "AWS4-HMAC-SHA256 Credential="
+        + credentials.access_key_id
+        + "/"
+        + credential_scope
+        + ", SignedHeaders="
+        + ";".join(header_names)
+        + ", Signature="
+        + hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+    )
+    return headers
+
+
+def get_sts_endpoint():
+    """
+    Get the STS endpoint url.
+
+    Returns
+    -------
+    endpoint : str
+        AWS_ENDPOINT_URL_STS if set. otherwise the global endpoint.
+    """
+    return os.environ.get(STS_ENDPOINT_ENVIRONMENT_VARIABLE) or DEFAULT_STS_ENDPOINT
+
+
+def get_sts_signing_region(endpoint):
+    """
+    Get the signing region of an STS endpoint.
+
+    Parameters
+    ----------
+    endpoint : str
+        STS endpoint url.
+
+    Returns
+    -------
+    region : str
+        region of a regional endpoint. otherwise "us-east-1".
+    """
+    import urllib.parse
+
+    matched = STS_REGIONAL_HOST_PATTERN.match(urllib.parse.urlsplit(endpoint).netloc)
+    return matched.group(1) if matched else DEFAULT_STS_REGION
+
+
+def call_sts(action, parameters, credentials, endpoint):
+    """
+    Call an STS action returning credentials.
+
+    Parameters
+    ----------
+    action : str
+        "AssumeRole" or "GetSessionToken".
+    parameters : dict
+        action parameters.
+    credentials : CredentialsVO
+        signing credentials.
+    endpoint : str
+        STS endpoint url.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        issued credentials.
+
+    Raises
+    ------
+    StsError
+        if STS returned an error or an invalid response.
+    """
+    import urllib.error
+    import urllib.parse
+    import urllib.request
+    import xml.etree.ElementTree
+
+    body = urllib.parse.urlencode(
+        dict(parameters, Action=action, Version=STS_API_VERSION)
+    ).encode("utf-8")
+    headers = sign_request(
+        "POST",
+        endpoint,
+        {"content-type": "application/x-www-form-urlencoded; charset=utf-8"},
+        body,
+        get_sts_signing_region(endpoint),
+        STS_SERVICE_NAME,
+        credentials,
+        datetime.datetime.now(datetime.timezone.utc),
+    )
+    request = urllib.request.Request(
+        endpoint, data=body, headers=headers, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=STS_TIMEOUT_SECONDS) as response:
+            response_body = response.read()
+    except urllib.error.HTTPError as error:
+        response_body = error.read()
+        try:
+            root = xml.etree.ElementTree.fromstring(response_body)
+            values = {
+                element.tag.rpartition("}")[2]: element.text for element in root.iter()
+            }
+        except xml.etree.ElementTree.ParseError:
+            values = {}
+        raise StsError(
+            action
+            + " failed. "
+            + (values.get("Code") or str(error.code))
+            + ": "
+            + (values.get("Message") or str(error.reason))
+        )
+    except OSError as error:
+        raise StsError(action + " failed. " + str(error))
+
+    try:
+        root = xml.etree.ElementTree.fromstring(response_body)
+    except xml.etree.ElementTree.ParseError as error:
+        raise StsError(action + " returned an invalid response. " + str(error))
+    for element in root.iter():
+        if element.tag.rpartition("}")[2] == "Credentials":
+            try:
+                return parse_credentials(
+                    {child.tag.rpartition("}")[2]: child.text for child in element}
+                )
+            except (KeyError, ValueError):
+                break
+    raise StsError(action + " returned no credentials.")
+
+
+def get_role_session_name(profile_name):
+    """
+    Get the role session name of a profile.
+
+    Parameters
+    ----------
+    profile_name : str
+        profile name.
+
+    Returns
+    -------
+    role_session_name : str
+        valid role session name. (ex. "sts-assumed-role-sts-session")
+    """
+    return ROLE_SESSION_NAME_INVALID_PATTERN.sub(
+        "-", ROLE_SESSION_NAME_PREFIX + profile_name
+    )[:ROLE_SESSION_NAME_MAX_LENGTH]
+
+
+def get_cache_file_path(cache_dir_path, cache_key):
+    """
+    Get the cache file path of a cache key.
+
+    Parameters
+    ----------
+    cache_dir_path : str
+        credential cache directory path.
+    cache_key : str
+        profile name or MFA session key.
+
+    Returns
+    -------
+    cache_file_path : str
+        sha256 hex digest named file in the directory.
+    """
+    return os.path.join(
+        cache_dir_path,
+        hashlib.sha256(cache_key.encode("utf-8")).hexdigest() + CACHE_FILE_SUFFIX,
+    )
+
+
+def get_mfa_session_cache_key(source_profile, mfa_serial):
+    """
+    Get the cache key of an MFA session.
+
+    Parameters
+    ----------
+    source_profile : str
+        source profile name.
+    mfa_serial : str
+        mfa serial arn.
+
+    Returns
+    -------
+    cache_key : str
+        MFA session cache key.
+    """
+    return "mfa-session:" + source_profile + ":" + mfa_serial
+
+
+def load_cached_credentials(cache_file_path):
+    """
+    Load cached credentials.
+
+    Parameters
+    ----------
+    cache_file_path : str
+        cache file path.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        cached credentials. None if not cached or broken.
+    """
+    try:
+        with open(cache_file_path, "r") as cache_file:
+            return parse_credentials(json.load(cache_file))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_cached_credentials(cache_file_path, credentials):
+    """
+    Save credentials to the cache only readable by the owner.
+
+    Parameters
+    ----------
+    cache_file_path : str
+        cache file path.
+    credentials : CredentialsVO
+        save target credentials.
+    """
+    cache_dir_path = os.path.dirname(cache_file_path)
+    if not os.path.isdir(cache_dir_path):
+        os.makedirs(cache_dir_path, mode=0o700)
+    file_util.write_file_atomically(
+        cache_file_path, [json.dumps(credentials.to_dict()).encode("utf-8")]
+    )
+
+
+def load_profile_settings(profile_name):
+    """
+    Load the settings of a profile from the credentials and config files.
+
+    AWS_SHARED_CREDENTIALS_FILE and AWS_CONFIG_FILE are used if set. A
+    credentials file value overrides the config file value.
+
+    Parameters
+    ----------
+    profile_name : str
+        profile name.
+
+    Returns
+    -------
+    settings : dict
+        setting key to value. empty if the profile not exist.
+    """
+    settings = {}
+    for file_path in (
+        os.environ.get(CONFIG_FILE_ENVIRONMENT_VARIABLE) or DEFAULT_CONFIG_FILE_PATH,
+        os.environ.get(CREDENTIALS_FILE_ENVIRONMENT_VARIABLE)
+        or DEFAULT_CREDENTIALS_FILE_PATH,
+    ):
+        for section in aws_config.load_config(
+            os.path.expanduser(file_path)
+        ).find_profile(profile_name):
+            for line in section.lines:
+                key, separator, value = line.partition("=")
+                if separator:
+                    settings[key.strip()] = value.strip()
+    return settings
+
+
+def make_credential_process(
+    cache_dir_path, profile_name, role_arn, source_profile, mfa_serial
+):
+    """
+    Make the credential_process value of a cached profile.
+
+    Parameters
+    ----------
+    cache_dir_path : str
+        credential cache directory path.
+    profile_name : str
+        profile name.
+    role_arn : str
+        assumed role arn.
+    source_profile : str
+        source profile name.
+    mfa_serial : str
+        mfa serial arn. not written if None or empty.
+
+    Returns
+    -------
+    credential_process : str
+        shell quoted command line.
+    """
+    command = [
+        sys.executable,
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), CREDENTIAL_CACHE_SCRIPT_NAME
+        ),
+        CREDENTIAL_PROCESS_COMMAND,
+        "--cache-dir",
+        os.path.abspath(os.path.expanduser(cache_dir_path)),
+        "--profile",
+        profile_name,
+        "--role-arn",
+        role_arn,
+        "--source-profile",
+        source_profile,
+    ]
+    if mfa_serial:
+        command.extend(["--mfa-serial", mfa_serial])
+    return shlex.join(command)
+
+
+def parse_credential_process(profile_name, credential_process):
+    """
+    Parse the credential_process value written by make_credential_process.
+
+    Parameters
+    ----------
+    profile_name : str
+        profile name of the section.
+    credential_process : str
+        credential_process value.
+
+    Returns
+    -------
+    cached_profile : CachedProfileVO
+        cached profile. None if the command is not this cache.
+    """
+    try:
+        command = shlex.split(credential_process)
+    except ValueError:
+        return None
+    if (
+        len(command) < 3
+        or os.path.basename(command[1]) != CREDENTIAL_CACHE_SCRIPT_NAME
+        or command[2] != CREDENTIAL_PROCESS_COMMAND
+    ):
+        return None
+    try:
+        arguments = parse_arguments(command[2:])
+    except SystemExit:
+        return None
+    if arguments.profile != profile_name:
+        return None
+    return CachedProfileVO(
+        arguments.cache_dir,
+        arguments.profile,
+        arguments.role_arn,
+        arguments.source_profile,
+        arguments.mfa_serial,
+    )
+
+
+def list_cached_profiles(config):
+    """
+    List the profiles served from the cache.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+
+    Returns
+    -------
+    cached_profiles : list of CachedProfileVO
+        cached profiles in config file order.
+    """
+    cached_profiles = []
+    for section in config.sections:
+        if section is None or section.header is None:
+            continue
+        credential_process = section.get("credential_process")
+        if not credential_process:
+            continue
+        cached_profile = parse_credential_process(section.name, credential_process)
+        if cached_profile is not None:
+            cached_profiles.append(cached_profile)
+    return cached_profiles
+
+
+def get_profile_credentials(profile_name, refresh_ahead_seconds, depth=0):
+    """
+    Get the credentials of a source profile.
+
+    Long term keys are used as they are. A profile served from this cache
+    is resolved through the cache, and another credential_process is run.
+    Other profiles (ex. SSO, credential_source or a role chain) are resolved
+    by the AWS CLI with "aws configure export-credentials".
+
+    Parameters
+    ----------
+    profile_name : str
+        source profile name.
+    refresh_ahead_seconds : float
+        refresh ahead seconds of cached profiles.
+    depth : int
+        source profile chain depth.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        source credentials.
+
+    Raises
+    ------
+    StsError
+        if the credentials are not available.
+    """
+    if depth > MAX_SOURCE_PROFILE_DEPTH:
+        raise StsError("source_profile chain is too deep. profile: " + profile_name)
+    settings = load_profile_settings(profile_name)
+    if settings.get("aws_access_key_id") and settings.get("aws_secret_access_key"):
+        return CredentialsVO(
+            settings["aws_access_key_id"],
+            settings["aws_secret_access_key"],
+            settings.get("aws_session_token"),
+            None,
+        )
+    credential_process = settings.get("credential_process")
+    if credential_process:
+        cached_profile = parse_credential_process(profile_name, credential_process)
+        if cached_profile is not None:
+            return get_credentials(cached_profile, refresh_ahead_seconds, depth + 1)
+        return run_credentials_command(
+            profile_name, "credential_process", shlex.split(credential_process)
+        )
+    return run_credentials_command(
+        profile_name,
+        "aws configure export-credentials",
+        list(AWS_CLI_EXPORT_CREDENTIALS_COMMAND) + [profile_name],
+    )
+
+
+def run_credentials_command(profile_name, command_name, command):
+    """
+    Run a command that prints credentials in the credential_process format.
+
+    Parameters
+    ----------
+    profile_name : str
+        source profile name.
+    command_name : str
+        command name for error messages.
+    command : list of str
+        command line.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        printed credentials.
+
+    Raises
+    ------
+    StsError
+        if the command is not found, fails or prints invalid credentials.
+    """
+    import subprocess
+
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    except OSError as error:
+        raise StsError(
+            command_name + " failed. profile: " + profile_name + ", " + str(error)
+        )
+    if result.returncode != 0:
+        raise StsError(command_name + " failed. profile: " + profile_name)
+    try:
+        return parse_credentials(json.loads(result.stdout))
+    except (ValueError, KeyError, TypeError):
+        raise StsError(
+            command_name + " returned invalid credentials. profile: " + profile_name
+        )
+
+
+def get_credentials(cached_profile, refresh_ahead_seconds, depth=0):
+    """
+    Get the credentials of a cached profile, assume the role if needed.
+
+    The cache file is locked while the credentials are refreshed, so the
+    refresher and credential_process never assume the same role twice.
+
+    Parameters
+    ----------
+    cached_profile : CachedProfileVO
+        cached profile.
+    refresh_ahead_seconds : float
+        cached credentials expiring within this are refreshed.
+    depth : int
+        source profile chain depth.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        assumed role credentials.
+
+    Raises
+    ------
+    StsError
+        if the role can not be assumed.
+    """
+    cache_dir_path = os.path.expanduser(cached_profile.cache_dir_path)
+    cache_file_path = get_cache_file_path(cache_dir_path, cached_profile.profile_name)
+    if not os.path.isdir(cache_dir_path):
+        os.makedirs(cache_dir_path, mode=0o700)
+    with file_util.lock_file(cache_file_path):
+        credentials = load_cached_credentials(cache_file_path)
+        if credentials is not None and not credentials.expires_within(
+            refresh_ahead_seconds, datetime.datetime.now(datetime.timezone.utc)
+        ):
+            return credentials
+
+        if cached_profile.mfa_serial:
+            source_credentials = load_cached_credentials(
+                get_cache_file_path(
+                    cache_dir_path,
+                    get_mfa_session_cache_key(
+                        cached_profile.source_profile, cached_profile.mfa_serial
+                    ),
+                )
+            )
+            if source_credentials is None or source_credentials.expires_within(
+                0, datetime.datetime.now(datetime.timezone.utc)
+            ):
+                raise StsError(
+                    "MFA session expired. run `python credential_cache.py login --profile "
+                    + cached_profile.profile_name
+                    + "`."
+                )
+        else:
+            source_credentials = get_profile_credentials(
+                cached_profile.source_profile, refresh_ahead_seconds, depth
+            )
+
+        credentials = call_sts(
+            "AssumeRole",
+            {
+                "RoleArn": cached_profile.role_arn,
+                "RoleSessionName": get_role_session_name(cached_profile.profile_name),
+                "DurationSeconds": str(DEFAULT_DURATION_SECONDS),
+            },
+            source_credentials,
+            get_sts_endpoint(),
+        )
+        save_cached_credentials(cache_file_path, credentials)
+        return credentials
+
+
+def login(cached_profile, token_code, duration_seconds=DEFAULT_MFA_DURATION_SECONDS):
+    """
+    Start an MFA session of the source profile for a cached profile.
+
+    The roles are assumed with the MFA session credentials, so they are
+    refreshed ahead without asking the token code until it expires.
+
+    Parameters
+    ----------
+    cached_profile : CachedProfileVO
+        cached profile with mfa serial.
+    token_code : str
+        MFA token code.
+    duration_seconds : int
+        MFA session seconds.
+
+    Returns
+    -------
+    credentials : CredentialsVO
+        MFA session credentials.
+    """
+    credentials = call_sts(
+        "GetSessionToken",
+        {
+            "SerialNumber": cached_profile.mfa_serial,
+            "TokenCode": token_code,
+            "DurationSeconds": str(duration_seconds),
+        },
+        get_profile_credentials(
+            cached_profile.source_profile, DEFAULT_REFRESH_AHEAD_SECONDS
+        ),
+        get_sts_endpoint(),
+    )
+    save_cached_credentials(
+        get_cache_file_path(
+            os.path.expanduser(cached_profile.cache_dir_path),
+            get_mfa_session_cache_key(
+                cached_profile.source_profile, cached_profile.mfa_serial
+            ),
+        ),
+        credentials,
+    )
+    return credentials
+
+
+def refresh_profiles(cached_profiles, refresh_ahead_seconds, workers=DEFAULT_WORKERS):
+    """
+    Refresh the cached credentials expiring soon with a thread pool.
+
+    Parameters
+    ----------
+    cached_profiles : list of CachedProfileVO
+        refresh target profiles.
+    refresh_ahead_seconds : float
+        credentials expiring within this are refreshed.
+    workers : int
+        max number of threads.
+
+    Returns
+    -------
+    errors : list of tuple of (str, str)
+        profile name and error message of failed profiles.
+    """
+
+    def refresh(cached_profile):
+        try:
+            get_credentials(cached_profile, refresh_ahead_seconds)
+        except (StsError, OSError) as error:
+            return cached_profile.profile_name, str(error)
+        return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return [error for error in executor.map(refresh, cached_profiles) if error]
+
+
+def find_cached_profile(config_file_path, profile_name):
+    """
+    Find a cached profile in the config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        profile name.
+
+    Returns
+    -------
+    cached_profile : CachedProfileVO
+        cached profile. None if the profile is not served from the cache.
+    """
+    for cached_profile in list_cached_profiles(
+        aws_config.load_config(config_file_path)
+    ):
+        if cached_profile.profile_name == profile_name:
+            return cached_profile
+    return None
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Refresh-ahead STS credential cache.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    credential_process_parser = subparsers.add_parser(CREDENTIAL_PROCESS_COMMAND)
+    credential_process_parser.add_argument("--cache-dir", required=True)
+    credential_process_parser.add_argument("--profile", required=True)
+    credential_process_parser.add_argument("--role-arn", required=True)
+    credential_process_parser.add_argument("--source-profile", required=True)
+    credential_process_parser.add_argument("--mfa-serial", default="")
+    credential_process_parser.add_argument(
+        "--refresh-ahead-seconds", type=float, default=DEFAULT_REFRESH_AHEAD_SECONDS
+    )
+
+    refresh_parser = subparsers.add_parser("refresh")
+    refresh_parser.add_argument("--config-file", default=DEFAULT_CONFIG_FILE_PATH)
+    refresh_parser.add_argument(
+        "--refresh-ahead-seconds", type=float, default=DEFAULT_REFRESH_AHEAD_SECONDS
+    )
+    refresh_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    refresh_parser.add_argument("--loop", action="store_true")
+    refresh_parser.add_argument(
+        "--interval", type=float, default=DEFAULT_REFRESH_INTERVAL_SECONDS
+    )
+
+    login_parser = subparsers.add_parser("login")
+    login_parser.add_argument("--config-file", default=DEFAULT_CONFIG_FILE_PATH)
+    login_parser.add_argument("--profile", required=True)
+    login_parser.add_argument("--token-code")
+    login_parser.add_argument(
+        "--duration-seconds", type=int, default=DEFAULT_MFA_DURATION_SECONDS
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute credential cache command.
+
+    credential-process prints the credentials of a profile for the AWS CLI.
+    refresh assumes the roles of the cached profiles expiring soon. (every
+    --interval seconds with --loop)
+    login starts the MFA session of a profile with mfa_serial.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    try:
+        if arguments.command == CREDENTIAL_PROCESS_COMMAND:
+            credentials = get_credentials(
+                CachedProfileVO(
+                    arguments.cache_dir,
+                    arguments.profile,
+                    arguments.role_arn,
+                    arguments.source_profile,
+                    arguments.mfa_serial,
+                ),
+                arguments.refresh_ahead_seconds,
+            )
+            print(json.dumps(credentials.to_dict()))
+        elif arguments.command == "refresh":
+            config_file_path = os.path.expanduser(arguments.config_file)
+            while True:
+                errors = refresh_profiles(
+                    list_cached_profiles(aws_config.load_config(config_file_path)),
+                    arguments.refresh_ahead_seconds,
+                    arguments.workers,
+                )
+                for profile_name, message in errors:
+                    print(profile_name + "\t" + message, file=sys.stderr)
+                if not arguments.loop:
+                    return 1 if errors else 0
+                time.sleep(arguments.interval)
+        elif arguments.command == "login":
+            cached_profile = find_cached_profile(
+                os.path.expanduser(arguments.config_file), arguments.profile
+            )
+            if cached_profile is None or not cached_profile.mfa_serial:
+                print(
+                    "profile " + arguments.profile + " has no cached mfa_serial.",
+                    file=sys.stderr,
+                )
+                return 1
+            token_code = arguments.token_code or input("MFA TOKEN CODE: ")
+            credentials = login(cached_profile, token_code, arguments.duration_seconds)
+            print(
+                "MFA session expires at "
+                + credentials.expiration.astimezone().isoformat(timespec="seconds")
+                + "."
+            )
+    except (StsError, file_util.LockTimeoutError) as error:
+        print(str(error), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,327 @@
+import contextlib
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+## const value
+LOCK_FILE_SUFFIX = ".lock"
+DEFAULT_LOCK_TIMEOUT = 30
+LOCK_RETRY_MIN_SECONDS = 0.001
+LOCK_RETRY_MAX_SECONDS = 0.05
+
+
+class LockTimeoutError(TimeoutError):
+    """
+    The lock of a file was not acquired within the timeout.
+    """
+
+
+def write_file_atomically(file_path, chunks, mode=None):
+    """
+    Write a file through a fsynced temporary file and rename.
+
+    Parameters
+    ----------
+    file_path : str
+        write target file path.
+    chunks : iterable of bytes-like object
+        file contents.
+    mode : int
+        permission bits of a new file, masked by the umask. a replaced file
+        keeps its own. 0600 of the temporary file if None.
+
+    Returns
+    -------
+    file_stat : os.stat_result
+        stat of the written file.
+    """
+    tmp_fd, tmp_file_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(file_path) + "_",
+        dir=os.path.dirname(os.path.abspath(file_path)),
+    )
+    try:
+        with os.fdopen(tmp_fd, "wb") as tmp_file:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+            file_stat = os.fstat(tmp_file.fileno())
+        if os.path.exists(file_path):
+            copy_mode_and_owner(file_path, tmp_file_path)
+        elif mode is not None:
+            os.chmod(tmp_file_path, mode & ~get_umask())
+        os.replace(tmp_file_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+    return file_stat
+
+
+def get_umask():
+    """
+    Get the umask of the process.
+
+    Returns
+    -------
+    umask : int
+        current umask.
+    """
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def copy_mode_and_owner(source_file_path, target_file_path):
+    """
+    Copy permission bits, and owner when running as root, to the replacing file.
+
+    Parameters
+    ----------
+    source_file_path : str
+        replaced file path.
+    target_file_path : str
+        replacing temporary file path.
+    """
+    shutil.copymode(source_file_path, target_file_path)
+    if os.geteuid() == 0:
+        file_stat = os.stat(source_file_path)
+        os.chown(target_file_path, file_stat.st_uid, file_stat.st_gid)
+
+
+def contains_block(file_path, start_signal, end_signal):
+    """
+    Stream a file and check a block from start signal to end signal exists.
+
+    Parameters
+    ----------
+    file_path : str
+        search target file path.
+    start_signal : bytes
+        block start marker.
+    end_signal : bytes
+        block end marker.
+
+    Returns
+    -------
+    is_exist : bool
+        True if the end signal is found after the first start signal.
+    """
+    return find_block_tag(file_path, start_signal, end_signal) is not None
+
+
+def find_block_tag(file_path, start_signal, end_signal):
+    """
+    Stream a file and get the text after the start signal of the first block.
+
+    Parameters
+    ----------
+    file_path : str
+        search target file path.
+    start_signal : bytes
+        block start marker.
+    end_signal : bytes
+        block end marker.
+
+    Returns
+    -------
+    tag : bytes
+        stripped text following the start signal on its line. (ex. b"sha256:...")
+        None if the end signal is not found after the first start signal.
+    """
+    with open(file_path, "rb") as target_file:
+        tag = None
+        rest = None
+        for line in target_file:
+            if rest is None:
+                start_index = line.find(start_signal)
+                if start_index < 0:
+                    continue
+                line = line[start_index + len(start_signal) :]
+                end_index = line.find(end_signal)
+                tag = (line if end_index < 0 else line[:end_index]).strip()
+            rest = line
+            if end_signal in rest:
+                return tag
+    return None
+
+
+def replace_block(file_path, block, start_signal, end_signal):
+    """
+    Replace the first block from start signal to end signal in one pass.
+
+    The file is streamed line by line into a fsynced temporary file that is
+    renamed into place, so only one line is held in memory and a crash
+    leaves either the old or the new file. The text before the start signal
+    and after the end signal on their lines is kept, and later duplicates
+    of the block are not touched. When the block does not exist, it is
+    appended after a newline.
+
+    Parameters
+    ----------
+    file_path : str
+        update target file path. a symbolic link is resolved, and refused
+        when running as root.
+    block : bytes
+        new block including the signals.
+    start_signal : bytes
+        block start marker.
+    end_signal : bytes
+        block end marker.
+
+    Returns
+    -------
+    is_replaced : bool
+        True if an existing block is replaced. False if appended.
+    """
+    if os.geteuid() == 0:
+        # a link in a home directory can point root at any file
+        open_flags = os.O_RDONLY | os.O_NOFOLLOW
+        file_path = os.path.abspath(file_path)
+    else:
+        open_flags = os.O_RDONLY
+        file_path = os.path.realpath(file_path)
+    tmp_fd, tmp_file_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(file_path) + "_", dir=os.path.dirname(file_path)
+    )
+    try:
+        with os.fdopen(tmp_fd, "wb") as tmp_file:
+            is_replaced = False
+            try:
+                target_fd = os.open(file_path, open_flags)
+            except FileNotFoundError:
+                target_fd = None
+            except OSError as error:
+                if error.errno == errno.ELOOP:
+                    raise OSError(
+                        errno.ELOOP, "symbolic link is refused as root", file_path
+                    )
+                raise
+            if target_fd is not None:
+                with os.fdopen(target_fd, "rb") as target_file:
+                    target_stat = os.fstat(target_file.fileno())
+                    is_replaced = copy_replacing_block(
+                        target_file, tmp_file, block, start_signal, end_signal
+                    )
+                os.fchmod(tmp_file.fileno(), stat.S_IMODE(target_stat.st_mode))
+                if os.geteuid() == 0:
+                    os.fchown(tmp_file.fileno(), target_stat.st_uid, target_stat.st_gid)
+            if not is_replaced:
+                tmp_file.write(b"\n" + block)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_file_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+    return is_replaced
+
+
+def copy_replacing_block(source_file, output_file, block, start_signal, end_signal):
+    """
+    Copy a file replacing the first block from start signal to end signal.
+
+    Parameters
+    ----------
+    source_file : io.BufferedReader
+        source file opened with binary mode.
+    output_file : io.BufferedWriter
+        output file opened with binary mode.
+    block : bytes
+        new block including the signals.
+    start_signal : bytes
+        block start marker.
+    end_signal : bytes
+        block end marker.
+
+    Returns
+    -------
+    is_replaced : bool
+        True if the block is replaced. if False the source is copied as it is.
+    """
+    source_offset = 0
+    block_source_offset = None
+    block_output_offset = None
+    for line in source_file:
+        line_source_offset = source_offset
+        source_offset += len(line)
+        if block_source_offset is None:
+            start_index = line.find(start_signal)
+            if start_index < 0:
+                output_file.write(line)
+                continue
+            block_source_offset = line_source_offset
+            block_output_offset = output_file.tell()
+            output_file.write(line[:start_index])
+            line = line[start_index + len(start_signal) :]
+
+        end_index = line.find(end_signal)
+        if end_index < 0:
+            continue
+        output_file.write(block)
+        output_file.write(line[end_index + len(end_signal) :])
+        shutil.copyfileobj(source_file, output_file)
+        return True
+
+    if block_source_offset is not None:
+        output_file.seek(block_output_offset)
+        output_file.truncate()
+        source_file.seek(block_source_offset)
+        shutil.copyfileobj(source_file, output_file)
+    return False
+
+
+@contextlib.contextmanager
+def lock_file(file_path, timeout=DEFAULT_LOCK_TIMEOUT):
+    """
+    Hold an exclusive advisory lock of a file.
+
+    The lock is taken on a sidecar "<file_path>.lock" file, so it stays
+    valid while the locked file itself is renamed or replaced. The lock is
+    not reentrant; do not lock the same file again while holding it. A
+    symbolic link lock file is refused when running as root.
+
+    Parameters
+    ----------
+    file_path : str
+        lock target file path.
+    timeout : float
+        max seconds to wait for the lock. wait forever if None.
+
+    Raises
+    ------
+    LockTimeoutError
+        if the lock is not acquired within the timeout.
+    """
+    lock_file_path = file_path + LOCK_FILE_SUFFIX
+    open_flags = os.O_RDWR | os.O_CREAT
+    if os.geteuid() == 0:
+        open_flags |= os.O_NOFOLLOW
+    lock_fd = os.open(lock_file_path, open_flags, 0o600)
+    try:
+        if timeout is None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        else:
+            deadline = time.monotonic() + timeout
+            retry_seconds = LOCK_RETRY_MIN_SECONDS
+            while True:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeoutError(
+                            errno.ETIMEDOUT,
+                            "lock timeout after " + str(timeout) + " seconds",
+                            lock_file_path,
+                        )
+                    time.sleep(retry_seconds)
+                    retry_seconds = min(retry_seconds * 2, LOCK_RETRY_MAX_SECONDS)
+        yield
+    finally:
+        os.close(lock_fd)
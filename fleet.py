@@ -0,0 +1,616 @@
+import argparse
+import concurrent.futures
+import copy
+import csv
+import datetime
+import errno
+import os
+import stat
+import sys
+import time
+import file_util
+import setup
+
+## const value
+DEFAULT_WORKERS = 8
+TARGET_YAML_EXTENSIONS = (".yaml", ".yml")
+TARGET_REQUIRED_FIELDS = ("home_dir", "shell")
+OVERRIDE_KEYS = (
+    "config_file_path",
+    "profile_name",
+    "region",
+    "output",
+    "change_log_file_path",
+    "backup_dir_path",
+    "install_mode",
+    "functions_dir_path",
+    "daemon_socket_path",
+    "credential_cache_dir_path",
+    "metrics_log_file_path",
+    "metrics_textfile_dir_path",
+)
+STATUS_UPDATED = setup.INSTALL_STATUS_UPDATED
+STATUS_INSERTED = setup.INSTALL_STATUS_INSERTED
+STATUS_SKIPPED = setup.INSTALL_STATUS_SKIPPED
+STATUS_FAILED = "failed"
+
+
+class FleetTargetVO:
+    """
+    Setup target user of fleet provisioning.
+    """
+
+    __slots__ = ("home_dir_path", "shell", "overrides")
+
+    def __init__(self, home_dir_path, shell, overrides):
+        """
+        Parameters
+        ----------
+        home_dir_path : str
+            home directory path of the user.
+        shell : str
+            login shell path of the user. (ex. "/bin/bash")
+        overrides : dict
+            SetupConfigVO attribute name to value overriding the setup config.
+        """
+        self.home_dir_path = home_dir_path
+        self.shell = shell
+        self.overrides = overrides
+
+
+class FleetResultVO:
+    """
+    Provisioning result of a fleet target.
+    """
+
+    __slots__ = (
+        "target",
+        "status",
+        "seconds",
+        "login_shell_setting_file_path",
+        "message",
+    )
+
+    def __init__(self, target, status, seconds, login_shell_setting_file_path, message):
+        """
+        Parameters
+        ----------
+        target : FleetTargetVO
+            provisioned target.
+        status : str
+            "updated", "inserted", "skipped" or "failed".
+        seconds : float
+            provisioning seconds of the target.
+        login_shell_setting_file_path : str
+            updated login shell setting file path. None if failed.
+        message : str
+            error message if failed. otherwise empty.
+        """
+        self.target = target
+        self.status = status
+        self.seconds = seconds
+        self.login_shell_setting_file_path = login_shell_setting_file_path
+        self.message = message
+
+
+def load_targets(target_file_path):
+    """
+    Load fleet targets from YAML or CSV file.
+
+    YAML file is a list of mappings (or a mapping with "targets" list) with
+    home_dir, shell and optional overrides mapping. CSV file has a header
+    row with home_dir, shell and optional override columns.
+
+    Parameters
+    ----------
+    target_file_path : str
+        target list file path.
+
+    Returns
+    -------
+    targets : list of FleetTargetVO
+        fleet targets in file order.
+
+    Raises
+    ------
+    ValueError
+        if a row lacks a required field or has an unknown override.
+    """
+    with open(target_file_path, "r") as target_file:
+        if target_file_path.endswith(TARGET_YAML_EXTENSIONS):
+            import yaml
+
+            rows = (
+                yaml.load(
+                    target_file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                )
+                or []
+            )
+            if isinstance(rows, dict):
+                rows = rows.get("targets") or []
+        else:
+            rows = [
+                {
+                    "home_dir": row.pop("home_dir", None),
+                    "shell": row.pop("shell", None),
+                    "overrides": {key: value for key, value in row.items() if value},
+                }
+                for row in csv.DictReader(target_file)
+            ]
+
+    targets = []
+    for row_number, row in enumerate(rows, start=1):
+        for field in TARGET_REQUIRED_FIELDS:
+            if not row.get(field):
+                raise ValueError(
+                    "target row " + str(row_number) + " has no " + field + "."
+                )
+        overrides = row.get("overrides") or {}
+        for key in overrides:
+            if key not in OVERRIDE_KEYS:
+                raise ValueError(
+                    "target row "
+                    + str(row_number)
+                    + " has unknown override "
+                    + key
+                    + "."
+                )
+        targets.append(
+            FleetTargetVO(
+                os.path.abspath(os.path.expanduser(str(row["home_dir"]))),
+                str(row["shell"]),
+                {key: str(value) for key, value in overrides.items()},
+            )
+        )
+    return targets
+
+
+def apply_overrides(setup_config, overrides):
+    """
+    Copy the setup config with the target overrides.
+
+    Parameters
+    ----------
+    setup_config : setup.SetupConfigVO
+        loaded config detail value object.
+    overrides : dict
+        SetupConfigVO attribute name to value.
+
+    Returns
+    -------
+    target_setup_config : setup.SetupConfigVO
+        setup config for the target.
+    """
+    if not overrides:
+        return setup_config
+    target_setup_config = copy.copy(setup_config)
+    for key, value in overrides.items():
+        setattr(target_setup_config, key, value)
+    return target_setup_config
+
+
+def provision_target(target, setup_config, now, logger):
+    """
+    Install register_sts_assumed_role function for a fleet target.
+
+    Parameters
+    ----------
+    target : FleetTargetVO
+        provisioning target.
+    setup_config : setup.SetupConfigVO
+        setup config for the target.
+    now : datetime.datetime
+        current datetime.
+    logger : logger
+        logging.logger object.
+
+    Returns
+    -------
+    result : FleetResultVO
+        provisioning result.
+    """
+    started = time.perf_counter()
+    try:
+        is_root = os.geteuid() == 0
+        if is_root:
+            # the paths are taken before installing, so only the files and
+            # directories created by this run (ex. "~/.aws") are given to the user.
+            owned_paths = get_owned_paths(target, setup_config)
+            existing_paths = list_existing_paths(owned_paths)
+        login_shell_setting_file_path, install_status = (
+            setup.install_register_sts_assumed_role(
+                target.shell, setup_config, now, logger, target.home_dir_path
+            )
+        )
+        if login_shell_setting_file_path is None:
+            return FleetResultVO(
+                target,
+                STATUS_FAILED,
+                time.perf_counter() - started,
+                None,
+                "login shell not supported.",
+            )
+        if is_root:
+            chown_to_home_owner(target.home_dir_path, owned_paths, existing_paths)
+    except OSError as error:
+        logger.error(
+            datetime.datetime.now().isoformat()
+            + " fleet provisioning error. home_dir: "
+            + target.home_dir_path
+            + ", error: "
+            + str(error)
+        )
+        return FleetResultVO(
+            target, STATUS_FAILED, time.perf_counter() - started, None, str(error)
+        )
+    return FleetResultVO(
+        target,
+        install_status,
+        time.perf_counter() - started,
+        login_shell_setting_file_path,
+        "",
+    )
+
+
+def get_owned_paths(target, setup_config):
+    """
+    Get the paths written for a fleet target that the user has to own.
+
+    The paths are refused if a symbolic link in the home directory points
+    them outside of it, because they are written by root.
+
+    Parameters
+    ----------
+    target : FleetTargetVO
+        provisioning target.
+    setup_config : setup.SetupConfigVO
+        setup config for the target.
+
+    Returns
+    -------
+    owned_paths : list of str
+        the login shell setting file, its lock file and the topmost missing
+        directories on the way to the functions and backup directories.
+
+    Raises
+    ------
+    OSError
+        if a path is a symbolic link or resolved outside the home directory.
+    """
+    login_shell_setting_file_path = setup.get_login_shell_setting_file_path(
+        target.shell, target.home_dir_path
+    )
+    if login_shell_setting_file_path is None:
+        return []
+    if os.path.islink(login_shell_setting_file_path):
+        raise OSError(
+            errno.ELOOP,
+            "symbolic link is refused as root",
+            login_shell_setting_file_path,
+        )
+    owned_paths = [
+        login_shell_setting_file_path,
+        os.path.realpath(login_shell_setting_file_path) + file_util.LOCK_FILE_SUFFIX,
+    ] + [
+        get_created_root_path(
+            target.home_dir_path,
+            setup.expand_home_path(path, target.home_dir_path),
+        )
+        for path in (setup_config.functions_dir_path, setup_config.backup_dir_path)
+        if path
+    ]
+    for path in owned_paths:
+        if not is_in_home_dir(target.home_dir_path, path):
+            raise OSError(
+                errno.EXDEV, "path is resolved outside the home directory", path
+            )
+    return owned_paths
+
+
+def get_created_root_path(home_dir_path, path):
+    """
+    Get the path to change the owner of before it is created.
+
+    Parameters
+    ----------
+    home_dir_path : str
+        home directory path of the user.
+    path : str
+        file or directory path to be created.
+
+    Returns
+    -------
+    root_path : str
+        the topmost missing directory below the home directory on the way
+        to the path, or the path itself if its parent exists.
+    """
+    home_dir_path = os.path.abspath(home_dir_path)
+    root_path = os.path.abspath(path)
+    parent_dir_path = os.path.dirname(root_path)
+    while (
+        parent_dir_path != root_path
+        and os.path.commonpath([home_dir_path, parent_dir_path]) == home_dir_path
+        and parent_dir_path != home_dir_path
+        and not os.path.lexists(parent_dir_path)
+    ):
+        root_path = parent_dir_path
+        parent_dir_path = os.path.dirname(root_path)
+    return root_path
+
+
+def is_in_home_dir(home_dir_path, path):
+    """
+    Check a path is resolved inside a home directory.
+
+    Parameters
+    ----------
+    home_dir_path : str
+        home directory path of the user.
+    path : str
+        check target path. it may not exist.
+
+    Returns
+    -------
+    is_in : bool
+        True if the resolved path is below the resolved home directory.
+    """
+    real_home_dir_path = os.path.realpath(home_dir_path)
+    real_path = os.path.realpath(path)
+    return (
+        real_path != real_home_dir_path
+        and os.path.commonpath([real_home_dir_path, real_path]) == real_home_dir_path
+    )
+
+
+def walk_paths(path):
+    """
+    Get a path and everything below it without following symbolic links.
+
+    Parameters
+    ----------
+    path : str
+        file or directory path.
+
+    Returns
+    -------
+    paths : list of str
+        the path and the files and directories below it. empty if not exist.
+    """
+    if not os.path.lexists(path):
+        return []
+    paths = [path]
+    if os.path.isdir(path) and not os.path.islink(path):
+        for dir_path, dir_names, file_names in os.walk(path):
+            paths.extend(
+                os.path.join(dir_path, name) for name in dir_names + file_names
+            )
+    return paths
+
+
+def list_existing_paths(paths):
+    """
+    Get the existing paths and everything below them.
+
+    Parameters
+    ----------
+    paths : list of str
+        file or directory paths.
+
+    Returns
+    -------
+    existing_paths : set of str
+        existing paths.
+    """
+    return {existing_path for path in paths for existing_path in walk_paths(path)}
+
+
+def chown_to_home_owner(home_dir_path, paths, existing_paths):
+    """
+    Change the owner of files created by root in a home directory.
+
+    Only regular files and directories created by root after the existing
+    paths are taken and resolved inside the home directory are changed.
+    Symbolic links are not followed, and a file with another hard link is
+    not changed.
+
+    Parameters
+    ----------
+    home_dir_path : str
+        home directory path of the user.
+    paths : list of str
+        created files or directories.
+    existing_paths : set of str
+        paths that existed before they were created.
+    """
+    home_stat = os.stat(os.path.realpath(home_dir_path))
+    for path in paths:
+        for created_path in walk_paths(path):
+            if created_path in existing_paths:
+                continue
+            try:
+                path_stat = os.lstat(created_path)
+            except FileNotFoundError:
+                continue
+            if (
+                path_stat.st_uid != os.geteuid()
+                or not (
+                    stat.S_ISREG(path_stat.st_mode) or stat.S_ISDIR(path_stat.st_mode)
+                )
+                or (stat.S_ISREG(path_stat.st_mode) and path_stat.st_nlink > 1)
+                or not is_in_home_dir(home_dir_path, created_path)
+            ):
+                continue
+            os.lchown(created_path, home_stat.st_uid, home_stat.st_gid)
+
+
+def provision_fleet(targets, setup_config, now, logger, workers=DEFAULT_WORKERS):
+    """
+    Install register_sts_assumed_role function for many users in parallel.
+
+    Each template is rendered once per login shell and setup config before
+    the login shell setting files are updated with a bounded thread pool.
+
+    Parameters
+    ----------
+    targets : list of FleetTargetVO
+        provisioning targets.
+    setup_config : setup.SetupConfigVO
+        loaded config detail value object.
+    now : datetime.datetime
+        current datetime.
+    logger : logger
+        logging.logger object.
+    workers : int
+        max number of threads.
+
+    Returns
+    -------
+    results : list of FleetResultVO
+        provisioning results in targets order.
+    """
+    target_setup_configs = [
+        apply_overrides(setup_config, target.overrides) for target in targets
+    ]
+    for target, target_setup_config in zip(targets, target_setup_configs):
+        template_file_path = setup.get_register_sts_assumed_role_template_file_path(
+            target.shell
+        )
+        if template_file_path is not None:
+            setup.generate_register_sts_assumed_role_template(
+                template_file_path, target_setup_config
+            )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(
+                lambda args: provision_target(args[0], args[1], now, logger),
+                zip(targets, target_setup_configs),
+            )
+        )
+
+
+def format_summary(results, seconds):
+    """
+    Format per-user provisioning results.
+
+    Parameters
+    ----------
+    results : list of FleetResultVO
+        provisioning results.
+    seconds : float
+        total provisioning seconds.
+
+    Returns
+    -------
+    lines : list of str
+        one line per user and a total line.
+    """
+    lines = []
+    for result in results:
+        line = "\t".join(
+            [
+                result.status,
+                format(result.seconds, ".4f") + "s",
+                result.target.home_dir_path,
+                result.target.shell,
+            ]
+        )
+        if result.message:
+            line += "\t" + result.message
+        lines.append(line)
+    counts = {
+        status: sum(1 for result in results if result.status == status)
+        for status in (STATUS_UPDATED, STATUS_INSERTED, STATUS_SKIPPED, STATUS_FAILED)
+    }
+    lines.append(
+        "provisioned "
+        + str(len(results))
+        + " users in "
+        + format(seconds, ".2f")
+        + "s. "
+        + ", ".join(status + ": " + str(count) for status, count in counts.items())
+    )
+    return lines
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Setup register_sts_assumed_role function for many users."
+    )
+    parser.add_argument("--targets", required=True)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--poll", action="store_true", help="watch without inotify.")
+    parser.add_argument("--debounce", type=float, default=0.5)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Provision the fleet targets and print the summary.
+
+    With --watch, the targets depending on a changed setup config, template
+    or target list are provisioned again until interrupted.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if all targets are provisioned. otherwise 1.
+    """
+    arguments = parse_arguments(argv)
+    try:
+        targets = load_targets(arguments.targets)
+    except (OSError, ValueError) as error:
+        print("target list load error. " + str(error), file=sys.stderr)
+        return 1
+
+    if arguments.watch:
+        import setup_watch
+
+        setup_watch.watch(
+            setup_watch.WatchStateVO(
+                os.path.abspath(setup.SETUP_CONFIG_FILE_PATH),
+                os.path.abspath(arguments.targets),
+                setup.load_setup_config(),
+                targets,
+            ),
+            setup.initialize_logger_setting(),
+            arguments.debounce,
+            arguments.poll,
+            arguments.workers,
+        )
+        return 0
+
+    started = time.perf_counter()
+    results = provision_fleet(
+        targets,
+        setup.load_setup_config(),
+        datetime.datetime.now(),
+        setup.initialize_logger_setting(),
+        arguments.workers,
+    )
+    for line in format_summary(results, time.perf_counter() - started):
+        print(line)
+    return 1 if any(result.status == STATUS_FAILED for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
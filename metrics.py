@@ -0,0 +1,429 @@
+import contextlib
+import json
+import os
+import time
+
+## const value
+METRIC_NAME_PREFIX = "sts_assumed_role_"
+TEXTFILE_SUFFIX = ".prom"
+TEXTFILE_MODE = 0o644
+METRICS_FILE_ENCODING = "utf-8"
+STAGE_METRICS = (
+    (
+        "stage_duration_seconds",
+        "seconds",
+        "Seconds spent in the stage by the last run.",
+    ),
+    ("stage_read_bytes", "read_bytes", "Bytes read in the stage by the last run."),
+    (
+        "stage_written_bytes",
+        "written_bytes",
+        "Bytes written in the stage by the last run.",
+    ),
+    ("stage_calls", "calls", "Number of times the stage ran in the last run."),
+)
+
+
+class SpanVO:
+    """
+    Elapsed time and file bytes of one stage.
+    """
+
+    __slots__ = ("stage", "started_at", "seconds", "read_bytes", "written_bytes")
+
+    def __init__(self, stage, started_at, seconds=0.0, read_bytes=0, written_bytes=0):
+        """
+        Parameters
+        ----------
+        stage : str
+            stage name. (ex. "render_template")
+        started_at : float
+            stage start unix time.
+        seconds : float
+            elapsed seconds of the stage.
+        read_bytes : int
+            bytes of the files read in the stage.
+        written_bytes : int
+            bytes of the files written in the stage.
+        """
+        self.stage = stage
+        self.started_at = started_at
+        self.seconds = seconds
+        self.read_bytes = read_bytes
+        self.written_bytes = written_bytes
+
+
+class SpanRecorder:
+    """
+    Timing spans and gauges of one command run.
+
+    Spans of the same stage are summed in the textfile, and kept one by one
+    in the JSON records.
+    """
+
+    __slots__ = ("command", "spans", "gauges")
+
+    def __init__(self, command):
+        """
+        Parameters
+        ----------
+        command : str
+            recorded command name. (ex. "setup", "register")
+        """
+        self.command = command
+        self.spans = []
+        self.gauges = {}
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Measure the elapsed time of a stage, even if it raises.
+
+        Parameters
+        ----------
+        stage : str
+            stage name.
+
+        Yields
+        ------
+        span : SpanVO
+            recorded span. the caller sets read_bytes and written_bytes.
+        """
+        span = SpanVO(stage, time.time())
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - started
+            self.spans.append(span)
+
+    def add_span(self, stage, seconds, read_bytes=0, written_bytes=0):
+        """
+        Record a stage measured outside of span. (ex. module import)
+
+        Parameters
+        ----------
+        stage : str
+            stage name.
+        seconds : float
+            elapsed seconds of the stage.
+        read_bytes : int
+            bytes of the files read in the stage.
+        written_bytes : int
+            bytes of the files written in the stage.
+        """
+        self.spans.append(
+            SpanVO(stage, time.time() - seconds, seconds, read_bytes, written_bytes)
+        )
+
+    def set_gauge(self, name, value):
+        """
+        Set a value observed by the run. (ex. "profiles")
+
+        Parameters
+        ----------
+        name : str
+            gauge name without the metric name prefix.
+        value : int or float
+            observed value.
+        """
+        self.gauges[name] = value
+
+    def summarize(self):
+        """
+        Sum the spans of each stage.
+
+        Returns
+        -------
+        stages : list of dict
+            "stage", "seconds", "read_bytes", "written_bytes" and "calls" in
+            the order of the first span of each stage.
+        """
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(
+                span.stage,
+                {
+                    "stage": span.stage,
+                    "seconds": 0.0,
+                    "read_bytes": 0,
+                    "written_bytes": 0,
+                    "calls": 0,
+                },
+            )
+            stage["seconds"] += span.seconds
+            stage["read_bytes"] += span.read_bytes
+            stage["written_bytes"] += span.written_bytes
+            stage["calls"] += 1
+        return list(stages.values())
+
+    def to_records(self):
+        """
+        Convert the spans and gauges to structured log records.
+
+        Returns
+        -------
+        records : list of dict
+            one "span" record for each span and one "gauge" record for each
+            gauge.
+        """
+        records = [
+            {
+                "type": "span",
+                "command": self.command,
+                "stage": span.stage,
+                "time": format_time(span.started_at),
+                "seconds": round(span.seconds, 6),
+                "read_bytes": span.read_bytes,
+                "written_bytes": span.written_bytes,
+            }
+            for span in self.spans
+        ]
+        now = format_time(time.time())
+        for name, value in self.gauges.items():
+            records.append(
+                {
+                    "type": "gauge",
+                    "command": self.command,
+                    "name": name,
+                    "time": now,
+                    "value": value,
+                }
+            )
+        return records
+
+    def to_textfile(self, now):
+        """
+        Render the Prometheus text exposition format of the last run.
+
+        Parameters
+        ----------
+        now : float
+            run end unix time.
+
+        Returns
+        -------
+        textfile : str
+            metrics in the text exposition format.
+        """
+        command_label = 'command="' + escape_label_value(self.command) + '"'
+        stages = self.summarize()
+        lines = []
+        for metric_name, key, help_text in STAGE_METRICS:
+            lines.append("# HELP " + METRIC_NAME_PREFIX + metric_name + " " + help_text)
+            lines.append("# TYPE " + METRIC_NAME_PREFIX + metric_name + " gauge")
+            for stage in stages:
+                lines.append(
+                    METRIC_NAME_PREFIX
+                    + metric_name
+                    + "{"
+                    + command_label
+                    + ',stage="'
+                    + escape_label_value(stage["stage"])
+                    + '"} '
+                    + format_value(stage[key])
+                )
+        for name, value in self.gauges.items():
+            lines.append("# TYPE " + METRIC_NAME_PREFIX + name + " gauge")
+            lines.append(
+                METRIC_NAME_PREFIX
+                + name
+                + "{"
+                + command_label
+                + "} "
+                + format_value(value)
+            )
+        lines.append(
+            "# TYPE " + METRIC_NAME_PREFIX + "last_run_timestamp_seconds gauge"
+        )
+        lines.append(
+            METRIC_NAME_PREFIX
+            + "last_run_timestamp_seconds{"
+            + command_label
+            + "} "
+            + format_value(now)
+        )
+        return "\n".join(lines) + "\n"
+
+
+def format_time(unix_time):
+    """
+    Format unix time as a local ISO 8601 string with the offset.
+
+    Parameters
+    ----------
+    unix_time : float
+        unix time.
+
+    Returns
+    -------
+    time_string : str
+        ISO 8601 time string. (ex. "2026-10-18T12:34:56.789012+09:00")
+    """
+    import datetime
+
+    return datetime.datetime.fromtimestamp(unix_time).astimezone().isoformat()
+
+
+def format_value(value):
+    """
+    Format a sample value of the text exposition format.
+
+    Parameters
+    ----------
+    value : int or float
+        sample value.
+
+    Returns
+    -------
+    value_string : str
+        integers as is, floats with repr precision.
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+def escape_label_value(value):
+    """
+    Escape a label value of the text exposition format.
+
+    Parameters
+    ----------
+    value : str
+        label value.
+
+    Returns
+    -------
+    escaped_value : str
+        value with backslash, double quote and new line escaped.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_file_size(file_path):
+    """
+    Get the size of a file for the byte counts.
+
+    Parameters
+    ----------
+    file_path : str
+        file path.
+
+    Returns
+    -------
+    size : int
+        file size. 0 if the file not exist.
+    """
+    try:
+        return os.stat(file_path).st_size
+    except OSError:
+        return 0
+
+
+def get_textfile_path(textfile_dir_path, command):
+    """
+    Get the textfile collector file path of a command.
+
+    Parameters
+    ----------
+    textfile_dir_path : str
+        textfile collector directory path.
+    command : str
+        recorded command name.
+
+    Returns
+    -------
+    textfile_path : str
+        textfile path. (ex. "<dir>/sts_assumed_role_setup.prom")
+    """
+    return os.path.join(
+        textfile_dir_path,
+        METRIC_NAME_PREFIX + command.replace("-", "_") + TEXTFILE_SUFFIX,
+    )
+
+
+def write_textfile(textfile_dir_path, recorder):
+    """
+    Replace the textfile of the command atomically.
+
+    The collector never reads a half written file, because the file is
+    renamed into the directory. A new textfile is readable by everyone
+    (0644 masked by the umask), so a collector running as another user can
+    read it.
+
+    Parameters
+    ----------
+    textfile_dir_path : str
+        textfile collector directory path.
+    recorder : SpanRecorder
+        recorded spans and gauges.
+
+    Returns
+    -------
+    textfile_path : str
+        written textfile path.
+    """
+    import file_util
+
+    os.makedirs(textfile_dir_path, exist_ok=True)
+    textfile_path = get_textfile_path(textfile_dir_path, recorder.command)
+    file_util.write_file_atomically(
+        textfile_path,
+        [recorder.to_textfile(time.time()).encode(METRICS_FILE_ENCODING)],
+        TEXTFILE_MODE,
+    )
+    return textfile_path
+
+
+def append_records(log_file_path, recorder):
+    """
+    Append the records as JSON lines with one write.
+
+    Parameters
+    ----------
+    log_file_path : str
+        metrics log file path.
+    recorder : SpanRecorder
+        recorded spans and gauges.
+    """
+    log_dir_path = os.path.dirname(log_file_path)
+    if log_dir_path:
+        os.makedirs(log_dir_path, exist_ok=True)
+    lines = "".join(
+        json.dumps(record, ensure_ascii=False) + "\n"
+        for record in recorder.to_records()
+    )
+    with open(log_file_path, "ab") as log_file:
+        log_file.write(lines.encode(METRICS_FILE_ENCODING))
+
+
+def export(recorder, log_file_path="", textfile_dir_path=""):
+    """
+    Export the records of a run to the enabled destinations.
+
+    A metrics export failure never fails the run, so the error is returned
+    for the caller to report.
+
+    Parameters
+    ----------
+    recorder : SpanRecorder
+        recorded spans and gauges.
+    log_file_path : str
+        metrics log file path. not written if empty.
+    textfile_dir_path : str
+        textfile collector directory path. not written if empty.
+
+    Returns
+    -------
+    error : OSError
+        export error. None if exported.
+    """
+    try:
+        if log_file_path:
+            append_records(log_file_path, recorder)
+        if textfile_dir_path:
+            write_textfile(textfile_dir_path, recorder)
+    except OSError as error:
+        return error
+    return None
@@ -0,0 +1,669 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import aws_config
+import backup_store
+import change_log
+import config_history
+import file_util
+
+## const value
+BUNDLE_VERSION = 1
+BUNDLE_FILE_ENCODING = "utf-8"
+CHANGE_ADDED = "added"
+CHANGE_CHANGED = "changed"
+CHANGE_REMOVED = "removed"
+CHANGE_CONFLICT = "conflict"
+DEFAULT_BACKUP_DIR_NAME = "sts_assumed_role_backup"
+
+
+class BundleSectionVO:
+    """
+    Managed profile section of a bundle with its hash.
+    """
+
+    __slots__ = ("section", "digest")
+
+    def __init__(self, section, digest):
+        """
+        Parameters
+        ----------
+        section : aws_config.ProfileSection
+            managed profile section.
+        digest : str
+            sha256 hex digest of the section string.
+        """
+        self.section = section
+        self.digest = digest
+
+    def to_dict(self):
+        """
+        Convert to JSON serializable dict.
+
+        Returns
+        -------
+        bundle_section : dict
+            "name", "hash", "header" and "lines".
+        """
+        return {
+            "name": self.section.name,
+            "hash": self.digest,
+            "header": self.section.header,
+            "lines": self.section.lines,
+        }
+
+
+def get_section_digest(section):
+    """
+    Get the hash of a profile section.
+
+    Parameters
+    ----------
+    section : aws_config.ProfileSection
+        profile section.
+
+    Returns
+    -------
+    digest : str
+        sha256 hex digest of the section string.
+    """
+    return hashlib.sha256(section.to_string().encode(BUNDLE_FILE_ENCODING)).hexdigest()
+
+
+def get_managed_profile_names(config, change_log_file_path, now):
+    """
+    Get the managed profile names of a config.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+    change_log_file_path : str
+        change log file path. if empty, profiles with a role are managed.
+    now : datetime.datetime
+        aware current datetime.
+
+    Returns
+    -------
+    profile_names : set of str
+        registered by register_sts_assumed_role and in the config.
+    """
+    if change_log_file_path:
+        return set(config_history.replay_saved(change_log_file_path, None, now)) & set(
+            config.profile_index
+        )
+    return set(
+        section.name
+        for section in config.sections
+        if section is not None
+        and section.header is not None
+        and aws_config.get_section_role_arn(section) is not None
+    )
+
+
+def make_bundle(config, managed_profile_names):
+    """
+    Make the bundle of the managed sections of a config.
+
+    A profile with duplicated sections gets the hash of all of them, so it
+    never matches a bundle section and is rewritten to one section.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        parsed config.
+    managed_profile_names : set of str
+        managed profile names.
+
+    Returns
+    -------
+    bundle : dict
+        profile name to BundleSectionVO in config file order.
+    """
+    bundle = {}
+    for profile_name in config.profile_names():
+        if profile_name not in managed_profile_names or profile_name in bundle:
+            continue
+        sections = config.find_profile(profile_name)
+        if len(sections) == 1:
+            digest = get_section_digest(sections[0])
+        else:
+            digest = hashlib.sha256(
+                "".join(section.to_string() for section in sections).encode(
+                    BUNDLE_FILE_ENCODING
+                )
+            ).hexdigest()
+        bundle[profile_name] = BundleSectionVO(sections[0], digest)
+    return bundle
+
+
+def is_bundle_file(file_path):
+    """
+    Check a file is a bundle or a config file.
+
+    Parameters
+    ----------
+    file_path : str
+        bundle or config file path.
+
+    Returns
+    -------
+    is_bundle : bool
+        True if the file is a JSON bundle.
+    """
+    if not os.path.exists(file_path):
+        return False
+    with open(file_path, "rb") as target_file:
+        return target_file.read(64).lstrip().startswith(b"{")
+
+
+def load_bundle(bundle_file_path):
+    """
+    Load a bundle file.
+
+    Parameters
+    ----------
+    bundle_file_path : str
+        bundle file path.
+
+    Returns
+    -------
+    bundle : dict
+        profile name to BundleSectionVO in bundle order.
+
+    Raises
+    ------
+    ValueError
+        if the file is not a bundle of the supported version.
+    """
+    with open(bundle_file_path, "rb") as bundle_file:
+        saved = json.loads(bundle_file.read().decode(BUNDLE_FILE_ENCODING))
+    if not isinstance(saved, dict) or saved.get("version") != BUNDLE_VERSION:
+        raise ValueError("unsupported bundle file. " + bundle_file_path)
+    try:
+        return {
+            bundle_section["name"]: BundleSectionVO(
+                aws_config.ProfileSection(
+                    bundle_section["header"],
+                    bundle_section["name"],
+                    list(bundle_section["lines"]),
+                ),
+                bundle_section["hash"],
+            )
+            for bundle_section in saved["sections"]
+        }
+    except (KeyError, TypeError) as error:
+        raise ValueError("broken bundle file. " + bundle_file_path) from error
+
+
+def save_bundle(bundle_file_path, bundle):
+    """
+    Save a bundle file atomically.
+
+    Parameters
+    ----------
+    bundle_file_path : str
+        bundle file path.
+    bundle : dict
+        profile name to BundleSectionVO.
+    """
+    file_util.write_file_atomically(
+        bundle_file_path,
+        [
+            json.dumps(
+                {
+                    "version": BUNDLE_VERSION,
+                    "sections": [
+                        bundle_section.to_dict() for bundle_section in bundle.values()
+                    ],
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode(BUNDLE_FILE_ENCODING)
+        ],
+    )
+
+
+def load_source(file_path, change_log_file_path, now):
+    """
+    Load the bundle of a bundle file or a config file.
+
+    Parameters
+    ----------
+    file_path : str
+        bundle or config file path.
+    change_log_file_path : str
+        change log file path of a config file. if empty, profiles with a
+        role are managed.
+    now : datetime.datetime
+        aware current datetime.
+
+    Returns
+    -------
+    bundle : dict
+        profile name to BundleSectionVO.
+    """
+    if is_bundle_file(file_path):
+        return load_bundle(file_path)
+    config = aws_config.load_config(file_path)
+    return make_bundle(
+        config, get_managed_profile_names(config, change_log_file_path, now)
+    )
+
+
+def compare_bundles(source, target, existing_profile_names=(), prune=True):
+    """
+    Compare two bundles section by section with the hashes.
+
+    Parameters
+    ----------
+    source : dict
+        profile name to BundleSectionVO of the sync source.
+    target : dict
+        profile name to BundleSectionVO of the sync target.
+    existing_profile_names : set of str
+        all profile names of the sync target. a source profile not in the
+        target bundle but in them is a conflict and never added.
+    prune : bool
+        if False target profiles not in the source are not removed.
+
+    Returns
+    -------
+    changes : list of tuple of (str, str)
+        "added", "changed", "conflict" or "removed" and the profile name.
+        added, changed and conflict are in source order, followed by
+        removed in target order.
+    """
+    changes = []
+    for profile_name, bundle_section in source.items():
+        if profile_name not in target:
+            if profile_name in existing_profile_names:
+                changes.append((CHANGE_CONFLICT, profile_name))
+            else:
+                changes.append((CHANGE_ADDED, profile_name))
+        elif target[profile_name].digest != bundle_section.digest:
+            changes.append((CHANGE_CHANGED, profile_name))
+    if prune:
+        for profile_name in target:
+            if profile_name not in source:
+                changes.append((CHANGE_REMOVED, profile_name))
+    return changes
+
+
+def get_applicable_changes(changes):
+    """
+    Get the changes to apply without the conflicts.
+
+    Parameters
+    ----------
+    changes : list of tuple of (str, str)
+        changes from compare_bundles.
+
+    Returns
+    -------
+    applicable_changes : list of tuple of (str, str)
+        added, changed and removed changes.
+    """
+    return [
+        (change, profile_name)
+        for change, profile_name in changes
+        if change != CHANGE_CONFLICT
+    ]
+
+
+def apply_changes(config, source, changes):
+    """
+    Apply the changes to a config in place.
+
+    A changed profile keeps the position of its first section, and added
+    profiles are appended.
+
+    Parameters
+    ----------
+    config : aws_config.AwsConfig
+        sync target config.
+    source : dict
+        profile name to BundleSectionVO of the sync source.
+    changes : list of tuple of (str, str)
+        changes from compare_bundles. conflicts are ignored.
+
+    Returns
+    -------
+    registered_sections : list of aws_config.ProfileSection
+        added and changed sections.
+    deleted_sections : list of aws_config.ProfileSection
+        removed sections.
+    """
+    registered_sections = []
+    deleted_sections = []
+    for change, profile_name in get_applicable_changes(changes):
+        if change == CHANGE_REMOVED:
+            deleted_sections.extend(config.delete_profile(profile_name))
+            continue
+        section = source[profile_name].section
+        registered_sections.append(section)
+        positions = config.profile_index.get(profile_name, [])
+        if len(positions) == 0:
+            config.append_profile(section)
+            continue
+        config.sections[positions[0]] = section
+        for position in positions[1:]:
+            config.sections[position] = None
+        config.profile_index[profile_name] = positions[:1]
+    return registered_sections, deleted_sections
+
+
+def make_change_log_events(registered_sections, deleted_sections, now):
+    """
+    Make the change log events of a sync.
+
+    Parameters
+    ----------
+    registered_sections : list of aws_config.ProfileSection
+        added and changed sections.
+    deleted_sections : list of aws_config.ProfileSection
+        removed sections.
+    now : datetime.datetime
+        synced datetime.
+
+    Returns
+    -------
+    change_log_events : list of dict
+        REGISTERED and DELETED events.
+    """
+    change_log_events = [
+        change_log.make_register_event(
+            section.name,
+            aws_config.get_section_role_arn(section),
+            (aws_config.get_section_source_profiles(section) or [None])[0],
+            aws_config.get_section_mfa_serial(section),
+            None,
+            now,
+        )
+        for section in registered_sections
+    ]
+    change_log_events.extend(aws_config.make_delete_events(deleted_sections, now))
+    return change_log_events
+
+
+def get_default_backup_dir_path(config_file_path):
+    """
+    Get the default backup store directory of a config file.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+
+    Returns
+    -------
+    backup_dir_path : str
+        backup store directory next to the config file.
+    """
+    return os.path.join(
+        os.path.dirname(os.path.abspath(config_file_path)), DEFAULT_BACKUP_DIR_NAME
+    )
+
+
+def sync_config(
+    source,
+    config_file_path,
+    change_log_file_path,
+    backup_dir_path,
+    now,
+    dry_run=False,
+    rotation_policy=None,
+    prune=False,
+):
+    """
+    Apply the changed managed sections of a bundle to a config file in one pass.
+
+    The config file is read, compared, backed up and written once under its
+    lock, and nothing is written when no section differs. Sections not
+    managed in the config file are never changed: a source profile with the
+    name of one is reported as a conflict.
+
+    Parameters
+    ----------
+    source : dict
+        profile name to BundleSectionVO of the sync source.
+    config_file_path : str
+        sync target AWS CLI config file path.
+    change_log_file_path : str
+        change log file path of the config file. the changes are appended
+        to it. if empty, profiles with a role are managed.
+    backup_dir_path : str
+        backup store directory path. not backed up if empty.
+    now : datetime.datetime
+        aware current datetime.
+    dry_run : bool
+        if True only compare the sections.
+    rotation_policy : change_log.RotationPolicyVO
+        change log rotation policy. not rotated if None.
+    prune : bool
+        if True remove the managed profiles not in the source even without
+        the change log. with the change log they are always removed.
+
+    Returns
+    -------
+    changes : list of tuple of (str, str)
+        applied (or to be applied) changes and conflicts.
+    """
+    with file_util.lock_file(config_file_path):
+        config = aws_config.load_config(config_file_path)
+        # without the change log the managed profiles are only a guess, so
+        # nothing is removed unless asked.
+        changes = compare_bundles(
+            source,
+            make_bundle(
+                config, get_managed_profile_names(config, change_log_file_path, now)
+            ),
+            set(config.profile_index),
+            prune or bool(change_log_file_path),
+        )
+        applicable_changes = get_applicable_changes(changes)
+        if dry_run or len(applicable_changes) == 0:
+            return changes
+
+        registered_sections, deleted_sections = apply_changes(
+            config, source, applicable_changes
+        )
+        if backup_dir_path:
+            backup_store.save_snapshot(backup_dir_path, config_file_path, now)
+        aws_config.save_config(config, config_file_path)
+    if change_log_file_path:
+        change_log.append_events(
+            change_log_file_path,
+            make_change_log_events(registered_sections, deleted_sections, now),
+            rotation_policy,
+        )
+    return changes
+
+
+def sync_bundle(source, bundle_file_path, dry_run=False):
+    """
+    Apply the changed sections of a bundle to a bundle file.
+
+    Parameters
+    ----------
+    source : dict
+        profile name to BundleSectionVO of the sync source.
+    bundle_file_path : str
+        sync target bundle file path.
+    dry_run : bool
+        if True only compare the sections.
+
+    Returns
+    -------
+    changes : list of tuple of (str, str)
+        applied (or to be applied) changes.
+    """
+    with file_util.lock_file(bundle_file_path):
+        target = load_bundle(bundle_file_path)
+        changes = compare_bundles(source, target)
+        if dry_run or len(changes) == 0:
+            return changes
+
+        for change, profile_name in changes:
+            if change == CHANGE_REMOVED:
+                del target[profile_name]
+            else:
+                target[profile_name] = source[profile_name]
+        save_bundle(bundle_file_path, target)
+    return changes
+
+
+def print_changes(changes, dry_run):
+    """
+    Print the changes and the numbers of each change.
+
+    Parameters
+    ----------
+    changes : list of tuple of (str, str)
+        changes from compare_bundles.
+    dry_run : bool
+        if True the changes are not applied.
+    """
+    for change, profile_name in changes:
+        print(change + "\t" + profile_name)
+    counts = [
+        (change, sum(1 for applied, _ in changes if applied == change))
+        for change in (CHANGE_ADDED, CHANGE_CHANGED, CHANGE_REMOVED, CHANGE_CONFLICT)
+    ]
+    print(
+        ", ".join(
+            change + ": " + str(count)
+            for change, count in counts
+            if change != CHANGE_CONFLICT or count > 0
+        )
+        + (" (dry run)" if dry_run else "")
+    )
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Sync the managed profiles between AWS CLI config files."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--config-file", required=True)
+    export_parser.add_argument("--change-log-file", default="")
+    export_parser.add_argument("--bundle-file", required=True)
+
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("--bundle-file", required=True)
+    import_parser.add_argument("--config-file", required=True)
+    import_parser.add_argument("--change-log-file", default="")
+    import_parser.add_argument(
+        "--backup-dir", default=None, help="default: next to the config file."
+    )
+    import_parser.add_argument("--no-backup", action="store_true")
+    import_parser.add_argument(
+        "--prune", action="store_true", help="remove without the change log."
+    )
+    import_parser.add_argument("--dry-run", action="store_true")
+    aws_config.add_rotation_arguments(import_parser)
+
+    sync_parser = subparsers.add_parser("sync")
+    sync_parser.add_argument("--source", required=True, help="bundle or config file.")
+    sync_parser.add_argument("--source-change-log-file", default="")
+    sync_parser.add_argument("--target", required=True, help="bundle or config file.")
+    sync_parser.add_argument("--target-change-log-file", default="")
+    sync_parser.add_argument(
+        "--backup-dir", default=None, help="default: next to the target config file."
+    )
+    sync_parser.add_argument("--no-backup", action="store_true")
+    sync_parser.add_argument(
+        "--prune", action="store_true", help="remove without the target change log."
+    )
+    sync_parser.add_argument("--dry-run", action="store_true")
+    aws_config.add_rotation_arguments(sync_parser)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute profile bundle command.
+
+    export writes the managed sections of a config file to a bundle.
+    import applies a bundle to a config file.
+    sync applies the managed sections of a bundle or config file to a
+    bundle or config file.
+    import and sync print the added, changed and removed profiles, and the
+    conflicts with profiles not managed in the target.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        0 if success. otherwise (error or conflict) 1.
+    """
+    arguments = parse_arguments(argv)
+    now = datetime.datetime.now().astimezone()
+    try:
+        if arguments.command == "export":
+            bundle = load_source(arguments.config_file, arguments.change_log_file, now)
+            save_bundle(arguments.bundle_file, bundle)
+            print(str(len(bundle)) + " profiles exported.")
+            return 0
+
+        if arguments.command == "import":
+            source = load_bundle(arguments.bundle_file)
+            target_file_path = arguments.config_file
+            target_change_log_file_path = arguments.change_log_file
+        else:
+            source = load_source(
+                arguments.source, arguments.source_change_log_file, now
+            )
+            target_file_path = arguments.target
+            target_change_log_file_path = arguments.target_change_log_file
+        if is_bundle_file(target_file_path):
+            changes = sync_bundle(source, target_file_path, arguments.dry_run)
+        else:
+            backup_dir_path = arguments.backup_dir
+            if arguments.no_backup:
+                backup_dir_path = ""
+            elif backup_dir_path is None:
+                backup_dir_path = get_default_backup_dir_path(target_file_path)
+            changes = sync_config(
+                source,
+                target_file_path,
+                target_change_log_file_path,
+                backup_dir_path,
+                now,
+                arguments.dry_run,
+                aws_config.get_rotation_policy(arguments),
+                arguments.prune,
+            )
+    except (OSError, ValueError) as error:
+        print(arguments.command + " error. " + str(error), file=sys.stderr)
+        return 1
+    print_changes(changes, arguments.dry_run)
+    if any(change == CHANGE_CONFLICT for change, _ in changes):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,556 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+## const value
+DAEMON_COMMANDS = ("register", "delete", "register-batch", "switch", "list")
+DAEMON_UNAVAILABLE_EXIT_STATUS = 75
+MESSAGE_ENCODING = "utf-8"
+PLAIN_REQUEST_ACCEPTED = b"\0"
+SOCKET_FILE_MODE = 0o600
+
+
+class ConfigCache:
+    """
+    Parsed AWS CLI config files kept in memory by the daemon.
+
+    A cached config and its section index are reused while the inode, size
+    and mtime of the file are unchanged, so a write by another process is
+    never missed. Registrations through the daemon splice the file with the
+    cached section index and update the cached config in place, so the file
+    is never parsed again.
+    """
+
+    __slots__ = ("entries", "lock")
+
+    def __init__(self):
+        import threading
+
+        self.entries = {}
+        self.lock = threading.RLock()
+
+    def load_entry(self, config_file_path, config_file):
+        """
+        Get the cache entry of an opened config file, reload it if changed.
+
+        Parameters
+        ----------
+        config_file_path : str
+            absolute AWS CLI config file path.
+        config_file : file object
+            the config file opened with binary mode at the start.
+
+        Returns
+        -------
+        entry : tuple
+            signature, parsed config (aws_config.AwsConfig) and section index
+            (aws_config.SectionIndex) of the opened file.
+        """
+        import io
+        import aws_config
+
+        signature = aws_config.get_file_signature(os.fstat(config_file.fileno()))
+        entry = self.entries.get(config_file_path)
+        if entry is not None and entry[0] == signature:
+            return entry
+        config_bytes = config_file.read()
+        entry = (
+            signature,
+            aws_config.parse_config(
+                config_bytes.decode(aws_config.CONFIG_FILE_ENCODING).splitlines()
+            ),
+            aws_config.scan_section_index(io.BytesIO(config_bytes)),
+        )
+        self.entries[config_file_path] = entry
+        return entry
+
+    def get(self, config_file_path):
+        """
+        Get the parsed config, reload it if the file changed.
+
+        Parameters
+        ----------
+        config_file_path : str
+            AWS CLI config file path.
+
+        Returns
+        -------
+        aws_config : aws_config.AwsConfig
+            parsed config. empty if the file not exist.
+        """
+        import aws_config
+
+        config_file_path = os.path.abspath(config_file_path)
+        with self.lock:
+            try:
+                config_file = open(config_file_path, "rb")
+            except FileNotFoundError:
+                self.entries.pop(config_file_path, None)
+                return aws_config.AwsConfig([])
+            with config_file:
+                return self.load_entry(config_file_path, config_file)[1]
+
+    def read_profile(self, config_file_path, profile_name):
+        """
+        Read the sections of a profile from the cached config.
+
+        Parameters
+        ----------
+        config_file_path : str
+            AWS CLI config file path.
+        profile_name : str
+            read target profile name.
+
+        Returns
+        -------
+        sections : list of aws_config.ProfileSection
+            sections of the profile. empty if the profile not exist.
+        """
+        return self.get(config_file_path).find_profile(profile_name)
+
+    def splice_profile(self, config_file_path, profile_name, section_string):
+        """
+        Replace the sections of a profile with the cached section index.
+
+        Same as aws_config.splice_profile, and the cached config and section
+        index are updated to the written file. The caller must hold the
+        config file lock.
+
+        Parameters
+        ----------
+        config_file_path : str
+            AWS CLI config file path.
+        profile_name : str
+            replace target profile name.
+        section_string : str
+            new section string. the profile is only deleted if None.
+
+        Returns
+        -------
+        deleted_sections : list of aws_config.ProfileSection
+            deleted sections that had the same profile name.
+        """
+        import aws_config
+
+        config_file_path = os.path.abspath(config_file_path)
+        with self.lock:
+            try:
+                config_file = open(config_file_path, "rb")
+            except FileNotFoundError:
+                config_file = None
+            try:
+                if config_file is None:
+                    entry = (
+                        None,
+                        aws_config.AwsConfig([]),
+                        aws_config.SectionIndex([], [], 0),
+                    )
+                else:
+                    entry = self.load_entry(config_file_path, config_file)
+                deleted_sections, section_index, signature = (
+                    aws_config.splice_opened_profile(
+                        config_file_path,
+                        config_file,
+                        entry[2],
+                        profile_name,
+                        section_string,
+                    )
+                )
+            except BaseException:
+                self.entries.pop(config_file_path, None)
+                raise
+            finally:
+                if config_file is not None:
+                    config_file.close()
+            if signature is None:
+                return deleted_sections
+
+            config = entry[1]
+            config.delete_profile(profile_name)
+            if section_string is not None:
+                for section in aws_config.parse_config(
+                    section_string.splitlines()
+                ).sections:
+                    config.append_profile(section)
+            # the deleted sections are removed once they are the majority,
+            # so a long running daemon does not grow with every splice
+            if config.sections.count(None) * 2 > len(config.sections):
+                config.compact()
+            self.entries[config_file_path] = (signature, config, section_index)
+        return deleted_sections
+
+
+def execute_request(request, config_cache):
+    """
+    Execute an aws_config.py command request in the daemon process.
+
+    The commands run the same code as aws_config.py with the config cache,
+    so list and the profile lookup of switch are answered from memory, and
+    register, delete and switch splice the config file with the cached
+    section index. The config file lock, backup and change log work the
+    same as the direct path.
+
+    Parameters
+    ----------
+    request : dict
+        "argv" aws_config.py arguments and "cwd" client working directory.
+    config_cache : ConfigCache
+        parsed config cache.
+
+    Returns
+    -------
+    response : dict
+        "exit_status", "stdout" and "stderr" of the command.
+    """
+    import contextlib
+    import io
+    import aws_config
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_status = 1
+    current_dir_path = os.getcwd()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(request.get("cwd") or current_dir_path)
+                argv = [str(argument) for argument in request["argv"]]
+                if len(argv) == 0 or argv[0] not in DAEMON_COMMANDS:
+                    print(
+                        "unsupported daemon command. " + str(argv[:1]), file=sys.stderr
+                    )
+                else:
+                    exit_status = aws_config.main(argv, config_cache)
+            except SystemExit as error:
+                exit_status = error.code if isinstance(error.code, int) else 1
+            except Exception as error:
+                print("daemon request error. " + str(error), file=sys.stderr)
+    finally:
+        os.chdir(current_dir_path)
+    return {
+        "exit_status": exit_status,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+    }
+
+
+def read_field(request_file):
+    """
+    Read a NUL terminated field of a plain request.
+
+    Parameters
+    ----------
+    request_file : file object
+        client socket opened with binary mode.
+
+    Returns
+    -------
+    field : str
+        field without the NUL.
+
+    Raises
+    ------
+    ValueError
+        if the connection is closed before the NUL.
+    """
+    field = bytearray()
+    while True:
+        character = request_file.read(1)
+        if character == b"":
+            raise ValueError("request is not terminated.")
+        if character == b"\0":
+            return field.decode(MESSAGE_ENCODING)
+        field += character
+
+
+def read_plain_request(request_file):
+    """
+    Read a plain request sent by the shell function.
+
+    A plain request is NUL terminated fields of the argument count, the
+    working directory and the arguments, so a shell can send it with
+    printf and a socket client without starting Python. The daemon answers
+    PLAIN_REQUEST_ACCEPTED as soon as it is read, so the client only runs
+    the command again without the daemon if the request was never taken.
+
+    Parameters
+    ----------
+    request_file : file object
+        client socket opened with binary mode.
+
+    Returns
+    -------
+    request : dict
+        "argv" and "cwd".
+    """
+    argument_count = int(read_field(request_file))
+    cwd = read_field(request_file)
+    return {
+        "argv": [read_field(request_file) for _ in range(argument_count)],
+        "cwd": cwd,
+    }
+
+
+def format_plain_response(response):
+    """
+    Format a response to a plain request.
+
+    Parameters
+    ----------
+    response : dict
+        "exit_status", "stdout" and "stderr" of the command.
+
+    Returns
+    -------
+    response_bytes : bytes
+        exit status line, stderr and a NUL, then stdout and a NUL.
+    """
+    return (
+        str(response["exit_status"])
+        + "\n"
+        + response["stderr"]
+        + "\0"
+        + response["stdout"]
+        + "\0"
+    ).encode(MESSAGE_ENCODING)
+
+
+def create_server(socket_path, logger):
+    """
+    Create the daemon server bound to a Unix domain socket.
+
+    A socket file left by a stopped daemon is removed. The socket is only
+    accessible by the owner.
+
+    Parameters
+    ----------
+    socket_path : str
+        Unix domain socket path.
+    logger : logger
+        logging.logger object.
+
+    Returns
+    -------
+    server : socketserver.UnixStreamServer
+        daemon server. requests are executed one by one.
+
+    Raises
+    ------
+    OSError
+        if another daemon is listening on the socket.
+    """
+    import socketserver
+
+    config_cache = ConfigCache()
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            is_json = self.rfile.peek(1)[:1] == b"{"
+            try:
+                if is_json:
+                    request = json.loads(self.rfile.readline().decode(MESSAGE_ENCODING))
+                else:
+                    request = read_plain_request(self.rfile)
+            except Exception as error:
+                request = None
+                response = {"exit_status": 1, "stdout": "", "stderr": str(error) + "\n"}
+            if not is_json:
+                self.wfile.write(PLAIN_REQUEST_ACCEPTED)
+            if request is not None:
+                response = execute_request(request, config_cache)
+                logger.info(
+                    "daemon request. argv: "
+                    + json.dumps(request.get("argv"))
+                    + ", exit_status: "
+                    + str(response["exit_status"])
+                )
+            if is_json:
+                self.wfile.write(json.dumps(response).encode(MESSAGE_ENCODING) + b"\n")
+            else:
+                self.wfile.write(format_plain_response(response))
+
+    if os.path.exists(socket_path):
+        if is_daemon_running(socket_path):
+            raise OSError("daemon is already running. socket: " + socket_path)
+        os.remove(socket_path)
+    socket_dir_path = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.isdir(socket_dir_path):
+        os.makedirs(socket_dir_path)
+
+    umask = os.umask(0o777 ^ SOCKET_FILE_MODE)
+    try:
+        return socketserver.UnixStreamServer(socket_path, RequestHandler)
+    finally:
+        os.umask(umask)
+
+
+def is_daemon_running(socket_path):
+    """
+    Whether a daemon is listening on the socket.
+
+    Parameters
+    ----------
+    socket_path : str
+        Unix domain socket path.
+
+    Returns
+    -------
+    is_running : bool
+        if connected True. otherwise False.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+    except OSError:
+        return False
+    return True
+
+
+def send_request(socket_path, argv, cwd):
+    """
+    Send an aws_config.py command to the daemon.
+
+    Parameters
+    ----------
+    socket_path : str
+        Unix domain socket path.
+    argv : list of str
+        aws_config.py arguments.
+    cwd : str
+        working directory to resolve relative paths.
+
+    Returns
+    -------
+    response : dict
+        "exit_status", "stdout" and "stderr" of the command.
+        None if the daemon is not running. once connected, the request may
+        have been run, so an error is returned instead of None.
+    """
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return None
+    with client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return None
+        try:
+            client.sendall(
+                json.dumps({"argv": argv, "cwd": cwd}).encode(MESSAGE_ENCODING) + b"\n"
+            )
+            with client.makefile("rb") as response_file:
+                response_line = response_file.readline()
+            return json.loads(response_line.decode(MESSAGE_ENCODING))
+        except (OSError, ValueError) as error:
+            return {
+                "exit_status": 1,
+                "stdout": "",
+                "stderr": "no response from the daemon. " + str(error) + "\n",
+            }
+
+
+def serve(socket_path, logger):
+    """
+    Run the daemon until SIGTERM or SIGINT.
+
+    Parameters
+    ----------
+    socket_path : str
+        Unix domain socket path.
+    logger : logger
+        logging.logger object.
+    """
+    import signal
+
+    def stop(signal_number, frame):
+        raise SystemExit(0)
+
+    server = create_server(socket_path, logger)
+    signal.signal(signal.SIGTERM, stop)
+    logger.info("daemon started. socket: " + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        logger.info("daemon stopped. socket: " + socket_path)
+
+
+def parse_arguments(argv):
+    """
+    Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Resident AWS CLI config file engine.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--socket", required=True)
+
+    request_parser = subparsers.add_parser("request")
+    request_parser.add_argument("--socket", required=True)
+    request_parser.add_argument("argv", nargs=argparse.REMAINDER)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """
+    Execute profile manager daemon command.
+
+    serve runs the daemon in the foreground.
+    request sends the aws_config.py arguments after "--" to the daemon and
+    prints the result.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments.
+
+    Returns
+    -------
+    exit_status : int
+        exit status of the command. 75 if the daemon is not running.
+    """
+    arguments = parse_arguments(argv)
+    socket_path = os.path.expanduser(arguments.socket)
+    if arguments.command == "serve":
+        import logging
+
+        logging.basicConfig(
+            format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO
+        )
+        try:
+            serve(socket_path, logging.getLogger("profile_daemon"))
+        except OSError as error:
+            print("daemon start error. " + str(error), file=sys.stderr)
+            return 1
+        return 0
+
+    request_argv = arguments.argv
+    if len(request_argv) > 0 and request_argv[0] == "--":
+        request_argv = request_argv[1:]
+    response = send_request(socket_path, request_argv, os.getcwd())
+    if response is None:
+        return DAEMON_UNAVAILABLE_EXIT_STATUS
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exit_status"]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
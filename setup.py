@@ -1,12 +1,17 @@
-import yaml
-import logging
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import datetime
-import shutil
+import sys
 
 ## const value
 SETUP_CONFIG_FILE_PATH = "config/setup-config.yaml"
 SETUP_LOG_FILE_PATH = "logs/setup.log"
+SETUP_CONFIG_CACHE_FILE_SUFFIX = ".cache.json"
+PROJECT_ROOT_DIR_PATH = os.path.dirname(os.path.abspath(__file__))
+PYTHON_EXECUTABLE_PATH = sys.executable
 BASH_LOGIN_SHELL_SETTING_FILE_PATH = "$HOME/.bashrc"
 ZSH_LOGIN_SHELL_SETTING_FILE_PATH = "$HOME/.zshrc"
 TEST_LOGIN_SHELL_SETTING_FILE_PATH = "tests/test_login_shell_setting_file_path.rc"
@@ -19,22 +24,72 @@ REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH = (
 REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH = (
     "tests/template/register_sts_assumed_role.test.tmpl"
 )
+REGISTER_STS_ASSUMED_ROLE_STUB_BASH_TEMPLATE_FILE_PATH = (
+    "template/register_sts_assumed_role_stub.bash.tmpl"
+)
+REGISTER_STS_ASSUMED_ROLE_STUB_ZSH_TEMPLATE_FILE_PATH = (
+    "template/register_sts_assumed_role_stub.zsh.tmpl"
+)
+REGISTER_STS_ASSUMED_ROLE_STUB_TEST_TEMPLATE_FILE_PATH = (
+    "tests/template/register_sts_assumed_role_stub.test.tmpl"
+)
+INSTALL_MODE_INLINE = "inline"
+INSTALL_MODE_LAZY = "lazy"
+REGISTER_STS_ASSUMED_ROLE_FUNCTION_NAME = "register_sts_assumed_role"
+BASH_FUNCTION_FILE_SUFFIX = ".bash"
 REPLACEMENT_STRING_CONFIG_FILE_PATH = "$REPLACEMENT_STRING_CONFIG_FILE_PATH"
 REPLACEMENT_STRING_REGISTER_PROFILE = "$REPLACEMENT_STRING_REGISTER_PROFILE"
 REPLACEMENT_STRING_REGION_NAME = "$REPLACEMENT_STRING_REGION_NAME"
 REPLACEMENT_STRING_OUTPUT_FORMAT = "$REPLACEMENT_STRING_OUTPUT_FORMAT"
 REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH = "$REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH"
+REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH = "$REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH"
+REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH = "$REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH"
+REPLACEMENT_STRING_BACKUP_DIR_PATH = "$REPLACEMENT_STRING_BACKUP_DIR_PATH"
+REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE = "$REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE"
+REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES = (
+    "$REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES"
+)
+REPLACEMENT_STRING_CHANGE_LOG_COMPRESS = "$REPLACEMENT_STRING_CHANGE_LOG_COMPRESS"
+REPLACEMENT_STRING_DAEMON_SOCKET_PATH = "$REPLACEMENT_STRING_DAEMON_SOCKET_PATH"
+REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH = (
+    "$REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH"
+)
+REPLACEMENT_STRING_METRICS_LOG_FILE_PATH = "$REPLACEMENT_STRING_METRICS_LOG_FILE_PATH"
+REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH = (
+    "$REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH"
+)
+REPLACEMENT_STRING_FUNCTION_FILE_PATH = "$REPLACEMENT_STRING_FUNCTION_FILE_PATH"
+REPLACEMENT_STRING_FUNCTION_DIR_PATH = "$REPLACEMENT_STRING_FUNCTION_DIR_PATH"
 REGISTER_STS_ASSUMED_ROLE_START_SIGNAL = (
     "###### register_sts_assumed_role starts here ######"
 )
 REGISTER_STS_ASSUMED_ROLE_END_SIGNAL = (
     "###### register_sts_assumed_role ends here ######"
 )
+REGISTER_STS_ASSUMED_ROLE_DIGEST_PREFIX = "sha256:"
+LOGIN_SHELL_SETTING_FILE_ENCODING = "utf-8"
+INSTALL_STATUS_UPDATED = "updated"
+INSTALL_STATUS_INSERTED = "inserted"
+INSTALL_STATUS_SKIPPED = "skipped"
 
 
 class SetupConfigVO:
     def __init__(
-        self, config_file_path, profile_name, region, output, change_log_file_path
+        self,
+        config_file_path,
+        profile_name,
+        region,
+        output,
+        change_log_file_path,
+        backup_dir_path,
+        backup_policy,
+        change_log_rotation,
+        install_mode,
+        functions_dir_path,
+        daemon_socket_path,
+        credential_cache_dir_path,
+        metrics_log_file_path,
+        metrics_textfile_dir_path,
     ):
         """
         Parameters
@@ -49,33 +104,226 @@ class SetupConfigVO:
             default output format.
         change_log_file_path : str
             file path for config file change log.
+        backup_dir_path : str
+            backup store directory path.
+        backup_policy : backup_store.BackupPolicyVO
+            backup store compression and retention policy.
+        change_log_rotation : change_log.RotationPolicyVO
+            change log size based rotation policy.
+        install_mode : str
+            "inline" writes the function to the login shell setting file.
+            "lazy" writes the function to functions_dir_path and a stub
+            loading it on first call to the login shell setting file.
+        functions_dir_path : str
+            function file directory path for lazy install mode.
+        daemon_socket_path : str
+            Unix domain socket path of the profile manager daemon.
+        credential_cache_dir_path : str
+            refresh-ahead credential cache directory path. empty if the
+            cache is disabled.
+        metrics_log_file_path : str
+            JSON lines file of the register_sts_assumed_role stage spans.
+            not written if empty.
+        metrics_textfile_dir_path : str
+            Prometheus textfile collector directory path. not written if
+            empty.
         """
         self.config_file_path = config_file_path
         self.profile_name = profile_name
         self.region = region
         self.output = output
         self.change_log_file_path = change_log_file_path
+        self.backup_dir_path = backup_dir_path
+        self.backup_policy = backup_policy
+        self.change_log_rotation = change_log_rotation
+        self.install_mode = install_mode
+        self.functions_dir_path = functions_dir_path
+        self.daemon_socket_path = daemon_socket_path
+        self.credential_cache_dir_path = credential_cache_dir_path
+        self.metrics_log_file_path = metrics_log_file_path
+        self.metrics_textfile_dir_path = metrics_textfile_dir_path
+
+    def to_dict(self):
+        """
+        Convert to JSON serializable dict.
 
+        Returns
+        -------
+        config : dict
+            attribute name to value. the policies are converted to dict.
+        """
+        config = dict(vars(self))
+        config["backup_policy"] = self.backup_policy.to_dict()
+        config["change_log_rotation"] = self.change_log_rotation.to_dict()
+        return config
+
+    def digest(self):
+        """
+        Get the hash of the config values for the rendered template cache.
 
-def load_setup_config():
+        Returns
+        -------
+        digest : str
+            sha256 hex digest of the config values.
+        """
+        import hashlib
+        import json
+
+        return hashlib.sha256(
+            json.dumps(self.to_dict(), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+
+def setup_config_from_dict(config):
+    """
+    Restore setup config from SetupConfigVO.to_dict value.
+
+    Parameters
+    ----------
+    config : dict
+        SetupConfigVO.to_dict value.
+
+    Returns
+    -------
+    setup_config : SetupConfigVO
+        restored config detail value object.
+    """
+    import backup_store
+    import change_log
+
+    config = dict(config)
+    config["backup_policy"] = backup_store.BackupPolicyVO(**config["backup_policy"])
+    config["change_log_rotation"] = change_log.RotationPolicyVO(
+        **config["change_log_rotation"]
+    )
+    return SetupConfigVO(**config)
+
+
+def get_setup_config_cache_file_path(setup_config_file_path):
+    """
+    Get the parsed setup config cache file path.
+
+    Parameters
+    ----------
+    setup_config_file_path : str
+        setup config yaml file path.
+
+    Returns
+    -------
+    cache_file_path : str
+        cache file path. (ex. "config/.setup-config.yaml.cache.json")
+    """
+    config_dir_path, config_file_name = os.path.split(setup_config_file_path)
+    return os.path.join(
+        config_dir_path, "." + config_file_name + SETUP_CONFIG_CACHE_FILE_SUFFIX
+    )
+
+
+def load_setup_config(setup_config_file_path=SETUP_CONFIG_FILE_PATH):
     """
     Load setup config from yaml file.
 
+    The parsed config is cached in a sidecar JSON file keyed by the yaml
+    mtime and sha256, so PyYAML is only imported when the yaml changed.
+
+    Parameters
+    ----------
+    setup_config_file_path : str
+        setup config yaml file path.
+
     Returns
     -------
     setup_config : SetupConfigVO
         loaded config detail value object.
     """
-    with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
-        config = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"]
+    import hashlib
+    import json
+    import file_util
+
+    with open(setup_config_file_path, "rb") as config_file:
+        config_bytes = config_file.read()
+        cache_key = [
+            os.fstat(config_file.fileno()).st_mtime_ns,
+            hashlib.sha256(config_bytes).hexdigest(),
+        ]
+
+    cache_file_path = get_setup_config_cache_file_path(setup_config_file_path)
+    try:
+        with open(cache_file_path, "r") as cache_file:
+            cache = json.load(cache_file)
+        if cache["key"] == cache_key:
+            return setup_config_from_dict(cache["config"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    setup_config = parse_setup_config(config_bytes)
+    try:
+        file_util.write_file_atomically(
+            cache_file_path,
+            [
+                json.dumps({"key": cache_key, "config": setup_config.to_dict()}).encode(
+                    "utf-8"
+                )
+            ],
+        )
+    except OSError:
+        pass
+    return setup_config
+
+
+def parse_setup_config(config_bytes):
+    """
+    Parse setup config yaml.
+
+    The libyaml based CSafeLoader is used if PyYAML is built with it.
+
+    Parameters
+    ----------
+    config_bytes : bytes
+        setup config yaml file contents.
+
+    Returns
+    -------
+    setup_config : SetupConfigVO
+        parsed config detail value object.
+    """
+    import backup_store
+    import change_log
+    import yaml
+
+    config = yaml.load(
+        config_bytes, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    )["setup"]
 
     register_profile = config["register_profile"]
+    retention = config["backup"]["retention"]
+    rotation = config["change_log"]["rotation"]
+    install = config["install"]
+    credential_cache = config["credential_cache"]
     return SetupConfigVO(
         config["config_file"]["file_path"],
         register_profile["profile_name"]["default"],
         register_profile["region"]["default"],
         register_profile["output"]["default"],
         config["change_log"]["file_path"],
+        config["backup"]["dir_path"],
+        backup_store.BackupPolicyVO(
+            config["backup"]["compress"],
+            retention["max_count"],
+            retention["max_age_days"],
+            retention["max_total_size"],
+        ),
+        change_log.RotationPolicyVO(
+            rotation["max_size"],
+            rotation["max_archives"],
+            rotation["compress"],
+        ),
+        install["mode"],
+        install["functions_dir_path"],
+        config["daemon"]["socket_path"],
+        credential_cache["dir_path"] if credential_cache["enabled"] else "",
+        config["metrics"]["log_file_path"],
+        config["metrics"]["textfile_dir_path"],
     )
 
 
@@ -83,20 +331,51 @@ def initialize_logger_setting():
     """
     Initialize logger setting.
 
+    The log directory and file are made when the first record is written,
+    not on every start.
+
     Returns
     -------
     logger : logger
         logging.logger object.
     """
-    if not os.path.isdir("logs"):
-        os.makedirs("logs")
-    logging.basicConfig(filename=SETUP_LOG_FILE_PATH)
+    import logging
+
+    class SetupLogFileHandler(logging.FileHandler):
+        def _open(self):
+            os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+            return super()._open()
+
+    logging.basicConfig(handlers=[SetupLogFileHandler(SETUP_LOG_FILE_PATH, delay=True)])
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     return logger
 
 
-def get_login_shell_setting_file_path(login_shell_path):
+def expand_home_path(file_path, home_dir_path=None):
+    """
+    Expand "$HOME" and environment variables of a path used by setup.
+
+    Parameters
+    ----------
+    file_path : str
+        path including "$HOME". (ex. "$HOME/.aws/sts_assumed_role_backup")
+    home_dir_path : str
+        home directory path of the setup target user. $HOME if None.
+
+    Returns
+    -------
+    expanded_path : str
+        expanded path.
+    """
+    if home_dir_path is not None:
+        file_path = file_path.replace("${HOME}", home_dir_path).replace(
+            "$HOME", home_dir_path
+        )
+    return os.path.expandvars(file_path)
+
+
+def get_login_shell_setting_file_path(login_shell_path, home_dir_path=None):
     """
     Get your local login shell setting file path.
 
@@ -104,18 +383,22 @@ def get_login_shell_setting_file_path(login_shell_path):
     ----------
     login_shell_path : str
         Your local login shell path.
+    home_dir_path : str
+        home directory path of the setup target user. $HOME if None.
 
     Returns
     -------
     login_shell_setting_file_path : str
         login shell setting file path.
     """
+    if home_dir_path is None:
+        home_dir_path = os.environ["HOME"]
     if login_shell_path is None:
         return None
     elif login_shell_path.endswith("bash"):
-        return BASH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"])
+        return BASH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", home_dir_path)
     elif login_shell_path.endswith("zsh"):
-        return ZSH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"])
+        return ZSH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", home_dir_path)
     elif login_shell_path == "test":
         return TEST_LOGIN_SHELL_SETTING_FILE_PATH
     else:
@@ -148,6 +431,58 @@ def get_register_sts_assumed_role_template_file_path(login_shell_path):
         return None
 
 
+def get_register_sts_assumed_role_stub_template_file_path(login_shell_path):
+    """
+    Get lazy loading stub template file path.
+
+    Parameters
+    ----------
+    login_shell_path : str
+        Your local login shell path.
+
+    Returns
+    -------
+    stub_template_file_path : str
+        register-sts-assumed-role stub template file path.
+    """
+    if login_shell_path is None:
+        return None
+    elif login_shell_path.endswith("bash"):
+        return REGISTER_STS_ASSUMED_ROLE_STUB_BASH_TEMPLATE_FILE_PATH
+    elif login_shell_path.endswith("zsh"):
+        return REGISTER_STS_ASSUMED_ROLE_STUB_ZSH_TEMPLATE_FILE_PATH
+    elif login_shell_path == "test":
+        return REGISTER_STS_ASSUMED_ROLE_STUB_TEST_TEMPLATE_FILE_PATH
+    else:
+        return None
+
+
+def get_function_file_path(login_shell_path, functions_dir_path):
+    """
+    Get lazy loading function file path.
+
+    zsh loads the file with autoload, so the file name is the function name.
+
+    Parameters
+    ----------
+    login_shell_path : str
+        Your local login shell path.
+    functions_dir_path : str
+        function file directory path.
+
+    Returns
+    -------
+    function_file_path : str
+        function file path.
+    """
+    function_file_path = os.path.join(
+        functions_dir_path, REGISTER_STS_ASSUMED_ROLE_FUNCTION_NAME
+    )
+    if login_shell_path.endswith("zsh"):
+        return function_file_path
+    return function_file_path + BASH_FUNCTION_FILE_SUFFIX
+
+
 def replace_replacement_string(
     template_string,
     config_file_path,
@@ -155,6 +490,14 @@ def replace_replacement_string(
     region,
     output,
     change_log_file_path,
+    python_executable_path,
+    project_root_dir_path,
+    backup_dir_path,
+    change_log_rotation,
+    daemon_socket_path="",
+    credential_cache_dir_path="",
+    metrics_log_file_path="",
+    metrics_textfile_dir_path="",
 ):
     """
     Generate register-sts-assumed-role function string.
@@ -173,25 +516,131 @@ def replace_replacement_string(
         default output format.
     change_log_file_path : str
         file path for config file change log.
+    python_executable_path : str
+        python executable path to run aws_config.py.
+    project_root_dir_path : str
+        this project root directory path.
+    backup_dir_path : str
+        backup store directory path.
+    change_log_rotation : change_log.RotationPolicyVO
+        change log size based rotation policy.
+    daemon_socket_path : str
+        profile manager daemon socket path. the daemon is not used if empty.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if empty.
+    metrics_log_file_path : str
+        metrics JSON lines file path. not written if empty.
+    metrics_textfile_dir_path : str
+        Prometheus textfile collector directory path. not written if empty.
 
     Returns
     -------
     str_register_sts_assumed_role : str
         register-sts-assumed-role function string.
     """
-    return (
-        template_string.replace(REPLACEMENT_STRING_CONFIG_FILE_PATH, config_file_path)
-        .replace(REPLACEMENT_STRING_REGISTER_PROFILE, profile_name)
-        .replace(REPLACEMENT_STRING_REGION_NAME, region)
-        .replace(REPLACEMENT_STRING_OUTPUT_FORMAT, output)
-        .replace(REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH, change_log_file_path)
+    import template_renderer
+
+    return template_renderer.compile_template(template_string).render(
+        get_replacement_values(
+            config_file_path,
+            profile_name,
+            region,
+            output,
+            change_log_file_path,
+            python_executable_path,
+            project_root_dir_path,
+            backup_dir_path,
+            change_log_rotation,
+            daemon_socket_path,
+            credential_cache_dir_path,
+            metrics_log_file_path,
+            metrics_textfile_dir_path,
+        )
     )
 
 
+def get_replacement_values(
+    config_file_path,
+    profile_name,
+    region,
+    output,
+    change_log_file_path,
+    python_executable_path,
+    project_root_dir_path,
+    backup_dir_path,
+    change_log_rotation,
+    daemon_socket_path="",
+    credential_cache_dir_path="",
+    metrics_log_file_path="",
+    metrics_textfile_dir_path="",
+):
+    """
+    Get template placeholder values.
+
+    Parameters
+    ----------
+    config_file_path : str
+        AWS CLI config file path.
+    profile_name : str
+        default profile name.
+    region : str
+        default region name.
+    output : str
+        default output format.
+    change_log_file_path : str
+        file path for config file change log.
+    python_executable_path : str
+        python executable path to run aws_config.py.
+    project_root_dir_path : str
+        this project root directory path.
+    backup_dir_path : str
+        backup store directory path.
+    change_log_rotation : change_log.RotationPolicyVO
+        change log size based rotation policy.
+    daemon_socket_path : str
+        profile manager daemon socket path. the daemon is not used if empty.
+    credential_cache_dir_path : str
+        credential cache directory path. role_arn is written if empty.
+    metrics_log_file_path : str
+        metrics JSON lines file path. not written if empty.
+    metrics_textfile_dir_path : str
+        Prometheus textfile collector directory path. not written if empty.
+
+    Returns
+    -------
+    values : dict
+        replacement string to value.
+    """
+    return {
+        REPLACEMENT_STRING_CONFIG_FILE_PATH: config_file_path,
+        REPLACEMENT_STRING_REGISTER_PROFILE: profile_name,
+        REPLACEMENT_STRING_REGION_NAME: region,
+        REPLACEMENT_STRING_OUTPUT_FORMAT: output,
+        REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH: change_log_file_path,
+        REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH: python_executable_path,
+        REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH: project_root_dir_path,
+        REPLACEMENT_STRING_BACKUP_DIR_PATH: backup_dir_path,
+        REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE: str(change_log_rotation.max_size),
+        REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES: str(
+            change_log_rotation.max_archives
+        ),
+        REPLACEMENT_STRING_CHANGE_LOG_COMPRESS: (
+            "true" if change_log_rotation.compress else "false"
+        ),
+        REPLACEMENT_STRING_DAEMON_SOCKET_PATH: daemon_socket_path,
+        REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH: credential_cache_dir_path,
+        REPLACEMENT_STRING_METRICS_LOG_FILE_PATH: metrics_log_file_path,
+        REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH: metrics_textfile_dir_path,
+    }
+
+
 def generate_register_sts_assumed_role_template(template_file_path, setup_config):
     """
     Generate register-sts-assumed-role function string.
 
+    The template is compiled once per file mtime, and the output is reused
+    while the setup config is the same.
+
     Parameters
     ----------
     template_file_path : str
@@ -204,18 +653,30 @@ def generate_register_sts_assumed_role_template(template_file_path, setup_config
     function_string : str
         register-sts-assumed-role function string.
     """
-    with open(template_file_path, "r") as template_file:
-        return replace_replacement_string(
-            template_file.read(),
+    import template_renderer
+
+    return template_renderer.render_template_file(
+        template_file_path,
+        get_replacement_values(
             setup_config.config_file_path,
             setup_config.profile_name,
             setup_config.region,
             setup_config.output,
             setup_config.change_log_file_path,
-        )
+            PYTHON_EXECUTABLE_PATH,
+            PROJECT_ROOT_DIR_PATH,
+            setup_config.backup_dir_path,
+            setup_config.change_log_rotation,
+            setup_config.daemon_socket_path,
+            setup_config.credential_cache_dir_path,
+            setup_config.metrics_log_file_path,
+            setup_config.metrics_textfile_dir_path,
+        ),
+        setup_config.digest(),
+    )
 
 
-def backup_file(file_path, now, logger):
+def backup_file(file_path, setup_config, now, logger, home_dir_path=None):
     """
     Backup login shell setting file before change.
 
@@ -223,31 +684,343 @@ def backup_file(file_path, now, logger):
     ----------
     file_path : str
         backup target file path.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
     now : datetime.datetime
         current datetime.
     logger : logger
         logging.logger object.
+    home_dir_path : str
+        home directory path of the setup target user. $HOME if None.
 
     Returns
     -------
-    backup_file_path : str
-        backup result file path.
+    snapshot : backup_store.SnapshotVO
+        saved backup snapshot.
     """
+    import backup_store
+
     if os.path.exists(file_path) == False:
         logger.warning(
             now.isoformat() + " backup target file not exist. file_path: " + file_path
         )
         return None
-    backup_file_path = file_path + "_bk_" + now.strftime("%Y%m%d%H%M%S")
-    shutil.copy(file_path, backup_file_path)
+    snapshot = backup_store.save_snapshot(
+        expand_home_path(setup_config.backup_dir_path, home_dir_path),
+        file_path,
+        now,
+        setup_config.backup_policy,
+    )
     logger.info(
         now.isoformat()
         + " backup file success. file_path: "
         + file_path
-        + ", backup_file_path: "
-        + backup_file_path
+        + ", digest: "
+        + snapshot.digest
+    )
+    return snapshot
+
+
+def install_lazy_function(
+    function_string, login_shell_path, setup_config, logger, home_dir_path=None
+):
+    """
+    Write the function to its own file and generate the stub loading it.
+
+    The stub also registers the shell completion, so the completion works
+    before the first call.
+
+    For zsh the file is an autoload function body that defines the function
+    and calls it, compiled to "<file>.zwc" with zcompile.
+
+    Parameters
+    ----------
+    function_string : str
+        register-sts-assumed-role function string.
+    login_shell_path : str
+        Your local login shell path.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
+    logger : logger
+        logging.logger object.
+    home_dir_path : str
+        home directory path of the setup target user. $HOME if None.
+
+    Returns
+    -------
+    stub_string : str
+        register-sts-assumed-role stub string for the login shell setting file.
+    """
+    import file_util
+
+    function_file_path = expand_home_path(
+        get_function_file_path(login_shell_path, setup_config.functions_dir_path),
+        home_dir_path,
+    )
+    os.makedirs(os.path.dirname(function_file_path), exist_ok=True)
+    file_util.write_file_atomically(
+        function_file_path,
+        [
+            get_function_file_string(function_string, login_shell_path).encode(
+                LOGIN_SHELL_SETTING_FILE_ENCODING
+            )
+        ],
+    )
+    if login_shell_path.endswith("zsh"):
+        compile_zsh_function(function_file_path, logger)
+    return render_lazy_stub(login_shell_path, setup_config)
+
+
+def get_function_file_string(function_string, login_shell_path):
+    """
+    Get the function file contents of lazy install mode.
+
+    Parameters
+    ----------
+    function_string : str
+        register-sts-assumed-role function string.
+    login_shell_path : str
+        Your local login shell path.
+
+    Returns
+    -------
+    function_file_string : str
+        function file contents. for zsh the function is called at the end.
+    """
+    if login_shell_path.endswith("zsh"):
+        return (
+            function_string + "\n" + REGISTER_STS_ASSUMED_ROLE_FUNCTION_NAME + ' "$@"\n'
+        )
+    return function_string
+
+
+def is_function_file_installed(function_file_path, function_file_string):
+    """
+    Check the function file of lazy install mode has the contents.
+
+    Parameters
+    ----------
+    function_file_path : str
+        function file path.
+    function_file_string : str
+        expected function file contents.
+
+    Returns
+    -------
+    is_installed : bool
+        True if the file exists with the same contents.
+    """
+    try:
+        with open(function_file_path, "rb") as function_file:
+            return function_file.read() == function_file_string.encode(
+                LOGIN_SHELL_SETTING_FILE_ENCODING
+            )
+    except FileNotFoundError:
+        return False
+
+
+def render_lazy_stub(login_shell_path, setup_config):
+    """
+    Render the stub loading the function file of lazy install mode.
+
+    Parameters
+    ----------
+    login_shell_path : str
+        Your local login shell path.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
+
+    Returns
+    -------
+    stub_string : str
+        register-sts-assumed-role stub string for the login shell setting file.
+    """
+    import template_renderer
+
+    compiled_template, _ = template_renderer.load_template(
+        os.path.join(
+            PROJECT_ROOT_DIR_PATH,
+            get_register_sts_assumed_role_stub_template_file_path(login_shell_path),
+        )
+    )
+    replacement_values = get_replacement_values(
+        setup_config.config_file_path,
+        setup_config.profile_name,
+        setup_config.region,
+        setup_config.output,
+        setup_config.change_log_file_path,
+        PYTHON_EXECUTABLE_PATH,
+        PROJECT_ROOT_DIR_PATH,
+        setup_config.backup_dir_path,
+        setup_config.change_log_rotation,
+        setup_config.daemon_socket_path,
+        setup_config.credential_cache_dir_path,
+        setup_config.metrics_log_file_path,
+        setup_config.metrics_textfile_dir_path,
+    )
+    replacement_values[REPLACEMENT_STRING_FUNCTION_FILE_PATH] = get_function_file_path(
+        login_shell_path, setup_config.functions_dir_path
+    )
+    replacement_values[REPLACEMENT_STRING_FUNCTION_DIR_PATH] = (
+        setup_config.functions_dir_path
+    )
+    return compiled_template.render(replacement_values)
+
+
+def compile_zsh_function(function_file_path, logger):
+    """
+    Compile a zsh autoload function file to "<file>.zwc".
+
+    autoload works without the compiled file, so a failure is only logged.
+
+    Parameters
+    ----------
+    function_file_path : str
+        zsh function file path.
+    logger : logger
+        logging.logger object.
+    """
+    import shutil
+    import subprocess
+
+    zsh_path = shutil.which("zsh")
+    if zsh_path is None:
+        logger.warning(
+            datetime.datetime.now().isoformat()
+            + " zsh not found. skip zcompile "
+            + function_file_path
+        )
+        return
+    result = subprocess.run(
+        [zsh_path, "-f", "-c", 'zcompile -- "$1"', "zsh", function_file_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if result.returncode != 0:
+        logger.warning(
+            datetime.datetime.now().isoformat()
+            + " zcompile failed. function_file_path: "
+            + function_file_path
+            + ", error: "
+            + result.stderr.strip()
+        )
+
+
+def get_block_digest(function_string, setup_config, stub_string=""):
+    """
+    Get the hash of the rendered function and the setup config.
+
+    Parameters
+    ----------
+    function_string : str
+        rendered register-sts-assumed-role function string before the lazy
+        install.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
+    stub_string : str
+        rendered stub string of lazy install mode. empty if inline.
+
+    Returns
+    -------
+    block_digest : str
+        sha256 hex digest.
+    """
+    import hashlib
+
+    return hashlib.sha256(
+        function_string.encode(LOGIN_SHELL_SETTING_FILE_ENCODING)
+        + b"\0"
+        + stub_string.encode(LOGIN_SHELL_SETTING_FILE_ENCODING)
+        + b"\0"
+        + setup_config.digest().encode(LOGIN_SHELL_SETTING_FILE_ENCODING)
+    ).hexdigest()
+
+
+def get_install_digest(login_shell_path, function_string, setup_config):
+    """
+    Get the block digest an install of a login shell writes.
+
+    Parameters
+    ----------
+    login_shell_path : str
+        login shell path of the setup target user.
+    function_string : str
+        rendered register-sts-assumed-role function string.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
+
+    Returns
+    -------
+    block_digest : str
+        block digest including the lazy install stub.
+    """
+    stub_string = ""
+    if setup_config.install_mode == INSTALL_MODE_LAZY:
+        stub_string = render_lazy_stub(login_shell_path, setup_config)
+    return get_block_digest(function_string, setup_config, stub_string)
+
+
+def stamp_block_digest(function_string, block_digest):
+    """
+    Embed the block digest in the start signal line of the function string.
+
+    Parameters
+    ----------
+    function_string : str
+        register-sts-assumed-role function string for the login shell
+        setting file.
+    block_digest : str
+        block digest from get_block_digest.
+
+    Returns
+    -------
+    function_string : str
+        function string whose start signal line ends with the digest.
+        (ex. "###### register_sts_assumed_role starts here ###### sha256:...")
+    """
+    return function_string.replace(
+        REGISTER_STS_ASSUMED_ROLE_START_SIGNAL,
+        REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
+        + " "
+        + REGISTER_STS_ASSUMED_ROLE_DIGEST_PREFIX
+        + block_digest,
+        1,
+    )
+
+
+def read_block_digest(login_shell_setting_file_path):
+    """
+    Read the block digest of the registered function.
+
+    Parameters
+    ----------
+    login_shell_setting_file_path : str
+        login shell setting file path.
+
+    Returns
+    -------
+    block_digest : str
+        registered block digest. None if the function or its digest not exist.
+    """
+    import file_util
+
+    if os.path.exists(login_shell_setting_file_path) == False:
+        return None
+
+    tag = file_util.find_block_tag(
+        login_shell_setting_file_path,
+        REGISTER_STS_ASSUMED_ROLE_START_SIGNAL.encode(
+            LOGIN_SHELL_SETTING_FILE_ENCODING
+        ),
+        REGISTER_STS_ASSUMED_ROLE_END_SIGNAL.encode(LOGIN_SHELL_SETTING_FILE_ENCODING),
     )
-    return backup_file_path
+    if tag is None:
+        return None
+    tag = tag.decode(LOGIN_SHELL_SETTING_FILE_ENCODING, "replace")
+    if not tag.startswith(REGISTER_STS_ASSUMED_ROLE_DIGEST_PREFIX):
+        return None
+    return tag[len(REGISTER_STS_ASSUMED_ROLE_DIGEST_PREFIX) :]
 
 
 def exist_register_sts_assumed_role(login_shell_setting_file_path):
@@ -264,23 +1037,26 @@ def exist_register_sts_assumed_role(login_shell_setting_file_path):
     is_exist : bool
         if exist True. not exist False.
     """
+    import file_util
+
     if os.path.exists(login_shell_setting_file_path) == False:
         return False
 
-    with open(login_shell_setting_file_path, "r") as login_shell_setting_file:
-        login_shell_setting = login_shell_setting_file.read()
-        start_index = login_shell_setting.find(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL)
-        if start_index < 0:
-            return False
-
-        register_sts_assumed_role = login_shell_setting[start_index:]
-        return register_sts_assumed_role.find(REGISTER_STS_ASSUMED_ROLE_END_SIGNAL) >= len(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL)
+    return file_util.contains_block(
+        login_shell_setting_file_path,
+        REGISTER_STS_ASSUMED_ROLE_START_SIGNAL.encode(
+            LOGIN_SHELL_SETTING_FILE_ENCODING
+        ),
+        REGISTER_STS_ASSUMED_ROLE_END_SIGNAL.encode(LOGIN_SHELL_SETTING_FILE_ENCODING),
+    )
 
 
 def register_function(function_string, login_shell_setting_file_path, logger):
     """
     Register register_sts_assumed_role function to login shell setting file.
 
+    The login shell setting file is streamed once and replaced atomically.
+
     Parameters
     ----------
     function_string : str
@@ -289,44 +1065,155 @@ def register_function(function_string, login_shell_setting_file_path, logger):
         login shell setting file path.
     logger : logger
         logging.logger object.
+
+    Returns
+    -------
+    is_replaced : bool
+        True if the function is updated. False if inserted.
     """
-    if exist_register_sts_assumed_role(login_shell_setting_file_path):
-        with open(login_shell_setting_file_path, "r") as login_shell_setting_file:
-            login_shell_setting = login_shell_setting_file.read()
-            before_function = login_shell_setting[
-                login_shell_setting.find(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL) :
-            ]
-            before_function = before_function[
-                : before_function.find(REGISTER_STS_ASSUMED_ROLE_END_SIGNAL)
-                + len(REGISTER_STS_ASSUMED_ROLE_END_SIGNAL)
-            ]
-            login_shell_setting = login_shell_setting.replace(
-                before_function, function_string
-            )
+    import file_util
 
-        with open(login_shell_setting_file_path, mode="w") as login_shell_setting_file:
-            login_shell_setting_file.write(login_shell_setting)
-        logger.info(
-            datetime.datetime.now().isoformat()
-            + "update register_sts_assumed_role to "
-            + login_shell_setting_file_path
-            + " successed."
-        )
-    else:
-        with open(login_shell_setting_file_path, mode="a") as login_shell_setting_file:
-            login_shell_setting_file.write("\n" + function_string)
-        logger.info(
-            datetime.datetime.now().isoformat()
-            + "insert register_sts_assumed_role to "
-            + login_shell_setting_file_path
-            + " successed."
+    is_replaced = file_util.replace_block(
+        login_shell_setting_file_path,
+        function_string.encode(LOGIN_SHELL_SETTING_FILE_ENCODING),
+        REGISTER_STS_ASSUMED_ROLE_START_SIGNAL.encode(
+            LOGIN_SHELL_SETTING_FILE_ENCODING
+        ),
+        REGISTER_STS_ASSUMED_ROLE_END_SIGNAL.encode(LOGIN_SHELL_SETTING_FILE_ENCODING),
+    )
+    logger.info(
+        datetime.datetime.now().isoformat()
+        + ("update" if is_replaced else "insert")
+        + " register_sts_assumed_role to "
+        + login_shell_setting_file_path
+        + " successed."
+    )
+    return is_replaced
+
+
+def install_register_sts_assumed_role(
+    login_shell_path, setup_config, now, logger, home_dir_path=None, recorder=None
+):
+    """
+    Install register_sts_assumed_role function for a login shell.
+
+    The login shell setting file is checked, backed up and updated under
+    its lock. The start signal line has the digest of the rendered function
+    and the setup config, and nothing is written or backed up while it is
+    the same and, in lazy install mode, the function file has the rendered
+    function.
+
+    Parameters
+    ----------
+    login_shell_path : str
+        login shell path of the setup target user.
+    setup_config : SetupConfigVO
+        loaded config detail value object.
+    now : datetime.datetime
+        current datetime.
+    logger : logger
+        logging.logger object.
+    home_dir_path : str
+        home directory path of the setup target user. $HOME if None.
+    recorder : metrics.SpanRecorder
+        records the render_template, check_digest, install_lazy_function,
+        backup_file and register_function spans. not recorded if None.
+
+    Returns
+    -------
+    login_shell_setting_file_path : str
+        updated login shell setting file path. None if the login shell is not supported.
+    install_status : str
+        "updated", "inserted" or "skipped" if the function is unchanged.
+    """
+    import file_util
+    import metrics
+
+    recorder = recorder or metrics.SpanRecorder("setup")
+    login_shell_setting_file_path = get_login_shell_setting_file_path(
+        login_shell_path, home_dir_path
+    )
+    template_file_path = get_register_sts_assumed_role_template_file_path(
+        login_shell_path
+    )
+    if login_shell_setting_file_path is None or template_file_path is None:
+        return None, None
+
+    with recorder.span("render_template") as span:
+        span.read_bytes = metrics.get_file_size(template_file_path)
+        function_string = generate_register_sts_assumed_role_template(
+            template_file_path, setup_config
         )
+    # the digest is checked under the lock, so concurrent setups do not both
+    # skip or both rewrite the block
+    with file_util.lock_file(os.path.realpath(login_shell_setting_file_path)):
+        with recorder.span("check_digest") as span:
+            block_digest = get_install_digest(
+                login_shell_path, function_string, setup_config
+            )
+            span.read_bytes = metrics.get_file_size(login_shell_setting_file_path)
+            is_unchanged = (
+                read_block_digest(login_shell_setting_file_path) == block_digest
+            )
+            if is_unchanged and setup_config.install_mode == INSTALL_MODE_LAZY:
+                is_unchanged = is_function_file_installed(
+                    expand_home_path(
+                        get_function_file_path(
+                            login_shell_path, setup_config.functions_dir_path
+                        ),
+                        home_dir_path,
+                    ),
+                    get_function_file_string(function_string, login_shell_path),
+                )
+        if is_unchanged:
+            logger.info(
+                now.isoformat()
+                + " register_sts_assumed_role in "
+                + login_shell_setting_file_path
+                + " is up to date. skipped."
+            )
+            return login_shell_setting_file_path, INSTALL_STATUS_SKIPPED
+
+        if setup_config.install_mode == INSTALL_MODE_LAZY:
+            with recorder.span("install_lazy_function") as span:
+                span.written_bytes = len(
+                    function_string.encode(LOGIN_SHELL_SETTING_FILE_ENCODING)
+                )
+                function_string = install_lazy_function(
+                    function_string,
+                    login_shell_path,
+                    setup_config,
+                    logger,
+                    home_dir_path,
+                )
+
+        with recorder.span("backup_file") as span:
+            snapshot = backup_file(
+                login_shell_setting_file_path, setup_config, now, logger, home_dir_path
+            )
+            if snapshot is not None:
+                span.read_bytes = snapshot.size
+                span.written_bytes = snapshot.stored_size
+        with recorder.span("register_function") as span:
+            span.read_bytes = metrics.get_file_size(login_shell_setting_file_path)
+            is_replaced = register_function(
+                stamp_block_digest(function_string, block_digest),
+                login_shell_setting_file_path,
+                logger,
+            )
+            span.written_bytes = metrics.get_file_size(login_shell_setting_file_path)
+    if is_replaced:
+        return login_shell_setting_file_path, INSTALL_STATUS_UPDATED
+    return login_shell_setting_file_path, INSTALL_STATUS_INSERTED
 
 
-def setup_register_sts_assumed_role(setup_config, now, logger):
+def setup_register_sts_assumed_role(setup_config, now, logger, recorder=None):
     """
     Setup register_sts_assumed_role function to login shell setting file.
 
+    The numbers of the updated and skipped login shell setting files are
+    printed after the result.
+
     Parameters
     ----------
     setup_config : SetupConfigVO
@@ -335,17 +1222,18 @@ def setup_register_sts_assumed_role(setup_config, now, logger):
         current datetime.
     logger : logger
         logging.logger object.
+    recorder : metrics.SpanRecorder
+        records the spans of each stage. not recorded if None.
     """
     if "SHELL" not in os.environ:
         print("Login shells not found.")
         return
 
     login_shell_path = os.environ["SHELL"]
-    login_shell_setting_file_path = get_login_shell_setting_file_path(login_shell_path)
-    template_file_path = get_register_sts_assumed_role_template_file_path(
-        login_shell_path
+    login_shell_setting_file_path, install_status = install_register_sts_assumed_role(
+        login_shell_path, setup_config, now, logger, None, recorder
     )
-    if login_shell_setting_file_path is None or template_file_path is None:
+    if login_shell_setting_file_path is None:
         logger.error(
             datetime.datetime.now().isoformat()
             + " Login shell not supported error. login_shell_path = "
@@ -354,25 +1242,108 @@ def setup_register_sts_assumed_role(setup_config, now, logger):
         print("Sorry. the only supported login shells are bash and zsh.")
         return
 
-    backup_file(login_shell_setting_file_path, now, logger)
-    register_function(
-        generate_register_sts_assumed_role_template(template_file_path, setup_config),
-        login_shell_setting_file_path,
-        logger
-    )
-
     logger.info(
         datetime.datetime.now().isoformat()
         + "execute setup_register_sts_assumed_role successed."
     )
+    is_skipped = install_status == INSTALL_STATUS_SKIPPED
+    if is_skipped:
+        print("register_sts_assumed_role is up to date.")
+    else:
+        print(
+            "Setup successed. please run `source "
+            + login_shell_setting_file_path
+            + "` command."
+        )
     print(
-        "Setup successed. please run `source "
-        + login_shell_setting_file_path
-        + "` command."
+        "updated: "
+        + str(0 if is_skipped else 1)
+        + ", skipped: "
+        + str(1 if is_skipped else 0)
     )
 
 
-if __name__ == "__main__":
+def main(argv):
+    """
+    Setup register_sts_assumed_role function.
+
+    The spans of each stage are written to the setup log as JSON records,
+    and to the Prometheus textfile collector directory if configured.
+
+    Parameters
+    ----------
+    argv : list of str
+        command line arguments. "--timings" prints the import and startup
+        seconds of each stage to stderr. "--watch" keeps updating the
+        function whenever the setup config or a template is changed.
+
+    Returns
+    -------
+    exit_status : int
+        always 0.
+    """
+    import argparse
+    import json
+    import metrics
+
+    parser = argparse.ArgumentParser(
+        description="Setup register_sts_assumed_role function."
+    )
+    parser.add_argument("--timings", action="store_true")
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--poll", action="store_true", help="watch without inotify.")
+    parser.add_argument("--debounce", type=float, default=0.5)
+    arguments = parser.parse_args(argv)
+
+    recorder = metrics.SpanRecorder("setup")
+    recorder.add_span("import", time.perf_counter() - IMPORT_STARTED)
+    with recorder.span("load_setup_config") as span:
+        span.read_bytes = metrics.get_file_size(SETUP_CONFIG_FILE_PATH)
+        setup_config = load_setup_config()
+    with recorder.span("initialize_logger_setting"):
+        logger = initialize_logger_setting()
+    if arguments.watch:
+        if "SHELL" not in os.environ:
+            print("Login shells not found.")
+            return 0
+        import fleet
+        import setup_watch
+
+        setup_watch.watch(
+            setup_watch.WatchStateVO(
+                os.path.abspath(SETUP_CONFIG_FILE_PATH),
+                None,
+                setup_config,
+                [fleet.FleetTargetVO(os.path.expanduser("~"), os.environ["SHELL"], {})],
+            ),
+            logger,
+            arguments.debounce,
+            arguments.poll,
+        )
+        return 0
     setup_register_sts_assumed_role(
-        load_setup_config(), datetime.datetime.now(), initialize_logger_setting(),
+        setup_config, datetime.datetime.now(), logger, recorder
     )
+    recorder.add_span("total", time.perf_counter() - IMPORT_STARTED)
+
+    for record in recorder.to_records():
+        logger.info(json.dumps(record))
+    error = metrics.export(
+        recorder, "", expand_home_path(setup_config.metrics_textfile_dir_path)
+    )
+    if error is not None:
+        logger.warning(
+            datetime.datetime.now().isoformat() + " metrics export error. " + str(error)
+        )
+
+    if arguments.timings:
+        for stage in recorder.summarize():
+            print(
+                stage["stage"] + "\t" + format(stage["seconds"], ".4f") + "s",
+                file=sys.stderr,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
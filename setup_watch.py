@@ -0,0 +1,498 @@
+import datetime
+import os
+import select
+import struct
+import sys
+import time
+import fleet
+import setup
+
+## const value
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+DEFAULT_POLL_INTERVAL_SECONDS = 1.0
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 65536
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+# editors and file_util.write_file_atomically replace files by rename, so
+# the parent directories are watched instead of the files.
+INOTIFY_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+TEMPLATE_FILE_PATHS = (
+    setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+    setup.REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH,
+    setup.REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH,
+    setup.REGISTER_STS_ASSUMED_ROLE_STUB_BASH_TEMPLATE_FILE_PATH,
+    setup.REGISTER_STS_ASSUMED_ROLE_STUB_ZSH_TEMPLATE_FILE_PATH,
+    setup.REGISTER_STS_ASSUMED_ROLE_STUB_TEST_TEMPLATE_FILE_PATH,
+)
+
+
+class PollingWatcher:
+    """
+    Detect file changes by comparing the stat of the files periodically.
+    """
+
+    __slots__ = ("file_paths", "interval", "signatures")
+
+    def __init__(self, file_paths, interval=DEFAULT_POLL_INTERVAL_SECONDS):
+        """
+        Parameters
+        ----------
+        file_paths : list of str
+            watched absolute file paths.
+        interval : float
+            seconds between the checks.
+        """
+        self.file_paths = file_paths
+        self.interval = interval
+        self.signatures = {
+            file_path: get_file_signature(file_path) for file_path in file_paths
+        }
+
+    def wait(self, timeout=None):
+        """
+        Wait until a watched file is changed.
+
+        Parameters
+        ----------
+        timeout : float
+            max seconds to wait. wait forever if None.
+
+        Returns
+        -------
+        changed_file_paths : set of str
+            changed file paths. empty if timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed_file_paths = set()
+            for file_path in self.file_paths:
+                signature = get_file_signature(file_path)
+                if signature != self.signatures[file_path]:
+                    self.signatures[file_path] = signature
+                    changed_file_paths.add(file_path)
+            if len(changed_file_paths) > 0:
+                return changed_file_paths
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed_file_paths
+            sleep_seconds = self.interval
+            if deadline is not None:
+                sleep_seconds = min(sleep_seconds, max(deadline - time.monotonic(), 0))
+            time.sleep(sleep_seconds)
+
+    def close(self):
+        """
+        Stop watching. nothing to release.
+        """
+
+
+class InotifyWatcher:
+    """
+    Detect file changes with the inotify of Linux.
+    """
+
+    __slots__ = ("file_paths", "fd", "watch_dir_paths")
+
+    def __init__(self, file_paths):
+        """
+        Parameters
+        ----------
+        file_paths : list of str
+            watched absolute file paths.
+
+        Raises
+        ------
+        OSError
+            if inotify is not available.
+        """
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available.")
+        self.file_paths = set(file_paths)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        self.watch_dir_paths = {}
+        try:
+            for dir_path in sorted(set(os.path.dirname(path) for path in file_paths)):
+                watch_descriptor = libc.inotify_add_watch(
+                    self.fd, os.fsencode(dir_path), INOTIFY_WATCH_MASK
+                )
+                if watch_descriptor < 0:
+                    raise OSError(
+                        ctypes.get_errno(), "inotify_add_watch failed.", dir_path
+                    )
+                self.watch_dir_paths[watch_descriptor] = dir_path
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout=None):
+        """
+        Wait until a watched file is changed.
+
+        Parameters
+        ----------
+        timeout : float
+            max seconds to wait. wait forever if None.
+
+        Returns
+        -------
+        changed_file_paths : set of str
+            changed file paths. empty if timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = (
+                None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if len(readable) == 0:
+                return set()
+            changed_file_paths = self.read_events()
+            if len(changed_file_paths) > 0:
+                return changed_file_paths
+
+    def read_events(self):
+        """
+        Read the queued inotify events.
+
+        Returns
+        -------
+        changed_file_paths : set of str
+            watched file paths of the events.
+        """
+        changed_file_paths = set()
+        try:
+            buffer = os.read(self.fd, INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return changed_file_paths
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(buffer):
+            watch_descriptor, _, _, name_size = INOTIFY_EVENT_HEADER.unpack_from(
+                buffer, offset
+            )
+            offset += INOTIFY_EVENT_HEADER.size
+            name = buffer[offset : offset + name_size].rstrip(b"\0")
+            offset += name_size
+            dir_path = self.watch_dir_paths.get(watch_descriptor)
+            if dir_path is None or not name:
+                continue
+            file_path = os.path.join(dir_path, os.fsdecode(name))
+            if file_path in self.file_paths:
+                changed_file_paths.add(file_path)
+        return changed_file_paths
+
+    def close(self):
+        """
+        Stop watching and close the inotify file descriptor.
+        """
+        os.close(self.fd)
+
+
+class WatchStateVO:
+    """
+    Inputs of the watched targets and the digests installed to them.
+    """
+
+    __slots__ = (
+        "setup_config_file_path",
+        "target_file_path",
+        "setup_config",
+        "targets",
+        "installed_digests",
+    )
+
+    def __init__(self, setup_config_file_path, target_file_path, setup_config, targets):
+        """
+        Parameters
+        ----------
+        setup_config_file_path : str
+            absolute setup config file path.
+        target_file_path : str
+            absolute fleet target list file path. None if the targets are fixed.
+        setup_config : setup.SetupConfigVO
+            loaded setup config.
+        targets : list of fleet.FleetTargetVO
+            watched targets.
+        """
+        self.setup_config_file_path = setup_config_file_path
+        self.target_file_path = target_file_path
+        self.setup_config = setup_config
+        self.targets = targets
+        self.installed_digests = {}
+
+
+def get_file_signature(file_path):
+    """
+    Get the stat signature of a watched file.
+
+    Parameters
+    ----------
+    file_path : str
+        file path.
+
+    Returns
+    -------
+    signature : tuple of int
+        inode, mtime and size. None if the file not exist.
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def get_watch_file_paths(state):
+    """
+    Get the input files of the watched targets.
+
+    Parameters
+    ----------
+    state : WatchStateVO
+        watch state.
+
+    Returns
+    -------
+    file_paths : list of str
+        absolute paths of the setup config, the templates and the target list.
+    """
+    file_paths = [state.setup_config_file_path]
+    file_paths.extend(
+        os.path.join(setup.PROJECT_ROOT_DIR_PATH, template_file_path)
+        for template_file_path in TEMPLATE_FILE_PATHS
+    )
+    if state.target_file_path is not None:
+        file_paths.append(state.target_file_path)
+    return file_paths
+
+
+def make_watcher(file_paths, polling=False):
+    """
+    Make an inotify watcher, or a polling watcher if inotify is not available.
+
+    Parameters
+    ----------
+    file_paths : list of str
+        watched absolute file paths.
+    polling : bool
+        if True always poll.
+
+    Returns
+    -------
+    watcher : InotifyWatcher or PollingWatcher
+        file watcher.
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(file_paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(file_paths)
+
+
+def wait_for_changes(watcher, debounce_seconds, timeout=None):
+    """
+    Wait for a change and collect the following changes of the burst.
+
+    Parameters
+    ----------
+    watcher : InotifyWatcher or PollingWatcher
+        file watcher.
+    debounce_seconds : float
+        the burst ends when no change follows in this seconds.
+    timeout : float
+        max seconds to wait for the first change. wait forever if None.
+
+    Returns
+    -------
+    changed_file_paths : set of str
+        changed file paths. empty if timed out.
+    """
+    changed_file_paths = watcher.wait(timeout)
+    while len(changed_file_paths) > 0:
+        following_file_paths = watcher.wait(debounce_seconds)
+        if len(following_file_paths) == 0:
+            break
+        changed_file_paths |= following_file_paths
+    return changed_file_paths
+
+
+def reload_inputs(state, changed_file_paths, logger):
+    """
+    Reload the changed setup config and target list.
+
+    A broken file is logged and the last loaded one is kept.
+
+    Parameters
+    ----------
+    state : WatchStateVO
+        watch state. updated in place.
+    changed_file_paths : set of str
+        changed file paths.
+    logger : logger
+        logging.logger object.
+    """
+    if state.setup_config_file_path in changed_file_paths:
+        try:
+            state.setup_config = setup.load_setup_config(state.setup_config_file_path)
+        except Exception as error:
+            logger.error(
+                datetime.datetime.now().isoformat()
+                + " setup config reload error. keep the last config. "
+                + str(error)
+            )
+    if (
+        state.target_file_path is not None
+        and state.target_file_path in changed_file_paths
+    ):
+        try:
+            state.targets = fleet.load_targets(state.target_file_path)
+        except (OSError, ValueError) as error:
+            logger.error(
+                datetime.datetime.now().isoformat()
+                + " target list reload error. keep the last targets. "
+                + str(error)
+            )
+
+
+def find_outdated_targets(state):
+    """
+    Find the targets whose installed function differs from the inputs.
+
+    The function and the stub are rendered once for each login shell and
+    target setup config, and the digests are compared with the digests
+    installed by this watch, so no login shell setting file is read.
+
+    Parameters
+    ----------
+    state : WatchStateVO
+        watch state.
+
+    Returns
+    -------
+    outdated_targets : list of tuple of (fleet.FleetTargetVO, str)
+        target and its new block digest in targets order. the digest is
+        None if the login shell is not supported.
+    """
+    group_digests = {}
+    outdated_targets = []
+    for target in state.targets:
+        template_file_path = setup.get_register_sts_assumed_role_template_file_path(
+            target.shell
+        )
+        if template_file_path is None:
+            # provisioned to report the unsupported login shell
+            outdated_targets.append((target, None))
+            continue
+        target_setup_config = fleet.apply_overrides(
+            state.setup_config, target.overrides
+        )
+        group_key = (template_file_path, target_setup_config.digest())
+        if group_key not in group_digests:
+            group_digests[group_key] = setup.get_install_digest(
+                target.shell,
+                setup.generate_register_sts_assumed_role_template(
+                    template_file_path, target_setup_config
+                ),
+                target_setup_config,
+            )
+        block_digest = group_digests[group_key]
+        if state.installed_digests.get(target.home_dir_path) != block_digest:
+            outdated_targets.append((target, block_digest))
+    return outdated_targets
+
+
+def update_outdated_targets(state, now, logger, workers=fleet.DEFAULT_WORKERS):
+    """
+    Install the function to the outdated targets.
+
+    Parameters
+    ----------
+    state : WatchStateVO
+        watch state. the installed digests are updated in place.
+    now : datetime.datetime
+        current datetime.
+    logger : logger
+        logging.logger object.
+    workers : int
+        max number of threads.
+
+    Returns
+    -------
+    results : list of fleet.FleetResultVO
+        provisioning results of the outdated targets.
+    """
+    outdated_targets = find_outdated_targets(state)
+    if len(outdated_targets) == 0:
+        return []
+    results = fleet.provision_fleet(
+        [target for target, _ in outdated_targets],
+        state.setup_config,
+        now,
+        logger,
+        workers,
+    )
+    for (target, block_digest), result in zip(outdated_targets, results):
+        if result.status != fleet.STATUS_FAILED:
+            state.installed_digests[target.home_dir_path] = block_digest
+    return results
+
+
+def watch(
+    state,
+    logger,
+    debounce_seconds=DEFAULT_DEBOUNCE_SECONDS,
+    polling=False,
+    workers=fleet.DEFAULT_WORKERS,
+):
+    """
+    Update the targets whenever the setup config, a template or the target
+    list is changed, until interrupted.
+
+    All targets are checked once at start, and then only the targets whose
+    function or stub depends on the changed inputs are updated.
+
+    Parameters
+    ----------
+    state : WatchStateVO
+        watch state.
+    logger : logger
+        logging.logger object.
+    debounce_seconds : float
+        a burst of changes is handled once after this quiet seconds.
+    polling : bool
+        if True poll the files instead of inotify.
+    workers : int
+        max number of threads.
+    """
+    watcher = make_watcher(get_watch_file_paths(state), polling)
+    try:
+        changed_file_paths = set()
+        while True:
+            reload_inputs(state, changed_file_paths, logger)
+            started = time.perf_counter()
+            results = update_outdated_targets(
+                state, datetime.datetime.now(), logger, workers
+            )
+            if len(results) > 0:
+                for line in fleet.format_summary(
+                    results, time.perf_counter() - started
+                ):
+                    print(line, flush=True)
+            changed_file_paths = wait_for_changes(watcher, debounce_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
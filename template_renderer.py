@@ -0,0 +1,137 @@
+import os
+import re
+
+## const value
+PLACEHOLDER_PATTERN = re.compile(r"\$REPLACEMENT_STRING_[A-Z0-9_]+")
+TEMPLATE_FILE_ENCODING = "utf-8"
+MAX_RENDERED_CACHE_SIZE = 128
+
+compiled_template_cache = {}
+rendered_template_cache = {}
+
+
+class CompiledTemplate:
+    """
+    Template parsed into literal and placeholder segments.
+    """
+
+    __slots__ = ("segments", "placeholders")
+
+    def __init__(self, segments, placeholders):
+        """
+        Parameters
+        ----------
+        segments : list of str
+            literal strings and placeholder names in template order.
+        placeholders : list of tuple of (int, str)
+            segment index and placeholder name of each placeholder.
+        """
+        self.segments = segments
+        self.placeholders = placeholders
+
+    def render(self, values):
+        """
+        Render the template with one join.
+
+        Placeholders not in values are kept as they are.
+
+        Parameters
+        ----------
+        values : dict
+            placeholder name (ex. "$REPLACEMENT_STRING_REGION_NAME") to value.
+
+        Returns
+        -------
+        rendered_string : str
+            rendered string.
+        """
+        segments = list(self.segments)
+        for index, placeholder in self.placeholders:
+            segments[index] = values.get(placeholder, placeholder)
+        return "".join(segments)
+
+
+def compile_template(template_string):
+    """
+    Parse a template string into literal and placeholder segments.
+
+    Parameters
+    ----------
+    template_string : str
+        template string.
+
+    Returns
+    -------
+    compiled_template : CompiledTemplate
+        compiled template.
+    """
+    segments = []
+    placeholders = []
+    literal_start = 0
+    for matched in PLACEHOLDER_PATTERN.finditer(template_string):
+        segments.append(template_string[literal_start : matched.start()])
+        placeholders.append((len(segments), matched.group(0)))
+        segments.append(matched.group(0))
+        literal_start = matched.end()
+    segments.append(template_string[literal_start:])
+    return CompiledTemplate(segments, placeholders)
+
+
+def load_template(template_file_path):
+    """
+    Load a compiled template, compiling the file only when it is changed.
+
+    Parameters
+    ----------
+    template_file_path : str
+        template file path.
+
+    Returns
+    -------
+    compiled_template : CompiledTemplate
+        compiled template.
+    signature : tuple of int
+        template file mtime and size when compiled.
+    """
+    template_file_path = os.path.abspath(template_file_path)
+    file_stat = os.stat(template_file_path)
+    signature = (file_stat.st_mtime_ns, file_stat.st_size)
+    cached = compiled_template_cache.get(template_file_path)
+    if cached is not None and cached[1] == signature:
+        return cached
+
+    with open(
+        template_file_path, "r", encoding=TEMPLATE_FILE_ENCODING
+    ) as template_file:
+        compiled_template = compile_template(template_file.read())
+    compiled_template_cache[template_file_path] = (compiled_template, signature)
+    return compiled_template, signature
+
+
+def render_template_file(template_file_path, values, cache_key):
+    """
+    Render a template file, reusing the output rendered with the same cache key.
+
+    Parameters
+    ----------
+    template_file_path : str
+        template file path.
+    values : dict
+        placeholder name to value.
+    cache_key : str
+        digest of the inputs of values.
+
+    Returns
+    -------
+    rendered_string : str
+        rendered string.
+    """
+    compiled_template, signature = load_template(template_file_path)
+    rendered_key = (os.path.abspath(template_file_path), signature, cache_key)
+    rendered_string = rendered_template_cache.get(rendered_key)
+    if rendered_string is None:
+        if len(rendered_template_cache) >= MAX_RENDERED_CACHE_SIZE:
+            rendered_template_cache.clear()
+        rendered_string = compiled_template.render(values)
+        rendered_template_cache[rendered_key] = rendered_string
+    return rendered_string
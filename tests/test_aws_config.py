@@ -0,0 +1,1165 @@
+import unittest
+import aws_config
+import backup_store
+import change_log
+import credential_cache
+import file_util
+import setup
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from io import StringIO
+from parameterized import parameterized
+
+REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH = (
+    "template/register_sts_assumed_role.bash.tmpl"
+)
+BEFORE_CONFIG = (
+    "[default]\n"
+    "region = ap-northeast-1\n"
+    "\n"
+    "\n"
+    "[profile sts-session]\n"
+    "role_arn = arn:aws:iam::123456789012:role/before\n"
+    "source_profile = default\n"
+    "[profile other]\n"
+    "region = us-east-1\n"
+    "output = json\n"
+)
+
+STRESS_REGISTRATIONS = 200
+STRESS_WORKERS = 16
+
+
+def register_stress_profile(arguments):
+    tmp_dir_path, number = arguments
+    return aws_config.main(
+        [
+            "register",
+            "--config-file",
+            os.path.join(tmp_dir_path, "config"),
+            "--profile",
+            "stress-" + str(number),
+            "--role-arn",
+            "arn:aws:iam::123456789012:role/stress-" + str(number),
+            "--source-profile",
+            "default",
+            "--region",
+            "ap-northeast-1",
+            "--output",
+            "json",
+            "--change-log-file",
+            os.path.join(tmp_dir_path, "change.log"),
+            "--backup-dir",
+            os.path.join(tmp_dir_path, "backup"),
+        ]
+    )
+
+
+class TestAwsConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_parse_config_expected_value(self):
+        ## when
+        config = aws_config.parse_config(BEFORE_CONFIG.splitlines())
+
+        ## then
+        self.assertEqual(config.profile_names(), ["default", "sts-session", "other"])
+        self.assertEqual(
+            config.find_profile("sts-session")[0].get("role_arn"),
+            "arn:aws:iam::123456789012:role/before",
+        )
+        self.assertIsNone(config.find_profile("other")[0].get("role_arn"))
+        self.assertEqual(config.find_profile("not_exist"), [])
+
+    def test_parse_config_keep_lines_before_first_section(self):
+        ## given
+        lines = ["# managed by hand", "", "[profile a]", "region = us-east-1"]
+
+        ## when
+        config = aws_config.parse_config(lines)
+
+        ## then
+        self.assertEqual(config.profile_names(), ["a"])
+        self.assertEqual(
+            config.to_string(), "# managed by hand\n\n[profile a]\nregion = us-east-1\n"
+        )
+
+    def test_profile_section_use_slots(self):
+        ## given
+        section = aws_config.ProfileSection("[profile a]", "a", [])
+
+        ## then
+        with self.assertRaises(AttributeError):
+            section.unknown = "value"
+
+    @parameterized.expand(
+        [
+            ("sts-session", "[profile sts-session]"),
+            ("default", "[default]"),
+        ]
+    )
+    def test_generate_profile_section_expected_value(self, profile_name, header):
+        ## when
+        section = aws_config.generate_profile_section(
+            profile_name, "arn:role", "source", "ap-northeast-1", "json", ""
+        )
+
+        ## then
+        self.assertEqual(section.header, header)
+        self.assertEqual(
+            section.lines,
+            [
+                "role_arn = arn:role",
+                "source_profile = source",
+                "region = ap-northeast-1",
+                "output = json",
+            ],
+        )
+
+    def test_register_assumed_role_replace_success(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+
+        ## when
+        deleted_sections = aws_config.register_assumed_role(
+            self.config_file_path,
+            "sts-session",
+            "arn:aws:iam::123456789012:role/after",
+            "default",
+            "ap-northeast-1",
+            "json",
+            "arn:aws:iam::123456789012:mfa/user",
+        )
+
+        ## then
+        self.assertEqual(len(deleted_sections), 1)
+        self.assertEqual(
+            deleted_sections[0].get("role_arn"), "arn:aws:iam::123456789012:role/before"
+        )
+        with open(self.config_file_path, "r") as config_file:
+            self.assertEqual(
+                config_file.read(),
+                "[default]\n"
+                "region = ap-northeast-1\n"
+                "\n"
+                "\n"
+                "[profile other]\n"
+                "region = us-east-1\n"
+                "output = json\n"
+                "\n"
+                "[profile sts-session]\n"
+                "role_arn = arn:aws:iam::123456789012:role/after\n"
+                "source_profile = default\n"
+                "mfa_serial = arn:aws:iam::123456789012:mfa/user\n"
+                "region = ap-northeast-1\n"
+                "output = json\n",
+            )
+
+    def test_register_assumed_role_delete_duplicate_sections(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(
+                "[profile a]\nregion = us-east-1\n[a]\nregion = us-west-2\n"
+            )
+
+        ## when
+        deleted_sections = aws_config.register_assumed_role(
+            self.config_file_path,
+            "a",
+            "arn:role",
+            "default",
+            "ap-northeast-1",
+            "json",
+            "",
+        )
+
+        ## then
+        self.assertEqual(
+            [section.header for section in deleted_sections], ["[profile a]", "[a]"]
+        )
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(), ["a"]
+        )
+
+    def test_register_assumed_role_config_file_not_exist(self):
+        ## when
+        deleted_sections = aws_config.register_assumed_role(
+            self.config_file_path,
+            "a",
+            "arn:role",
+            "default",
+            "ap-northeast-1",
+            "json",
+            "",
+        )
+
+        ## then
+        self.assertEqual(deleted_sections, [])
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(), ["a"]
+        )
+
+    def test_delete_assumed_role_expected_value(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+
+        ## when
+        deleted_sections = aws_config.delete_assumed_role(
+            self.config_file_path, "other"
+        )
+
+        ## then
+        self.assertEqual(len(deleted_sections), 1)
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(),
+            ["default", "sts-session"],
+        )
+
+    def test_make_delete_events_credential_process(self):
+        ## given
+        config = aws_config.parse_config(
+            (
+                "[profile cached]\ncredential_process = "
+                + credential_cache.make_credential_process(
+                    self.tmp_dir_path,
+                    "cached",
+                    "arn:aws:iam::123456789012:role/cached",
+                    "default",
+                    "arn:aws:iam::123456789012:mfa/user",
+                )
+                + "\nregion = ap-northeast-1\n"
+            ).splitlines()
+        )
+        now = datetime.datetime.now().astimezone()
+
+        ## when
+        change_log_events = aws_config.make_delete_events(
+            config.find_profile("cached"), now
+        )
+
+        ## then
+        self.assertEqual(
+            [
+                (
+                    change_log_event["event"],
+                    change_log_event["role_arn"],
+                    change_log_event["source_profile"],
+                    change_log_event["mfa_serial"],
+                )
+                for change_log_event in change_log_events
+            ],
+            [
+                (
+                    change_log.EVENT_DELETED,
+                    "arn:aws:iam::123456789012:role/cached",
+                    "default",
+                    "arn:aws:iam::123456789012:mfa/user",
+                )
+            ],
+        )
+
+    def test_load_section_index_expected_value(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+
+        ## when
+        section_index = aws_config.load_section_index(self.config_file_path)
+
+        ## then
+        self.assertTrue(
+            os.path.exists(
+                aws_config.get_section_index_file_path(self.config_file_path)
+            )
+        )
+        self.assertEqual(section_index.names, ["default", "sts-session", "other"])
+        self.assertEqual(section_index.find("sts-session"), [1])
+        with open(self.config_file_path, "rb") as config_file:
+            config_bytes = config_file.read()
+        start, end = section_index.span(1, 2)
+        self.assertTrue(config_bytes[start:end].startswith(b"[profile sts-session]\n"))
+        self.assertEqual(section_index.span(0, 3), (0, len(config_bytes)))
+
+    def test_load_section_index_rebuild_after_config_changed(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        aws_config.load_section_index(self.config_file_path)
+        with open(self.config_file_path, "a") as config_file:
+            config_file.write("[profile appended]\nregion = us-east-1\n")
+
+        ## when
+        section_index = aws_config.load_section_index(self.config_file_path)
+
+        ## then
+        self.assertEqual(
+            section_index.names, ["default", "sts-session", "other", "appended"]
+        )
+
+    def test_read_profile_not_save_section_index_while_locked(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        aws_config.load_section_index(self.config_file_path)
+        section_index_file_path = aws_config.get_section_index_file_path(
+            self.config_file_path
+        )
+        with open(section_index_file_path, "rb") as section_index_file:
+            before_section_index = section_index_file.read()
+
+        ## when
+        with file_util.lock_file(self.config_file_path):
+            file_util.write_file_atomically(
+                self.config_file_path,
+                [b"[profile first]\nregion = us-west-2\n\n", BEFORE_CONFIG.encode()],
+            )
+            sections = aws_config.read_profile(self.config_file_path, "other")
+            with open(section_index_file_path, "rb") as section_index_file:
+                locked_section_index = section_index_file.read()
+        aws_config.register_assumed_role(
+            self.config_file_path,
+            "other",
+            "arn:role/a",
+            "default",
+            "us-east-1",
+            "json",
+            "",
+        )
+
+        ## then
+        self.assertEqual([section.get("region") for section in sections], ["us-east-1"])
+        self.assertEqual(locked_section_index, before_section_index)
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(),
+            ["first", "default", "sts-session", "other"],
+        )
+        self.assertEqual(
+            aws_config.read_profile(self.config_file_path, "first")[0].get("region"),
+            "us-west-2",
+        )
+
+    def test_splice_profile_keep_section_index_consistent(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(
+                "# comment\n" + BEFORE_CONFIG + "[profile last]\nregion = x"
+            )
+
+        ## when
+        aws_config.register_assumed_role(
+            self.config_file_path,
+            "other",
+            "arn:role/a",
+            "default",
+            "us-east-1",
+            "json",
+            "",
+        )
+        aws_config.register_assumed_role(
+            self.config_file_path,
+            "new",
+            "arn:role/b",
+            "default",
+            "us-east-1",
+            "json",
+            "",
+        )
+        aws_config.delete_assumed_role(self.config_file_path, "sts-session")
+
+        ## then
+        spliced_index = aws_config.load_section_index(self.config_file_path)
+        with open(self.config_file_path, "rb") as config_file:
+            scanned_index = aws_config.scan_section_index(config_file)
+        self.assertEqual(spliced_index.names, [None, "default", "last", "other", "new"])
+        self.assertEqual(spliced_index.names, scanned_index.names)
+        self.assertEqual(spliced_index.starts, scanned_index.starts)
+        self.assertEqual(spliced_index.size, scanned_index.size)
+        with open(self.config_file_path, "r") as config_file:
+            self.assertEqual(
+                config_file.read(),
+                "# comment\n"
+                "[default]\n"
+                "region = ap-northeast-1\n"
+                "\n"
+                "\n"
+                "[profile last]\n"
+                "region = x\n"
+                "\n"
+                "[profile other]\n"
+                "role_arn = arn:role/a\n"
+                "source_profile = default\n"
+                "region = us-east-1\n"
+                "output = json\n"
+                "\n"
+                "[profile new]\n"
+                "role_arn = arn:role/b\n"
+                "source_profile = default\n"
+                "region = us-east-1\n"
+                "output = json\n",
+            )
+
+    def test_delete_assumed_role_profile_not_exist(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        before_stat = os.stat(self.config_file_path)
+
+        ## when
+        deleted_sections = aws_config.delete_assumed_role(
+            self.config_file_path, "not_exist"
+        )
+
+        ## then
+        self.assertEqual(deleted_sections, [])
+        self.assertEqual(os.stat(self.config_file_path).st_ino, before_stat.st_ino)
+
+    @parameterized.expand(
+        [
+            (
+                "manifest.yaml",
+                "- profile: a\n"
+                "  role_arn: arn:role/a\n"
+                "  source_profile: default\n"
+                "- profile: sts-session\n"
+                "  role_arn: arn:role/b\n"
+                "  source_profile: default\n"
+                "  mfa_serial: arn:mfa/user\n"
+                "  region: us-east-1\n"
+                "  output: text\n"
+                "  comment: onboarding\n",
+            ),
+            (
+                "manifest.csv",
+                "profile,role_arn,source_profile,mfa_serial,region,output,comment\n"
+                "a,arn:role/a,default,,,,\n"
+                "sts-session,arn:role/b,default,arn:mfa/user,us-east-1,text,onboarding\n",
+            ),
+        ]
+    )
+    def test_load_manifest_expected_value(self, manifest_file_name, manifest_string):
+        ## given
+        manifest_file_path = os.path.join(self.tmp_dir_path, manifest_file_name)
+        with open(manifest_file_path, "w") as manifest_file:
+            manifest_file.write(manifest_string)
+
+        ## when
+        assumed_roles = aws_config.load_manifest(
+            manifest_file_path, "ap-northeast-1", "json"
+        )
+
+        ## then
+        self.assertEqual(
+            [role.profile_name for role in assumed_roles], ["a", "sts-session"]
+        )
+        self.assertEqual(assumed_roles[0].region, "ap-northeast-1")
+        self.assertEqual(assumed_roles[0].output, "json")
+        self.assertEqual(assumed_roles[0].mfa_serial, "")
+        self.assertEqual(assumed_roles[1].mfa_serial, "arn:mfa/user")
+        self.assertEqual(assumed_roles[1].region, "us-east-1")
+        self.assertEqual(assumed_roles[1].output, "text")
+        self.assertEqual(assumed_roles[1].comment, "onboarding")
+
+    def test_load_manifest_required_field_not_exist(self):
+        ## given
+        manifest_file_path = os.path.join(self.tmp_dir_path, "manifest.csv")
+        with open(manifest_file_path, "w") as manifest_file:
+            manifest_file.write("profile,role_arn\na,arn:role/a\n")
+
+        ## then
+        with self.assertRaises(ValueError):
+            aws_config.load_manifest(manifest_file_path, "ap-northeast-1", "json")
+
+    def test_register_assumed_roles_success(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        now = datetime.datetime.now()
+        assumed_roles = [
+            aws_config.AssumedRoleVO(
+                "role" + str(index),
+                "arn:role/" + str(index),
+                "default",
+                "",
+                "ap-northeast-1",
+                "json",
+                "",
+            )
+            for index in range(200)
+        ]
+        assumed_roles.append(
+            aws_config.AssumedRoleVO(
+                "sts-session",
+                "arn:role/after",
+                "default",
+                "",
+                "ap-northeast-1",
+                "json",
+                "",
+            )
+        )
+
+        backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+
+        ## when
+        snapshot = aws_config.register_assumed_roles(
+            self.config_file_path,
+            change_log_file_path,
+            backup_dir_path,
+            assumed_roles,
+            now,
+        )
+
+        ## then
+        self.assertEqual(
+            backup_store.read_snapshot(backup_dir_path, snapshot).decode(),
+            BEFORE_CONFIG,
+        )
+        self.assertEqual(len(backup_store.load_index(backup_dir_path)[1]), 1)
+        config = aws_config.load_config(self.config_file_path)
+        self.assertEqual(len(config.profile_names()), 203)
+        self.assertEqual(
+            config.find_profile("sts-session")[0].get("role_arn"), "arn:role/after"
+        )
+        change_log_events = list(change_log.read_events(change_log_file_path))
+        self.assertEqual(
+            [event["event"] for event in change_log_events].count("REGISTERED"), 201
+        )
+        deleted_events = [
+            event for event in change_log_events if event["event"] == "DELETED"
+        ]
+        self.assertEqual(len(deleted_events), 1)
+        self.assertEqual(deleted_events[0]["profile"], "sts-session")
+        self.assertEqual(
+            deleted_events[0]["role_arn"], "arn:aws:iam::123456789012:role/before"
+        )
+
+    def test_find_stale_profiles_expected_value(self):
+        ## given
+        now = datetime.datetime.now().astimezone()
+        old = now - datetime.timedelta(days=40)
+        config = aws_config.parse_config(
+            (
+                BEFORE_CONFIG
+                + "[profile old-source]\nrole_arn = arn:aws:iam::123456789012:role/source\nsource_profile = default\n"
+                + "[profile chained]\nrole_arn = arn:aws:iam::123456789012:role/chained\nsource_profile = old-source\n"
+                + "[profile reregistered]\nrole_arn = arn:aws:iam::123456789012:role/new\nsource_profile = default\n"
+            ).splitlines()
+        )
+        change_log_events = [
+            change_log.make_register_event(
+                "sts-session", "arn", "default", None, None, old
+            ),
+            change_log.make_register_event(
+                "old-source", "arn", "default", None, None, old
+            ),
+            change_log.make_register_event(
+                "chained", "arn", "old-source", None, None, now
+            ),
+            change_log.make_register_event(
+                "reregistered", "arn", "default", None, None, old
+            ),
+            change_log.make_delete_event("reregistered", "arn", "default", None, old),
+            change_log.make_register_event(
+                "reregistered", "arn", "default", None, None, now
+            ),
+            change_log.make_register_event(
+                "removed", "arn", "default", None, None, old
+            ),
+        ]
+
+        ## when
+        stale_profiles = aws_config.find_stale_profiles(
+            config, change_log_events, now - datetime.timedelta(days=30)
+        )
+
+        ## then
+        self.assertEqual(
+            stale_profiles, [("sts-session", change_log.format_datetime(old))]
+        )
+
+    def test_find_stale_profiles_keep_transitive_sources(self):
+        ## given
+        now = datetime.datetime.now().astimezone()
+        old = now - datetime.timedelta(days=40)
+        config = aws_config.parse_config(
+            (
+                "[profile stale-b]\nrole_arn = arn:aws:iam::123456789012:role/b\nsource_profile = stale-a\n"
+                + "[profile kept-c]\nrole_arn = arn:aws:iam::123456789012:role/c\nsource_profile = stale-b\n"
+                + "[profile stale-a]\nrole_arn = arn:aws:iam::123456789012:role/a\nsource_profile = default\n"
+                + "[profile cached]\ncredential_process = "
+                + credential_cache.make_credential_process(
+                    self.tmp_dir_path,
+                    "cached",
+                    "arn:aws:iam::123456789012:role/cached",
+                    "stale-d",
+                    None,
+                )
+                + "\n"
+                + "[profile stale-d]\nrole_arn = arn:aws:iam::123456789012:role/d\nsource_profile = default\n"
+                + "[profile stale-e]\nrole_arn = arn:aws:iam::123456789012:role/e\nsource_profile = default\n"
+            ).splitlines()
+        )
+        change_log_events = [
+            change_log.make_register_event(
+                profile_name, "arn", "default", None, None, old
+            )
+            for profile_name in ("stale-a", "stale-b", "stale-d", "stale-e")
+        ] + [
+            change_log.make_register_event(
+                profile_name, "arn", "default", None, None, now
+            )
+            for profile_name in ("kept-c", "cached")
+        ]
+
+        ## when
+        stale_profiles = aws_config.find_stale_profiles(
+            config, change_log_events, now - datetime.timedelta(days=30)
+        )
+
+        ## then
+        self.assertEqual(stale_profiles, [("stale-e", change_log.format_datetime(old))])
+
+    @parameterized.expand(
+        [
+            ("dry_run", ["--dry-run"], ["default", "sts-session", "other", "fresh"], 2),
+            ("delete", [], ["default", "other", "fresh"], 3),
+        ]
+    )
+    def test_main_gc(self, _, options, profile_names, change_log_event_count):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(
+                BEFORE_CONFIG
+                + "[profile fresh]\nrole_arn = arn:aws:iam::123456789012:role/fresh\nsource_profile = default\n"
+            )
+        change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+        now = datetime.datetime.now()
+        change_log.append_events(
+            change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "sts-session",
+                    "arn:aws:iam::123456789012:role/before",
+                    "default",
+                    None,
+                    None,
+                    now - datetime.timedelta(days=31),
+                ),
+                change_log.make_register_event(
+                    "fresh",
+                    "arn:aws:iam::123456789012:role/fresh",
+                    "default",
+                    None,
+                    None,
+                    now - datetime.timedelta(days=29),
+                ),
+            ],
+        )
+        stdout = StringIO()
+
+        ## when
+        with contextlib.redirect_stdout(stdout):
+            exit_status = aws_config.main(
+                [
+                    "gc",
+                    "--config-file",
+                    self.config_file_path,
+                    "--change-log-file",
+                    change_log_file_path,
+                    "--backup-dir",
+                    backup_dir_path,
+                    "--ttl-days",
+                    "30",
+                ]
+                + options
+            )
+
+        ## then
+        self.assertEqual(exit_status, 0)
+        self.assertTrue(stdout.getvalue().startswith("sts-session\t"))
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(), profile_names
+        )
+        change_log_events = list(change_log.read_events(change_log_file_path))
+        self.assertEqual(len(change_log_events), change_log_event_count)
+        if not options:
+            self.assertEqual(
+                (change_log_events[-1]["event"], change_log_events[-1]["profile"]),
+                ("DELETED", "sts-session"),
+            )
+            self.assertEqual(len(backup_store.load_index(backup_dir_path)[1]), 1)
+
+    def test_save_config_not_leave_tmp_file(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        os.chmod(self.config_file_path, 0o600)
+
+        ## when
+        aws_config.save_config(
+            aws_config.load_config(self.config_file_path), self.config_file_path
+        )
+
+        ## then
+        self.assertEqual(os.listdir(self.tmp_dir_path), ["config"])
+        self.assertEqual(os.stat(self.config_file_path).st_mode & 0o777, 0o600)
+
+    def test_main_register_concurrent_no_lost_profile(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+
+        ## when
+        with concurrent.futures.ProcessPoolExecutor(STRESS_WORKERS) as executor:
+            exit_statuses = list(
+                executor.map(
+                    register_stress_profile,
+                    [
+                        (self.tmp_dir_path, number)
+                        for number in range(STRESS_REGISTRATIONS)
+                    ],
+                )
+            )
+
+        ## then
+        self.assertEqual(exit_statuses, [0] * STRESS_REGISTRATIONS)
+        profile_names = aws_config.load_config(self.config_file_path).profile_names()
+        self.assertEqual(
+            sorted(profile_names[3:]),
+            sorted("stress-" + str(number) for number in range(STRESS_REGISTRATIONS)),
+        )
+        self.assertEqual(
+            aws_config.load_section_index(self.config_file_path).names, profile_names
+        )
+        self.assertEqual(
+            len(
+                list(
+                    change_log.read_events(
+                        os.path.join(self.tmp_dir_path, "change.log")
+                    )
+                )
+            ),
+            STRESS_REGISTRATIONS,
+        )
+
+    def test_register_sts_assumed_role_bash_function(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        function_file_path = self.__write_bash_function()
+        user_input = (
+            'arn:aws:iam::123456789012:role/after\ndefault\n\n\n\n\nC:\\path "quoted"\n'
+        )
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source " + function_file_path + " && register_sts_assumed_role",
+            ],
+            input=user_input,
+            capture_output=True,
+            text=True,
+        )
+
+        ## then
+        self.assertEqual(result.returncode, 0, result.stderr)
+        config = aws_config.load_config(self.config_file_path)
+        self.assertEqual(config.profile_names(), ["default", "other", "sts-session"])
+        self.assertEqual(
+            config.find_profile("sts-session")[0].get("role_arn"),
+            "arn:aws:iam::123456789012:role/after",
+        )
+        change_log_events = list(change_log.read_events(change_log_file_path))
+        self.assertEqual(
+            [event["event"] for event in change_log_events], ["DELETED", "REGISTERED"]
+        )
+        self.assertEqual(
+            change_log_events[0]["role_arn"], "arn:aws:iam::123456789012:role/before"
+        )
+        self.assertEqual(change_log_events[1]["comment"], 'C:\\path "quoted"')
+        self.assertEqual(
+            len(backup_store.load_index(os.path.join(self.tmp_dir_path, "backup"))[1]),
+            1,
+        )
+
+    @parameterized.expand(
+        [
+            (
+                "all_options",
+                [
+                    "--role-arn",
+                    "arn:aws:iam::123456789012:role/flag",
+                    "--source-profile",
+                    "default",
+                    "--profile",
+                    "flag-session",
+                    "--mfa-serial",
+                    "",
+                    "--region",
+                    "us-west-2",
+                    "--output",
+                    "text",
+                    "--comment",
+                    "by flags",
+                ],
+                "",
+            ),
+            (
+                "yes",
+                [
+                    "--role-arn",
+                    "arn:aws:iam::123456789012:role/flag",
+                    "--source-profile",
+                    "default",
+                    "--profile",
+                    "flag-session",
+                    "--region",
+                    "us-west-2",
+                    "--output",
+                    "text",
+                    "--yes",
+                ],
+                "",
+            ),
+            (
+                "prompt_not_given_options",
+                [
+                    "--role-arn",
+                    "arn:aws:iam::123456789012:role/flag",
+                    "--profile",
+                    "flag-session",
+                    "--region",
+                    "us-west-2",
+                    "--output",
+                    "text",
+                ],
+                "default\n\nby prompt\n",
+            ),
+        ]
+    )
+    def test_register_sts_assumed_role_bash_function_options(
+        self, _, options, user_input
+    ):
+        ## given
+        function_file_path = self.__write_bash_function()
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source " + function_file_path + ' && register_sts_assumed_role "$@"',
+                "bash",
+            ]
+            + options,
+            input=user_input,
+            capture_output=True,
+            text=True,
+        )
+
+        ## then
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(result.stdout.endswith("register_sts_assumed_role DONE!\n"))
+        section = aws_config.load_config(self.config_file_path).find_profile(
+            "flag-session"
+        )[0]
+        self.assertEqual(section.get("role_arn"), "arn:aws:iam::123456789012:role/flag")
+        self.assertEqual(section.get("source_profile"), "default")
+        self.assertIsNone(section.get("mfa_serial"))
+        self.assertEqual(section.get("region"), "us-west-2")
+        self.assertEqual(section.get("output"), "text")
+
+    @parameterized.expand(
+        [
+            (
+                "required_not_given",
+                ["--role-arn", "arn:aws:iam::123456789012:role/flag", "--yes"],
+            ),
+            ("unknown_option", ["--role", "arn:aws:iam::123456789012:role/flag"]),
+            ("no_value", ["--yes", "--role-arn"]),
+        ]
+    )
+    def test_register_sts_assumed_role_bash_function_invalid_options(self, _, options):
+        ## given
+        function_file_path = self.__write_bash_function()
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source " + function_file_path + ' && register_sts_assumed_role "$@"',
+                "bash",
+            ]
+            + options,
+            input="",
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+
+        ## then
+        self.assertEqual(result.returncode, 1)
+        self.assertFalse(os.path.exists(self.config_file_path))
+
+    def test_register_sts_assumed_role_bash_function_stdin_ndjson(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        function_file_path = self.__write_bash_function()
+        ndjson = (
+            '{"profile": "stream-a", "role_arn": "arn:aws:iam::123456789012:role/a", "source_profile": "default"}\n'
+            "\n"
+            '{"profile": "stream-b", "role_arn": "arn:aws:iam::123456789012:role/b"}\n'
+            "not json\n"
+            '{"profile": "sts-session", "role_arn": "arn:aws:iam::123456789012:role/c", '
+            '"source_profile": "default", "region": "eu-west-1", "comment": "streamed"}\n'
+        )
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source "
+                + function_file_path
+                + " && register_sts_assumed_role --stdin-ndjson --output text",
+            ],
+            input=ndjson,
+            capture_output=True,
+            text=True,
+        )
+
+        ## then
+        self.assertEqual(result.returncode, 1, result.stderr)
+        results = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual(
+            [(r["line"], r["profile"], r["status"]) for r in results],
+            [
+                (1, "stream-a", "registered"),
+                (3, None, "failed"),
+                (4, None, "failed"),
+                (5, "sts-session", "registered"),
+            ],
+        )
+        self.assertEqual(results[1]["error"], "manifest row 3 has no source_profile.")
+        config = aws_config.load_config(self.config_file_path)
+        self.assertEqual(
+            config.profile_names(), ["default", "other", "stream-a", "sts-session"]
+        )
+        self.assertEqual(
+            config.find_profile("sts-session")[0].get("region"), "eu-west-1"
+        )
+        self.assertEqual(config.find_profile("stream-a")[0].get("output"), "text")
+        self.assertEqual(
+            [event["event"] for event in change_log.read_events(change_log_file_path)],
+            ["REGISTERED", "DELETED", "REGISTERED"],
+        )
+        self.assertEqual(
+            len(backup_store.load_index(os.path.join(self.tmp_dir_path, "backup"))[1]),
+            1,
+        )
+
+    @parameterized.expand(
+        [
+            ("arn:aws:iam::123456789012:role/dev", "123456789012-dev"),
+            ("arn:aws:iam::123456789012:role/team/dev-admin", "123456789012-dev-admin"),
+            ("arn:aws-cn:iam::123456789012:role/dev", "123456789012-dev"),
+            ("arn:aws:iam::123456789012:user/dev", None),
+        ]
+    )
+    def test_get_switch_profile_name_expected_value(self, role_arn, expected_value):
+        ## when
+        profile_name = aws_config.get_switch_profile_name(role_arn)
+
+        ## then
+        self.assertEqual(profile_name, expected_value)
+
+    def test_switch_assumed_role_not_rewrite_config(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+        change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+        role_arn = "arn:aws:iam::123456789012:role/team/dev"
+        now = datetime.datetime.now()
+        first_result = aws_config.switch_assumed_role(
+            self.config_file_path,
+            change_log_file_path,
+            role_arn,
+            "",
+            "default",
+            "ap-northeast-1",
+            "json",
+            "",
+            "",
+            now,
+            backup_dir_path,
+        )
+        config_stat = os.stat(self.config_file_path)
+
+        ## when
+        switch_results = [
+            aws_config.switch_assumed_role(
+                self.config_file_path,
+                change_log_file_path,
+                target,
+                "",
+                "",
+                "ap-northeast-1",
+                "json",
+                "",
+                "",
+                now,
+                backup_dir_path,
+            )
+            for target in (role_arn, "123456789012-dev", "sts-session")
+        ]
+
+        ## then
+        self.assertEqual(first_result, ("123456789012-dev", True))
+        self.assertEqual(
+            switch_results,
+            [
+                ("123456789012-dev", False),
+                ("123456789012-dev", False),
+                ("sts-session", False),
+            ],
+        )
+        self.assertEqual(
+            aws_config.get_file_signature(os.stat(self.config_file_path)),
+            aws_config.get_file_signature(config_stat),
+        )
+        self.assertEqual(len(backup_store.load_index(backup_dir_path)[1]), 1)
+        self.assertEqual(
+            [
+                (event["event"], event["profile"], event["role_arn"])
+                for event in change_log.read_events(change_log_file_path)
+            ],
+            [
+                ("REGISTERED", "123456789012-dev", role_arn),
+                ("SWITCHED", "123456789012-dev", role_arn),
+                ("SWITCHED", "123456789012-dev", role_arn),
+                ("SWITCHED", "123456789012-dev", role_arn),
+                ("SWITCHED", "sts-session", "arn:aws:iam::123456789012:role/before"),
+            ],
+        )
+
+    @parameterized.expand(
+        [
+            ("not_registered_profile", "not-registered", "", "default"),
+            ("source_profile_not_given", "arn:aws:iam::123456789012:role/dev", "", ""),
+            (
+                "alias_of_another_role",
+                "arn:aws:iam::123456789012:role/dev",
+                "sts-session",
+                "default",
+            ),
+            ("not_role_arn", "arn:aws:iam::123456789012:user/dev", "", "default"),
+        ]
+    )
+    def test_switch_assumed_role_error(self, _, target, profile_name, source_profile):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(BEFORE_CONFIG)
+
+        ## when, then
+        with self.assertRaises(ValueError):
+            aws_config.switch_assumed_role(
+                self.config_file_path,
+                os.path.join(self.tmp_dir_path, "change.log"),
+                target,
+                profile_name,
+                source_profile,
+                "ap-northeast-1",
+                "json",
+                "",
+                "",
+                datetime.datetime.now(),
+            )
+        with open(self.config_file_path, "r") as config_file:
+            self.assertEqual(config_file.read(), BEFORE_CONFIG)
+
+    def test_register_sts_assumed_role_bash_function_switch(self):
+        ## given
+        function_file_path = self.__write_bash_function()
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source "
+                + function_file_path
+                + " && register_sts_assumed_role --switch arn:aws:iam::123456789012:role/dev"
+                + " --source-profile default --profile dev"
+                + ' && echo "${AWS_PROFILE}"'
+                + " && register_sts_assumed_role --switch sts-session"
+                + ' ; echo "${AWS_PROFILE}"',
+            ],
+            input="",
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+
+        ## then
+        self.assertEqual(
+            result.stdout,
+            "register_sts_assumed_role switched to dev.\n"
+            "dev\n"
+            "register_sts_assumed_role FAILED!\n"
+            "dev\n",
+            result.stderr,
+        )
+        self.assertIn("profile sts-session is not registered.", result.stderr)
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path).profile_names(), ["dev"]
+        )
+
+    ########################################################################
+    ############################ Private Method ############################
+    ########################################################################
+    def __write_bash_function(self):
+        function_file_path = os.path.join(self.tmp_dir_path, "function.bash")
+        with open(
+            REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH, "r"
+        ) as template_file:
+            function_string = setup.replace_replacement_string(
+                template_file.read(),
+                self.config_file_path,
+                "sts-session",
+                "ap-northeast-1",
+                "json",
+                os.path.join(self.tmp_dir_path, "change.log"),
+                setup.PYTHON_EXECUTABLE_PATH,
+                setup.PROJECT_ROOT_DIR_PATH,
+                os.path.join(self.tmp_dir_path, "backup"),
+                change_log.RotationPolicyVO(1048576, 3, True),
+            )
+        with open(function_file_path, "w") as function_file:
+            function_file.write(function_string)
+        return function_file_path
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+import backup_store
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+from io import StringIO
+from parameterized import parameterized
+
+BASE_DATETIME = datetime.datetime(2026, 10, 18, 12, 0, 0)
+
+
+class TestBackupStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.store_dir_path = os.path.join(self.tmp_dir_path, "store")
+        self.file_path = os.path.join(self.tmp_dir_path, "config")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def __save(self, contents, now, policy):
+        with open(self.file_path, "w") as target_file:
+            target_file.write(contents)
+        return backup_store.save_snapshot(
+            self.store_dir_path, self.file_path, now, policy
+        )
+
+    def __count_objects(self):
+        return sum(
+            len(file_names)
+            for _, _, file_names in os.walk(
+                os.path.join(self.store_dir_path, backup_store.OBJECTS_DIR_NAME)
+            )
+        )
+
+    @parameterized.expand([(True,), (False,)])
+    def test_save_snapshot_deduplicate_contents(self, compress):
+        ## given
+        policy = backup_store.BackupPolicyVO(compress, 0, 0, 0)
+
+        ## when
+        first_snapshot = self.__save("a", BASE_DATETIME, policy)
+        self.__save("b", BASE_DATETIME + datetime.timedelta(seconds=1), policy)
+        third_snapshot = self.__save(
+            "a", BASE_DATETIME + datetime.timedelta(seconds=2), policy
+        )
+        self.__save("a", BASE_DATETIME + datetime.timedelta(seconds=3), policy)
+
+        ## then
+        self.assertEqual(first_snapshot.digest, third_snapshot.digest)
+        self.assertEqual(third_snapshot.compressed, compress)
+        self.assertEqual(len(backup_store.load_index(self.store_dir_path)[1]), 3)
+        self.assertEqual(self.__count_objects(), 2)
+        self.assertEqual(
+            backup_store.read_snapshot(self.store_dir_path, third_snapshot), b"a"
+        )
+
+    def test_save_snapshot_file_not_exist(self):
+        ## when
+        snapshot = backup_store.save_snapshot(
+            self.store_dir_path, self.file_path, BASE_DATETIME
+        )
+
+        ## then
+        self.assertIsNone(snapshot)
+        self.assertFalse(os.path.exists(self.store_dir_path))
+
+    def test_save_snapshot_evict_by_count(self):
+        ## given
+        policy = backup_store.BackupPolicyVO(True, 3, 0, 0)
+
+        ## when
+        for index in range(10):
+            self.__save(
+                str(index), BASE_DATETIME + datetime.timedelta(seconds=index), policy
+            )
+
+        ## then
+        snapshots = backup_store.load_index(self.store_dir_path)[1]
+        self.assertEqual(
+            [backup_store.read_snapshot(self.store_dir_path, s) for s in snapshots],
+            [b"7", b"8", b"9"],
+        )
+        self.assertEqual(self.__count_objects(), 3)
+
+    def test_save_snapshot_evict_by_age(self):
+        ## given
+        policy = backup_store.BackupPolicyVO(True, 0, 7, 0)
+
+        ## when
+        for days in (0, 3, 10, 12):
+            self.__save(
+                str(days), BASE_DATETIME + datetime.timedelta(days=days), policy
+            )
+
+        ## then
+        snapshots = backup_store.load_index(self.store_dir_path)[1]
+        self.assertEqual(
+            [backup_store.read_snapshot(self.store_dir_path, s) for s in snapshots],
+            [b"10", b"12"],
+        )
+
+    def test_save_snapshot_evict_by_total_size_keep_newest(self):
+        ## given
+        policy = backup_store.BackupPolicyVO(False, 0, 0, 25)
+
+        ## when
+        for index in range(5):
+            self.__save(
+                str(index) * 10,
+                BASE_DATETIME + datetime.timedelta(seconds=index),
+                policy,
+            )
+
+        ## then
+        snapshots = backup_store.load_index(self.store_dir_path)[1]
+        self.assertEqual(
+            [backup_store.read_snapshot(self.store_dir_path, s) for s in snapshots],
+            [b"3" * 10, b"4" * 10],
+        )
+
+    def test_restore_snapshot_find_by_time(self):
+        ## given
+        policy = backup_store.default_policy()
+        for index in range(3):
+            self.__save(
+                "contents" + str(index),
+                BASE_DATETIME + datetime.timedelta(hours=index),
+                policy,
+            )
+        output_file_path = os.path.join(self.tmp_dir_path, "restored")
+
+        ## when
+        snapshot = backup_store.restore_snapshot(
+            self.store_dir_path,
+            self.file_path,
+            BASE_DATETIME + datetime.timedelta(hours=1, minutes=30),
+            output_file_path,
+        )
+        not_found_snapshot = backup_store.restore_snapshot(
+            self.store_dir_path,
+            self.file_path,
+            BASE_DATETIME - datetime.timedelta(hours=1),
+            output_file_path,
+        )
+
+        ## then
+        with open(output_file_path, "r") as restored_file:
+            self.assertEqual(restored_file.read(), "contents1")
+        self.assertEqual(
+            snapshot.created_at,
+            (BASE_DATETIME + datetime.timedelta(hours=1)).timestamp(),
+        )
+        self.assertIsNone(not_found_snapshot)
+
+    def test_main_restore_latest(self):
+        ## given
+        self.__save("before", BASE_DATETIME, backup_store.default_policy())
+        with open(self.file_path, "w") as target_file:
+            target_file.write("broken")
+
+        tmp_stdout, sys.stdout = sys.stdout, StringIO()
+
+        ## when
+        exit_status = backup_store.main(
+            ["restore", "--store-dir", self.store_dir_path, self.file_path]
+        )
+
+        ## then
+        self.assertTrue(sys.stdout.getvalue().startswith("restored "))
+        sys.stdout = tmp_stdout
+        self.assertEqual(exit_status, 0)
+        with open(self.file_path, "r") as target_file:
+            self.assertEqual(target_file.read(), "before")
+
+
+if __name__ == "__main__":
+    unittest.main()
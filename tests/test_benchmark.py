@@ -0,0 +1,113 @@
+import unittest
+import aws_config
+import benchmark
+import setup
+import json
+import os
+import shutil
+import tempfile
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_generate_config_profile_count(self):
+        ## given
+        config_file_path = os.path.join(self.tmp_dir_path, "config")
+
+        ## when
+        benchmark.generate_config(config_file_path, 100)
+
+        ## then
+        profile_names = aws_config.load_config(config_file_path).profile_names()
+        self.assertEqual(len(profile_names), 100)
+        self.assertEqual(profile_names[0], "default")
+
+    def test_generate_rc_file_contains_function(self):
+        ## given
+        rc_file_path = os.path.join(self.tmp_dir_path, "rc")
+        function_string = benchmark.render_function_string(
+            setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH,
+            os.path.join(self.tmp_dir_path, "config"),
+            self.tmp_dir_path,
+        )
+
+        ## when
+        benchmark.generate_rc_file(rc_file_path, 64 * 1024, function_string)
+
+        ## then
+        self.assertTrue(setup.exist_register_sts_assumed_role(rc_file_path))
+        self.assertAlmostEqual(os.path.getsize(rc_file_path), 64 * 1024, delta=1024)
+
+    def test_find_regressions(self):
+        ## given
+        baseline_report = {
+            "results": [
+                benchmark.BenchmarkResultVO("a", 1, 1, 1.0, 1.0, "ok").to_dict(),
+                benchmark.BenchmarkResultVO("b", 1, 1, 1.0, 1.0, "ok").to_dict(),
+            ]
+        }
+        report = {
+            "results": [
+                benchmark.BenchmarkResultVO("a", 1, 1, 1.2, 1.2, "ok").to_dict(),
+                benchmark.BenchmarkResultVO("b", 1, 1, 2.0, 2.0, "ok").to_dict(),
+                benchmark.BenchmarkResultVO("c", 1, 1, 9.0, 9.0, "ok").to_dict(),
+            ]
+        }
+
+        ## when
+        regressions = benchmark.find_regressions(report, baseline_report, 1.5)
+
+        ## then
+        self.assertEqual(regressions, [("b/1", 1.0, 2.0)])
+
+    def test_run_benchmarks_report_format(self):
+        ## when
+        report = benchmark.run_benchmarks([1024], [10], 1)
+
+        ## then
+        json.dumps(report)
+        self.assertEqual(report["version"], benchmark.RESULT_FORMAT_VERSION)
+        self.assertEqual(
+            [
+                (result["name"], result["parameter"])
+                for result in report["results"][1:7]
+            ],
+            [
+                ("exist_register_sts_assumed_role", 1024),
+                ("read_block_digest", 1024),
+                ("register_function", 1024),
+                ("backup_file", 1024),
+                ("register_sts_assumed_role.bash", 10),
+                ("register_sts_assumed_role.zsh", 10),
+            ],
+        )
+        self.assertEqual(
+            [result["name"] for result in report["results"][7:]],
+            [
+                "shell_startup." + shell_name + "." + mode
+                for shell_name in ("bash", "zsh")
+                for mode in ("none", "inline", "lazy")
+            ],
+        )
+        for result in report["results"]:
+            if result["status"] == "ok":
+                self.assertGreater(result["median_seconds"], 0)
+
+    def test_run_contention_benchmarks_no_lost_profile(self):
+        ## when
+        results = benchmark.run_contention_benchmarks([2], 1, self.tmp_dir_path)
+
+        ## then
+        self.assertEqual(
+            [(result.name, result.parameter, result.status) for result in results],
+            [("contention.register.200", 2, "ok")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
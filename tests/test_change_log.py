@@ -0,0 +1,195 @@
+import unittest
+import change_log
+import datetime
+import json
+from parameterized import parameterized
+import os
+import shutil
+import tempfile
+
+LOG_DATETIME = datetime.datetime(
+    2026, 10, 18, 12, 34, 56, tzinfo=datetime.timezone(datetime.timedelta(hours=9))
+)
+
+
+class TestChangeLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_make_register_event_expected_value(self):
+        ## when
+        change_log_event = change_log.make_register_event(
+            "sts-session", "arn:role", "default", "", "back\\slash", LOG_DATETIME
+        )
+
+        ## then
+        self.assertEqual(tuple(change_log_event.keys()), change_log.EVENT_KEYS)
+        self.assertEqual(change_log_event["event"], "REGISTERED")
+        self.assertEqual(
+            datetime.datetime.fromisoformat(change_log_event["time"]), LOG_DATETIME
+        )
+        self.assertIsNone(change_log_event["mfa_serial"])
+        self.assertEqual(change_log_event["comment"], "back\\slash")
+
+    def test_append_events_one_line_per_event(self):
+        ## given
+        change_log_events = [
+            change_log.make_delete_event("a", "arn:role/a", None, None, LOG_DATETIME),
+            change_log.make_register_event(
+                "a",
+                "arn:role/b",
+                "default",
+                None,
+                'multi\nline "comment"',
+                LOG_DATETIME,
+            ),
+        ]
+
+        ## when
+        change_log.append_events(self.change_log_file_path, change_log_events)
+        change_log.append_events(self.change_log_file_path, [])
+
+        ## then
+        with open(self.change_log_file_path, "r") as change_log_file:
+            lines = change_log_file.read().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], change_log_events)
+
+    def test_read_events_filter(self):
+        ## given
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "a",
+                    "arn:role/a",
+                    "default",
+                    None,
+                    None,
+                    LOG_DATETIME + datetime.timedelta(days=days),
+                )
+                for days in range(3)
+            ]
+            + [
+                change_log.make_register_event(
+                    "b", "arn:role/b", "default", None, None, LOG_DATETIME
+                )
+            ],
+        )
+
+        ## when
+        profile_events = list(
+            change_log.read_events(self.change_log_file_path, profile_name="a")
+        )
+        role_arn_events = list(
+            change_log.read_events(self.change_log_file_path, role_arn="arn:role/b")
+        )
+        time_events = list(
+            change_log.read_events(
+                self.change_log_file_path,
+                profile_name="a",
+                since=LOG_DATETIME + datetime.timedelta(days=1),
+                until=LOG_DATETIME + datetime.timedelta(days=1),
+            )
+        )
+
+        ## then
+        self.assertEqual(len(profile_events), 3)
+        self.assertEqual([event["profile"] for event in role_arn_events], ["b"])
+        self.assertEqual(len(time_events), 1)
+
+    def test_read_events_legacy_format(self):
+        ## given
+        with open(self.change_log_file_path, "w") as change_log_file:
+            change_log_file.write(
+                'DELETED - - [18/Oct/2026:12:34:56 +0900] "profile = a" '
+                '"role_arn = arn:role/a" "source_profile = default" \n\n'
+                'REGISTERED - - [18/Oct/2026:12:34:56 +0900] "profile = a" '
+                '"role_arn = arn:role/b" "source_profile = default" '
+                '"mfa_serial = arn:mfa" "registered comment = None"\n\n'
+            )
+
+        ## when
+        change_log_events = list(change_log.read_events(self.change_log_file_path))
+
+        ## then
+        self.assertEqual(
+            change_log_events,
+            [
+                change_log.make_delete_event(
+                    "a", "arn:role/a", "default", None, LOG_DATETIME
+                ),
+                change_log.make_register_event(
+                    "a", "arn:role/b", "default", "arn:mfa", None, LOG_DATETIME
+                ),
+            ],
+        )
+
+    @parameterized.expand([(True,), (False,)])
+    def test_append_events_rotate_and_read_archives(self, compress):
+        ## given
+        rotation_policy = change_log.RotationPolicyVO(1, 2, compress)
+        change_log_events = [
+            change_log.make_register_event(
+                "profile" + str(index), "arn:role", "default", None, None, LOG_DATETIME
+            )
+            for index in range(5)
+        ]
+
+        ## when
+        for change_log_event in change_log_events:
+            change_log.append_events(
+                self.change_log_file_path, [change_log_event], rotation_policy
+            )
+
+        ## then
+        suffix = change_log.ARCHIVE_COMPRESSED_SUFFIX if compress else ""
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir_path)),
+            [
+                "change.log",
+                "change.log.1" + suffix,
+                "change.log.2" + suffix,
+                "change.log.lock",
+            ],
+        )
+        self.assertEqual(
+            list(change_log.read_events(self.change_log_file_path)),
+            change_log_events[2:],
+        )
+
+    def test_append_events_rotate_without_archive(self):
+        ## given
+        rotation_policy = change_log.RotationPolicyVO(1, 0, True)
+
+        ## when
+        for profile_name in ("a", "b"):
+            change_log.append_events(
+                self.change_log_file_path,
+                [
+                    change_log.make_delete_event(
+                        profile_name, None, None, None, LOG_DATETIME
+                    )
+                ],
+                rotation_policy,
+            )
+
+        ## then
+        self.assertEqual(
+            [e["profile"] for e in change_log.read_events(self.change_log_file_path)],
+            ["b"],
+        )
+        self.assertEqual(
+            change_log.list_archive_file_paths(self.change_log_file_path), []
+        )
+
+    def test_read_events_file_not_exist(self):
+        ## then
+        self.assertEqual(list(change_log.read_events(self.change_log_file_path)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
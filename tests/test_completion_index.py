@@ -0,0 +1,339 @@
+import unittest
+import aws_config
+import change_log
+import completion_index
+import setup
+import contextlib
+import datetime
+import os
+import shutil
+import subprocess
+import tempfile
+from io import StringIO
+from parameterized import parameterized
+
+REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH = (
+    "template/register_sts_assumed_role.bash.tmpl"
+)
+DEV_ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+DEV_ADMIN_ROLE_ARN = "arn:aws:iam::123456789012:role/dev-admin"
+OPERATOR_ROLE_ARN = "arn:aws:iam::210987654321:role/operator"
+MFA_SERIAL = "arn:aws:iam::123456789012:mfa/alice"
+
+
+class TestCompletionIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+        self.change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        self.now = datetime.datetime.now()
+        aws_config.register_assumed_role(
+            self.config_file_path,
+            "dev",
+            DEV_ROLE_ARN,
+            "base",
+            "ap-northeast-1",
+            "json",
+            "",
+        )
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "old-dev", DEV_ADMIN_ROLE_ARN, "ci", MFA_SERIAL, "", self.now
+                ),
+                change_log.make_delete_event(
+                    "old-dev", DEV_ADMIN_ROLE_ARN, "ci", MFA_SERIAL, self.now
+                ),
+            ],
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    @parameterized.expand(
+        [
+            ("profile", "", ["dev", "old-dev"]),
+            (
+                "role_arn",
+                "arn:aws:iam::123456789012:role/dev",
+                [DEV_ROLE_ARN, DEV_ADMIN_ROLE_ARN],
+            ),
+            ("role_arn", "arn:aws:iam::2", []),
+            ("source_profile", "", ["base", "ci", "dev", "old-dev"]),
+            ("mfa_serial", "arn:", [MFA_SERIAL]),
+        ]
+    )
+    def test_complete_expected_value(self, kind, prefix, expected_value):
+        ## given
+        index, _ = completion_index.update_index(
+            completion_index.empty_index(),
+            self.config_file_path,
+            self.change_log_file_path,
+        )
+
+        ## when
+        candidates = completion_index.complete(index, kind, prefix)
+
+        ## then
+        self.assertEqual(candidates, expected_value)
+
+    def test_update_index_reads_only_appended_events(self):
+        ## given
+        index_file_path = completion_index.get_index_file_path(
+            self.change_log_file_path
+        )
+        index, _ = completion_index.update_index(
+            completion_index.empty_index(),
+            self.config_file_path,
+            self.change_log_file_path,
+        )
+        completion_index.save_index(index_file_path, index)
+        index, unchanged = completion_index.update_index(
+            completion_index.load_index(index_file_path),
+            self.config_file_path,
+            self.change_log_file_path,
+        )
+        with open(self.change_log_file_path, "a") as change_log_file:
+            change_log_file.write("not a change log line\n")
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "ops", OPERATOR_ROLE_ARN, "base", "", "", self.now
+                )
+            ],
+        )
+        with open(self.change_log_file_path, "a") as change_log_file:
+            change_log_file.write('{"event": "REGISTERED", "profile": "partial')
+
+        ## when
+        index, changed = completion_index.update_index(
+            index, self.config_file_path, self.change_log_file_path
+        )
+
+        ## then
+        self.assertFalse(unchanged)
+        self.assertTrue(changed)
+        self.assertEqual(
+            completion_index.complete(index, "role_arn", "arn:aws:iam::2"),
+            [OPERATOR_ROLE_ARN],
+        )
+        self.assertEqual(completion_index.complete(index, "profile", "p"), [])
+        self.assertEqual(
+            index.change_log_position[1],
+            os.path.getsize(self.change_log_file_path)
+            - len('{"event": "REGISTERED", "profile": "partial'),
+        )
+
+    def test_update_index_after_rotation(self):
+        ## given
+        index, _ = completion_index.update_index(
+            completion_index.empty_index(),
+            self.config_file_path,
+            self.change_log_file_path,
+        )
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "ops", OPERATOR_ROLE_ARN, "base", "", "", self.now
+                )
+            ],
+        )
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "next", DEV_ROLE_ARN, "base", "", "", self.now
+                )
+            ],
+            change_log.RotationPolicyVO(1, 3, True),
+        )
+
+        ## when
+        index, changed = completion_index.update_index(
+            index, self.config_file_path, self.change_log_file_path
+        )
+
+        ## then
+        self.assertTrue(changed)
+        self.assertEqual(
+            completion_index.complete(index, "profile", ""),
+            ["dev", "next", "old-dev", "ops"],
+        )
+
+    def test_update_index_after_several_rotations(self):
+        ## given
+        index, _ = completion_index.update_index(
+            completion_index.empty_index(),
+            self.config_file_path,
+            self.change_log_file_path,
+        )
+        for profile_name, role_arn in (
+            ("ops", OPERATOR_ROLE_ARN),
+            ("next", DEV_ROLE_ARN),
+            ("last", DEV_ROLE_ARN),
+        ):
+            change_log.append_events(
+                self.change_log_file_path,
+                [
+                    change_log.make_register_event(
+                        profile_name, role_arn, "base", "", "", self.now
+                    )
+                ],
+                change_log.RotationPolicyVO(1, 3, True),
+            )
+
+        ## when
+        index, changed = completion_index.update_index(
+            index, self.config_file_path, self.change_log_file_path
+        )
+
+        ## then
+        self.assertTrue(changed)
+        self.assertEqual(
+            len(change_log.list_archive_file_paths(self.change_log_file_path)), 3
+        )
+        self.assertEqual(
+            completion_index.complete(index, "profile", ""),
+            ["dev", "last", "next", "old-dev", "ops"],
+        )
+        self.assertEqual(
+            completion_index.complete(index, "role_arn", "arn:aws:iam::2"),
+            [OPERATOR_ROLE_ARN],
+        )
+
+    @parameterized.expand(
+        [
+            ("option", "register_sts_assumed_role --ro", "--ro", ["--role-arn"], False),
+            (
+                "value_after_colon",
+                "register_sts_assumed_role --role-arn arn:aws:iam::123456789012:role/dev-",
+                "role/dev-",
+                ["role/dev-admin"],
+                True,
+            ),
+            (
+                "value_after_space",
+                "register_sts_assumed_role --mfa-serial ",
+                "",
+                [MFA_SERIAL],
+                True,
+            ),
+            (
+                "no_completion_value",
+                "register_sts_assumed_role --region ap",
+                "ap",
+                [],
+                False,
+            ),
+            (
+                "switch_profile",
+                "register_sts_assumed_role --switch ol",
+                "ol",
+                ["old-dev"],
+                True,
+            ),
+            (
+                "switch_role_arn",
+                "register_sts_assumed_role --switch arn:aws:iam::123456789012:role/dev-",
+                "role/dev-",
+                ["role/dev-admin"],
+                True,
+            ),
+        ]
+    )
+    def test_main_complete_bash(self, _, line, word, expected_value, index_used):
+        ## given
+        environment = {
+            name: os.environ.get(name) for name in ("COMP_LINE", "COMP_POINT")
+        }
+        os.environ["COMP_LINE"] = line + " --yes"
+        os.environ["COMP_POINT"] = str(len(line))
+        stdout = StringIO()
+
+        ## when
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exit_status = completion_index.main(
+                    [
+                        "complete",
+                        "--bash",
+                        "--config-file",
+                        self.config_file_path,
+                        "--change-log-file",
+                        self.change_log_file_path,
+                        "--",
+                        "register_sts_assumed_role",
+                        word,
+                        "",
+                    ]
+                )
+        finally:
+            for name, value in environment.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        ## then
+        self.assertEqual(exit_status, 0)
+        self.assertEqual(stdout.getvalue().splitlines(), expected_value)
+        self.assertEqual(
+            os.path.exists(
+                completion_index.get_index_file_path(self.change_log_file_path)
+            ),
+            index_used,
+        )
+
+    def test_register_sts_assumed_role_bash_function_prompt_lookup(self):
+        ## given
+        function_file_path = os.path.join(self.tmp_dir_path, "function.bash")
+        with open(
+            REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH, "r"
+        ) as template_file:
+            function_string = setup.replace_replacement_string(
+                template_file.read(),
+                self.config_file_path,
+                "sts-session",
+                "ap-northeast-1",
+                "json",
+                self.change_log_file_path,
+                setup.PYTHON_EXECUTABLE_PATH,
+                setup.PROJECT_ROOT_DIR_PATH,
+                os.path.join(self.tmp_dir_path, "backup"),
+                change_log.RotationPolicyVO(0, 0, False),
+            )
+        with open(function_file_path, "w") as function_file:
+            function_file.write(function_string)
+
+        ## when
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source "
+                + function_file_path
+                + " && complete -p register_sts_assumed_role && register_sts_assumed_role",
+            ],
+            input="arn:aws:iam::123456789012:role/d*\narn:aws:iam::123456789012:role/dev-*\nc*\nlookup-session\narn:*\n\n\n\n",
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+
+        ## then
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("completion_index.py", result.stdout.splitlines()[0])
+        self.assertIn(DEV_ROLE_ARN + "\n" + DEV_ADMIN_ROLE_ARN, result.stderr)
+        section = aws_config.load_config(self.config_file_path).find_profile(
+            "lookup-session"
+        )[0]
+        self.assertEqual(section.get("role_arn"), DEV_ADMIN_ROLE_ARN)
+        self.assertEqual(section.get("source_profile"), "ci")
+        self.assertEqual(section.get("mfa_serial"), MFA_SERIAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+import unittest
+import change_log
+import config_history
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from parameterized import parameterized
+
+DEV_ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+DEV_ADMIN_ROLE_ARN = "arn:aws:iam::123456789012:role/dev-admin"
+OPERATOR_ROLE_ARN = "arn:aws:iam::210987654321:role/operator"
+BASE_TIME = datetime.datetime(2026, 10, 1, 9, 0, 0).astimezone()
+
+
+class TestConfigHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+        self.change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        self.now = BASE_TIME + datetime.timedelta(days=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    @parameterized.expand(
+        [
+            (
+                "before_any_event",
+                -1,
+                {},
+            ),
+            (
+                "after_register",
+                0,
+                {"dev": DEV_ROLE_ARN},
+            ),
+            (
+                "after_second_register",
+                1,
+                {"dev": DEV_ROLE_ARN, "operator": OPERATOR_ROLE_ARN},
+            ),
+            (
+                "after_reregister",
+                2,
+                {"dev": DEV_ADMIN_ROLE_ARN, "operator": OPERATOR_ROLE_ARN},
+            ),
+            (
+                "after_delete",
+                3,
+                {"dev": DEV_ADMIN_ROLE_ARN},
+            ),
+        ]
+    )
+    def test_replay_expected_profiles(self, _, at_hours, expected_role_arns):
+        ## given
+        self.__write_history()
+
+        ## when
+        profiles, _ = config_history.replay(
+            self.change_log_file_path,
+            [],
+            BASE_TIME + datetime.timedelta(hours=at_hours),
+            self.now,
+            0,
+        )
+
+        ## then
+        self.assertEqual(
+            {
+                profile_name: profile["role_arn"]
+                for profile_name, profile in profiles.items()
+            },
+            expected_role_arns,
+        )
+
+    def test_replay_resumes_from_checkpoint(self):
+        ## given
+        self.__write_history()
+        _, checkpoints = config_history.replay(
+            self.change_log_file_path, [], None, self.now, 2
+        )
+        # a stale checkpoint proves the replay starts from it
+        checkpoints[-1].profiles["from-checkpoint"] = dict(
+            checkpoints[-1].profiles["dev"]
+        )
+
+        ## when
+        profiles, new_checkpoints = config_history.replay(
+            self.change_log_file_path,
+            checkpoints,
+            BASE_TIME + datetime.timedelta(hours=3),
+            self.now,
+            2,
+        )
+
+        ## then
+        self.assertEqual(
+            [checkpoint.time for checkpoint in checkpoints],
+            [
+                BASE_TIME + datetime.timedelta(hours=1),
+                BASE_TIME + datetime.timedelta(hours=2),
+            ],
+        )
+        self.assertEqual(sorted(profiles), ["dev", "from-checkpoint"])
+        self.assertEqual(profiles["dev"]["role_arn"], DEV_ADMIN_ROLE_ARN)
+        self.assertEqual(new_checkpoints, [])
+
+    def test_replay_checkpoint_includes_late_event(self):
+        ## given
+        # the second writer appends its earlier event after the first one
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "dev", DEV_ROLE_ARN, "base", None, None, BASE_TIME
+                ),
+                change_log.make_register_event(
+                    "operator",
+                    OPERATOR_ROLE_ARN,
+                    "base",
+                    None,
+                    None,
+                    BASE_TIME - datetime.timedelta(seconds=10),
+                ),
+                change_log.make_register_event(
+                    "dev",
+                    DEV_ADMIN_ROLE_ARN,
+                    "base",
+                    None,
+                    None,
+                    BASE_TIME + datetime.timedelta(hours=1),
+                ),
+            ],
+        )
+
+        ## when
+        _, checkpoints = config_history.replay(
+            self.change_log_file_path, [], None, self.now, 1
+        )
+
+        ## then
+        self.assertEqual(checkpoints[0].time, BASE_TIME)
+        self.assertEqual(
+            {
+                profile_name: profile["role_arn"]
+                for profile_name, profile in checkpoints[0].profiles.items()
+            },
+            {"dev": DEV_ROLE_ARN, "operator": OPERATOR_ROLE_ARN},
+        )
+
+    def test_main_as_of_diff(self):
+        ## given
+        self.__write_history()
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(
+                "[default]\n"
+                "region = ap-northeast-1\n"
+                "\n"
+                "[profile dev]\n"
+                "role_arn = " + DEV_ADMIN_ROLE_ARN + "\n"
+                "source_profile = base\n"
+                "region = us-east-1\n"
+            )
+
+        ## when
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_status = config_history.main(
+                [
+                    "as-of",
+                    "--config-file",
+                    self.config_file_path,
+                    "--change-log-file",
+                    self.change_log_file_path,
+                    "--at",
+                    (BASE_TIME + datetime.timedelta(hours=1)).isoformat(),
+                    "--checkpoint-interval",
+                    "2",
+                ]
+            )
+
+        ## then
+        self.assertEqual(exit_status, 0)
+        self.assertEqual(
+            [
+                line
+                for line in stdout.getvalue().splitlines()
+                if line[:1] in ("-", "+") and line[:3] not in ("---", "+++")
+            ],
+            [
+                "-role_arn = " + DEV_ADMIN_ROLE_ARN,
+                "+role_arn = " + DEV_ROLE_ARN,
+                "+",
+                "+[profile operator]",
+                "+role_arn = " + OPERATOR_ROLE_ARN,
+                "+source_profile = base",
+            ],
+        )
+        self.assertIn("region = us-east-1", stdout.getvalue())
+        with open(
+            config_history.get_checkpoint_file_path(self.change_log_file_path), "r"
+        ) as checkpoint_file:
+            self.assertEqual(len(json.load(checkpoint_file)["checkpoints"]), 2)
+
+    ##############################
+    #       Private Method       #
+    ##############################
+    def __write_history(self):
+        change_log.append_events(
+            self.change_log_file_path,
+            [
+                change_log.make_register_event(
+                    "dev", DEV_ROLE_ARN, "base", None, None, BASE_TIME
+                ),
+                change_log.make_register_event(
+                    "operator",
+                    OPERATOR_ROLE_ARN,
+                    "base",
+                    None,
+                    None,
+                    BASE_TIME + datetime.timedelta(hours=1),
+                ),
+                change_log.make_register_event(
+                    "dev",
+                    DEV_ADMIN_ROLE_ARN,
+                    "base",
+                    None,
+                    "admin",
+                    BASE_TIME + datetime.timedelta(hours=2),
+                ),
+                change_log.make_switch_event(
+                    "dev", DEV_ADMIN_ROLE_ARN, BASE_TIME + datetime.timedelta(hours=2)
+                ),
+                change_log.make_delete_event(
+                    "operator",
+                    OPERATOR_ROLE_ARN,
+                    "base",
+                    None,
+                    BASE_TIME + datetime.timedelta(hours=3),
+                ),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
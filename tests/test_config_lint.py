@@ -0,0 +1,198 @@
+import unittest
+import aws_config
+import config_lint
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+LINT_CONFIG = (
+    "[default]\n"
+    "region = ap-northeast-1\n"
+    "[profile base]\n"
+    "aws_access_key_id = AKIAEXAMPLE\n"
+    "source_profile = base\n"
+    "[profile dev]\n"
+    "role_arn = arn:aws:iam::123456789012:role/dev\n"
+    "source_profile = base\n"
+    "[profile dev]\n"
+    "region = us-east-1\n"
+    "[profile dangling]\n"
+    "role_arn = arn:aws:iam::123456789012:role/dangling\n"
+    "source_profile = removed\n"
+    "[profile loop-a]\n"
+    "role_arn = arn:aws:iam::123456789012:role/a\n"
+    "source_profile = loop-b\n"
+    "[profile loop-b]\n"
+    "role_arn = arn:aws:iam::123456789012:role/b\n"
+    "source_profile = loop-a\n"
+    "[profile region-only]\n"
+    "region = eu-west-1\n"
+    "[profile from-credentials]\n"
+    "role_arn = arn:aws:iam::123456789012:role/c\n"
+    "source_profile = ci\n"
+)
+
+
+class TestConfigLint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_lint_config_expected_value(self):
+        ## given
+        config = aws_config.parse_config(LINT_CONFIG.splitlines())
+
+        ## when
+        issues = config_lint.lint_config(config, ["ci"])
+
+        ## then
+        self.assertEqual(
+            [(issue.kind, issue.profile_name, issue.message) for issue in issues],
+            [
+                (config_lint.ISSUE_DUPLICATE, "dev", "2 sections."),
+                (
+                    config_lint.ISSUE_DANGLING_SOURCE_PROFILE,
+                    "dangling",
+                    "source_profile removed not exist.",
+                ),
+                (config_lint.ISSUE_CYCLE, "loop-a", "loop-a -> loop-b -> loop-a"),
+                (
+                    config_lint.ISSUE_UNUSED,
+                    "region-only",
+                    "no role_arn, credentials or profile using it as source_profile.",
+                ),
+            ],
+        )
+
+    def test_lint_config_non_profile_sections(self):
+        ## given
+        config = aws_config.parse_config(
+            (
+                "[default]\n"
+                "region = ap-northeast-1\n"
+                "[sso-session my-sso]\n"
+                "sso_start_url = https://example.awsapps.com/start\n"
+                "[services local-endpoints]\n"
+                "s3 =\n"
+                "  endpoint_url = http://localhost:4566\n"
+                "[profile sso]\n"
+                "sso_session = my-sso\n"
+                "services = local-endpoints\n"
+                "[profile sso-removed]\n"
+                "sso_session = removed-sso\n"
+                "services = removed-services\n"
+            ).splitlines()
+        )
+
+        ## when
+        issues = config_lint.lint_config(config)
+
+        ## then
+        self.assertEqual(
+            [(issue.kind, issue.profile_name, issue.message) for issue in issues],
+            [
+                (
+                    config_lint.ISSUE_DANGLING_SECTION,
+                    "sso-removed",
+                    "sso_session removed-sso not exist.",
+                ),
+                (
+                    config_lint.ISSUE_DANGLING_SECTION,
+                    "sso-removed",
+                    "services removed-services not exist.",
+                ),
+            ],
+        )
+
+    def test_find_cycles_linear_time(self):
+        ## given
+        profile_count = 100000
+        source_profiles = {
+            "p" + str(number): "p" + str(number + 1) for number in range(profile_count)
+        }
+        source_profiles["p" + str(profile_count)] = "p" + str(profile_count // 2)
+
+        ## when
+        started = time.perf_counter()
+        cycles = config_lint.find_cycles(source_profiles)
+
+        ## then
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(len(cycles), 1)
+        self.assertEqual(len(cycles[0]), profile_count // 2 + 1)
+        self.assertEqual(cycles[0][0], "p" + str(profile_count // 2))
+
+    def test_compact_config_merge_duplicate_sections(self):
+        ## given
+        config = aws_config.parse_config(LINT_CONFIG.splitlines())
+
+        ## when
+        compacted_config, merged_count = config_lint.compact_config(config)
+
+        ## then
+        self.assertEqual(merged_count, 1)
+        self.assertEqual(
+            compacted_config.profile_names(),
+            [
+                "default",
+                "base",
+                "dev",
+                "dangling",
+                "loop-a",
+                "loop-b",
+                "region-only",
+                "from-credentials",
+            ],
+        )
+        self.assertEqual(
+            compacted_config.find_profile("dev")[0].lines,
+            [
+                "role_arn = arn:aws:iam::123456789012:role/dev",
+                "source_profile = base",
+                "region = us-east-1",
+            ],
+        )
+
+    def test_main_compact(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(LINT_CONFIG)
+        backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+        stdout = StringIO()
+
+        ## when
+        with contextlib.redirect_stdout(stdout):
+            exit_status = config_lint.main(
+                [
+                    "--config-file",
+                    self.config_file_path,
+                    "--credentials-file",
+                    os.path.join(self.tmp_dir_path, "credentials"),
+                    "--compact",
+                    "--backup-dir",
+                    backup_dir_path,
+                ]
+            )
+
+        ## then
+        self.assertEqual(exit_status, 1)
+        output_lines = stdout.getvalue().splitlines()
+        self.assertEqual(output_lines[0], "merged 1 duplicate sections.")
+        self.assertEqual(output_lines[-1], "4 issues found.")
+        config = aws_config.load_config(self.config_file_path)
+        self.assertEqual(len(config.find_profile("dev")), 1)
+        self.assertNotIn(
+            config_lint.ISSUE_DUPLICATE,
+            [issue.kind for issue in config_lint.lint_config(config)],
+        )
+        self.assertTrue(os.path.isdir(backup_dir_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
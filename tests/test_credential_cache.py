@@ -0,0 +1,355 @@
+import unittest
+import aws_config
+import credential_cache
+import contextlib
+import datetime
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.parse
+from io import StringIO
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/cached"
+DENIED_ROLE_ARN = "arn:aws:iam::123456789012:role/denied"
+MFA_SERIAL = "arn:aws:iam::123456789012:mfa/user"
+SOURCE_ACCESS_KEY_ID = "AKIASOURCE"
+ENVIRONMENT_VARIABLES = (
+    credential_cache.CONFIG_FILE_ENVIRONMENT_VARIABLE,
+    credential_cache.CREDENTIALS_FILE_ENVIRONMENT_VARIABLE,
+    credential_cache.STS_ENDPOINT_ENVIRONMENT_VARIABLE,
+    "PATH",
+)
+FAKE_AWS_CLI_SCRIPT = """#!{python_executable_path}
+import json
+import sys
+
+if sys.argv[1:] != {expected_argv!r}:
+    sys.exit(255)
+print(json.dumps({{"Version": 1, "AccessKeyId": "ASIASSO", "SecretAccessKey": "sso-secret"}}))
+"""
+
+
+class StubStsHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        parameters = dict(
+            urllib.parse.parse_qsl(
+                self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+            )
+        )
+        self.server.requests.append((parameters, self.headers["Authorization"]))
+        if parameters.get("RoleArn") == DENIED_ROLE_ARN:
+            status = 403
+            body = (
+                "<ErrorResponse><Error><Type>Sender</Type><Code>AccessDenied</Code>"
+                "<Message>not authorized</Message></Error></ErrorResponse>"
+            )
+        else:
+            status = 200
+            number = str(len(self.server.requests))
+            expiration = datetime.datetime.now(
+                datetime.timezone.utc
+            ) + datetime.timedelta(seconds=self.server.expiration_seconds)
+            body = (
+                "<"
+                + parameters["Action"]
+                + 'Response xmlns="https://sts.amazonaws.com/doc/2011-06-15/">'
+                "<" + parameters["Action"] + "Result><Credentials>"
+                "<AccessKeyId>ASIA" + number + "</AccessKeyId>"
+                "<SecretAccessKey>secret" + number + "</SecretAccessKey>"
+                "<SessionToken>token" + number + "</SessionToken>"
+                "<Expiration>"
+                + expiration.strftime("%Y-%m-%dT%H:%M:%SZ")
+                + "</Expiration>"
+                "</Credentials></" + parameters["Action"] + "Result>"
+                "</" + parameters["Action"] + "Response>"
+            )
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+        self.cache_dir_path = os.path.join(self.tmp_dir_path, "cache")
+        credentials_file_path = os.path.join(self.tmp_dir_path, "credentials")
+        with open(credentials_file_path, "w") as credentials_file:
+            credentials_file.write(
+                "[base]\n"
+                "aws_access_key_id = " + SOURCE_ACCESS_KEY_ID + "\n"
+                "aws_secret_access_key = source-secret\n"
+            )
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubStsHandler)
+        self.server.requests = []
+        self.server.expiration_seconds = 3600
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+        self.environment = {
+            name: os.environ.get(name) for name in ENVIRONMENT_VARIABLES
+        }
+        os.environ[credential_cache.CONFIG_FILE_ENVIRONMENT_VARIABLE] = (
+            self.config_file_path
+        )
+        os.environ[credential_cache.CREDENTIALS_FILE_ENVIRONMENT_VARIABLE] = (
+            credentials_file_path
+        )
+        os.environ[credential_cache.STS_ENDPOINT_ENVIRONMENT_VARIABLE] = (
+            "http://127.0.0.1:" + str(self.server.server_address[1])
+        )
+
+    def tearDown(self):
+        for name, value in self.environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_sign_request_expected_value(self):
+        ## given
+        credentials = credential_cache.CredentialsVO(
+            "AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", None, None
+        )
+
+        ## when
+        headers = credential_cache.sign_request(
+            "GET",
+            "https://iam.amazonaws.com/?Action=ListUsers&Version=2010-05-08",
+            {"content-type": "application/x-www-form-urlencoded; charset=utf-8"},
+            b"",
+            "us-east-1",
+            "iam",
+            credentials,
+            datetime.datetime(2015, 8, 30, 12, 36, tzinfo=datetime.timezone.utc),
+        )
+
+        ## then
+        self.assertEqual(
+            headers["authorization"],
+            "AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20150830/us-east-1/iam/aws4_request, "
+            "SignedHeaders=content-type;host;x-amz-date, "
+            "Signature=5d672d79c15b13162d9279b0855cfba6789a8edb4c82c400e06b5924a6f2b5d7",
+        )
+
+    def test_register_assumed_role_writes_credential_process(self):
+        ## when
+        aws_config.register_assumed_role(
+            self.config_file_path,
+            "cached-session",
+            ROLE_ARN,
+            "base",
+            "ap-northeast-1",
+            "json",
+            MFA_SERIAL,
+            None,
+            self.cache_dir_path,
+        )
+
+        ## then
+        section = aws_config.load_config(self.config_file_path).find_profile(
+            "cached-session"
+        )[0]
+        self.assertIsNone(section.get("role_arn"))
+        self.assertEqual(section.get("region"), "ap-northeast-1")
+        cached_profiles = credential_cache.list_cached_profiles(
+            aws_config.load_config(self.config_file_path)
+        )
+        self.assertEqual(
+            [
+                (
+                    cached_profile.cache_dir_path,
+                    cached_profile.profile_name,
+                    cached_profile.role_arn,
+                    cached_profile.source_profile,
+                    cached_profile.mfa_serial,
+                )
+                for cached_profile in cached_profiles
+            ],
+            [(self.cache_dir_path, "cached-session", ROLE_ARN, "base", MFA_SERIAL)],
+        )
+
+    def test_main_credential_process_served_from_cache(self):
+        ## given
+        argv = [
+            credential_cache.CREDENTIAL_PROCESS_COMMAND,
+            "--cache-dir",
+            self.cache_dir_path,
+            "--profile",
+            "cached-session",
+            "--role-arn",
+            ROLE_ARN,
+            "--source-profile",
+            "base",
+        ]
+        outputs = []
+
+        ## when
+        for _ in range(2):
+            stdout = StringIO()
+            with contextlib.redirect_stdout(stdout):
+                exit_status = credential_cache.main(argv)
+            self.assertEqual(exit_status, 0)
+            outputs.append(json.loads(stdout.getvalue()))
+
+        ## then
+        self.assertEqual(len(self.server.requests), 1)
+        parameters, authorization = self.server.requests[0]
+        self.assertEqual(parameters["Action"], "AssumeRole")
+        self.assertEqual(parameters["RoleArn"], ROLE_ARN)
+        self.assertEqual(
+            parameters["RoleSessionName"], "sts-assumed-role-cached-session"
+        )
+        self.assertIn("Credential=" + SOURCE_ACCESS_KEY_ID + "/", authorization)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0]["Version"], 1)
+        self.assertEqual(outputs[0]["AccessKeyId"], "ASIA1")
+        self.assertEqual(outputs[0]["SessionToken"], "token1")
+        cache_file_path = credential_cache.get_cache_file_path(
+            self.cache_dir_path, "cached-session"
+        )
+        self.assertEqual(os.stat(cache_file_path).st_mode & 0o777, 0o600)
+
+    def test_refresh_profiles_refresh_ahead_of_expiry(self):
+        ## given
+        for profile_name in ("refresh-a", "refresh-b"):
+            aws_config.register_assumed_role(
+                self.config_file_path,
+                profile_name,
+                ROLE_ARN,
+                "base",
+                "ap-northeast-1",
+                "json",
+                "",
+                None,
+                self.cache_dir_path,
+            )
+        cached_profiles = credential_cache.list_cached_profiles(
+            aws_config.load_config(self.config_file_path)
+        )
+        self.server.expiration_seconds = (
+            credential_cache.DEFAULT_REFRESH_AHEAD_SECONDS - 60
+        )
+        credential_cache.refresh_profiles(cached_profiles, 0, 2)
+
+        ## when
+        self.server.expiration_seconds = 3600
+        errors = credential_cache.refresh_profiles(
+            cached_profiles, credential_cache.DEFAULT_REFRESH_AHEAD_SECONDS, 2
+        )
+        fresh_errors = credential_cache.refresh_profiles(
+            cached_profiles, credential_cache.DEFAULT_REFRESH_AHEAD_SECONDS, 2
+        )
+
+        ## then
+        self.assertEqual(errors, [])
+        self.assertEqual(fresh_errors, [])
+        self.assertEqual(len(self.server.requests), 4)
+        for cached_profile in cached_profiles:
+            credentials = credential_cache.load_cached_credentials(
+                credential_cache.get_cache_file_path(
+                    self.cache_dir_path, cached_profile.profile_name
+                )
+            )
+            self.assertFalse(
+                credentials.expires_within(
+                    credential_cache.DEFAULT_REFRESH_AHEAD_SECONDS,
+                    datetime.datetime.now(datetime.timezone.utc),
+                )
+            )
+
+    def test_get_credentials_with_mfa_session(self):
+        ## given
+        cached_profile = credential_cache.CachedProfileVO(
+            self.cache_dir_path, "mfa-session", ROLE_ARN, "base", MFA_SERIAL
+        )
+        with self.assertRaises(credential_cache.StsError):
+            credential_cache.get_credentials(cached_profile, 0)
+
+        ## when
+        credential_cache.login(cached_profile, "123456")
+        credentials = credential_cache.get_credentials(cached_profile, 0)
+
+        ## then
+        self.assertEqual(credentials.access_key_id, "ASIA2")
+        (login_parameters, _), (assume_parameters, authorization) = self.server.requests
+        self.assertEqual(login_parameters["Action"], "GetSessionToken")
+        self.assertEqual(login_parameters["SerialNumber"], MFA_SERIAL)
+        self.assertEqual(login_parameters["TokenCode"], "123456")
+        self.assertEqual(assume_parameters["Action"], "AssumeRole")
+        self.assertNotIn("SerialNumber", assume_parameters)
+        self.assertIn("Credential=ASIA1/", authorization)
+
+    def test_get_profile_credentials_resolved_by_aws_cli(self):
+        ## given
+        with open(self.config_file_path, "w") as config_file:
+            config_file.write(
+                "[profile sso-base]\nsso_session = company\n"
+                "sso_account_id = 123456789012\nsso_role_name = admin\n"
+            )
+        bin_dir_path = os.path.join(self.tmp_dir_path, "bin")
+        os.makedirs(bin_dir_path)
+        with open(os.path.join(bin_dir_path, "aws"), "w") as aws_file:
+            aws_file.write(
+                FAKE_AWS_CLI_SCRIPT.format(
+                    python_executable_path=sys.executable,
+                    expected_argv=list(
+                        credential_cache.AWS_CLI_EXPORT_CREDENTIALS_COMMAND[1:]
+                    )
+                    + ["sso-base"],
+                )
+            )
+        os.chmod(os.path.join(bin_dir_path, "aws"), 0o755)
+        os.environ["PATH"] = bin_dir_path + os.pathsep + os.environ["PATH"]
+
+        ## when
+        credentials = credential_cache.get_profile_credentials("sso-base", 0)
+
+        ## then
+        self.assertEqual(
+            (credentials.access_key_id, credentials.secret_access_key),
+            ("ASIASSO", "sso-secret"),
+        )
+
+    def test_main_credential_process_sts_error(self):
+        ## given
+        stderr = StringIO()
+
+        ## when
+        with contextlib.redirect_stderr(stderr):
+            exit_status = credential_cache.main(
+                [
+                    credential_cache.CREDENTIAL_PROCESS_COMMAND,
+                    "--cache-dir",
+                    self.cache_dir_path,
+                    "--profile",
+                    "denied-session",
+                    "--role-arn",
+                    DENIED_ROLE_ARN,
+                    "--source-profile",
+                    "base",
+                ]
+            )
+
+        ## then
+        self.assertEqual(exit_status, 1)
+        self.assertIn(
+            "AssumeRole failed. AccessDenied: not authorized", stderr.getvalue()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
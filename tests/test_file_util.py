@@ -0,0 +1,103 @@
+import unittest
+import file_util
+import os
+import shutil
+import tempfile
+import threading
+import time
+from parameterized import parameterized
+
+
+class TestFileUtil(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir_path, "target")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    @parameterized.expand(
+        [
+            ("tagged", b"a\n<start> sha256:abc\nbody\n<end>\n", b"sha256:abc"),
+            ("untagged", b"<start>\nbody\n<end>\n", b""),
+            ("one_line", b"<start> tag <end>\n", b"tag"),
+            ("unterminated", b"<start> sha256:abc\nbody\n", None),
+            ("not_exist", b"a\n", None),
+        ]
+    )
+    def test_find_block_tag_expected_value(self, _, contents, expected_value):
+        ## given
+        with open(self.file_path, "wb") as target_file:
+            target_file.write(contents)
+
+        ## when
+        tag = file_util.find_block_tag(self.file_path, b"<start>", b"<end>")
+
+        ## then
+        self.assertEqual(tag, expected_value)
+
+    @unittest.skipUnless(os.geteuid() == 0, "symbolic link is followed if not root.")
+    def test_replace_block_refuse_symlink_as_root(self):
+        ## given
+        with open(self.file_path, "wb") as target_file:
+            target_file.write(b"root only\n")
+        link_file_path = os.path.join(self.tmp_dir_path, "link")
+        os.symlink(self.file_path, link_file_path)
+
+        ## when
+        with self.assertRaises(OSError):
+            file_util.replace_block(
+                link_file_path, b"<start><end>", b"<start>", b"<end>"
+            )
+
+        ## then
+        with open(self.file_path, "rb") as target_file:
+            self.assertEqual(target_file.read(), b"root only\n")
+        self.assertEqual(sorted(os.listdir(self.tmp_dir_path)), ["link", "target"])
+
+    def test_lock_file_timeout(self):
+        ## given
+        started = time.monotonic()
+
+        ## when
+        with file_util.lock_file(self.file_path):
+            with self.assertRaises(file_util.LockTimeoutError):
+                with file_util.lock_file(self.file_path, timeout=0.1):
+                    pass
+
+        ## then
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        with file_util.lock_file(self.file_path, timeout=0):
+            pass
+
+    def test_lock_file_exclusive(self):
+        ## given
+        counter_file_path = self.file_path
+
+        def increment():
+            for _ in range(50):
+                with file_util.lock_file(counter_file_path):
+                    if os.path.exists(counter_file_path):
+                        with open(counter_file_path, "r") as counter_file:
+                            count = int(counter_file.read())
+                    else:
+                        count = 0
+                    file_util.write_file_atomically(
+                        counter_file_path, [str(count + 1).encode()]
+                    )
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+
+        ## when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ## then
+        with open(counter_file_path, "r") as counter_file:
+            self.assertEqual(int(counter_file.read()), 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
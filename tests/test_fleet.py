@@ -0,0 +1,228 @@
+import unittest
+import fleet
+import setup
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+
+TARGETS_YAML = """
+- home_dir: {tmp_dir_path}/alice
+  shell: /bin/bash
+- home_dir: {tmp_dir_path}/bob
+  shell: /usr/bin/zsh
+  overrides:
+    install_mode: inline
+    region: us-east-1
+- home_dir: {tmp_dir_path}/carol
+  shell: /bin/tcsh
+"""
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        for user_name in ("alice", "bob", "carol"):
+            os.makedirs(os.path.join(self.tmp_dir_path, user_name))
+        with open(os.path.join(self.tmp_dir_path, "alice", ".bashrc"), "w") as rc_file:
+            rc_file.write("export EDITOR=vi\n")
+        self.targets_file_path = os.path.join(self.tmp_dir_path, "targets.yaml")
+        with open(self.targets_file_path, "w") as targets_file:
+            targets_file.write(TARGETS_YAML.format(tmp_dir_path=self.tmp_dir_path))
+        self.logger = logging.getLogger("test_fleet")
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_load_targets_csv(self):
+        ## given
+        targets_file_path = os.path.join(self.tmp_dir_path, "targets.csv")
+        with open(targets_file_path, "w") as targets_file:
+            targets_file.write(
+                "home_dir,shell,region\n/home/a,/bin/bash,\n/home/b,/bin/zsh,us-west-2\n"
+            )
+
+        ## when
+        targets = fleet.load_targets(targets_file_path)
+
+        ## then
+        self.assertEqual(
+            [(t.home_dir_path, t.shell, t.overrides) for t in targets],
+            [
+                ("/home/a", "/bin/bash", {}),
+                ("/home/b", "/bin/zsh", {"region": "us-west-2"}),
+            ],
+        )
+
+    def test_load_targets_unknown_override(self):
+        ## given
+        with open(self.targets_file_path, "w") as targets_file:
+            targets_file.write(
+                "- home_dir: /home/a\n  shell: bash\n  overrides:\n    shell: zsh\n"
+            )
+
+        ## then
+        with self.assertRaises(ValueError):
+            fleet.load_targets(self.targets_file_path)
+
+    def test_provision_fleet_per_user_result(self):
+        ## given
+        targets = fleet.load_targets(self.targets_file_path)
+        setup_config = setup.load_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+
+        ## when
+        results = fleet.provision_fleet(
+            targets, setup_config, datetime.datetime.now(), self.logger, 2
+        )
+
+        ## then
+        self.assertEqual(
+            [result.status for result in results],
+            [fleet.STATUS_INSERTED, fleet.STATUS_INSERTED, fleet.STATUS_FAILED],
+        )
+        alice_dir_path = os.path.join(self.tmp_dir_path, "alice")
+        with open(os.path.join(alice_dir_path, ".bashrc"), "r") as rc_file:
+            alice_rc = rc_file.read()
+        self.assertTrue(alice_rc.startswith("export EDITOR=vi\n\n"))
+        self.assertIn(
+            "sts_assumed_role_functions/register_sts_assumed_role.bash", alice_rc
+        )
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(
+                    alice_dir_path,
+                    ".aws/sts_assumed_role_functions/register_sts_assumed_role.bash",
+                )
+            )
+        )
+        self.assertTrue(
+            os.path.isdir(os.path.join(alice_dir_path, ".aws/sts_assumed_role_backup"))
+        )
+        with open(os.path.join(self.tmp_dir_path, "bob", ".zshrc"), "r") as rc_file:
+            bob_rc = rc_file.read()
+        self.assertIn("REGION_NAME=us-east-1", bob_rc)
+        self.assertIn("CONFIG_FILE_PATH=", bob_rc)
+        self.assertEqual(results[2].message, "login shell not supported.")
+
+    def test_provision_fleet_rerun_skipped(self):
+        ## given
+        targets = fleet.load_targets(self.targets_file_path)
+        setup_config = setup.load_setup_config()
+        fleet.provision_fleet(
+            targets, setup_config, datetime.datetime.now(), self.logger, 2
+        )
+        alice_rc_file_path = os.path.join(self.tmp_dir_path, "alice", ".bashrc")
+        alice_rc_mtime_ns = os.stat(alice_rc_file_path).st_mtime_ns
+
+        ## when
+        results = fleet.provision_fleet(
+            targets, setup_config, datetime.datetime.now(), self.logger, 2
+        )
+
+        ## then
+        self.assertEqual(
+            [result.status for result in results],
+            [fleet.STATUS_SKIPPED, fleet.STATUS_SKIPPED, fleet.STATUS_FAILED],
+        )
+        self.assertEqual(os.stat(alice_rc_file_path).st_mtime_ns, alice_rc_mtime_ns)
+
+    @unittest.skipUnless(os.geteuid() == 0, "chown needs root.")
+    def test_provision_fleet_created_paths_owned_by_user(self):
+        ## given
+        alice_dir_path = os.path.join(self.tmp_dir_path, "alice")
+        os.chown(alice_dir_path, 12345, 12345)
+        os.chown(os.path.join(alice_dir_path, ".bashrc"), 12345, 12345)
+        setup_config = setup.load_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+
+        ## when
+        results = fleet.provision_fleet(
+            fleet.load_targets(self.targets_file_path)[:1],
+            setup_config,
+            datetime.datetime.now(),
+            self.logger,
+            1,
+        )
+
+        ## then
+        self.assertEqual(results[0].status, fleet.STATUS_INSERTED)
+        for path in (
+            ".aws",
+            ".aws/sts_assumed_role_functions",
+            ".aws/sts_assumed_role_backup",
+            ".bashrc",
+            ".bashrc.lock",
+        ):
+            self.assertEqual(
+                os.stat(os.path.join(alice_dir_path, path)).st_uid, 12345, path
+            )
+
+    @unittest.skipUnless(os.geteuid() == 0, "chown needs root.")
+    def test_provision_fleet_not_follow_user_links(self):
+        ## given
+        alice_dir_path = os.path.join(self.tmp_dir_path, "alice")
+        os.chown(alice_dir_path, 12345, 12345)
+        secret_file_path = os.path.join(self.tmp_dir_path, "secret")
+        with open(secret_file_path, "w") as secret_file:
+            secret_file.write("root only\n")
+        os.chmod(secret_file_path, 0o600)
+        os.remove(os.path.join(alice_dir_path, ".bashrc"))
+        os.symlink(secret_file_path, os.path.join(alice_dir_path, ".bashrc"))
+        os.makedirs(os.path.join(alice_dir_path, ".aws/sts_assumed_role_backup"))
+        os.link(
+            secret_file_path,
+            os.path.join(alice_dir_path, ".aws/sts_assumed_role_backup/linked"),
+        )
+        setup_config = setup.load_setup_config()
+
+        ## when
+        symlink_results = fleet.provision_fleet(
+            fleet.load_targets(self.targets_file_path)[:1],
+            setup_config,
+            datetime.datetime.now(),
+            self.logger,
+            1,
+        )
+        os.remove(os.path.join(alice_dir_path, ".bashrc"))
+        results = fleet.provision_fleet(
+            fleet.load_targets(self.targets_file_path)[:1],
+            setup_config,
+            datetime.datetime.now(),
+            self.logger,
+            1,
+        )
+
+        ## then
+        self.assertEqual(symlink_results[0].status, fleet.STATUS_FAILED)
+        self.assertEqual(results[0].status, fleet.STATUS_INSERTED)
+        with open(secret_file_path, "r") as secret_file:
+            self.assertEqual(secret_file.read(), "root only\n")
+        self.assertEqual(os.stat(secret_file_path).st_uid, 0)
+        self.assertEqual(os.stat(os.path.join(alice_dir_path, ".bashrc")).st_uid, 12345)
+
+    def test_format_summary(self):
+        ## given
+        targets = fleet.load_targets(self.targets_file_path)
+        results = fleet.provision_fleet(
+            targets, setup.load_setup_config(), datetime.datetime.now(), self.logger, 2
+        )
+
+        ## when
+        lines = fleet.format_summary(results, 1.5)
+
+        ## then
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith(fleet.STATUS_INSERTED + "\t"))
+        self.assertTrue(lines[2].endswith("\tlogin shell not supported."))
+        self.assertEqual(
+            lines[3],
+            "provisioned 3 users in 1.50s. updated: 0, inserted: 2, skipped: 0, failed: 1",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import unittest
+import aws_config
+import metrics
+import setup
+import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_to_textfile_expected_value(self):
+        ## given
+        recorder = metrics.SpanRecorder("register")
+        recorder.add_span("rewrite_config", 0.25, 100, 150)
+        recorder.add_span("rewrite_config", 0.5, 150, 200)
+        recorder.add_span("append_change_log", 0.125, 0, 42)
+        recorder.set_gauge("profiles", 3)
+
+        ## when
+        textfile = recorder.to_textfile(1700000000.0)
+
+        ## then
+        self.assertEqual(
+            textfile,
+            "# HELP sts_assumed_role_stage_duration_seconds Seconds spent in the stage by the last run.\n"
+            "# TYPE sts_assumed_role_stage_duration_seconds gauge\n"
+            'sts_assumed_role_stage_duration_seconds{command="register",stage="rewrite_config"} 0.75\n'
+            'sts_assumed_role_stage_duration_seconds{command="register",stage="append_change_log"} 0.125\n'
+            "# HELP sts_assumed_role_stage_read_bytes Bytes read in the stage by the last run.\n"
+            "# TYPE sts_assumed_role_stage_read_bytes gauge\n"
+            'sts_assumed_role_stage_read_bytes{command="register",stage="rewrite_config"} 250\n'
+            'sts_assumed_role_stage_read_bytes{command="register",stage="append_change_log"} 0\n'
+            "# HELP sts_assumed_role_stage_written_bytes Bytes written in the stage by the last run.\n"
+            "# TYPE sts_assumed_role_stage_written_bytes gauge\n"
+            'sts_assumed_role_stage_written_bytes{command="register",stage="rewrite_config"} 350\n'
+            'sts_assumed_role_stage_written_bytes{command="register",stage="append_change_log"} 42\n'
+            "# HELP sts_assumed_role_stage_calls Number of times the stage ran in the last run.\n"
+            "# TYPE sts_assumed_role_stage_calls gauge\n"
+            'sts_assumed_role_stage_calls{command="register",stage="rewrite_config"} 2\n'
+            'sts_assumed_role_stage_calls{command="register",stage="append_change_log"} 1\n'
+            "# TYPE sts_assumed_role_profiles gauge\n"
+            'sts_assumed_role_profiles{command="register"} 3\n'
+            "# TYPE sts_assumed_role_last_run_timestamp_seconds gauge\n"
+            'sts_assumed_role_last_run_timestamp_seconds{command="register"} 1700000000.0\n',
+        )
+
+    def test_span_recorded_when_raised(self):
+        ## given
+        recorder = metrics.SpanRecorder("register")
+
+        ## when
+        with self.assertRaises(ValueError):
+            with recorder.span("load_manifest") as span:
+                span.read_bytes = 10
+                raise ValueError("broken manifest")
+
+        ## then
+        self.assertEqual(
+            [(span.stage, span.read_bytes) for span in recorder.spans],
+            [("load_manifest", 10)],
+        )
+        self.assertGreaterEqual(recorder.spans[0].seconds, 0)
+
+    def test_write_textfile_readable_by_collector(self):
+        ## given
+        textfile_dir_path = os.path.join(self.tmp_dir_path, "textfile")
+        recorder = metrics.SpanRecorder("register")
+        umask = os.umask(0o027)
+
+        ## when
+        try:
+            textfile_path = metrics.write_textfile(textfile_dir_path, recorder)
+            new_mode = os.stat(textfile_path).st_mode & 0o777
+            os.chmod(textfile_path, 0o600)
+            metrics.write_textfile(textfile_dir_path, recorder)
+            replaced_mode = os.stat(textfile_path).st_mode & 0o777
+        finally:
+            os.umask(umask)
+
+        ## then
+        self.assertEqual(new_mode, 0o640)
+        self.assertEqual(replaced_mode, 0o600)
+
+    def test_main_register_exports_metrics(self):
+        ## given
+        config_file_path = os.path.join(self.tmp_dir_path, "config")
+        metrics_log_file_path = os.path.join(
+            self.tmp_dir_path, "metrics", "register.log"
+        )
+        textfile_dir_path = os.path.join(self.tmp_dir_path, "textfile")
+        with open(config_file_path, "w") as config_file:
+            config_file.write("[default]\nregion = ap-northeast-1\n")
+
+        ## when
+        exit_status = aws_config.main(
+            [
+                "register",
+                "--config-file",
+                config_file_path,
+                "--profile",
+                "sts-session",
+                "--role-arn",
+                ROLE_ARN,
+                "--source-profile",
+                "default",
+                "--region",
+                "ap-northeast-1",
+                "--output",
+                "json",
+                "--change-log-file",
+                os.path.join(self.tmp_dir_path, "change.log"),
+                "--backup-dir",
+                os.path.join(self.tmp_dir_path, "backup"),
+                "--metrics-log-file",
+                metrics_log_file_path,
+                "--metrics-textfile-dir",
+                textfile_dir_path,
+            ]
+        )
+
+        ## then
+        self.assertEqual(exit_status, 0)
+        with open(metrics_log_file_path, "r") as metrics_log_file:
+            records = [json.loads(line) for line in metrics_log_file]
+        self.assertEqual(
+            [record["stage"] for record in records if record["type"] == "span"],
+            ["backup_config", "rewrite_config", "append_change_log"],
+        )
+        rewrite_record = records[1]
+        self.assertEqual(rewrite_record["command"], "register")
+        self.assertEqual(
+            rewrite_record["written_bytes"], os.path.getsize(config_file_path)
+        )
+        self.assertEqual(
+            {
+                record["name"]: record["value"]
+                for record in records
+                if record["type"] == "gauge"
+            },
+            {"registered_profiles": 1, "profiles": 2},
+        )
+        with open(
+            metrics.get_textfile_path(textfile_dir_path, "register"), "r"
+        ) as textfile:
+            self.assertIn(
+                'sts_assumed_role_profiles{command="register"} 2\n', textfile.read()
+            )
+        self.assertEqual(
+            os.listdir(textfile_dir_path), ["sts_assumed_role_register.prom"]
+        )
+
+    def test_install_register_sts_assumed_role_records_spans(self):
+        ## given
+        setup_config = setup.load_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+        setup_config.backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+        setup_config.functions_dir_path = os.path.join(self.tmp_dir_path, "functions")
+        bashrc_file_path = os.path.join(self.tmp_dir_path, ".bashrc")
+        with open(bashrc_file_path, "w") as bashrc_file:
+            bashrc_file.write("export PATH\n")
+        logger = logging.getLogger("test_metrics")
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+        recorder = metrics.SpanRecorder("setup")
+
+        ## when
+        setup.install_register_sts_assumed_role(
+            "/bin/bash",
+            setup_config,
+            datetime.datetime.now(),
+            logger,
+            self.tmp_dir_path,
+            recorder,
+        )
+
+        ## then
+        spans = {span.stage: span for span in recorder.spans}
+        self.assertEqual(
+            list(spans),
+            [
+                "render_template",
+                "check_digest",
+                "install_lazy_function",
+                "backup_file",
+                "register_function",
+            ],
+        )
+        self.assertEqual(
+            spans["render_template"].read_bytes,
+            os.path.getsize(setup.REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
+        )
+        self.assertEqual(spans["backup_file"].read_bytes, len("export PATH\n"))
+        self.assertEqual(spans["register_function"].read_bytes, len("export PATH\n"))
+        self.assertEqual(
+            spans["register_function"].written_bytes, os.path.getsize(bashrc_file_path)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,328 @@
+import unittest
+import aws_config
+import backup_store
+import change_log
+import profile_bundle
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from parameterized import parameterized
+
+DEV_ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+DEV_ADMIN_ROLE_ARN = "arn:aws:iam::123456789012:role/dev-admin"
+OPERATOR_ROLE_ARN = "arn:aws:iam::210987654321:role/operator"
+AUDIT_ROLE_ARN = "arn:aws:iam::210987654321:role/audit"
+
+
+class TestProfileBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.now = datetime.datetime.now().astimezone()
+        self.source_config_file_path = os.path.join(self.tmp_dir_path, "source-config")
+        self.source_change_log_file_path = os.path.join(self.tmp_dir_path, "source.log")
+        self.target_config_file_path = os.path.join(self.tmp_dir_path, "target-config")
+        self.target_change_log_file_path = os.path.join(self.tmp_dir_path, "target.log")
+        self.bundle_file_path = os.path.join(self.tmp_dir_path, "bundle.json")
+        self.backup_dir_path = os.path.join(self.tmp_dir_path, "backup")
+
+        with open(self.source_config_file_path, "w") as config_file:
+            config_file.write("[default]\nregion = us-east-1\n")
+        self.__register(
+            self.source_config_file_path,
+            self.source_change_log_file_path,
+            "dev",
+            DEV_ROLE_ARN,
+        )
+        self.__register(
+            self.source_config_file_path,
+            self.source_change_log_file_path,
+            "operator",
+            OPERATOR_ROLE_ARN,
+        )
+
+        with open(self.target_config_file_path, "w") as config_file:
+            config_file.write(
+                "[default]\nregion = ap-northeast-1\n\n"
+                "[profile local]\nrole_arn = "
+                + AUDIT_ROLE_ARN
+                + "\nsource_profile = default\n"
+            )
+        self.__register(
+            self.target_config_file_path,
+            self.target_change_log_file_path,
+            "operator",
+            DEV_ADMIN_ROLE_ARN,
+        )
+        self.__register(
+            self.target_config_file_path,
+            self.target_change_log_file_path,
+            "audit",
+            AUDIT_ROLE_ARN,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_main_export_import(self):
+        ## given
+        expected_sections = {
+            section.name: section.to_string()
+            for section in aws_config.load_config(self.source_config_file_path).sections
+            if section.header is not None and section.name != "default"
+        }
+
+        ## when
+        with contextlib.redirect_stdout(StringIO()):
+            export_status = profile_bundle.main(
+                [
+                    "export",
+                    "--config-file",
+                    self.source_config_file_path,
+                    "--change-log-file",
+                    self.source_change_log_file_path,
+                    "--bundle-file",
+                    self.bundle_file_path,
+                ]
+            )
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            import_status = profile_bundle.main(
+                [
+                    "import",
+                    "--bundle-file",
+                    self.bundle_file_path,
+                    "--config-file",
+                    self.target_config_file_path,
+                    "--change-log-file",
+                    self.target_change_log_file_path,
+                    "--backup-dir",
+                    self.backup_dir_path,
+                ]
+            )
+
+        ## then
+        self.assertEqual((export_status, import_status), (0, 0))
+        with open(self.bundle_file_path, "r") as bundle_file:
+            self.assertEqual(
+                [section["name"] for section in json.load(bundle_file)["sections"]],
+                ["dev", "operator"],
+            )
+        self.assertEqual(
+            stdout.getvalue(),
+            "added\tdev\nchanged\toperator\nremoved\taudit\n"
+            "added: 1, changed: 1, removed: 1\n",
+        )
+        config = aws_config.load_config(self.target_config_file_path)
+        self.assertEqual(
+            config.profile_names(), ["default", "local", "operator", "dev"]
+        )
+        self.assertEqual(
+            config.find_profile("default")[0].get("region"), "ap-northeast-1"
+        )
+        for profile_name, section_string in expected_sections.items():
+            self.assertEqual(
+                config.find_profile(profile_name)[0].to_string(), section_string
+            )
+        self.assertEqual(
+            [
+                (change_log_event["event"], change_log_event["profile"])
+                for change_log_event in change_log.read_events(
+                    self.target_change_log_file_path
+                )
+            ][-3:],
+            [
+                (change_log.EVENT_REGISTERED, "dev"),
+                (change_log.EVENT_REGISTERED, "operator"),
+                (change_log.EVENT_DELETED, "audit"),
+            ],
+        )
+        self.assertEqual(len(backup_store.load_index(self.backup_dir_path)[1]), 1)
+
+    def test_sync_config_unchanged_not_rewritten(self):
+        ## given
+        source = profile_bundle.load_source(
+            self.source_config_file_path, self.source_change_log_file_path, self.now
+        )
+        profile_bundle.sync_config(
+            source,
+            self.target_config_file_path,
+            self.target_change_log_file_path,
+            self.backup_dir_path,
+            self.now,
+        )
+        config_file_stat = os.stat(self.target_config_file_path)
+
+        ## when
+        changes = profile_bundle.sync_config(
+            source,
+            self.target_config_file_path,
+            self.target_change_log_file_path,
+            self.backup_dir_path,
+            self.now,
+        )
+
+        ## then
+        self.assertEqual(changes, [])
+        self.assertEqual(
+            os.stat(self.target_config_file_path).st_ino, config_file_stat.st_ino
+        )
+
+    @parameterized.expand(
+        [
+            (
+                [],
+                "added\tdev\nchanged\toperator\n"
+                "added: 1, changed: 1, removed: 0 (dry run)\n",
+            ),
+            (
+                ["--prune"],
+                "added\tdev\nchanged\toperator\nremoved\tlocal\nremoved\taudit\n"
+                "added: 1, changed: 1, removed: 2 (dry run)\n",
+            ),
+        ]
+    )
+    def test_main_sync_dry_run_without_change_log(self, options, expected_stdout):
+        ## given
+        with open(self.target_config_file_path, "r") as config_file:
+            before_config_string = config_file.read()
+
+        ## when
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_status = profile_bundle.main(
+                [
+                    "sync",
+                    "--source",
+                    self.source_config_file_path,
+                    "--target",
+                    self.target_config_file_path,
+                    "--dry-run",
+                ]
+                + options
+            )
+
+        ## then
+        self.assertEqual(exit_status, 0)
+        # without the change log profiles with a role are managed, but only
+        # removed with --prune
+        self.assertEqual(stdout.getvalue(), expected_stdout)
+        with open(self.target_config_file_path, "r") as config_file:
+            self.assertEqual(config_file.read(), before_config_string)
+        self.assertFalse(
+            os.path.exists(
+                profile_bundle.get_default_backup_dir_path(self.target_config_file_path)
+            )
+        )
+
+    def test_main_sync_unmanaged_profile_conflict(self):
+        ## given
+        with open(self.target_config_file_path, "a") as config_file:
+            config_file.write(
+                "\n[profile dev]\naws_access_key_id = AKIAEXAMPLE\n"
+                "aws_secret_access_key = secret\n"
+            )
+        static_dev_section_string = (
+            aws_config.load_config(self.target_config_file_path)
+            .find_profile("dev")[0]
+            .to_string()
+        )
+
+        ## when
+        stdout = StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_status = profile_bundle.main(
+                [
+                    "sync",
+                    "--source",
+                    self.source_config_file_path,
+                    "--target",
+                    self.target_config_file_path,
+                ]
+            )
+
+        ## then
+        self.assertEqual(exit_status, 1)
+        self.assertEqual(
+            stdout.getvalue(),
+            "conflict\tdev\nchanged\toperator\n"
+            "added: 0, changed: 1, removed: 0, conflict: 1\n",
+        )
+        config = aws_config.load_config(self.target_config_file_path)
+        self.assertEqual(
+            config.find_profile("dev")[0].to_string(), static_dev_section_string
+        )
+        self.assertEqual(len(config.find_profile("local")), 1)
+        self.assertEqual(len(config.find_profile("audit")), 1)
+        self.assertEqual(
+            len(
+                backup_store.load_index(
+                    profile_bundle.get_default_backup_dir_path(
+                        self.target_config_file_path
+                    )
+                )[1]
+            ),
+            1,
+        )
+
+    def test_sync_bundle_expected_value(self):
+        ## given
+        profile_bundle.save_bundle(
+            self.bundle_file_path,
+            profile_bundle.load_source(
+                self.target_config_file_path, self.target_change_log_file_path, self.now
+            ),
+        )
+        source = profile_bundle.load_source(
+            self.source_config_file_path, self.source_change_log_file_path, self.now
+        )
+
+        ## when
+        changes = profile_bundle.sync_bundle(source, self.bundle_file_path)
+
+        ## then
+        self.assertEqual(
+            changes,
+            [
+                (profile_bundle.CHANGE_ADDED, "dev"),
+                (profile_bundle.CHANGE_CHANGED, "operator"),
+                (profile_bundle.CHANGE_REMOVED, "audit"),
+            ],
+        )
+        self.assertEqual(
+            profile_bundle.compare_bundles(
+                source, profile_bundle.load_bundle(self.bundle_file_path)
+            ),
+            [],
+        )
+
+    ##############################
+    #       Private Method       #
+    ##############################
+    def __register(
+        self, config_file_path, change_log_file_path, profile_name, role_arn
+    ):
+        aws_config.register_assumed_role(
+            config_file_path,
+            profile_name,
+            role_arn,
+            "default",
+            "ap-northeast-1",
+            "json",
+            "",
+        )
+        change_log.append_events(
+            change_log_file_path,
+            [
+                change_log.make_register_event(
+                    profile_name, role_arn, "default", None, None, self.now
+                )
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,362 @@
+import unittest
+import aws_config
+import change_log
+import profile_daemon
+import setup
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from parameterized import parameterized
+
+REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH = (
+    "template/register_sts_assumed_role.bash.tmpl"
+)
+ROLE_ARN = "arn:aws:iam::123456789012:role/daemon"
+FAKE_SOCAT_SCRIPT = """#!{python_executable_path}
+import socket
+import sys
+
+client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+client.connect(sys.argv[-1][len("UNIX-CONNECT:"):])
+client.sendall(sys.stdin.buffer.read())
+client.shutdown(socket.SHUT_WR)
+while True:
+    response_bytes = client.recv(4096)
+    if not response_bytes:
+        break
+    sys.stdout.buffer.write(response_bytes)
+"""
+
+
+class TestProfileDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir_path, "daemon.sock")
+        self.config_file_path = os.path.join(self.tmp_dir_path, "config")
+        self.change_log_file_path = os.path.join(self.tmp_dir_path, "change.log")
+        self.logger = logging.getLogger("test_profile_daemon")
+        self.logger.propagate = False
+        self.server = profile_daemon.create_server(self.socket_path, self.logger)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        shutil.rmtree(self.tmp_dir_path)
+
+    def test_send_request_register_and_list(self):
+        ## given
+        register_argv = self.__register_argv("daemon-session")
+
+        ## when
+        register_response = profile_daemon.send_request(
+            self.socket_path, register_argv, self.tmp_dir_path
+        )
+        list_response = profile_daemon.send_request(
+            self.socket_path, ["list", "--config-file", "config"], self.tmp_dir_path
+        )
+
+        ## then
+        self.assertEqual(
+            register_response["exit_status"], 0, register_response["stderr"]
+        )
+        self.assertEqual(
+            list_response,
+            {"exit_status": 0, "stdout": "daemon-session\n", "stderr": ""},
+        )
+        self.assertEqual(
+            [
+                event["event"]
+                for event in change_log.read_events(self.change_log_file_path)
+            ],
+            ["REGISTERED"],
+        )
+
+    def test_send_request_list_reloads_changed_config(self):
+        ## given
+        list_argv = ["list", "--config-file", self.config_file_path]
+        profile_daemon.send_request(self.socket_path, list_argv, self.tmp_dir_path)
+
+        ## when
+        aws_config.main(self.__register_argv("direct-session"))
+        list_response = profile_daemon.send_request(
+            self.socket_path, list_argv, self.tmp_dir_path
+        )
+
+        ## then
+        self.assertEqual(list_response["stdout"], "direct-session\n")
+
+    def test_send_request_unsupported_command(self):
+        ## when
+        response = profile_daemon.send_request(
+            self.socket_path, ["serve"], self.tmp_dir_path
+        )
+
+        ## then
+        self.assertEqual(response["exit_status"], 1)
+        self.assertIn("unsupported daemon command.", response["stderr"])
+
+    def test_plain_request_register_and_list(self):
+        ## given
+        register_argv = self.__register_argv("plain-session")
+
+        ## when
+        register_response_bytes = self.__send_plain_request(register_argv)
+        list_response_bytes = self.__send_plain_request(
+            ["list", "--config-file", "config"]
+        )
+        unsupported_response_bytes = self.__send_plain_request(["serve"])
+
+        ## then
+        self.assertTrue(
+            register_response_bytes.startswith(b"\0" + b"0\n"), register_response_bytes
+        )
+        self.assertEqual(list_response_bytes, b"\0" + b"0\n\0plain-session\n\0")
+        self.assertTrue(
+            unsupported_response_bytes.startswith(
+                b"\0" + b"1\nunsupported daemon command."
+            )
+        )
+
+    def test_config_cache_splice_profile_keep_cached_config(self):
+        ## given
+        aws_config.main(self.__register_argv("direct-session"))
+        config_cache = profile_daemon.ConfigCache()
+        config = config_cache.get(self.config_file_path)
+        section_string = (
+            "[profile cached-session]\nrole_arn = "
+            + ROLE_ARN
+            + "\nsource_profile = default\n"
+        )
+
+        ## when
+        deleted_sections = config_cache.splice_profile(
+            self.config_file_path, "cached-session", section_string
+        )
+        spliced_config = config_cache.get(self.config_file_path)
+        sections = config_cache.read_profile(self.config_file_path, "cached-session")
+
+        ## then
+        self.assertEqual(deleted_sections, [])
+        # the cached config is updated in place, not parsed again
+        self.assertIs(spliced_config, config)
+        self.assertEqual([section.get("role_arn") for section in sections], [ROLE_ARN])
+        self.assertEqual(
+            spliced_config.profile_names(),
+            aws_config.load_config(self.config_file_path).profile_names(),
+        )
+
+    def test_config_cache_splice_profile_compact_deleted_sections(self):
+        ## given
+        aws_config.main(self.__register_argv("direct-session"))
+        config_cache = profile_daemon.ConfigCache()
+        config = config_cache.get(self.config_file_path)
+        section_string = (
+            "[profile cached-session]\nrole_arn = "
+            + ROLE_ARN
+            + "\nsource_profile = default\n"
+        )
+
+        ## when
+        for _ in range(100):
+            config_cache.splice_profile(
+                self.config_file_path, "cached-session", section_string
+            )
+
+        ## then
+        self.assertIs(config_cache.get(self.config_file_path), config)
+        self.assertLessEqual(len(config.sections), 4)
+        self.assertEqual(
+            config.to_string(),
+            aws_config.load_config(self.config_file_path).to_string(),
+        )
+
+    def test_main_request_daemon_not_running(self):
+        ## given
+        socket_path = os.path.join(self.tmp_dir_path, "stopped.sock")
+
+        ## when
+        exit_status = profile_daemon.main(
+            [
+                "request",
+                "--socket",
+                socket_path,
+                "--",
+                "list",
+                "--config-file",
+                "config",
+            ]
+        )
+
+        ## then
+        self.assertEqual(exit_status, profile_daemon.DAEMON_UNAVAILABLE_EXIT_STATUS)
+
+    def test_create_server_already_running(self):
+        ## then
+        with self.assertRaises(OSError):
+            profile_daemon.create_server(self.socket_path, self.logger)
+        self.assertEqual(
+            os.stat(self.socket_path).st_mode & 0o777, profile_daemon.SOCKET_FILE_MODE
+        )
+
+    def test_execute_request_unexpected_error(self):
+        ## given
+        class BrokenConfigCache:
+            def get(self, config_file_path):
+                raise RuntimeError("broken cache")
+
+        ## when
+        response = profile_daemon.execute_request(
+            {"argv": ["list", "--config-file", "config"], "cwd": self.tmp_dir_path},
+            BrokenConfigCache(),
+        )
+
+        ## then
+        self.assertEqual(response["exit_status"], 1)
+        self.assertIn("broken cache", response["stderr"])
+
+    @parameterized.expand([(False,), (True,)])
+    def test_register_sts_assumed_role_bash_function_through_daemon(self, with_socat):
+        ## given
+        function_file_path = self.__write_bash_function(self.socket_path)
+
+        ## when
+        with self.assertLogs(self.logger) as logs:
+            result = self.__run_bash_function(function_file_path, with_socat)
+
+        ## then
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('"register"', logs.records[0].getMessage())
+        self.assertEqual(
+            aws_config.load_config(self.config_file_path)
+            .find_profile("sts-session")[0]
+            .get("role_arn"),
+            ROLE_ARN,
+        )
+
+    @parameterized.expand([(False,), (True,)])
+    def test_register_sts_assumed_role_bash_function_not_rerun_after_accepted(
+        self, with_socat
+    ):
+        ## given
+        # the daemon accepts the request and dies before the response
+        socket_path = os.path.join(self.tmp_dir_path, "dying.sock")
+        dying_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        dying_server.bind(socket_path)
+        dying_server.listen(1)
+
+        def accept_and_die():
+            connection, _ = dying_server.accept()
+            with connection:
+                connection.recv(65536)
+                connection.sendall(profile_daemon.PLAIN_REQUEST_ACCEPTED)
+
+        server_thread = threading.Thread(target=accept_and_die)
+        server_thread.start()
+        function_file_path = self.__write_bash_function(socket_path)
+
+        ## when
+        result = self.__run_bash_function(function_file_path, with_socat)
+        server_thread.join()
+        dying_server.close()
+
+        ## then
+        self.assertIn("register_sts_assumed_role FAILED!", result.stdout)
+        self.assertFalse(os.path.exists(self.config_file_path))
+
+    ########################################################################
+    ############################ Private Method ############################
+    ########################################################################
+    def __register_argv(self, profile_name):
+        return [
+            "register",
+            "--config-file",
+            self.config_file_path,
+            "--profile",
+            profile_name,
+            "--role-arn",
+            ROLE_ARN,
+            "--source-profile",
+            "default",
+            "--region",
+            "ap-northeast-1",
+            "--output",
+            "json",
+            "--change-log-file",
+            self.change_log_file_path,
+            "--backup-dir",
+            os.path.join(self.tmp_dir_path, "backup"),
+        ]
+
+    def __write_bash_function(self, socket_path):
+        function_file_path = os.path.join(self.tmp_dir_path, "function.bash")
+        with open(
+            REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH, "r"
+        ) as template_file:
+            function_string = setup.replace_replacement_string(
+                template_file.read(),
+                self.config_file_path,
+                "sts-session",
+                "ap-northeast-1",
+                "json",
+                self.change_log_file_path,
+                setup.PYTHON_EXECUTABLE_PATH,
+                setup.PROJECT_ROOT_DIR_PATH,
+                os.path.join(self.tmp_dir_path, "backup"),
+                change_log.RotationPolicyVO(0, 0, False),
+                socket_path,
+            )
+        with open(function_file_path, "w") as function_file:
+            function_file.write(function_string)
+        return function_file_path
+
+    def __run_bash_function(self, function_file_path, with_socat):
+        environment = dict(os.environ)
+        if with_socat:
+            bin_dir_path = os.path.join(self.tmp_dir_path, "bin")
+            os.makedirs(bin_dir_path, exist_ok=True)
+            with open(os.path.join(bin_dir_path, "socat"), "w") as socat_file:
+                socat_file.write(
+                    FAKE_SOCAT_SCRIPT.format(python_executable_path=sys.executable)
+                )
+            os.chmod(os.path.join(bin_dir_path, "socat"), 0o755)
+            environment["PATH"] = bin_dir_path + os.pathsep + environment["PATH"]
+        return subprocess.run(
+            [
+                "bash",
+                "-c",
+                "source " + function_file_path + " && register_sts_assumed_role",
+            ],
+            input=ROLE_ARN + "\ndefault\n\n\n\n\n\n",
+            capture_output=True,
+            text=True,
+            env=environment,
+        )
+
+    def __send_plain_request(self, argv):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with client:
+            client.connect(self.socket_path)
+            client.sendall(
+                "".join(
+                    field + "\0" for field in [str(len(argv)), self.tmp_dir_path] + argv
+                ).encode(profile_daemon.MESSAGE_ENCODING)
+            )
+            response_bytes = b""
+            while True:
+                received_bytes = client.recv(4096)
+                if not received_bytes:
+                    return response_bytes
+                response_bytes += received_bytes
+
+
+if __name__ == "__main__":
+    unittest.main()
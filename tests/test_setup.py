@@ -7,8 +7,17 @@ from parameterized import parameterized
 import datetime
 from io import StringIO
 import sys
+import shutil
+import subprocess
+import tempfile
+import threading
+import backup_store
+import change_log
 
 TEST_RESULT_LOG_FILE_PATH = "tests/logs/test_result.log"
+TEST_BACKUP_DIR_PATH = "tests/backup"
+TEST_FUNCTIONS_DIR_PATH = "tests/functions"
+LOCK_FILE_SUFFIX = ".lock"
 SETUP_CONFIG_FILE_PATH = "tests/config/setup-config.yaml"
 AWS_ALL_REGIONS = [
     "us-east-2",
@@ -51,6 +60,22 @@ REPLACEMENT_STRING_REGISTER_PROFILE = "$REPLACEMENT_STRING_REGISTER_PROFILE"
 REPLACEMENT_STRING_REGION_NAME = "$REPLACEMENT_STRING_REGION_NAME"
 REPLACEMENT_STRING_OUTPUT_FORMAT = "$REPLACEMENT_STRING_OUTPUT_FORMAT"
 REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH = "$REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH"
+REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH = "$REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH"
+REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH = "$REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH"
+REPLACEMENT_STRING_BACKUP_DIR_PATH = "$REPLACEMENT_STRING_BACKUP_DIR_PATH"
+REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE = "$REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE"
+REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES = (
+    "$REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES"
+)
+REPLACEMENT_STRING_CHANGE_LOG_COMPRESS = "$REPLACEMENT_STRING_CHANGE_LOG_COMPRESS"
+REPLACEMENT_STRING_DAEMON_SOCKET_PATH = "$REPLACEMENT_STRING_DAEMON_SOCKET_PATH"
+REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH = (
+    "$REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH"
+)
+REPLACEMENT_STRING_METRICS_LOG_FILE_PATH = "$REPLACEMENT_STRING_METRICS_LOG_FILE_PATH"
+REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH = (
+    "$REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH"
+)
 REGISTER_STS_ASSUMED_ROLE_START_SIGNAL = (
     "###### register_sts_assumed_role starts here ######"
 )
@@ -73,6 +98,10 @@ class TestSetup(unittest.TestCase):
         for tmp_file_path in tmp_file_paths:
             if os.path.isfile(tmp_file_path):
                 os.remove(tmp_file_path)
+        if os.path.isdir(TEST_BACKUP_DIR_PATH):
+            shutil.rmtree(TEST_BACKUP_DIR_PATH)
+        if os.path.isdir(TEST_FUNCTIONS_DIR_PATH):
+            shutil.rmtree(TEST_FUNCTIONS_DIR_PATH)
 
     @classmethod
     def __initialize_logger(cls):
@@ -88,12 +117,38 @@ class TestSetup(unittest.TestCase):
         global tmp_file_paths
         tmp_file_paths = []
 
+    def test_initialize_logger_setting_make_log_dir_on_first_record(self):
+        ## given
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp_dir_path)
+        root_logger = logging.getLogger()
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+            self.addCleanup(root_logger.addHandler, handler)
+
+        ## when
+        setup_logger = setup.initialize_logger_setting()
+        self.addCleanup(self.__remove_handlers, root_logger)
+        is_made_before_record = os.path.exists("logs")
+        setup_logger.info("first record")
+
+        ## then
+        self.assertFalse(is_made_before_record)
+        with open(setup.SETUP_LOG_FILE_PATH, "r") as log_file:
+            self.assertIn("first record", log_file.read())
+
     def test_load_setup_config_expected_value(self):
         ## when
         config = setup.load_setup_config()
 
         ## then
-        config_file_path, profile_name, region, output, change_log_file_path = self.__load_setup_config()
+        config_file_path, profile_name, region, output, change_log_file_path = (
+            self.__load_setup_config()
+        )
+        backup_dir_path, backup_policy = self.__load_backup_config()
 
         self.assertTrue(len(config.config_file_path) > 0)
         self.assertEqual(config.config_file_path, config_file_path)
@@ -105,6 +160,86 @@ class TestSetup(unittest.TestCase):
         self.assertEqual(config.output, output)
         self.assertTrue(len(config.change_log_file_path) > 0)
         self.assertEqual(config.change_log_file_path, change_log_file_path)
+        self.assertTrue(len(config.backup_dir_path) > 0)
+        self.assertEqual(config.backup_dir_path, backup_dir_path)
+        self.assertEqual(config.backup_policy.to_dict(), backup_policy)
+        self.assertIn(
+            config.install_mode, [setup.INSTALL_MODE_INLINE, setup.INSTALL_MODE_LAZY]
+        )
+        self.assertTrue(len(config.functions_dir_path) > 0)
+        self.assertEqual(config.daemon_socket_path, self.__load_daemon_socket_path())
+        self.assertEqual(
+            config.credential_cache_dir_path, self.__load_credential_cache_dir_path()
+        )
+        self.assertEqual(
+            (config.metrics_log_file_path, config.metrics_textfile_dir_path),
+            self.__load_metrics_config(),
+        )
+        self.assertEqual(
+            (
+                config.change_log_rotation.max_size,
+                config.change_log_rotation.max_archives,
+                config.change_log_rotation.compress,
+            ),
+            self.__load_change_log_rotation_config(),
+        )
+
+    def test_setup_config_digest(self):
+        ## given
+        config = setup.load_setup_config()
+        other_config = setup.load_setup_config()
+
+        ## when
+        digest = config.digest()
+        other_config.change_log_rotation.max_archives += 1
+
+        ## then
+        self.assertEqual(digest, setup.load_setup_config().digest())
+        self.assertNotEqual(digest, other_config.digest())
+
+    def test_load_setup_config_cache(self):
+        ## given
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        setup_config_file_path = os.path.join(tmp_dir_path, "setup-config.yaml")
+        shutil.copyfile(SETUP_CONFIG_FILE_PATH, setup_config_file_path)
+        cache_file_path = os.path.join(tmp_dir_path, ".setup-config.yaml.cache.json")
+
+        ## when
+        config = setup.load_setup_config(setup_config_file_path)
+        cached_config = setup.load_setup_config(setup_config_file_path)
+
+        ## then
+        self.assertEqual(
+            setup.get_setup_config_cache_file_path(setup_config_file_path),
+            cache_file_path,
+        )
+        self.assertTrue(os.path.isfile(cache_file_path))
+        self.assertEqual(cached_config.to_dict(), config.to_dict())
+        self.assertEqual(cached_config.digest(), config.digest())
+
+    def test_load_setup_config_cache_invalidated_by_change(self):
+        ## given
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        setup_config_file_path = os.path.join(tmp_dir_path, "setup-config.yaml")
+        shutil.copyfile(SETUP_CONFIG_FILE_PATH, setup_config_file_path)
+        setup.load_setup_config(setup_config_file_path)
+        config_stat = os.stat(setup_config_file_path)
+        with open(setup_config_file_path, "r") as config_file:
+            config_string = config_file.read()
+
+        ## when
+        with open(setup_config_file_path, "w") as config_file:
+            config_file.write(config_string.replace('"ap-northeast-1"', '"us-east-1"'))
+        os.utime(
+            setup_config_file_path,
+            ns=(config_stat.st_atime_ns, config_stat.st_mtime_ns),
+        )
+        config = setup.load_setup_config(setup_config_file_path)
+
+        ## then
+        self.assertEqual(config.region, "us-east-1")
 
     def test_load_setup_config_validate(self):
         ## when
@@ -114,42 +249,65 @@ class TestSetup(unittest.TestCase):
         self.assertIn(config.region, AWS_ALL_REGIONS)
         self.assertIn(config.output, CLI_ALL_OUTPUT_FORMATS)
 
-    @parameterized.expand([
-        ("/bin/bash", BASH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"])),
-        ("/usr/local/bin/zsh", ZSH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"])),
-        ("test", TEST_LOGIN_SHELL_SETTING_FILE_PATH),
-        ("/bin/tcsh", None),
-        (None, None)
-    ])
-    def test_get_login_shell_setting_file_path_expected_value(self, login_shell_path, expected_value):
+    @parameterized.expand(
+        [
+            (
+                "/bin/bash",
+                BASH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"]),
+            ),
+            (
+                "/usr/local/bin/zsh",
+                ZSH_LOGIN_SHELL_SETTING_FILE_PATH.replace("$HOME", os.environ["HOME"]),
+            ),
+            ("test", TEST_LOGIN_SHELL_SETTING_FILE_PATH),
+            ("/bin/tcsh", None),
+            (None, None),
+        ]
+    )
+    def test_get_login_shell_setting_file_path_expected_value(
+        self, login_shell_path, expected_value
+    ):
         ## when
         setting_file_path = setup.get_login_shell_setting_file_path(login_shell_path)
 
         ## then
         self.assertEqual(setting_file_path, expected_value)
 
-    @parameterized.expand([
-        ("/bin/bash", REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
-        ("/usr/local/bin/zsh", REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
-        ("test", REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH),
-        ("/bin/tcsh", None),
-        (None, None)
-    ])
-    def test_get_register_sts_assumed_role_template_file_path_expected_value(self, login_shell_path, expected_value):
+    @parameterized.expand(
+        [
+            ("/bin/bash", REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
+            ("/usr/local/bin/zsh", REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
+            ("test", REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH),
+            ("/bin/tcsh", None),
+            (None, None),
+        ]
+    )
+    def test_get_register_sts_assumed_role_template_file_path_expected_value(
+        self, login_shell_path, expected_value
+    ):
         ## when
-        template_file_path = setup.get_register_sts_assumed_role_template_file_path(login_shell_path)
+        template_file_path = setup.get_register_sts_assumed_role_template_file_path(
+            login_shell_path
+        )
 
         ## then
         self.assertEqual(template_file_path, expected_value)
 
-    @parameterized.expand([
-        ("/bin/bash", REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
-        ("/usr/local/bin/zsh", REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
-        ("test", REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH)
-    ])
-    def test_generate_register_sts_assumed_role_template_expected_value(self, login_shell_path, template_file_path):
+    @parameterized.expand(
+        [
+            ("/bin/bash", REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
+            ("/usr/local/bin/zsh", REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
+            ("test", REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH),
+        ]
+    )
+    def test_generate_register_sts_assumed_role_template_expected_value(
+        self, login_shell_path, template_file_path
+    ):
         ## given
-        config_file_path, profile_name, region, output, change_log_file_path = self.__load_setup_config()
+        config_file_path, profile_name, region, output, change_log_file_path = (
+            self.__load_setup_config()
+        )
+        max_size, max_archives, compress = self.__load_change_log_rotation_config()
         with open(template_file_path, "r") as template_file:
             expected_value = (
                 template_file.read()
@@ -158,6 +316,33 @@ class TestSetup(unittest.TestCase):
                 .replace(REPLACEMENT_STRING_REGION_NAME, region)
                 .replace(REPLACEMENT_STRING_OUTPUT_FORMAT, output)
                 .replace(REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH, change_log_file_path)
+                .replace(REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH, sys.executable)
+                .replace(REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH, os.getcwd())
+                .replace(
+                    REPLACEMENT_STRING_BACKUP_DIR_PATH, self.__load_backup_config()[0]
+                )
+                .replace(REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE, str(max_size))
+                .replace(REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES, str(max_archives))
+                .replace(
+                    REPLACEMENT_STRING_CHANGE_LOG_COMPRESS,
+                    "true" if compress else "false",
+                )
+                .replace(
+                    REPLACEMENT_STRING_DAEMON_SOCKET_PATH,
+                    self.__load_daemon_socket_path(),
+                )
+                .replace(
+                    REPLACEMENT_STRING_CREDENTIAL_CACHE_DIR_PATH,
+                    self.__load_credential_cache_dir_path(),
+                )
+                .replace(
+                    REPLACEMENT_STRING_METRICS_LOG_FILE_PATH,
+                    self.__load_metrics_config()[0],
+                )
+                .replace(
+                    REPLACEMENT_STRING_METRICS_TEXTFILE_DIR_PATH,
+                    self.__load_metrics_config()[1],
+                )
             )
 
         ## when
@@ -169,11 +354,13 @@ class TestSetup(unittest.TestCase):
         ## then
         self.assertEqual(function_string, expected_value)
 
-    @parameterized.expand([
-        (REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
-        (REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
-        (REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH)
-    ])
+    @parameterized.expand(
+        [
+            (REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH),
+            (REGISTER_STS_ASSUMED_ROLE_ZSH_TEMPLATE_FILE_PATH),
+            (REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH),
+        ]
+    )
     def test_replace_replacement_string(self, template_file_path):
         ## given
         exist_config_file_path_replacement_string_before_replace = False
@@ -181,13 +368,19 @@ class TestSetup(unittest.TestCase):
         exist_region_replacement_string_before_replace = False
         exist_output_replacement_string_before_replace = False
         exist_change_log_file_path_replacement_string_before_replace = False
+        exist_python_executable_path_replacement_string_before_replace = False
+        exist_project_root_dir_path_replacement_string_before_replace = False
+        exist_backup_dir_path_replacement_string_before_replace = False
+        exist_change_log_rotation_replacement_string_before_replace = False
         not_exist_config_file_path_before_replace = False
         not_exist_profile_name_before_replace = False
         not_exist_region_before_replace = False
         not_exist_output_before_replace = False
         not_exist_change_log_file_path_before_replace = False
 
-        config_file_path, profile_name, region, output, change_log_file_path = self.__load_setup_config()
+        config_file_path, profile_name, region, output, change_log_file_path = (
+            self.__load_setup_config()
+        )
         with open(template_file_path, "r") as template_file:
             before_template = template_file.read()
             if REPLACEMENT_STRING_CONFIG_FILE_PATH in before_template:
@@ -200,13 +393,25 @@ class TestSetup(unittest.TestCase):
                 exist_output_replacement_string_before_replace = True
             if REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH in before_template:
                 exist_change_log_file_path_replacement_string_before_replace = True
+            if REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH in before_template:
+                exist_python_executable_path_replacement_string_before_replace = True
+            if REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH in before_template:
+                exist_project_root_dir_path_replacement_string_before_replace = True
+            if REPLACEMENT_STRING_BACKUP_DIR_PATH in before_template:
+                exist_backup_dir_path_replacement_string_before_replace = True
+            if (
+                REPLACEMENT_STRING_CHANGE_LOG_MAX_SIZE in before_template
+                and REPLACEMENT_STRING_CHANGE_LOG_MAX_ARCHIVES in before_template
+                and REPLACEMENT_STRING_CHANGE_LOG_COMPRESS in before_template
+            ):
+                exist_change_log_rotation_replacement_string_before_replace = True
             if config_file_path not in before_template:
                 not_exist_config_file_path_before_replace = True
             if profile_name not in before_template:
                 not_exist_profile_name_before_replace = True
             if region not in before_template:
                 not_exist_region_before_replace = True
-            if output not in before_template:
+            if "OUTPUT_FORMAT=" + output not in before_template:
                 not_exist_output_before_replace = True
             if change_log_file_path not in before_template:
                 not_exist_change_log_file_path_before_replace = True
@@ -219,6 +424,10 @@ class TestSetup(unittest.TestCase):
             region,
             output,
             change_log_file_path,
+            sys.executable,
+            os.getcwd(),
+            TEST_BACKUP_DIR_PATH,
+            change_log.RotationPolicyVO(1048576, 3, True),
         )
 
         ## then
@@ -228,18 +437,30 @@ class TestSetup(unittest.TestCase):
         self.assertNotIn(REPLACEMENT_STRING_REGISTER_PROFILE, function_string)
         self.assertIn(region, function_string)
         self.assertNotIn(REPLACEMENT_STRING_REGION_NAME, function_string)
-        self.assertIn(output, function_string)
+        self.assertIn("OUTPUT_FORMAT=" + output, function_string)
         self.assertNotIn(REPLACEMENT_STRING_OUTPUT_FORMAT, function_string)
         self.assertIn(change_log_file_path, function_string)
         self.assertNotIn(REPLACEMENT_STRING_CHANGE_LOG_FILE_PATH, function_string)
+        self.assertIn(sys.executable, function_string)
+        self.assertNotIn(REPLACEMENT_STRING_PYTHON_EXECUTABLE_PATH, function_string)
+        self.assertIn(os.getcwd(), function_string)
+        self.assertNotIn(REPLACEMENT_STRING_PROJECT_ROOT_DIR_PATH, function_string)
+        self.assertIn(TEST_BACKUP_DIR_PATH, function_string)
+        self.assertNotIn(REPLACEMENT_STRING_BACKUP_DIR_PATH, function_string)
+        self.assertIn('--change-log-max-size "${CHANGE_LOG_MAX_SIZE}"', function_string)
+        self.assertIn("CHANGE_LOG_MAX_SIZE=1048576", function_string)
+        self.assertIn("CHANGE_LOG_MAX_ARCHIVES=3", function_string)
+        self.assertIn("CHANGE_LOG_COMPRESS=true", function_string)
 
         self.assertTrue(exist_config_file_path_replacement_string_before_replace)
         self.assertTrue(exist_profile_name_replacement_string_before_replace)
         self.assertTrue(exist_region_replacement_string_before_replace)
         self.assertTrue(exist_output_replacement_string_before_replace)
-        self.assertTrue(
-            exist_change_log_file_path_replacement_string_before_replace
-        )
+        self.assertTrue(exist_change_log_file_path_replacement_string_before_replace)
+        self.assertTrue(exist_python_executable_path_replacement_string_before_replace)
+        self.assertTrue(exist_project_root_dir_path_replacement_string_before_replace)
+        self.assertTrue(exist_backup_dir_path_replacement_string_before_replace)
+        self.assertTrue(exist_change_log_rotation_replacement_string_before_replace)
         self.assertTrue(not_exist_config_file_path_before_replace)
         self.assertTrue(not_exist_profile_name_before_replace)
         self.assertTrue(not_exist_region_before_replace)
@@ -257,33 +478,61 @@ class TestSetup(unittest.TestCase):
         now = datetime.datetime.now()
 
         ## when
-        backup_file_path = setup.backup_file(file_path, now, logger)
-        tmp_file_paths.append(backup_file_path)
+        snapshot = setup.backup_file(
+            file_path, self.__load_test_setup_config(), now, logger
+        )
 
         ## then
-        self.assertTrue(os.path.exists(backup_file_path))
+        self.assertEqual(snapshot.file_path, os.path.abspath(file_path))
+        self.assertEqual(snapshot.created_at, now.timestamp())
         self.assertEqual(
-            backup_file_path, file_path + "_bk_" + now.strftime("%Y%m%d%H%M%S")
+            backup_store.read_snapshot(TEST_BACKUP_DIR_PATH, snapshot),
+            test_string.encode(),
         )
-        with open(backup_file_path, "r") as backup_file:
-            self.assertEqual(backup_file.read(), test_string)
+
+    def test_backup_file_store_same_contents_once(self):
+        ## given
+        file_path = "tests/test_backup_file_store_same_contents_once.txt"
+        tmp_file_paths.append(file_path)
+        with open(file_path, "w") as test_file:
+            test_file.write("same contents")
+        setup_config = self.__load_test_setup_config()
+
+        ## when
+        snapshots = [
+            setup.backup_file(file_path, setup_config, datetime.datetime.now(), logger)
+            for _ in range(3)
+        ]
+
+        ## then
+        self.assertEqual(len(set(snapshot.digest for snapshot in snapshots)), 1)
+        stored_snapshots = [
+            snapshot
+            for snapshot in backup_store.load_index(TEST_BACKUP_DIR_PATH)[1]
+            if snapshot.file_path == os.path.abspath(file_path)
+        ]
+        self.assertEqual(len(stored_snapshots), 1)
 
     def test_backup_file_file_not_exist(self):
         ## given
         file_path = "tests/test_backup_file_file_not_exist.txt"
 
         ## when
-        backup_file_path = setup.backup_file(file_path, datetime.datetime.now(), logger)
+        snapshot = setup.backup_file(
+            file_path, self.__load_test_setup_config(), datetime.datetime.now(), logger
+        )
 
         ## then
-        self.assertIsNone(backup_file_path)
+        self.assertIsNone(snapshot)
 
     def test_exist_register_sts_assumed_role_file_not_exist(self):
         ## given
         file_path = "tests/test_exist_register_sts_assumed_role_file_not_exist.txt"
 
         ## when
-        exist_register_sts_assumed_role = setup.exist_register_sts_assumed_role(file_path)
+        exist_register_sts_assumed_role = setup.exist_register_sts_assumed_role(
+            file_path
+        )
 
         ## then
         self.assertFalse(exist_register_sts_assumed_role)
@@ -312,14 +561,25 @@ class TestSetup(unittest.TestCase):
             wrong_order_file.writelines(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL)
 
         login_shell_setting_file_paths = [
-            {"file_path": exist_signal_file_path, "expected_value": True,},
-            {"file_path": not_exist_signal_file_path, "expected_value": False,},
-            {"file_path": wrong_order_file_path, "expected_value": False,},
+            {
+                "file_path": exist_signal_file_path,
+                "expected_value": True,
+            },
+            {
+                "file_path": not_exist_signal_file_path,
+                "expected_value": False,
+            },
+            {
+                "file_path": wrong_order_file_path,
+                "expected_value": False,
+            },
         ]
 
         for login_shell_setting_file in login_shell_setting_file_paths:
             ## when
-            exist_register_sts_assumed_role = setup.exist_register_sts_assumed_role(login_shell_setting_file["file_path"])
+            exist_register_sts_assumed_role = setup.exist_register_sts_assumed_role(
+                login_shell_setting_file["file_path"]
+            )
 
             ## then
             self.assertEqual(
@@ -327,11 +587,7 @@ class TestSetup(unittest.TestCase):
                 login_shell_setting_file["expected_value"],
             )
 
-    @parameterized.expand([
-        ("/bin/bash"),
-        ("/usr/local/bin/zsh"),
-        ("test")
-    ])
+    @parameterized.expand([("/bin/bash"), ("/usr/local/bin/zsh"), ("test")])
     def test_register_function_insert_success(self, login_shell_path):
         ## given
         function_string = self.__generate_function_string(login_shell_path)
@@ -350,15 +606,9 @@ class TestSetup(unittest.TestCase):
 
         ## then
         with open(insert_file_path, "r") as result_file:
-            self.assertEqual(
-                result_file.read(), test_string + "\n" + function_string
-            )
+            self.assertEqual(result_file.read(), test_string + "\n" + function_string)
 
-    @parameterized.expand([
-        ("/bin/bash"),
-        ("/usr/local/bin/zsh"),
-        ("test")
-    ])
+    @parameterized.expand([("/bin/bash"), ("/usr/local/bin/zsh"), ("test")])
     def test_register_function_update_success(self, login_shell_path):
         ## given
         function_string = self.__generate_function_string(login_shell_path)
@@ -390,6 +640,65 @@ class TestSetup(unittest.TestCase):
                 before_text + "\n" + function_string + "\n" + after_text,
             )
 
+    @unittest.skipIf(os.geteuid() == 0, "symbolic link is refused as root.")
+    def test_register_function_update_first_block_only(self):
+        ## given
+        function_string = self.__generate_function_string("test")
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        update_file_path = os.path.join(tmp_dir_path, "update.rc")
+        link_file_path = os.path.join(tmp_dir_path, "link.rc")
+        duplicate_block = (
+            REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
+            + "\nduplicate\n"
+            + REGISTER_STS_ASSUMED_ROLE_END_SIGNAL
+        )
+        with open(update_file_path, "w") as update_file:
+            update_file.write(
+                "before\n# "
+                + REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
+                + "\nold\n"
+                + REGISTER_STS_ASSUMED_ROLE_END_SIGNAL
+                + " # after\n"
+                + duplicate_block
+            )
+        os.chmod(update_file_path, 0o640)
+        os.symlink(update_file_path, link_file_path)
+
+        ## when
+        setup.register_function(function_string, link_file_path, logger)
+
+        ## then
+        self.assertTrue(os.path.islink(link_file_path))
+        self.assertEqual(os.stat(update_file_path).st_mode & 0o777, 0o640)
+        with open(update_file_path, "r") as result_file:
+            self.assertEqual(
+                result_file.read(),
+                "before\n# " + function_string + " # after\n" + duplicate_block,
+            )
+
+    def test_register_function_unterminated_block_insert(self):
+        ## given
+        function_string = self.__generate_function_string("test")
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        insert_file_path = os.path.join(tmp_dir_path, "insert.rc")
+        unterminated_string = (
+            "before\n" + REGISTER_STS_ASSUMED_ROLE_START_SIGNAL + "\nrest"
+        )
+        with open(insert_file_path, "w") as insert_file:
+            insert_file.write(unterminated_string)
+
+        ## when
+        setup.register_function(function_string, insert_file_path, logger)
+
+        ## then
+        self.assertEqual(os.listdir(tmp_dir_path), ["insert.rc"])
+        with open(insert_file_path, "r") as result_file:
+            self.assertEqual(
+                result_file.read(), unterminated_string + "\n" + function_string
+            )
+
     def test_setup_register_sts_assumed_role_success(self):
         ## given
         now = datetime.datetime.now()
@@ -400,7 +709,12 @@ class TestSetup(unittest.TestCase):
         before_text = "before"
         after_text = "after"
         tmp_file_paths.append(TEST_LOGIN_SHELL_SETTING_FILE_PATH)
-        with open(TEST_LOGIN_SHELL_SETTING_FILE_PATH, "w") as test_login_shell_setting_file:
+        tmp_file_paths.append(
+            os.path.realpath(TEST_LOGIN_SHELL_SETTING_FILE_PATH) + LOCK_FILE_SUFFIX
+        )
+        with open(
+            TEST_LOGIN_SHELL_SETTING_FILE_PATH, "w"
+        ) as test_login_shell_setting_file:
             test_login_shell_setting_file.writelines(before_text + "\n")
             test_login_shell_setting_file.writelines(
                 REGISTER_STS_ASSUMED_ROLE_START_SIGNAL + "\n"
@@ -411,41 +725,43 @@ class TestSetup(unittest.TestCase):
             )
             test_login_shell_setting_file.writelines(after_text)
         tmp_stdout, sys.stdout = sys.stdout, StringIO()
+        setup_config = self.__load_test_setup_config()
 
         ## when
-        setup.setup_register_sts_assumed_role(
-            setup.load_setup_config(), now, logger
-        )
-        backup_file_path = (
-            TEST_LOGIN_SHELL_SETTING_FILE_PATH + "_bk_" + now.strftime("%Y%m%d%H%M%S")
+        setup.setup_register_sts_assumed_role(setup_config, now, logger)
+        snapshot = backup_store.find_snapshot(
+            backup_store.load_index(TEST_BACKUP_DIR_PATH)[1],
+            TEST_LOGIN_SHELL_SETTING_FILE_PATH,
+            now,
         )
-        tmp_file_paths.append(backup_file_path)
 
         ## then
         self.assertEqual(
             sys.stdout.getvalue(),
             "Setup successed. please run `source "
             + TEST_LOGIN_SHELL_SETTING_FILE_PATH
-            + "` command.\n",
+            + "` command.\n"
+            + "updated: 1, skipped: 0\n",
+        )
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(
+            backup_store.read_snapshot(TEST_BACKUP_DIR_PATH, snapshot).decode(),
+            before_text
+            + "\n"
+            + REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
+            + "\n"
+            + test_replaced_string
+            + "\n"
+            + REGISTER_STS_ASSUMED_ROLE_END_SIGNAL
+            + "\n"
+            + after_text,
         )
-        self.assertTrue(os.path.exists(backup_file_path))
-        with open(backup_file_path, "r") as backup_file:
-            self.assertEqual(
-                backup_file.read(),
-                before_text
-                + "\n"
-                + REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
-                + "\n"
-                + test_replaced_string
-                + "\n"
-                + REGISTER_STS_ASSUMED_ROLE_END_SIGNAL
-                + "\n"
-                + after_text,
-            )
 
         function_string = setup.generate_register_sts_assumed_role_template(
-            REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH,
-            setup.load_setup_config(),
+            REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH, setup_config
+        )
+        function_string = setup.stamp_block_digest(
+            function_string, setup.get_block_digest(function_string, setup_config)
         )
         with open(TEST_LOGIN_SHELL_SETTING_FILE_PATH, "r") as result_file:
             login_shell_setting = result_file.read()
@@ -459,6 +775,194 @@ class TestSetup(unittest.TestCase):
         if "before_shell_environ" in locals():
             os.environ["SHELL"] = before_shell_environ
 
+    @parameterized.expand(
+        [
+            (setup.INSTALL_MODE_INLINE,),
+            (setup.INSTALL_MODE_LAZY,),
+        ]
+    )
+    def test_install_register_sts_assumed_role_skip_unchanged(self, install_mode):
+        ## given
+        now = datetime.datetime.now()
+        tmp_dir_path = tempfile.mkdtemp()
+        setup_config = self.__load_test_setup_config()
+        setup_config.install_mode = install_mode
+        setup_config.backup_dir_path = os.path.join(tmp_dir_path, "backup")
+        setup_config.functions_dir_path = os.path.join(tmp_dir_path, "functions")
+        rc_file_path = os.path.join(tmp_dir_path, ".bashrc")
+        with open(rc_file_path, "w") as rc_file:
+            rc_file.write("export PATH\n")
+        _, first_status = setup.install_register_sts_assumed_role(
+            "/bin/bash", setup_config, now, logger, tmp_dir_path
+        )
+        rc_file_stat = os.stat(rc_file_path)
+        snapshot_count = len(backup_store.load_index(setup_config.backup_dir_path)[1])
+
+        ## when
+        _, second_status = setup.install_register_sts_assumed_role(
+            "/bin/bash", setup_config, now, logger, tmp_dir_path
+        )
+        skipped_rc_file_stat = os.stat(rc_file_path)
+        skipped_snapshot_count = len(
+            backup_store.load_index(setup_config.backup_dir_path)[1]
+        )
+        setup_config.region = "us-east-1"
+        _, changed_status = setup.install_register_sts_assumed_role(
+            "/bin/bash", setup_config, now, logger, tmp_dir_path
+        )
+
+        ## then
+        self.assertEqual(
+            [first_status, second_status, changed_status],
+            [
+                setup.INSTALL_STATUS_INSERTED,
+                setup.INSTALL_STATUS_SKIPPED,
+                setup.INSTALL_STATUS_UPDATED,
+            ],
+        )
+        self.assertEqual(
+            (skipped_rc_file_stat.st_ino, skipped_rc_file_stat.st_mtime_ns),
+            (rc_file_stat.st_ino, rc_file_stat.st_mtime_ns),
+        )
+        self.assertEqual(skipped_snapshot_count, snapshot_count)
+        self.assertNotEqual(os.stat(rc_file_path).st_ino, rc_file_stat.st_ino)
+        self.assertEqual(
+            len(backup_store.load_index(setup_config.backup_dir_path)[1]),
+            snapshot_count + 1,
+        )
+        with open(rc_file_path, "r") as rc_file:
+            self.assertEqual(
+                rc_file.read().count(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL), 1
+            )
+        self.assertIsNotNone(setup.read_block_digest(rc_file_path))
+        shutil.rmtree(tmp_dir_path)
+
+    def test_install_register_sts_assumed_role_lazy_function_file_changed(self):
+        ## given
+        now = datetime.datetime.now()
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        setup_config = self.__load_test_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+        setup_config.backup_dir_path = os.path.join(tmp_dir_path, "backup")
+        setup_config.functions_dir_path = os.path.join(tmp_dir_path, "functions")
+        setup.install_register_sts_assumed_role(
+            "/bin/bash", setup_config, now, logger, tmp_dir_path
+        )
+        function_file_path = setup.get_function_file_path(
+            "/bin/bash", setup_config.functions_dir_path
+        )
+        with open(function_file_path, "r") as function_file:
+            function_string = function_file.read()
+        with open(function_file_path, "w") as function_file:
+            function_file.write("function register_sts_assumed_role { :; }\n")
+
+        ## when
+        _, status = setup.install_register_sts_assumed_role(
+            "/bin/bash", setup_config, now, logger, tmp_dir_path
+        )
+
+        ## then
+        self.assertEqual(status, setup.INSTALL_STATUS_UPDATED)
+        with open(function_file_path, "r") as function_file:
+            self.assertEqual(function_file.read(), function_string)
+
+    def test_install_register_sts_assumed_role_concurrent_once(self):
+        ## given
+        now = datetime.datetime.now()
+        tmp_dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir_path)
+        setup_config = self.__load_test_setup_config()
+        setup_config.backup_dir_path = os.path.join(tmp_dir_path, "backup")
+        statuses = []
+
+        def install():
+            statuses.append(
+                setup.install_register_sts_assumed_role(
+                    "/bin/bash", setup_config, now, logger, tmp_dir_path
+                )[1]
+            )
+
+        threads = [threading.Thread(target=install) for _ in range(4)]
+
+        ## when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ## then
+        self.assertEqual(
+            sorted(statuses),
+            sorted(
+                [setup.INSTALL_STATUS_INSERTED] + [setup.INSTALL_STATUS_SKIPPED] * 3
+            ),
+        )
+        with open(os.path.join(tmp_dir_path, ".bashrc"), "r") as rc_file:
+            self.assertEqual(
+                rc_file.read().count(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL), 1
+            )
+
+    @parameterized.expand(
+        [
+            ("test", "register_sts_assumed_role.bash"),
+            ("/usr/local/bin/zsh", "register_sts_assumed_role"),
+        ]
+    )
+    def test_setup_register_sts_assumed_role_lazy(
+        self, login_shell_path, function_file_name
+    ):
+        ## given
+        setup_config = self.__load_test_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+        function_string = self.__generate_function_string(login_shell_path)
+
+        ## when
+        stub_string = setup.install_lazy_function(
+            function_string, login_shell_path, setup_config, logger
+        )
+
+        ## then
+        function_file_path = os.path.join(TEST_FUNCTIONS_DIR_PATH, function_file_name)
+        with open(function_file_path, "r") as function_file:
+            self.assertTrue(function_file.read().startswith(function_string))
+        self.assertTrue(stub_string.startswith(REGISTER_STS_ASSUMED_ROLE_START_SIGNAL))
+        self.assertTrue(stub_string.endswith(REGISTER_STS_ASSUMED_ROLE_END_SIGNAL))
+        self.assertLess(len(stub_string.splitlines()), 10)
+        if login_shell_path == "test":
+            self.assertIn('source "' + function_file_path + '"', stub_string)
+        else:
+            self.assertIn(
+                'fpath=("' + TEST_FUNCTIONS_DIR_PATH + '" $fpath)', stub_string
+            )
+
+    def test_setup_register_sts_assumed_role_lazy_source_on_first_call(self):
+        ## given
+        setup_config = self.__load_test_setup_config()
+        function_string = (
+            REGISTER_STS_ASSUMED_ROLE_START_SIGNAL
+            + '\nfunction register_sts_assumed_role {\n  echo "loaded ${1}"\n}\n'
+            + REGISTER_STS_ASSUMED_ROLE_END_SIGNAL
+        )
+
+        ## when
+        stub_string = setup.install_lazy_function(
+            function_string, "test", setup_config, logger
+        )
+        result = subprocess.run(
+            [
+                "bash",
+                "-c",
+                stub_string
+                + "\nregister_sts_assumed_role first && register_sts_assumed_role second",
+            ],
+            capture_output=True,
+            text=True,
+        )
+
+        ## then
+        self.assertEqual(result.stdout, "loaded first\nloaded second\n", result.stderr)
+
     def test_setup_register_sts_assumed_role_login_shell_not_found(self):
         ## given
         now = datetime.datetime.now()
@@ -468,13 +972,12 @@ class TestSetup(unittest.TestCase):
         tmp_stdout, sys.stdout = sys.stdout, StringIO()
 
         ## when
-        setup.setup_register_sts_assumed_role(
-            setup.load_setup_config(), now, logger
-        )
+        setup.setup_register_sts_assumed_role(setup.load_setup_config(), now, logger)
 
         ## then
         self.assertEqual(
-            sys.stdout.getvalue(), "Login shells not found.\n",
+            sys.stdout.getvalue(),
+            "Login shells not found.\n",
         )
 
         sys.stdout = tmp_stdout
@@ -490,9 +993,7 @@ class TestSetup(unittest.TestCase):
         tmp_stdout, sys.stdout = sys.stdout, StringIO()
 
         ## when
-        setup.setup_register_sts_assumed_role(
-            setup.load_setup_config(), now, logger
-        )
+        setup.setup_register_sts_assumed_role(setup.load_setup_config(), now, logger)
 
         ## then
         self.assertEqual(
@@ -507,6 +1008,11 @@ class TestSetup(unittest.TestCase):
     ########################################################################
     ############################ Private Method ############################
     ########################################################################
+    def __remove_handlers(self, target_logger):
+        for handler in target_logger.handlers[:]:
+            target_logger.removeHandler(handler)
+            handler.close()
+
     def __load_setup_config(self):
         with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
             test_config = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"]
@@ -520,6 +1026,50 @@ class TestSetup(unittest.TestCase):
             change_log_file_path = test_config["change_log"]["file_path"]
             return config_file_path, profile_name, region, output, change_log_file_path
 
+    def __load_backup_config(self):
+        with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
+            backup_config = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"][
+                "backup"
+            ]
+            retention = backup_config["retention"]
+            return backup_config["dir_path"], {
+                "compress": backup_config["compress"],
+                "max_count": retention["max_count"],
+                "max_age_days": retention["max_age_days"],
+                "max_total_size": retention["max_total_size"],
+            }
+
+    def __load_change_log_rotation_config(self):
+        with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
+            rotation = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"][
+                "change_log"
+            ]["rotation"]
+            return rotation["max_size"], rotation["max_archives"], rotation["compress"]
+
+    def __load_daemon_socket_path(self):
+        with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
+            return yaml.load(config_file, Loader=yaml.SafeLoader)["setup"]["daemon"][
+                "socket_path"
+            ]
+
+    def __load_credential_cache_dir_path(self):
+        with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
+            credential_cache = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"][
+                "credential_cache"
+            ]
+            return credential_cache["dir_path"] if credential_cache["enabled"] else ""
+
+    def __load_metrics_config(self):
+        with open(SETUP_CONFIG_FILE_PATH, "r") as config_file:
+            metrics = yaml.load(config_file, Loader=yaml.SafeLoader)["setup"]["metrics"]
+            return metrics["log_file_path"], metrics["textfile_dir_path"]
+
+    def __load_test_setup_config(self):
+        setup_config = setup.load_setup_config()
+        setup_config.backup_dir_path = TEST_BACKUP_DIR_PATH
+        setup_config.functions_dir_path = TEST_FUNCTIONS_DIR_PATH
+        return setup_config
+
     def __generate_function_string(self, login_shell_path):
         if login_shell_path.endswith("bash"):
             template_file_path = REGISTER_STS_ASSUMED_ROLE_BASH_TEMPLATE_FILE_PATH
@@ -528,7 +1078,8 @@ class TestSetup(unittest.TestCase):
         elif login_shell_path == "test":
             template_file_path = REGISTER_STS_ASSUMED_ROLE_TEST_TEMPLATE_FILE_PATH
         return setup.generate_register_sts_assumed_role_template(
-            template_file_path, setup.load_setup_config(),
+            template_file_path,
+            setup.load_setup_config(),
         )
 
 
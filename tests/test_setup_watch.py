@@ -0,0 +1,160 @@
+import unittest
+import fleet
+import setup
+import setup_watch
+import copy
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from parameterized import parameterized
+
+TARGETS_YAML = """
+- home_dir: {tmp_dir_path}/alice
+  shell: /bin/bash
+- home_dir: {tmp_dir_path}/bob
+  shell: /usr/bin/zsh
+  overrides:
+    region: us-east-1
+"""
+
+
+class TestSetupWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        for user_name in ("alice", "bob"):
+            os.makedirs(os.path.join(self.tmp_dir_path, user_name))
+        self.targets_file_path = os.path.join(self.tmp_dir_path, "targets.yaml")
+        with open(self.targets_file_path, "w") as targets_file:
+            targets_file.write(TARGETS_YAML.format(tmp_dir_path=self.tmp_dir_path))
+        self.logger = logging.getLogger("test_setup_watch")
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    @parameterized.expand([(False,), (True,)])
+    def test_make_watcher_detect_replaced_file(self, polling):
+        ## given
+        watched_file_path = os.path.join(self.tmp_dir_path, "setup-config.yaml")
+        other_file_path = os.path.join(self.tmp_dir_path, "other.yaml")
+        with open(watched_file_path, "w") as watched_file:
+            watched_file.write("setup: {}\n")
+        watcher = setup_watch.make_watcher([watched_file_path], polling)
+        if polling:
+            watcher.interval = 0.01
+
+        ## when
+        timed_out_file_paths = watcher.wait(0.05)
+        with open(other_file_path, "w") as other_file:
+            other_file.write("ignored\n")
+        replacing_file_path = watched_file_path + ".tmp"
+        with open(replacing_file_path, "w") as replacing_file:
+            replacing_file.write("setup: {changed: true}\n")
+        os.replace(replacing_file_path, watched_file_path)
+        changed_file_paths = watcher.wait(1)
+        watcher.close()
+
+        ## then
+        self.assertEqual(timed_out_file_paths, set())
+        self.assertEqual(changed_file_paths, {watched_file_path})
+
+    def test_wait_for_changes_debounce_burst(self):
+        ## given
+        file_paths = [
+            os.path.join(self.tmp_dir_path, "a.tmpl"),
+            os.path.join(self.tmp_dir_path, "b.tmpl"),
+        ]
+        for file_path in file_paths:
+            with open(file_path, "w") as target_file:
+                target_file.write("0")
+        watcher = setup_watch.PollingWatcher(file_paths, 0.01)
+
+        def write_burst():
+            for count, file_path in enumerate(file_paths * 3):
+                time.sleep(0.02)
+                with open(file_path, "w") as target_file:
+                    target_file.write(str(count + 1) * (count + 2))
+
+        writer = threading.Thread(target=write_burst)
+
+        ## when
+        writer.start()
+        changed_file_paths = setup_watch.wait_for_changes(watcher, 0.2, 1)
+        writer.join()
+        following_file_paths = watcher.wait(0)
+
+        ## then
+        self.assertEqual(changed_file_paths, set(file_paths))
+        self.assertEqual(following_file_paths, set())
+
+    def test_update_outdated_targets_only_dependent(self):
+        ## given
+        setup_config = setup.load_setup_config()
+        setup_config.install_mode = setup.INSTALL_MODE_LAZY
+        state = setup_watch.WatchStateVO(
+            os.path.abspath(setup.SETUP_CONFIG_FILE_PATH),
+            self.targets_file_path,
+            setup_config,
+            fleet.load_targets(self.targets_file_path),
+        )
+        first_results = setup_watch.update_outdated_targets(
+            state, datetime.datetime.now(), self.logger, 2
+        )
+        unchanged_results = setup_watch.update_outdated_targets(
+            state, datetime.datetime.now(), self.logger, 2
+        )
+
+        ## when
+        # bob overrides the region, so only alice depends on it
+        state.setup_config = copy.copy(setup_config)
+        state.setup_config.region = "eu-west-1"
+        results = setup_watch.update_outdated_targets(
+            state, datetime.datetime.now(), self.logger, 2
+        )
+
+        ## then
+        self.assertEqual(
+            [result.status for result in first_results],
+            [fleet.STATUS_INSERTED, fleet.STATUS_INSERTED],
+        )
+        self.assertEqual(unchanged_results, [])
+        self.assertEqual(
+            [(result.target.home_dir_path, result.status) for result in results],
+            [(os.path.join(self.tmp_dir_path, "alice"), fleet.STATUS_UPDATED)],
+        )
+        with open(
+            os.path.join(
+                self.tmp_dir_path,
+                "alice",
+                ".aws/sts_assumed_role_functions/register_sts_assumed_role.bash",
+            ),
+            "r",
+        ) as function_file:
+            self.assertIn("REGION_NAME=eu-west-1", function_file.read())
+
+    def test_reload_inputs_keep_last_targets_when_broken(self):
+        ## given
+        targets = fleet.load_targets(self.targets_file_path)
+        state = setup_watch.WatchStateVO(
+            os.path.abspath(setup.SETUP_CONFIG_FILE_PATH),
+            self.targets_file_path,
+            setup.load_setup_config(),
+            targets,
+        )
+        with open(self.targets_file_path, "w") as targets_file:
+            targets_file.write("- home_dir: /home/carol\n")
+
+        ## when
+        setup_watch.reload_inputs(state, {self.targets_file_path}, self.logger)
+
+        ## then
+        self.assertIs(state.targets, targets)
+
+
+if __name__ == "__main__":
+    unittest.main()
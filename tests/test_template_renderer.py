@@ -0,0 +1,101 @@
+import unittest
+import template_renderer
+import os
+import shutil
+import tempfile
+from parameterized import parameterized
+
+TEMPLATE_STRING = "A=$REPLACEMENT_STRING_A # a\nB=$REPLACEMENT_STRING_B$REPLACEMENT_STRING_A\nC=$REPLACEMENT_STRING_C\n"
+TEMPLATE_VALUES = {
+    "$REPLACEMENT_STRING_A": "a",
+    "$REPLACEMENT_STRING_B": "$REPLACEMENT_STRING_A",
+}
+
+
+class TestTemplateRenderer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.template_file_path = os.path.join(self.tmp_dir_path, "test.tmpl")
+        with open(self.template_file_path, "w") as template_file:
+            template_file.write(TEMPLATE_STRING)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+        template_renderer.compiled_template_cache.clear()
+        template_renderer.rendered_template_cache.clear()
+
+    def test_compile_template_segments(self):
+        ## when
+        compiled_template = template_renderer.compile_template(TEMPLATE_STRING)
+
+        ## then
+        self.assertEqual("".join(compiled_template.segments), TEMPLATE_STRING)
+        self.assertEqual(
+            [placeholder for _, placeholder in compiled_template.placeholders],
+            [
+                "$REPLACEMENT_STRING_A",
+                "$REPLACEMENT_STRING_B",
+                "$REPLACEMENT_STRING_A",
+                "$REPLACEMENT_STRING_C",
+            ],
+        )
+
+    @parameterized.expand([("",), ("no placeholder\n",)])
+    def test_compile_template_no_placeholder(self, template_string):
+        ## when
+        compiled_template = template_renderer.compile_template(template_string)
+
+        ## then
+        self.assertEqual(compiled_template.render(TEMPLATE_VALUES), template_string)
+
+    def test_render_single_pass(self):
+        ## when
+        rendered_string = template_renderer.compile_template(TEMPLATE_STRING).render(
+            TEMPLATE_VALUES
+        )
+
+        ## then
+        self.assertEqual(
+            rendered_string,
+            "A=a # a\nB=$REPLACEMENT_STRING_Aa\nC=$REPLACEMENT_STRING_C\n",
+        )
+
+    def test_load_template_recompile_changed_file(self):
+        ## given
+        first_template, first_signature = template_renderer.load_template(
+            self.template_file_path
+        )
+
+        ## when
+        cached_template, _ = template_renderer.load_template(self.template_file_path)
+        with open(self.template_file_path, "w") as template_file:
+            template_file.write("changed=$REPLACEMENT_STRING_A\n")
+        os.utime(
+            self.template_file_path,
+            ns=(first_signature[0] + 10**9, first_signature[0] + 10**9),
+        )
+        changed_template, _ = template_renderer.load_template(self.template_file_path)
+
+        ## then
+        self.assertIs(cached_template, first_template)
+        self.assertEqual(changed_template.render(TEMPLATE_VALUES), "changed=a\n")
+
+    def test_render_template_file_cache_by_key(self):
+        ## when
+        first_string = template_renderer.render_template_file(
+            self.template_file_path, TEMPLATE_VALUES, "key"
+        )
+        cached_string = template_renderer.render_template_file(
+            self.template_file_path, {}, "key"
+        )
+        other_string = template_renderer.render_template_file(
+            self.template_file_path, {}, "other key"
+        )
+
+        ## then
+        self.assertIs(cached_string, first_string)
+        self.assertEqual(other_string, TEMPLATE_STRING)
+
+
+if __name__ == "__main__":
+    unittest.main()